@@ -1,5 +1,12 @@
+import os
 import flet as ft
-from multi_assets_sim import SimApp
+from multi_assets_sim import SimApp, JsonlProfileHook, ResultCache
+
+# 指定されていればシミュレーションの処理区分ごとの時間をJSONL形式で追記する
+PROFILE_LOG = os.environ.get("MULTI_ASSETS_SIM_PROFILE_LOG")
+# シードを指定した場合の集計結果のキャッシュ(Web版の全セッションで共有する)。
+# ディレクトリが指定されていればディスク上にも保存し、再起動後も使う
+RESULT_CACHE = ResultCache(disk_dir=os.environ.get("MULTI_ASSETS_SIM_CACHE_DIR"))
 
 
 def main(page: ft.Page):
@@ -8,7 +15,8 @@ def main(page: ft.Page):
     page.scroll = ft.ScrollMode.AUTO
     # page.scroll = ft.ScrollMode.ADAPTIVE
 
-    page.add(SimApp(page.web))
+    hook = JsonlProfileHook(PROFILE_LOG) if PROFILE_LOG else None
+    page.add(SimApp(page.web, profile_hook=hook, result_cache=RESULT_CACHE))
 
 
 ft.app(target=main)
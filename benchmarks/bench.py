@@ -0,0 +1,424 @@
+"""シミュレーション,集計,入出力,描画の処理時間とメモリ使用量(tracemallocのピーク)を計測するベンチマーク。
+
+    python benchmarks/bench.py                      # 計測してbench_result.jsonへ書き出し、ベースラインと比較する
+    python benchmarks/bench.py --update-baseline     # 計測結果をベースラインとして保存する
+    python benchmarks/bench.py --filter simulate    # 名前に"simulate"を含むケースのみ計測する
+
+ベースラインより処理時間が--time-threshold倍、ピークメモリが--mem-threshold倍を超えたケースを退行として表示し、
+1件でもあれば終了コード1で終了する。処理時間は--repeat回のうちの最小値とする。
+計測の前に、シードを指定した結果がワーカー数やチャンクサイズによらず一致すること、
+reprice()の結果が同じパラメータで計算し直した結果と一致することを確かめ、一致しなければ終了コード1で終了する(--no-checkで省略)。
+"""
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import warnings
+import argparse
+import datetime
+import platform
+import tempfile
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from multi_assets_sim import (  # noqa: E402
+    MonteCarloParam,
+    MonteCarloSim,
+    MultiMonteCarloParam,
+    MultiMonteCarloSim,
+    MonteCarloResultView,
+    SimHistogram,
+)
+from multi_assets_sim.sim_base import SEED_BLOCK  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, "..", "data")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = "bench_result.json"
+# reprice()は乱数を使わずに1次式で計算し直すため、計算順序の違いによる丸め誤差(結果の型のマシンイプシロンの倍数)だけを許容する
+REPRICE_RTOL_EPS = 16
+
+# 日本語フォントが無い環境での警告で出力が埋もれないようにする
+logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+
+def _multi_param(size: int, year: int, assets_len: int) -> MultiMonteCarloParam:
+    """アセット数を指定した複数アセットのパラメータを作成する関数(相関は一定の乱数で作る)
+
+    Args:
+        size (int): シミュレーション数
+        year (int): 運用年数
+        assets_len (int): アセット数
+
+    Returns:
+        MultiMonteCarloParam: _description_
+    """
+    param = MultiMonteCarloParam(size=size, year=year, seed=1)
+    if assets_len != len(param.labels):
+        rng = np.random.default_rng(0)
+        stds = rng.uniform(0.03, 0.25, assets_len)
+        m = rng.normal(size=(assets_len, assets_len))
+        cor = np.corrcoef(m @ m.T + np.eye(assets_len) * assets_len)
+        param = MultiMonteCarloParam(
+            profits=stds * 0.3,
+            stds=stds,
+            cor=cor,
+            cov=MultiMonteCarloParam.get_covs(cor, stds),
+            labels=[f"asset{i}" for i in range(assets_len)],
+            ratios=np.full(assets_len, 1 / assets_len),
+            size=size,
+            year=year,
+            seed=1,
+        )
+    return param
+
+
+def _simulated(size: int, year: int, assets_len: int) -> MultiMonteCarloSim:
+    """集計のベンチマーク用にシミュレーション済みのクラスを返す関数"""
+    sim = MultiMonteCarloSim()
+    sim.set_param(_multi_param(size, year, assets_len))
+    sim.simulate(keep_all_pattern=False)
+    return sim
+
+
+def case_single_simulate(size: int, year: int) -> Callable[[], None]:
+    param = MonteCarloParam(size=size, year=year, seed=1)
+
+    def run():
+        sim = MonteCarloSim()
+        sim.set_param(param)
+        sim.simulate()
+
+    return run
+
+
+def case_multi_simulate(size: int, year: int, assets_len: int) -> Callable[[], None]:
+    param = _multi_param(size, year, assets_len)
+
+    def run():
+        sim = MultiMonteCarloSim()
+        sim.set_param(param)
+        sim.simulate(keep_all_pattern=False)
+
+    return run
+
+
+def case_percentile(getter: str, size: int) -> Callable[[], None]:
+    sim = _simulated(size, 20, 4)
+
+    def run():
+        sim._percentile_cache = None  # シミュレーションごとのキャッシュを使わずに計測する
+        getattr(sim, getter)()
+
+    return run
+
+
+def case_load_yaml() -> Callable[[], None]:
+    fpath = os.path.join(DATA_DIR, "multi_param_gpif.yml")
+    return lambda: MultiMonteCarloParam.load_yaml(fpath)
+
+
+def case_save_excel(tmpdir: str) -> Callable[[], None]:
+    param = MultiMonteCarloParam.load_yaml(os.path.join(DATA_DIR, "multi_param_gpif.yml"))
+    fpath = os.path.join(tmpdir, "save_param.xlsx")
+    return lambda: param.save_excel(fpath)
+
+
+def case_load_excel(tmpdir: str) -> Callable[[], None]:
+    param = MultiMonteCarloParam.load_yaml(os.path.join(DATA_DIR, "multi_param_gpif.yml"))
+    fpath = os.path.join(tmpdir, "load_param.xlsx")
+    param.save_excel(fpath)
+    return lambda: MultiMonteCarloParam.load_excel(fpath)
+
+
+def case_render_plot_svg(kind: str) -> Callable[[], None]:
+    sim = _simulated(10_000, 30, 4)
+    view = MonteCarloResultView(False)
+    view.build()
+    view.df_result_desc = sim.get_percentile_describe()
+    view.df_persentile_eachtime = sim.get_percentile_eachtime()
+    view.df_persentile_hisotry = sim.get_percentile_history()
+
+    # pageに追加せずにグラフのSVGへの描画のみを計測する
+    return lambda: view.render_plot_svg(kind)
+
+
+def case_histogram_add(size: int, year: int) -> Callable[[], None]:
+    sim = _simulated(size, year, 4)
+    result = sim.get_result()
+    hist = SimHistogram.from_totals(result[:, :SEED_BLOCK], per_year=True)
+
+    # 全パスをSEED_BLOCKごとにヒストグラムへ蓄積する処理のみを計測する
+    def run():
+        h = hist.empty_like()
+        for i in range(0, size, SEED_BLOCK):
+            h.add(result[:, i : i + SEED_BLOCK])
+
+    return run
+
+
+def case_render_distribution_svg(kind: str) -> Callable[[], None]:
+    sim = _simulated(10_000, 30, 4)
+    view = MonteCarloResultView(False)
+    view.build()
+    view.df_result_desc = sim.get_percentile_describe()
+    view.hist = sim.get_histogram(per_year=True)
+
+    return lambda: view.render_plot_svg(kind)
+
+
+def case_build_native_chart(n_percentiles: int) -> Callable[[], None]:
+    sim = MultiMonteCarloSim()
+    param = _multi_param(10_000, 50, 4)
+    param.percentiles = list(np.linspace(1, 99, n_percentiles).astype(int))
+    sim.set_param(param)
+    sim.simulate(keep_all_pattern=False)
+    view = MonteCarloResultView(False)
+    view.build()
+    view.df_persentile_eachtime = sim.get_percentile_eachtime()
+    view.df_persentile_hisotry = sim.get_percentile_history()
+
+    # LineChartのControlの作成(点の間引きを含む)のみを計測する
+    return lambda: view.build_native_chart("EachTime")
+
+
+def get_cases(tmpdir: str) -> dict:
+    """計測するケースの名前と、計測対象の関数を作る関数の辞書を返す
+
+    Args:
+        tmpdir (str): 入出力のベンチマークで使う一時ディレクトリ
+
+    Returns:
+        dict: 名前 -> 引数なしで計測対象の関数を返す関数
+    """
+    cases = {}
+    for size, year in [(10_000, 20), (100_000, 20), (100_000, 50)]:
+        cases[f"single_simulate[size={size},year={year}]"] = (
+            lambda s=size, y=year: case_single_simulate(s, y)
+        )
+    for size, year, assets_len in [
+        (10_000, 20, 4),
+        (100_000, 20, 4),
+        (100_000, 50, 4),
+        (10_000, 20, 20),
+    ]:
+        cases[f"multi_simulate[size={size},year={year},assets={assets_len}]"] = (
+            lambda s=size, y=year, a=assets_len: case_multi_simulate(s, y, a)
+        )
+    for getter in [
+        "get_percentile_describe",
+        "get_percentile_eachtime",
+        "get_percentile_history",
+    ]:
+        cases[f"{getter}[size=100000]"] = lambda g=getter: case_percentile(g, 100_000)
+    cases["load_yaml"] = case_load_yaml
+    cases["save_excel"] = lambda: case_save_excel(tmpdir)
+    cases["load_excel"] = lambda: case_load_excel(tmpdir)
+    cases["render_plot_svg[EachTime]"] = lambda: case_render_plot_svg("EachTime")
+    cases["render_plot_svg[History]"] = lambda: case_render_plot_svg("History")
+    cases["build_native_chart[percentiles=99]"] = lambda: case_build_native_chart(99)
+    cases["histogram_add[size=100000,year=50]"] = lambda: case_histogram_add(100_000, 50)
+    cases["render_plot_svg[Distribution]"] = lambda: case_render_distribution_svg("Distribution")
+    cases["render_plot_svg[Heatmap]"] = lambda: case_render_distribution_svg("Heatmap")
+    return cases
+
+
+def _check_params() -> list:
+    """再現性を確かめるパラメータのリストを返す関数。
+    ブロックの途中で終わるパス数とし、ブロックごとに状態を持つ乱数の生成方法も含める
+
+    Returns:
+        list: (名前, パラメータ)のリスト
+    """
+    size = 3 * SEED_BLOCK + 123
+    params = [("single", MonteCarloParam(size=size, year=10, seed=1))]
+    for name, kwargs in [
+        ("multi", {}),
+        ("multi[antithetic]", {"antithetic": True}),
+        ("multi[sobol]", {"sampler": "sobol"}),
+        ("multi[tilt]", {"tilt": 0.2}),
+        ("multi[float32]", {"precision": "float32"}),
+    ]:
+        params.append((name, MultiMonteCarloParam(size=size, year=10, seed=1, **kwargs)))
+    return params
+
+
+def _new_sim(param):
+    """パラメータに対応するシミュレーションクラスを作成する関数"""
+    sim = MultiMonteCarloSim() if isinstance(param, MultiMonteCarloParam) else MonteCarloSim()
+    sim.set_param(param)
+    return sim
+
+
+def check_reproducibility() -> list[str]:
+    """シードを指定した結果が、ワーカー数(1, 2)とチャンクサイズによらずnp.array_equalで一致すること、
+    reprice()の結果が同じパラメータでsimulate()し直した結果と一致することを確かめる関数
+
+    Returns:
+        list[str]: 一致しなかった条件の説明のリスト(空なら全て一致)
+    """
+    errors = []
+    for name, param in _check_params():
+        ref = _new_sim(param)
+        ref.simulate(keep_growth=True)
+        expected = ref.get_result()
+        for workers, chunk_size in [(1, SEED_BLOCK), (1, 2 * SEED_BLOCK), (2, None), (2, SEED_BLOCK)]:
+            sim = _new_sim(param)
+            sim.simulate(workers=workers, chunk_size=chunk_size)
+            if np.array_equal(sim.get_result(), expected) is False:
+                errors.append(f"{name}: result differs with workers={workers}, chunk_size={chunk_size}")
+
+        repriced = copy.deepcopy(param)
+        repriced.start = 1_000_000
+        repriced.month = 50_000
+        ref.reprice(repriced)
+        sim = _new_sim(repriced)
+        sim.simulate()
+        rtol = REPRICE_RTOL_EPS * np.finfo(sim.get_result().dtype).eps
+        if np.allclose(ref.get_result(), sim.get_result(), rtol=rtol, atol=0) is False:
+            errors.append(f"{name}: reprice() differs from simulate()")
+    return errors
+
+
+def measure(fn: Callable[[], None], repeat: int) -> dict:
+    """処理時間(repeat回の最小値)と、tracemallocで計測したピークメモリを返す関数。
+    tracemallocは処理を遅くするため、メモリは処理時間とは別に1回だけ計測する
+
+    Args:
+        fn (Callable[[], None]): 計測対象の関数
+        repeat (int): 処理時間を計測する回数
+
+    Returns:
+        dict: "time"[s]と"peak_mb"[MiB]の辞書
+    """
+    fn()  # 初回のみの読込やキャッシュの影響を除く
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time": min(times), "peak_mb": peak / 1024**2}
+
+
+def compare(
+    results: dict,
+    baseline: dict,
+    time_threshold: float,
+    mem_threshold: float,
+    min_time: float,
+) -> pd.DataFrame:
+    """計測結果をベースラインと比較する関数
+
+    Args:
+        results (dict): 今回の計測結果(名前 -> measure()の結果)
+        baseline (dict): ベースラインの計測結果
+        time_threshold (float): 退行とみなす処理時間の比
+        mem_threshold (float): 退行とみなすピークメモリの比
+        min_time (float): 処理時間の増加がこの秒数以下なら比によらず退行とみなさない(短い処理のばらつき対策)
+
+    Returns:
+        pd.DataFrame: ケースごとの比較結果
+    """
+    rows = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        row = {"case": name, "time[s]": res["time"], "peak[MiB]": res["peak_mb"]}
+        if base is not None:
+            row["time_ratio"] = res["time"] / max(base["time"], 1e-9)
+            row["mem_ratio"] = res["peak_mb"] / max(base["peak_mb"], 1e-9)
+            slow = row["time_ratio"] > time_threshold and res["time"] - base["time"] > min_time
+            row["regression"] = bool(slow or row["mem_ratio"] > mem_threshold)
+        else:
+            row["time_ratio"] = row["mem_ratio"] = np.nan
+            row["regression"] = False
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="計測結果のJSONファイル")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="比較するベースラインのJSONファイル")
+    parser.add_argument("--update-baseline", action="store_true", help="計測結果をベースラインとして保存する")
+    parser.add_argument("--filter", default="", help="名前にこの文字列を含むケースのみ計測する")
+    parser.add_argument("--repeat", type=int, default=3, help="処理時間を計測する回数")
+    parser.add_argument("--time-threshold", type=float, default=1.5, help="退行とみなす処理時間の比")
+    parser.add_argument("--mem-threshold", type=float, default=1.3, help="退行とみなすピークメモリの比")
+    parser.add_argument("--min-time", type=float, default=0.005, help="退行とみなす処理時間の最小の増加[s]")
+    parser.add_argument("--no-check", action="store_true", help="結果の再現性の確認を省略する")
+    args = parser.parse_args()
+
+    if args.no_check is False:
+        errors = check_reproducibility()
+        for err in errors:
+            print(f"check failed: {err}")
+        if len(errors) > 0:
+            return 1
+        print("reproducibility check passed", flush=True)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, make in get_cases(tmpdir).items():
+            if args.filter not in name:
+                continue
+            results[name] = measure(make(), args.repeat)
+            print(f"{name}: {results[name]['time']:.4f}s, {results[name]['peak_mb']:.1f}MiB", flush=True)
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, encoding="utf-8", mode="w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.update_baseline is True:
+        baseline = {"meta": report["meta"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8", mode="r") as f:
+                baseline = json.load(f)
+        # 一部のケースのみ計測した場合は、そのケースだけを更新する
+        baseline["meta"] = report["meta"]
+        baseline["results"].update(results)
+        with open(args.baseline, encoding="utf-8", mode="w") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"baseline is updated: {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline) is False:
+        print(f"baseline is not found: {args.baseline}")
+        return 0
+    with open(args.baseline, encoding="utf-8", mode="r") as f:
+        baseline = json.load(f)["results"]
+    df = compare(results, baseline, args.time_threshold, args.mem_threshold, args.min_time)
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+        print(df.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    n_reg = int(df["regression"].sum())
+    if n_reg > 0:
+        print(f"{n_reg} regression(s) found")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,7 @@
+from multi_assets_sim.sim_base import SimulationCancelled
+from multi_assets_sim.sim_profile import SimProfile, JsonlProfileHook
+from multi_assets_sim.sim_histogram import SimHistogram
+from multi_assets_sim.result_cache import ResultCache, param_hash
 from multi_assets_sim.single.monte_carlo_sim import MonteCarloSim
 from multi_assets_sim.single.monte_carlo_param import MonteCarloParam
 from multi_assets_sim.multi.multi_monte_carlo_sim import MultiMonteCarloSim
@@ -5,4 +9,5 @@ from multi_assets_sim.multi.multi_monte_carlo_param import MultiMonteCarloParam
 from multi_assets_sim.monte_carlo_input_view import MonteCarloInputView
 from multi_assets_sim.multi_monte_carlo_input_view import MultiMonteCarloInputView
 from multi_assets_sim.monte_carlo_result_view import MonteCarloResultView
+from multi_assets_sim.param_sweep_view import ParamSweepView
 from multi_assets_sim.sim_app import SimApp
@@ -190,6 +190,34 @@ class CorrelationTableView(ft.UserControl):
         """
         self.param = copy.deepcopy(param)
 
+    @staticmethod
+    def round_ratios(ratios: np.ndarray, decimals: int = 4) -> np.ndarray:
+        """構成比率を小数点以下decimals桁に丸める関数。
+        丸めた後の合計が1からずれた分は最も大きい比率に加え、合計をちょうど1にする
+
+        Args:
+            ratios (np.ndarray): 合計が1の構成比率(asset_len,)
+            decimals (int, optional): 丸める桁数. Defaults to 4.
+
+        Returns:
+            np.ndarray: _description_
+        """
+        rounded = np.round(np.asarray(ratios, dtype=np.float64), decimals)
+        i = int(np.argmax(rounded))
+        rounded[i] = np.round(1.0 - (rounded.sum() - rounded[i]), decimals)
+        return rounded
+
+    def set_ratios(self, ratios: np.ndarray):
+        """構成比率だけを差し替えてViewへ反映させる関数。他の入力中の値はそのまま残す。
+        表示する値と一致するよう小数点以下4桁に丸め、合計は1に保つ
+
+        Args:
+            ratios (np.ndarray): 合計が1の構成比率(asset_len,)
+        """
+        self._update_param_from_ctrls()
+        self.param.ratios = self.round_ratios(ratios)
+        self.update_view()
+
     def get_param(self) -> MultiMonteCarloParam:
         """現在のParamを返す関数。相関行列は対称行列にしている
 
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, ys: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets法で、折れ線の形を保つように間引く点のインデックスを選ぶ関数。
+    両端の点は必ず残し、間の点をn_out-2個のバケットに分けて、各バケットから
+    前のバケットで選んだ点と次のバケットの平均の点とで作る三角形の面積が最大になる点を1つずつ選ぶ。
+    同じxを持つ複数の系列は、バケットごとに全系列をまとめて計算する。
+
+    Args:
+        x (np.ndarray): 各点のx座標(昇順)(N,)
+        ys (np.ndarray): 各系列の各点のy座標(S, N)
+        n_out (int): 残す点の数(3以上)
+
+    Returns:
+        np.ndarray: 系列ごとの残す点のインデックス(S, min(n_out, N))
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ys = np.atleast_2d(np.asarray(ys, dtype=np.float64))
+    n_series, n = ys.shape
+    if n_out >= n or n_out < 3:
+        return np.tile(np.arange(n), (n_series, 1))
+
+    rows = np.arange(n_series)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)  # 両端を除いた点のバケットの境界
+    idx = np.zeros((n_series, n_out), dtype=np.intp)
+    idx[:, -1] = n - 1
+    prev = np.zeros(n_series, dtype=np.intp)
+    for b in range(n_out - 2):
+        lo, hi = edges[b], max(edges[b + 1], edges[b] + 1)
+        # 次のバケット(最後は右端の点)の平均
+        nlo, nhi = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+        nhi = max(nhi, nlo + 1)
+        ax, ay = x[prev], ys[rows, prev]
+        cx, cy = x[nlo:nhi].mean(), ys[:, nlo:nhi].mean(axis=1)
+        bx, by = x[lo:hi], ys[:, lo:hi]
+        area = np.abs(
+            (ax[:, np.newaxis] - cx) * (by - ay[:, np.newaxis])
+            - (ax[:, np.newaxis] - bx) * (cy - ay)[:, np.newaxis]
+        )
+        prev = lo + np.argmax(area, axis=1)
+        idx[:, b + 1] = prev
+    return idx
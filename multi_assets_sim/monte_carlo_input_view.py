@@ -61,7 +61,7 @@ class MonteCarloInputView(ft.UserControl):
         )
         self.tf[CtrlKey.size] = ft.TextField(
             label="simulation size",
-            hint_text="size of monte carlo simulation: recomended 5000-10000",
+            hint_text="size of monte carlo simulation: recomended 5000-10000 (upper limit if tolerance is set)",
             keyboard_type=ft.KeyboardType.NUMBER,
             on_change=validate.textfield_int_changed,
             value=str(self.sim_param.size),
@@ -73,6 +73,30 @@ class MonteCarloInputView(ft.UserControl):
             on_change=validate.textfield_percentile_changed,
             value=str(",".join([f"{p}" for p in self.sim_param.percentiles])),
         )
+        self.tf[CtrlKey.tolerance] = ft.TextField(
+            label="tolerance",
+            hint_text="target relative error of percentiles: ex. 1%->0.01 (empty: always run simulation size)",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_change=validate.textfield_optional_float_changed,
+            value=self._tolerance_text(),
+        )
+        self.tf[CtrlKey.tilt] = ft.TextField(
+            label="tilt",
+            hint_text="importance sampling shift per year[σ]: ex. 1% tail in 20 years->2.33/sqrt(20)=0.52 (empty or 0: off)",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_change=validate.textfield_optional_float_changed,
+            value=str(self.sim_param.tilt),
+        )
+        self.cb_antithetic = ft.Checkbox(
+            label="対称変量法(符号を反転した乱数の対を使う)", value=self.sim_param.antithetic
+        )
+        self.cb_control_variate = ft.Checkbox(
+            label="制御変量法(資産額の期待値で重み付けする)",
+            value=self.sim_param.control_variate,
+        )
+        self.cb_sobol = ft.Checkbox(
+            label="準モンテカルロ(Sobol列)", value=self.sim_param.sampler == "sobol"
+        )
         labels = {
             CtrlKey.profit: "リターン/年",
             CtrlKey.risk: "リスク/年",
@@ -81,6 +105,8 @@ class MonteCarloInputView(ft.UserControl):
             CtrlKey.month: "毎月積立額",
             CtrlKey.size: "シミュレーション数",
             CtrlKey.percentiles: "パーセンタイル",
+            CtrlKey.tolerance: "目標相対誤差",
+            CtrlKey.tilt: "重点サンプリング",
         }
         # ボタン類
         self.btn_sim = ft.ElevatedButton("Simulate", on_click=self.click_sim)
@@ -107,6 +133,8 @@ class MonteCarloInputView(ft.UserControl):
             CtrlKey.month,
             CtrlKey.size,
             CtrlKey.percentiles,
+            CtrlKey.tolerance,
+            CtrlKey.tilt,
         ]
         ctrls = [
             ft.Row(
@@ -117,10 +145,21 @@ class MonteCarloInputView(ft.UserControl):
             )
             for k in ckey
         ]
+        ctrls.append(ft.Row([self.cb_antithetic, self.cb_control_variate, self.cb_sobol]))
         ctrls.append(ft.Row([self.btn_sim, self.btn_save_param, self.btn_load_param]))
 
         return ft.Column(ctrls)
 
+    def _tolerance_text(self) -> str:
+        """目標相対誤差の表示用の文字列を返す関数(未指定なら空欄)
+
+        Returns:
+            str: _description_
+        """
+        if self.sim_param.tolerance is None:
+            return ""
+        return str(self.sim_param.tolerance)
+
     def did_mount(self):
         """pageにmountされた後の処理。
         Overlayへ追加が必要なControl(FilePickerなど)を追加する
@@ -167,6 +206,13 @@ class MonteCarloInputView(ft.UserControl):
             self.sim_param.percentiles = [
                 int(p) for p in self.tf[CtrlKey.percentiles].value.split(",")
             ]
+            tolerance = self.tf[CtrlKey.tolerance].value.strip()
+            self.sim_param.tolerance = float(tolerance) if tolerance != "" else None
+            tilt = self.tf[CtrlKey.tilt].value.strip()
+            self.sim_param.tilt = float(tilt) if tilt != "" else 0.0
+            self.sim_param.antithetic = self.cb_antithetic.value
+            self.sim_param.control_variate = self.cb_control_variate.value
+            self.sim_param.sampler = "sobol" if self.cb_sobol.value is True else "random"
             self.sim_param.check_types()
             return True
         except ValueError:
@@ -217,6 +263,11 @@ class MonteCarloInputView(ft.UserControl):
                 self.tf[CtrlKey.percentiles].value = ",".join(
                     [f"{p}" for p in self.sim_param.percentiles]
                 )
+                self.tf[CtrlKey.tolerance].value = self._tolerance_text()
+                self.tf[CtrlKey.tilt].value = str(self.sim_param.tilt)
+                self.cb_antithetic.value = self.sim_param.antithetic
+                self.cb_control_variate.value = self.sim_param.control_variate
+                self.cb_sobol.value = self.sim_param.sampler == "sobol"
                 self.update()
         except Exception as e:
             self.open_err_dlg(f"読込中にエラーが発生しました: {e}")
@@ -1,10 +1,16 @@
+import io
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import matplotlib
 from matplotlib import rcParams
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import flet as ft
-from flet.matplotlib_chart import MatplotlibChart
 from .table_keys import DataFrameKey
+from .downsample import lttb_indices
+from .sim_histogram import SimHistogram
 
 rcParams["font.family"] = "sans-serif"
 rcParams["font.sans-serif"] = [
@@ -18,24 +24,86 @@ rcParams["font.sans-serif"] = [
     "Noto Sans CJK JP",
 ]
 
+# グラフの描画方法
+# "native": FletのLineChartで描画する(点を間引いてクライアント側で描画するため、切替や拡大縮小が速い)
+# "matplotlib": matplotlibでSVGに描画してImageで表示する
+PLOT_BACKENDS = ("native", "matplotlib")
+
+# グラフの種類
+# "History": 最終年のパーセンタイルに位置するパスの推移, "EachTime": 毎年のパーセンタイルの推移,
+# "Distribution": 最終年の資産額の分布, "Heatmap": 毎年の資産額の分布のヒートマップ
+GRAPH_TYPES = ("History", "EachTime", "Distribution", "Heatmap")
+# LineChartで描画できるグラフの種類(それ以外はplot_backendによらずmatplotlibで描画する)
+NATIVE_GRAPH_TYPES = ("History", "EachTime", "Distribution")
+# 結果をセットした際に先に描画しておく、もう一方のグラフの種類
+PREFETCH_GRAPH_TYPES = {"History": "EachTime", "EachTime": "History"}
+
+# LineChartの系列の色(matplotlibの既定の色の順)
+LINE_COLORS = [
+    "#1f77b4",
+    "#ff7f0e",
+    "#2ca02c",
+    "#d62728",
+    "#9467bd",
+    "#8c564b",
+    "#e377c2",
+    "#7f7f7f",
+    "#bcbd22",
+    "#17becf",
+]
+
 
 class MonteCarloResultView(ft.UserControl):
-    """モンテカルロシミュレーションの結果表示用View
+    """モンテカルロシミュレーションの結果表示用View。
+
+    plot_backend="native"ではグラフをFletのLineChartとして作り、全系列の点の合計がNATIVE_MAX_POINTS以下になるよう
+    折れ線の形を保って間引く(LTTB法)。NATIVE_GRAPH_TYPESの全種類を作っておき、切り替えは表示/非表示のみで行う。
+    plot_backend="matplotlib"ではpyplotを使わずにFigureを作ってSVGの文字列へ描画し、Imageに表示する。
+    描画は専用のスレッドで行い、結果ごとにグラフの種類ごとのSVGをキャッシュするため、
+    グラフの種類を切り替える際は描画し直さない。Figureは描画後すぐに破棄する。
+    Save Plotはどちらの場合もmatplotlibで描画する。
+    分布("Distribution", "Heatmap")は、シミュレーションで蓄積したヒストグラム(SimHistogram)から描画する。
 
     Args:
         ft (_type_): _description_
     """
 
-    def __init__(self, is_web: bool):
-        matplotlib.use("svg")
+    # グラフの大きさ[inch]
+    FIG_SIZE = (6.4, 4.8)
+    # LineChartに送る全系列の点の数の上限
+    NATIVE_MAX_POINTS = 2000
+    # LineChartでタッチした点のツールチップを表示する最大の系列数(多いとツールチップでグラフが隠れる)
+    NATIVE_TOOLTIP_SERIES = 20
+    # ヒートマップの縦軸(資産額)のビン数
+    HEATMAP_BINS = 100
 
+    def __init__(self, is_web: bool, plot_backend: str = "native"):
+        """
+        Args:
+            is_web (bool): Web版かどうか
+            plot_backend (str, optional): グラフの描画方法(PLOT_BACKENDSのいずれか). Defaults to "native".
+
+        Raises:
+            ValueError: 描画方法が不正な場合
+        """
+        if plot_backend not in PLOT_BACKENDS:
+            raise ValueError(f"plot_backend must be one of {PLOT_BACKENDS}")
         super().__init__()
+        self.plot_backend = plot_backend
         self.df_result_desc = None
         self.df_persentile_hisotry = None
         self.df_persentile_eachtime = None
+        self.hist = None  # 分布のグラフ用のヒストグラム
 
-        self.graph_eachtime = True
+        self.graph_kind = "EachTime"  # 表示中のグラフの種類(GRAPH_TYPESのいずれか)
         self.is_web = is_web
+        self.plot_seconds = 0.0  # 直近のグラフ描画にかかった時間[s]
+
+        # 描画用のスレッド(matplotlibの描画を1つずつ行う)と、結果ごとの描画済みSVGのFuture
+        self._render_pool = ThreadPoolExecutor(max_workers=1)
+        self._plot_futures = {}  # グラフの種類(graph_kind) -> Future[(SVG, 描画時間)]
+        self._generation = 0  # set_sim_result()ごとに増やし、古い結果の描画を破棄する
+        self._lock = threading.Lock()
 
     def build(self):
         self.dtbl = ft.DataTable()  # DataTableは単独ではスクロールできないのでRowなりColumnなりでラッパー作る
@@ -45,15 +113,30 @@ class MonteCarloResultView(ft.UserControl):
                 [
                     ft.Radio(value="History", label="最終年のみのパーセンタイル"),
                     ft.Radio(value="EachTime", label="毎年のパーセンタイル"),
+                    ft.Radio(value="Distribution", label="最終年の分布"),
+                    ft.Radio(value="Heatmap", label="毎年の分布"),
                 ],
+                wrap=True,
                 # alignment=ft.MainAxisAlignment.CENTER,
             ),
-            value="EachTime",
+            value=self.graph_kind,
             on_change=self.onchange_graph_type,
         )
 
-        fig = plt.figure()
-        self.chart = MatplotlibChart(figure=fig, expand=True)
+        self.sw_native = ft.Switch(
+            label="Flet Chartで表示",
+            value=self.plot_backend == "native",
+            on_change=self.onchange_plot_backend,
+        )
+
+        w, h = MonteCarloResultView.FIG_SIZE
+        self.chart = ft.Image(src="", fit=ft.ImageFit.FILL, aspect_ratio=w / h, visible=False)
+        # plot_backend="native"のグラフの種類(graph_kind)ごとの表示先
+        self.native_charts = {kind: ft.Column(visible=False) for kind in NATIVE_GRAPH_TYPES}
+        self._native_built = False  # 現在の結果のLineChartを作成済みかどうか
+
+        # 暫定結果の表示中などの状態表示
+        self.txt_status = ft.Text("")
 
         self.row_main = ft.ResponsiveRow(
             [
@@ -65,8 +148,14 @@ class MonteCarloResultView(ft.UserControl):
                 ),
                 ft.Column(
                     [
-                        ft.Container(self.graph_type),
-                        ft.Container(self.chart, width=600),
+                        self.txt_status,
+                        ft.Row([ft.Container(self.graph_type), self.sw_native], wrap=True),
+                        ft.Container(
+                            ft.Column(
+                                [self.chart] + list(self.native_charts.values())
+                            ),
+                            width=600,
+                        ),
                     ],
                     # horizontal_alignment=ft.CrossAxisAlignment.CENTER,
                     col={"lg": 6},
@@ -102,6 +191,10 @@ class MonteCarloResultView(ft.UserControl):
         self.page.overlay.append(self.save_plot_dialog)
         self.page.update()
 
+    def will_unmount(self):
+        """pageから外される前の処理。描画用のスレッドを止める"""
+        self._render_pool.shutdown(wait=False, cancel_futures=True)
+
     def onchange_graph_type(self, e):
         """グラフ種類の選択ボタンが変更されたイベント
 
@@ -110,14 +203,20 @@ class MonteCarloResultView(ft.UserControl):
         Raises:
             ValueError: _description_
         """
-        if e.control.value == "History":
-            self.graph_eachtime = False
-            self.show_result_plot()
-        elif e.control.value == "EachTime":
-            self.graph_eachtime = True
-            self.show_result_plot()
-        else:
+        if e.control.value not in GRAPH_TYPES:
             raise ValueError("Irregular Radio Value")
+        self.graph_kind = e.control.value
+        self.show_result_plot()
+
+    def onchange_plot_backend(self, e):
+        """グラフの描画方法の切替スイッチが変更されたイベント
+
+        Args:
+            e (_type_): _description_
+        """
+        self.plot_backend = "native" if e.control.value is True else "matplotlib"
+        if self.has_result() is True:
+            self.show_result_plot()
 
     def show_result_table(self):
         """シミュレーション結果をパーセンタイルごとにテーブルにして結果表示を行う関数"""
@@ -130,42 +229,92 @@ class MonteCarloResultView(ft.UserControl):
             else:
                 return f"{v:.2%}"
 
-        df = self.df_result_desc[
-            [
-                DataFrameKey.labels.value,
-                DataFrameKey.result.value,
-                DataFrameKey.profit.value,
-                DataFrameKey.profit_ratio.value,
-            ]
+        cols = [
+            DataFrameKey.labels.value,
+            DataFrameKey.result.value,
+            DataFrameKey.profit.value,
+            DataFrameKey.profit_ratio.value,
         ]
+        df = self.df_result_desc[cols]
+        rows = [[cell_text(v) for v in r[1:]] for r in df.itertuples()]  # (idx, c1, c2, c3,...)
+        # 信頼区間があれば1列にまとめて表示する
+        if DataFrameKey.ci_lower.value in self.df_result_desc.columns:
+            cols.append("95%信頼区間[円]")
+            ci = self.df_result_desc[
+                [DataFrameKey.ci_lower.value, DataFrameKey.ci_upper.value]
+            ]
+            for row, (lo, hi) in zip(rows, ci.itertuples(index=False)):
+                row.append(f"{lo:,} 〜 {hi:,}")
+        if DataFrameKey.shortfall.value in self.df_result_desc.columns:
+            cols.append(DataFrameKey.shortfall.value)
+            for row, v in zip(rows, self.df_result_desc[DataFrameKey.shortfall.value]):
+                row.append(f"{int(v):,}")
+
+        # 行と列が同じならセルの文字だけ差し替えて、表をその場で更新する
+        if len(self.dtbl.columns) == len(cols) and len(self.dtbl.rows) == len(rows):
+            for dr, row in zip(self.dtbl.rows, rows):
+                for cell, v in zip(dr.cells, row):
+                    cell.content.value = v
+            return
+
         self.dtbl.columns = [
             ft.DataColumn(ft.Text(c), numeric=True)
             if i > 0
             else ft.DataColumn(ft.Text(c))
-            for i, c in enumerate(df.columns)
+            for i, c in enumerate(cols)
         ]
         self.dtbl.rows = [
-            ft.DataRow(
-                cells=[
-                    ft.DataCell(
-                        ft.Text(
-                            cell_text(v),
-                        )
-                    )
-                    for v in r[1:]
-                ]
-            )
-            for r in df.itertuples()  # (idx, c1, c2, c3,...)
+            ft.DataRow(cells=[ft.DataCell(ft.Text(v)) for v in row]) for row in rows
         ]
 
-    def show_result_plot(self, save_fpath: str = None):
-        """パーセンタイルをグラフ化して表示する関数。
-        ただし、save_figでパスが指定されているならグラフの保存も行う
+    def _get_principal(self) -> float:
+        """最終年の元本を返す関数(結果と利益の差から求める)
+
+        Returns:
+            float: _description_
+        """
+        df = self.df_result_desc
+        if df is None or len(df) == 0:
+            return None
+        return float(df[DataFrameKey.result.value].iloc[0] - df[DataFrameKey.profit.value].iloc[0])
+
+    def _get_hist_message(self, kind: str) -> str:
+        """分布のグラフを描画できない場合の理由を返す関数
 
         Args:
-            save_fpath (str, optional): グラフを保存するファイル名. Defaults to None.
+            kind (str): グラフの種類
+
+        Returns:
+            str: 描画できる場合はNone
         """
-        if self.graph_eachtime is True:
+        if self.hist is None:
+            return "分布のデータがありません(計算完了後に表示されます)"
+        if kind == "Heatmap" and self.hist.per_year is False:
+            return "毎年の分布のデータがありません"
+        return None
+
+    def _get_heatmap(self) -> (np.ndarray, np.ndarray):
+        """毎年のヒストグラムを共通の資産額のビンに振り分け直す関数
+
+        Returns:
+            (np.ndarray, np.ndarray): 各年,各ビンの割合(year, HEATMAP_BINS)と、ビンの境界[円](HEATMAP_BINS+1,)
+        """
+        lo, hi = float(self.hist.lo.min()), float(self.hist.hi.max())
+        n = MonteCarloResultView.HEATMAP_BINS
+        if self.hist.log is True:
+            edges = np.geomspace(lo, hi, n + 1)
+        else:
+            edges = np.linspace(lo, hi, n + 1)
+        return self.hist.rebin(edges), edges
+
+    def _plot_percentiles(self, ax, eachtime: bool):
+        """パーセンタイルの推移のグラフを描画する関数
+
+        Args:
+            ax (_type_): 描画先のAxes
+            eachtime (bool): 毎年のパーセンタイルならTrue、最終年のパーセンタイルの履歴ならFalse
+        """
+        if eachtime is True:
             df = self.df_persentile_eachtime
         else:
             df = self.df_persentile_hisotry
@@ -173,8 +322,6 @@ class MonteCarloResultView(ft.UserControl):
         _df = df.drop(columns=[DataFrameKey.passing_year.value])
         year = df[DataFrameKey.passing_year.value]
 
-        fig = plt.figure()
-        ax = fig.add_subplot()
         for label, item in _df.items():
             # 利益率を%に直して表示
             r = item * 100
@@ -185,36 +332,404 @@ class MonteCarloResultView(ft.UserControl):
         ax.set_ylabel("累積利益率[%]")
         ax.yaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter("{x:,.0f}"))
         ax.set_xlabel("年数[年]")
+
+    def _plot_distribution(self, ax):
+        """最終年の資産額の分布を描画する関数(対数のビンなら横軸も対数にする)
+
+        Args:
+            ax (_type_): 描画先のAxes
+        """
+        edges = self.hist.get_edges()[-1] / 10_000
+        shares = self.hist.get_shares()[-1] * 100
+        ax.stairs(shares, edges, fill=True, alpha=0.6)
+        principal = self._get_principal()
+        if principal is not None:
+            ax.axvline(principal / 10_000, color="tab:red", linestyle="--", label="元本")
+            ax.legend()
+        if self.hist.log is True:
+            ax.set_xscale("log")
+        ax.set_title("最終年の資産額の分布")
+        ax.set_ylabel("割合[%]")
+        ax.set_xlabel("資産額[万円]")
+        ax.xaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter("{x:,.0f}"))
+
+    def _plot_heatmap(self, fig: Figure, ax):
+        """毎年の資産額の分布をヒートマップで描画する関数
+
+        Args:
+            fig (Figure): 描画先のFigure
+            ax (_type_): 描画先のAxes
+        """
+        shares, edges = self._get_heatmap()
+        year = len(shares)
+        x = np.arange(year + 1) + 0.5
+        mesh = ax.pcolormesh(x, edges / 10_000, shares.T * 100, cmap="viridis", shading="flat")
+        fig.colorbar(mesh, ax=ax, label="割合[%]")
+        if self.hist.log is True:
+            ax.set_yscale("log")
+        ax.set_title("毎年の資産額の分布")
+        ax.set_ylabel("資産額[万円]")
+        ax.yaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter("{x:,.0f}"))
+        ax.set_xlabel("年数[年]")
+
+    def build_plot_figure(self, kind: str) -> Figure:
+        """結果のグラフを作成する関数。pyplotに登録しないFigureを返すので、使い終わったら破棄するだけでよい
+
+        Args:
+            kind (str): グラフの種類(GRAPH_TYPESのいずれか)
+
+        Returns:
+            Figure: _description_
+        """
+        fig = Figure(figsize=MonteCarloResultView.FIG_SIZE)
+        ax = fig.add_subplot()
+        if kind in ("History", "EachTime"):
+            self._plot_percentiles(ax, kind == "EachTime")
+        elif self._get_hist_message(kind) is not None:
+            ax.text(0.5, 0.5, self._get_hist_message(kind), ha="center", va="center")
+            ax.set_axis_off()
+        elif kind == "Distribution":
+            self._plot_distribution(ax)
+        else:
+            self._plot_heatmap(fig, ax)
         fig.tight_layout()
+        return fig
 
-        # ファイル名が指定されていたら保存する
-        if save_fpath is not None:
-            fig.savefig(save_fpath, dpi=300)
+    def _build_native_percentiles(self, eachtime: bool) -> list:
+        """パーセンタイルの推移のグラフをFletのLineChartとして作成する関数。
+        全系列の点の合計がNATIVE_MAX_POINTSを超える場合は、系列ごとにLTTB法で点を間引く
 
-        self.chart.figure = fig
-        self.update()
+        Args:
+            eachtime (bool): 毎年のパーセンタイルならTrue、最終年のパーセンタイルの履歴ならFalse
+
+        Returns:
+            list: タイトル,凡例,LineChartのControlのリスト
+        """
+        if eachtime is True:
+            df = self.df_persentile_eachtime
+        else:
+            df = self.df_persentile_hisotry
+
+        labels = [c for c in df.columns if c != DataFrameKey.passing_year.value]
+        x = df[DataFrameKey.passing_year.value].to_numpy()
+        # 利益率を%に直して表示
+        ys = np.nan_to_num(df[labels].to_numpy(dtype=np.float64).T * 100)
+        n_out = max(3, MonteCarloResultView.NATIVE_MAX_POINTS // max(1, len(labels)))
+        idx = lttb_indices(x, ys, n_out)
+
+        series = []
+        legend = []
+        for k, label in enumerate(labels):
+            color = LINE_COLORS[k % len(LINE_COLORS)]
+            points = [
+                ft.LineChartDataPoint(
+                    float(x[i]), float(ys[k, i]), tooltip=f"{label} {x[i]}年: {ys[k, i]:,.0f}%"
+                )
+                for i in idx[k]
+            ]
+            series.append(ft.LineChartData(data_points=points, color=color, stroke_width=1.5))
+            legend.append(
+                ft.Row(
+                    [ft.Container(width=12, height=3, bgcolor=color), ft.Text(label, size=11)],
+                    spacing=4,
+                )
+            )
+
+        y_min, y_max = float(ys.min()), float(ys.max())
+        pad = max((y_max - y_min) * 0.05, 1.0)
+        chart = ft.LineChart(
+            data_series=series,
+            left_axis=ft.ChartAxis(title=ft.Text("累積利益率[%]"), labels_size=50),
+            bottom_axis=ft.ChartAxis(
+                title=ft.Text("年数[年]"),
+                labels_size=30,
+                labels_interval=max(1, round(float(x[-1]) / 10)),
+            ),
+            horizontal_grid_lines=ft.ChartGridLines(
+                color=ft.colors.with_opacity(0.2, ft.colors.ON_SURFACE), width=1
+            ),
+            min_x=float(x[0]),
+            max_x=float(x[-1]),
+            min_y=y_min - pad,
+            max_y=y_max + pad,
+            interactive=len(labels) <= MonteCarloResultView.NATIVE_TOOLTIP_SERIES,
+            height=420,
+        )
+        return [
+            ft.Text("モンテカルロシミュレーション結果", weight=ft.FontWeight.BOLD),
+            ft.Row(legend, wrap=True, spacing=8),
+            chart,
+        ]
+
+    def _build_native_distribution(self) -> list:
+        """最終年の資産額の分布をFletのLineChartとして作成する関数。
+        LineChartは対数軸を持たないため、対数のビンの場合は横軸をlog10(資産額[万円])とし、目盛りに資産額を表示する
+
+        Returns:
+            list: タイトル,凡例,LineChartのControlのリスト
+        """
+        edges = self.hist.get_edges()[-1] / 10_000
+        shares = self.hist.get_shares()[-1] * 100
+        pos = np.log10(edges) if self.hist.log is True else edges
+        centers = (pos[:-1] + pos[1:]) / 2
+        points = [
+            ft.LineChartDataPoint(
+                float(c),
+                float(v),
+                tooltip=f"{edges[i]:,.0f}〜{edges[i + 1]:,.0f}万円: {v:.2f}%",
+            )
+            for i, (c, v) in enumerate(zip(centers, shares))
+        ]
+        series = [
+            ft.LineChartData(
+                data_points=points,
+                color=LINE_COLORS[0],
+                stroke_width=1.5,
+                below_line_bgcolor=ft.colors.with_opacity(0.3, LINE_COLORS[0]),
+            )
+        ]
+        legend = [
+            ft.Row(
+                [ft.Container(width=12, height=3, bgcolor=LINE_COLORS[0]), ft.Text("割合", size=11)],
+                spacing=4,
+            )
+        ]
+        y_max = float(shares.max()) * 1.05 or 1.0
+        principal = self._get_principal()
+        if principal is not None and principal > 0:
+            p = np.log10(principal / 10_000) if self.hist.log is True else principal / 10_000
+            if pos[0] <= p <= pos[-1]:
+                series.append(
+                    ft.LineChartData(
+                        data_points=[
+                            ft.LineChartDataPoint(float(p), 0.0, show_tooltip=False),
+                            ft.LineChartDataPoint(float(p), y_max, show_tooltip=False),
+                        ],
+                        color=LINE_COLORS[3],
+                        stroke_width=1,
+                        dash_pattern=[4, 4],
+                    )
+                )
+                legend.append(
+                    ft.Row(
+                        [ft.Container(width=12, height=3, bgcolor=LINE_COLORS[3]), ft.Text("元本", size=11)],
+                        spacing=4,
+                    )
+                )
+
+        bottom_axis = ft.ChartAxis(title=ft.Text("資産額[万円]"), labels_size=30)
+        if self.hist.log is True:
+            # 1, 2, 5 x 10^k の目盛りのうち範囲内のものを表示する
+            ticks = [
+                m * 10.0**k
+                for k in range(int(np.floor(pos[0])), int(np.ceil(pos[-1])) + 1)
+                for m in (1, 2, 5)
+            ]
+            ticks = [v for v in ticks if pos[0] <= np.log10(v) <= pos[-1]]
+            bottom_axis.labels = [
+                ft.ChartAxisLabel(value=float(np.log10(v)), label=ft.Text(f"{v:,.0f}", size=11))
+                for v in ticks
+            ]
+        chart = ft.LineChart(
+            data_series=series,
+            left_axis=ft.ChartAxis(title=ft.Text("割合[%]"), labels_size=50),
+            bottom_axis=bottom_axis,
+            horizontal_grid_lines=ft.ChartGridLines(
+                color=ft.colors.with_opacity(0.2, ft.colors.ON_SURFACE), width=1
+            ),
+            min_x=float(pos[0]),
+            max_x=float(pos[-1]),
+            min_y=0.0,
+            max_y=y_max,
+            height=420,
+        )
+        return [
+            ft.Text("最終年の資産額の分布", weight=ft.FontWeight.BOLD),
+            ft.Row(legend, wrap=True, spacing=8),
+            chart,
+        ]
+
+    def build_native_chart(self, kind: str) -> list:
+        """結果のグラフをFletのLineChartとして作成する関数
+
+        Args:
+            kind (str): グラフの種類(NATIVE_GRAPH_TYPESのいずれか)
+
+        Returns:
+            list: タイトル,凡例,LineChartのControlのリスト
+        """
+        if kind in ("History", "EachTime"):
+            return self._build_native_percentiles(kind == "EachTime")
+        if self._get_hist_message(kind) is not None:
+            return [ft.Text(self._get_hist_message(kind))]
+        return self._build_native_distribution()
+
+    def _show_native_plot(self):
+        """LineChartのグラフを表示する関数。現在の結果のLineChartがなければ全種類を作成する(画面の更新は呼び出し側で行う)"""
+        t = time.perf_counter()
+        if self._native_built is False:
+            for kind, col in self.native_charts.items():
+                col.controls = self.build_native_chart(kind)
+            self._native_built = True
+            self.plot_seconds = time.perf_counter() - t
+        self.chart.visible = False
+        for kind, col in self.native_charts.items():
+            col.visible = kind == self.graph_kind
+
+    def render_plot_svg(self, kind: str) -> str:
+        """グラフをSVGの文字列に描画する関数
+
+        Args:
+            kind (str): グラフの種類(GRAPH_TYPESのいずれか)
+
+        Returns:
+            str: _description_
+        """
+        fig = self.build_plot_figure(kind)
+        s = io.StringIO()
+        fig.savefig(s, format="svg")
+        fig.clear()
+        return s.getvalue()
+
+    def _request_plot(self, kind: str) -> Future:
+        """現在の結果のグラフの描画を描画用のスレッドへ依頼する関数。描画済み/依頼済みならそのFutureを返す
+
+        Args:
+            kind (str): グラフの種類
+
+        Returns:
+            Future: (SVG, 描画時間)を返すFuture。描画前に結果が差し替えられた場合はNoneを返す
+        """
+        with self._lock:
+            fut = self._plot_futures.get(kind)
+            if fut is None:
+                gen = self._generation
+
+                def render():
+                    # 描画の前後で暫定結果などが次の結果に差し替えられていたら破棄する
+                    if gen != self._generation:
+                        return None
+                    t = time.perf_counter()
+                    svg = self.render_plot_svg(kind)
+                    if gen != self._generation:
+                        return None
+                    return svg, time.perf_counter() - t
+
+                fut = self._render_pool.submit(render)
+                self._plot_futures[kind] = fut
+            return fut
+
+    def _set_plot(self, rendered: tuple) -> bool:
+        """描画済みのSVGをグラフに反映する関数(画面の更新は呼び出し側で行う)
+
+        Args:
+            rendered (tuple): (SVG, 描画時間)。Noneなら反映しない
+
+        Returns:
+            bool: 反映したかどうか
+        """
+        if rendered is None:
+            return False
+        self.chart.src = rendered[0]
+        self.chart.visible = True
+        self.plot_seconds = rendered[1]
+        return True
+
+    def _uses_native(self) -> bool:
+        """表示中のグラフの種類をLineChartで描画するかどうか"""
+        return self.plot_backend == "native" and self.graph_kind in NATIVE_GRAPH_TYPES
+
+    def show_result_plot(self, save_fpath: str = None):
+        """結果をグラフ化して表示する関数。
+        ただし、save_figでパスが指定されているならグラフの保存のみを行う。
+        描画済みのグラフがあればそのまま表示し、なければ描画用のスレッドで描画してから表示する
+
+        Args:
+            save_fpath (str, optional): グラフを保存するファイル名. Defaults to None.
+        """
+        if save_fpath is not None:
+            # 保存時はdpiを指定して描画し直す(画面表示用のmatplotlibの描画と重ならないよう描画用のスレッドで行う)
+            def save():
+                fig = self.build_plot_figure(self.graph_kind)
+                fig.savefig(save_fpath, dpi=300)
+                fig.clear()
+
+            self._render_pool.submit(save).result()
+            return
+
+        if self._uses_native():
+            self._show_native_plot()
+            self.update()
+            return
+
+        for col in self.native_charts.values():
+            col.visible = False
+        kind = self.graph_kind
+        gen = self._generation
+        fut = self._request_plot(kind)
+        if fut.done():
+            if self._set_plot(fut.result()):
+                self.update()
+            return
+
+        def on_done(f: Future):
+            # 描画が終わった時点で同じ結果,同じ種類をmatplotlibで表示していれば反映する
+            if (
+                f.cancelled()
+                or gen != self._generation
+                or kind != self.graph_kind
+                or self._uses_native()
+            ):
+                return
+            if self._set_plot(f.result()):
+                self.update()
+
+        fut.add_done_callback(on_done)
 
     def set_sim_result(
         self,
         df_result_desc: pd.DataFrame,
         df_persentile_eachtime: pd.DataFrame,
         df_persentile_hisotry: pd.DataFrame,
+        status: str = "",
+        hist: SimHistogram = None,
     ):
-        """シミュレーション結果をセットする関数
+        """シミュレーション結果をセットする関数。
+        計算途中の暫定結果を繰り返しセットした場合は、表とグラフをその場で更新する
 
         Args:
             df_result_desc (pd.DataFrame): _description_
             df_persentile_eachtime (pd.DataFrame): _description_
             df_persentile_hisotry (pd.DataFrame): _description_
+            status (str, optional): 結果の状態の表示(暫定結果のパス数など). Defaults to "".
+            hist (SimHistogram, optional): 分布のグラフ用のヒストグラム. Defaults to None(分布は表示しない).
         """
-        self.df_result_desc = df_result_desc
-        self.df_persentile_eachtime = df_persentile_eachtime
-        self.df_persentile_hisotry = df_persentile_hisotry
-
+        with self._lock:
+            self._generation += 1
+            self._plot_futures = {}
+            self._native_built = False
+            self.df_result_desc = df_result_desc
+            self.df_persentile_eachtime = df_persentile_eachtime
+            self.df_persentile_hisotry = df_persentile_hisotry
+            self.hist = hist
+        self.txt_status.value = status
+
+        if self._uses_native():
+            self.show_result_table()
+            self._show_native_plot()
+            self.update()
+            return
+
+        # 表示中の種類のグラフを描画用のスレッドで描画している間に表を作り、揃ってから1度だけ画面を更新する
+        fut = self._request_plot(self.graph_kind)
         self.show_result_table()
-        self.show_result_plot()
-
+        for col in self.native_charts.values():
+            col.visible = False
+        self._set_plot(fut.result())
         self.update()
+        # 切り替えた際にすぐ表示できるよう、もう一方の種類も描画しておく
+        if self.graph_kind in PREFETCH_GRAPH_TYPES:
+            self._request_plot(PREFETCH_GRAPH_TYPES[self.graph_kind])
 
     def has_result(self) -> bool:
         """シミュレーション結果を保持しているかboolで返す関数
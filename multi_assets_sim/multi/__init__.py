@@ -1,2 +1,4 @@
 from multi_assets_sim.multi.multi_monte_carlo_sim import MultiMonteCarloSim
 from multi_assets_sim.multi.multi_monte_carlo_param import MultiMonteCarloParam
+from multi_assets_sim.multi.param_sweep import ParamSweep
+from multi_assets_sim.multi.allocation_optimizer import AllocationOptimizer
@@ -0,0 +1,287 @@
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable
+from .multi_monte_carlo_param import MultiMonteCarloParam
+from .correlated_shock import generate_correlated_shocks, iter_correlated_shocks
+from multi_assets_sim.sim_base import MonteCarloSimBase, SimulationCancelled
+from multi_assets_sim.table_keys import DataFrameKey
+
+# 指定可能な目的関数
+# "median": 下限のパーセンタイルが下限額以上という条件で、最終年の中央値を最大化する
+# "cvar": 最終年の資産額の下位cvar_percentile%の平均(期待ショートフォール)を最大化する(損失のCVaRの最小化)
+OBJECTIVES = ("median", "cvar")
+
+# 全年分の騰落率をメモリ上に残す上限[byte]。超える場合は評価のたびに同じシードから1年ずつ生成し直す
+OPTIMIZE_SHOCK_BYTES = 256 * 1024 * 1024
+# 候補をまとめて評価する際の、1バッチあたりの作業配列の目安サイズ[byte]
+OPTIMIZE_BLOCK_BYTES = 256 * 1024 * 1024
+
+
+class AllocationOptimizer:
+    """構成比率(各アセット0以上、合計1)を最適化するクラス。
+
+    全ての候補で同じ騰落率を使って評価する(共通乱数)。騰落率はOPTIMIZE_SHOCK_BYTESに収まれば全年分を1度だけ生成して残し、
+    収まらなければ評価のたびに同じシードから1年ずつ生成し直す。候補は作業配列がOPTIMIZE_BLOCK_BYTESに
+    収まる数ずつに分けて評価するため、パス数が多くてもメモリ量は一定以下になる。
+    候補は現在の良い候補の平均を中心としたディリクレ分布から1バッチ分まとめて生成し、
+    上位の候補に近づけながら分布の集中度を上げていく(クロスエントロピー法)。
+    評価した全ての候補は残しておき、get_frontier()で中央値と下振れの効率的フロンティアを返す。
+    乱数は擬似乱数のみを使い、param.sampler, tilt, control_variateは使わない(antitheticは使う)。
+    """
+
+    def __init__(
+        self,
+        param: MultiMonteCarloParam,
+        objective: str = "median",
+        floor_percentile: int = 3,
+        floor: float = None,
+        cvar_percentile: int = 5,
+    ):
+        """
+        Args:
+            param (MultiMonteCarloParam): 構成比率以外のパラメータ。param.ratiosは探索の初期値に使う
+            objective (str, optional): 目的関数(OBJECTIVESのいずれか). Defaults to "median".
+            floor_percentile (int, optional): objective="median"で下限を課すパーセンタイル. Defaults to 3.
+            floor (float, optional): floor_percentileの下限額[円]. Defaults to None(最終年の元本).
+            cvar_percentile (int, optional): 期待ショートフォールを求める下位のパーセンタイル. Defaults to 5.
+
+        Raises:
+            ValueError: 目的関数やパーセンタイルが不正な場合
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"objective must be one of {OBJECTIVES}")
+        if not 0 < floor_percentile < 100 or not 0 < cvar_percentile < 100:
+            raise ValueError("percentile must be in 1..99")
+        self.param = param
+        self.objective = objective
+        self.floor_percentile = floor_percentile
+        self.cvar_percentile = cvar_percentile
+        self.floor = floor
+        if floor is None:
+            self.floor = float(param.start + 12 * param.month * param.year)
+
+        # 全候補で共有する騰落率のシード。seedがNoneでもこのインスタンスの中では同じ乱数になる
+        self._seed = np.random.SeedSequence(param.seed)
+        # 全候補で共有する騰落率(year, size, asset_len)。目安に収まらなければNoneとし、評価のたびに生成する
+        self.shocks = None
+        dtype = np.dtype(param.precision)
+        if param.year * param.size * len(param.labels) * dtype.itemsize <= OPTIMIZE_SHOCK_BYTES:
+            self.shocks = generate_correlated_shocks(
+                np.random.default_rng(self._seed),
+                param.profits,
+                param.get_cov_factor(),
+                param.year,
+                param.size,
+                dtype,
+                param.antithetic,
+            )
+        self._growth = None  # リバランスしない場合のアセットごとの騰落率の累積
+        self.candidates = []  # 評価した候補の(構成比率, 中央値, 下限のパーセンタイル, 期待ショートフォール)
+        self.best = None  # 最も良い構成比率
+        self.best_stats = None  # 最も良い構成比率のevaluate()の結果
+
+    def _iter_shocks(self):
+        """全候補で共有する各年の騰落率を順に返すジェネレータ。
+        メモリ上に残していなければ、同じシードから1年ずつ生成し直す(毎回同じ値になる)
+
+        Yields:
+            np.ndarray: 1年分の騰落率(size, asset_len)
+        """
+        if self.shocks is not None:
+            yield from self.shocks
+            return
+        param = self.param
+        for block in iter_correlated_shocks(
+            np.random.default_rng(self._seed),
+            param.profits,
+            param.get_cov_factor(),
+            param.year,
+            param.size,
+            block_year=1,
+            dtype=np.dtype(param.precision),
+            antithetic=param.antithetic,
+        ):
+            yield from block
+
+    def _get_batch_size(self) -> int:
+        """作業配列(累積2つ,最終年の資産額,集計用のコピー)が目安に収まるよう、1度に評価する候補の数を返す関数
+
+        Returns:
+            int: _description_
+        """
+        return int(max(1, OPTIMIZE_BLOCK_BYTES // max(1, self.param.size * 8 * 4)))
+
+    def _get_final(self, ratios: np.ndarray) -> np.ndarray:
+        """構成比率の候補ごとに最終年の資産合計を計算する関数
+
+        Args:
+            ratios (np.ndarray): 構成比率の候補(K, asset_len)
+
+        Returns:
+            np.ndarray: 各パス,各候補の最終年の資産合計(size, K)
+        """
+        start = self.param.start
+        saving = 12.0 * self.param.month
+        if self.param.rebalance is True:
+            # 資産合計 = start * A + 12 * month * B (A, Bはポートフォリオの騰落率の累積)
+            r = ratios.T.astype(np.dtype(self.param.precision))
+            a = np.ones((self.param.size, len(ratios)))
+            b = np.zeros_like(a)
+            for vals in self._iter_shocks():
+                g = vals @ r
+                a *= g
+                b += 1.0
+                b *= g
+            # 作業配列を増やさないよう、その場で最終年の資産額にする
+            a *= start
+            b *= saving
+            a += b
+            return a
+        if self._growth is None:
+            # リバランスしない場合はアセットごとの累積が構成比率によらないので1度だけ計算する
+            a = np.ones((self.param.size, len(self.param.labels)))
+            b = np.zeros_like(a)
+            for vals in self._iter_shocks():
+                a *= vals
+                b += 1.0
+                b *= vals
+            self._growth = start * a + saving * b  # 構成比率1あたりのアセットごとの最終年の資産額
+        return self._growth @ ratios.T
+
+    def evaluate(self, ratios: np.ndarray, cancel_event: threading.Event = None) -> dict:
+        """構成比率の候補をまとめて評価する関数。候補は作業配列が目安に収まる数ずつに分けて計算する
+
+        Args:
+            ratios (np.ndarray): 構成比率の候補(K, asset_len)
+            cancel_event (threading.Event, optional): setされたら候補のバッチの区切りで中断する. Defaults to None.
+
+        Raises:
+            SimulationCancelled: cancel_eventにより中断された場合
+
+        Returns:
+            dict: "median", "floor", "shortfall"をキーとする各候補の値(K,)の辞書
+        """
+        ratios = np.atleast_2d(ratios)
+        n = self.param.size
+        k = max(1, int(np.ceil(n * self.cvar_percentile / 100)))
+        batch = self._get_batch_size()
+        res = {"median": [], "floor": [], "shortfall": []}
+        for k0 in range(0, len(ratios), batch):
+            if cancel_event is not None and cancel_event.is_set():
+                raise SimulationCancelled("Allocation optimization is cancelled")
+            final = self._get_final(ratios[k0 : k0 + batch])  # (size, batch)
+            median, floor = np.percentile(
+                final, [50, self.floor_percentile], axis=0, method="nearest"
+            )
+            res["median"].append(median)
+            res["floor"].append(floor)
+            res["shortfall"].append(np.partition(final, k - 1, axis=0)[:k].mean(axis=0))
+            del final
+        return {key: np.concatenate(v) for key, v in res.items()}
+
+    def _rank(self, stats: dict) -> np.ndarray:
+        """評価結果を良い順に並べたインデックスを返す関数。
+        objective="median"では下限を満たす候補を優先し、満たさない候補は下限のパーセンタイルが高い順とする
+
+        Args:
+            stats (dict): evaluate()の結果
+
+        Returns:
+            np.ndarray: _description_
+        """
+        if self.objective == "cvar":
+            return np.argsort(-stats["shortfall"], kind="stable")
+        feasible = stats["floor"] >= self.floor
+        key = np.where(feasible, stats["median"], stats["floor"])
+        return np.lexsort((-key, ~feasible))
+
+    def optimize(
+        self,
+        iterations: int = 20,
+        batch: int = 128,
+        elite: float = 0.1,
+        progress_fn: Callable[[int, int], None] = None,
+        cancel_event: threading.Event = None,
+    ) -> np.ndarray:
+        """構成比率を最適化する関数
+
+        Args:
+            iterations (int, optional): 候補を生成し直す回数. Defaults to 20.
+            batch (int, optional): 1回に評価する候補の数. Defaults to 128.
+            elite (float, optional): 次の候補の中心に使う上位の候補の割合. Defaults to 0.1.
+            progress_fn (Callable[[int, int], None], optional): (完了した回数, iterations)を受け取る進捗通知用の関数. Defaults to None.
+            cancel_event (threading.Event, optional): setされたら回または候補のバッチの区切りで中断する. Defaults to None.
+
+        Raises:
+            SimulationCancelled: cancel_eventにより中断された場合
+
+        Returns:
+            np.ndarray: 最も良い構成比率(asset_len,)
+        """
+        assets_len = len(self.param.labels)
+        rng = np.random.default_rng(
+            np.random.SeedSequence(self.param.seed, spawn_key=(1,))
+        )
+        n_elite = max(2, int(batch * elite))
+        center = np.clip(np.asarray(self.param.ratios, dtype=np.float64), 0.0, None)
+        center = center / center.sum() if center.sum() > 0 else np.full(assets_len, 1 / assets_len)
+        concentration = float(assets_len)  # 最初は単体全体から広く生成する
+        best, best_stats = None, None
+        for it in range(iterations):
+            if cancel_event is not None and cancel_event.is_set():
+                raise SimulationCancelled("Allocation optimization is cancelled")
+            cand = rng.dirichlet(np.maximum(center * concentration, 1e-2), batch)
+            # 各アセットのみの構成と、これまでの最良の候補も比べる
+            fixed = [np.eye(assets_len)] if it == 0 else []
+            if best is not None:
+                fixed.append(best[np.newaxis, :])
+            cand = np.concatenate(fixed + [cand], axis=0)
+            stats = self.evaluate(cand, cancel_event)
+            for i in range(len(cand)):
+                self.candidates.append(
+                    (cand[i], stats["median"][i], stats["floor"][i], stats["shortfall"][i])
+                )
+            order = self._rank(stats)
+            best = cand[order[0]]
+            best_stats = {k: v[order[0]] for k, v in stats.items()}
+            # 上位の候補の平均へ中心を移し、集中度を上げて探索範囲を狭める
+            center = 0.3 * center + 0.7 * cand[order[:n_elite]].mean(axis=0)
+            concentration *= 1.5
+            if progress_fn is not None:
+                progress_fn(it + 1, iterations)
+        self.best = best
+        self.best_stats = best_stats
+        return best
+
+    def get_frontier(self) -> pd.DataFrame:
+        """評価した候補のうち、中央値と下振れ(下限のパーセンタイルまたは期待ショートフォール)の
+        どちらも他の候補に劣らないもの(効率的フロンティア)を中央値の高い順に返す関数
+
+        Returns:
+            pd.DataFrame: 構成比率,中央値,下限のパーセンタイル,期待ショートフォールの列を持つ
+        """
+        if len(self.candidates) == 0:
+            raise ValueError("Optimization is not executed")
+        ratios = np.array([c[0] for c in self.candidates])
+        median = np.array([c[1] for c in self.candidates])
+        floor = np.array([c[2] for c in self.candidates])
+        shortfall = np.array([c[3] for c in self.candidates])
+        risk = shortfall if self.objective == "cvar" else floor
+
+        # 中央値の高い順に見て、下振れがそれまでの最大を更新するものを残す
+        order = np.lexsort((-risk, -median))
+        keep = []
+        best_risk = -np.inf
+        for i in order:
+            if risk[i] > best_risk:
+                keep.append(i)
+                best_risk = risk[i]
+        return pd.DataFrame(
+            {
+                DataFrameKey.ratios.value: [tuple(np.round(ratios[i], 4).tolist()) for i in keep],
+                MonteCarloSimBase._get_percentile_label(50): median[keep],
+                MonteCarloSimBase._get_percentile_label(self.floor_percentile): floor[keep],
+                DataFrameKey.shortfall.value: shortfall[keep],
+            }
+        )
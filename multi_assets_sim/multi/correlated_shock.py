@@ -0,0 +1,150 @@
+import numpy as np
+from multi_assets_sim.sobol import SobolSampler, sobol_normals
+
+# 1ブロックあたりに生成する乱数の目安サイズ[byte]
+SHOCK_BLOCK_BYTES = 256 * 1024 * 1024
+
+
+def get_block_year(
+    year: int, size: int, assets_len: int, dtype: np.dtype = np.float64
+) -> int:
+    """1度にまとめて生成する年数を、ブロックのメモリ量が目安に収まるように決める関数
+
+    Args:
+        year (int): 運用年数
+        size (int): シミュレーションを行う要素数
+        assets_len (int): アセット数
+        dtype (np.dtype, optional): 乱数の型. Defaults to np.float64.
+
+    Returns:
+        int: 1ブロックあたりの年数(1以上year以下)
+    """
+    per_year = max(1, size * assets_len * np.dtype(dtype).itemsize)
+    return int(min(year, max(1, SHOCK_BLOCK_BYTES // per_year)))
+
+
+def iter_correlated_shocks(
+    rng: np.random.Generator,
+    means: np.ndarray,
+    factor: np.ndarray,
+    year: int,
+    size: int,
+    block_year: int = None,
+    dtype: np.dtype = np.float64,
+    antithetic: bool = False,
+):
+    """相関を持つ各年の騰落率(1+リターン)を数年分まとめて生成するジェネレータ。
+    標準正規乱数を一括で生成し、共分散行列の分解行列Lを掛けることで相関を持たせる。
+
+    Args:
+        rng (np.random.Generator): 乱数生成器
+        means (np.ndarray): 各アセットの平均リターン(asset_len,)
+        factor (np.ndarray): cov = L @ L.T となる分解行列L(asset_len, asset_len)
+        year (int): 運用年数
+        size (int): シミュレーションを行う要素数
+        block_year (int, optional): 1度に生成する年数. Defaults to None(メモリ量から自動決定).
+        dtype (np.dtype, optional): 乱数の型(float64 or float32). Defaults to np.float64.
+        antithetic (bool, optional): 前半のパスの乱数の符号を反転して後半のパスに使うかどうか(対称変量法).
+            j番目と(size+1)//2+j番目のパスが全年で対になる. Defaults to False.
+
+    Yields:
+        np.ndarray: (block_year, size, asset_len)の騰落率
+    """
+    assets_len = len(means)
+    if block_year is None:
+        block_year = get_block_year(year, size, assets_len, dtype)
+    factor_t = np.asarray(factor.T, dtype=dtype)
+    growth = np.asarray(1 + means, dtype=dtype)
+
+    for i in range(0, year, block_year):
+        n = min(block_year, year - i)
+        if antithetic is True:
+            half = rng.standard_normal((n, (size + 1) // 2, assets_len), dtype=dtype)
+            z = np.concatenate([half, -half[:, : size // 2]], axis=1)
+        else:
+            z = rng.standard_normal((n, size, assets_len), dtype=dtype)
+        shocks = z @ factor_t  # (n, size, asset_len)
+        shocks += growth
+        yield shocks
+
+
+def generate_correlated_shocks(
+    rng: np.random.Generator,
+    means: np.ndarray,
+    factor: np.ndarray,
+    year: int,
+    size: int,
+    dtype: np.dtype = np.float64,
+    antithetic: bool = False,
+) -> np.ndarray:
+    """相関を持つ全年分の騰落率(1+リターン)を1度に生成する関数
+
+    Args:
+        rng (np.random.Generator): 乱数生成器
+        means (np.ndarray): 各アセットの平均リターン(asset_len,)
+        factor (np.ndarray): cov = L @ L.T となる分解行列L(asset_len, asset_len)
+        year (int): 運用年数
+        size (int): シミュレーションを行う要素数
+        dtype (np.dtype, optional): 乱数の型(float64 or float32). Defaults to np.float64.
+        antithetic (bool, optional): 前半のパスの乱数の符号を反転して後半のパスに使うかどうか. Defaults to False.
+
+    Returns:
+        np.ndarray: (year, size, asset_len)の騰落率
+    """
+    return next(
+        iter_correlated_shocks(rng, means, factor, year, size, year, dtype, antithetic)
+    )
+
+
+def get_pca_factor(cov: np.ndarray) -> (np.ndarray, np.ndarray):
+    """共分散行列を固有値分解し、分散の大きい主成分から順に並べた分解行列を返す関数
+
+    Args:
+        cov (np.ndarray): 共分散行列(asset_len, asset_len)
+
+    Returns:
+        (np.ndarray, np.ndarray): cov = F @ F.T となる分解行列F(asset_len, asset_len)と、各主成分の分散(asset_len,)
+    """
+    vals, vecs = np.linalg.eigh(cov)
+    order = np.argsort(vals)[::-1]
+    vals = np.maximum(vals[order], 0.0)  # 半正定値でない場合の負の固有値は0に丸める
+    return vecs[:, order] * np.sqrt(vals), vals
+
+
+def generate_qmc_shocks(
+    sampler: SobolSampler,
+    rng: np.random.Generator,
+    start: int,
+    means: np.ndarray,
+    cov: np.ndarray,
+    year: int,
+    size: int,
+    dtype: np.dtype = np.float64,
+    antithetic: bool = False,
+) -> np.ndarray:
+    """Sobol列から相関を持つ全年分の騰落率(1+リターン)を生成する関数。
+    共分散行列の主成分ごとに独立な正規乱数を作り(分散の大きい主成分ほどSobol列の先頭の次元を使う)、
+    主成分の分解行列を掛けて相関を持たせる。
+
+    Args:
+        sampler (SobolSampler): Sobol列の生成器
+        rng (np.random.Generator): Sobol列の次元数を超える分に使う乱数生成器
+        start (int): 最初の点の番号
+        means (np.ndarray): 各アセットの平均リターン(asset_len,)
+        cov (np.ndarray): 共分散行列(asset_len, asset_len)
+        year (int): 運用年数
+        size (int): シミュレーションを行う要素数
+        dtype (np.dtype, optional): 乱数の型(float64 or float32). Defaults to np.float64.
+        antithetic (bool, optional): 前半のパスの乱数の符号を反転して後半のパスに使うかどうか. Defaults to False.
+
+    Returns:
+        np.ndarray: (year, size, asset_len)の騰落率(転置したビュー)
+    """
+    factor, vals = get_pca_factor(cov)
+    n = (size + 1) // 2 if antithetic is True else size
+    z = sobol_normals(sampler, rng, start, n, year, vals, dtype)  # (year, asset_len, n)
+    if antithetic is True:
+        z = np.concatenate([z, -z[:, :, : size // 2]], axis=2)
+    shocks = np.asarray(factor, dtype=dtype) @ z
+    shocks += np.asarray(1 + means, dtype=dtype)[:, np.newaxis]
+    return shocks.transpose(0, 2, 1)
@@ -1,7 +1,32 @@
+import os
 import yaml
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field, asdict
+from multi_assets_sim.single.monte_carlo_param import PRECISIONS, SAMPLERS
+
+# 拡張子 -> 読み込み形式
+PARAM_FILE_FORMATS = {
+    ".xlsx": "excel",
+    ".xlsm": "excel",
+    ".xls": "excel",
+    ".yml": "yaml",
+    ".yaml": "yaml",
+}
+
+# libyamlがあればCで実装されたローダーを使う(結果は同じで、読み込みが数倍速い)
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _load_param_file(fpath: str, return_exceptions: bool):
+    """load_files()でワーカープロセスから呼ぶ関数(プロセス間で渡すためモジュールの関数とする)"""
+    try:
+        return MultiMonteCarloParam.load_file(fpath)
+    except Exception as e:
+        if return_exceptions is False:
+            raise
+        return e
 
 
 @dataclass
@@ -59,9 +84,65 @@ class MultiMonteCarloParam:
         default_factory=lambda: np.array([0.25, 0.25, 0.25, 0.25])
     )
 
+    # 乱数のシード。Noneなら毎回異なる乱数になる
+    seed: int = None
+
+    # 乱数と結果の配列の精度("float64" or "float32")。
+    # float32では乱数と結果の配列をfloat32で持つ(メモリ量が半分)。年ごとの資産額の積算はfloat64で行うが、
+    # float32の正規乱数はfloat64とは別の乱数列になるため、同じシードでもパスごとの結果は一致せず、
+    # パーセンタイルの差はシードを変えた場合と同程度(10万パス,30年で1%前後)になる。
+    # 丸め誤差そのもの(同じ乱数をfloat64で計算した値との相対誤差)は年数とともに増え、実測で30年の平均1e-6程度、最大1e-4程度
+    precision: str = "float64"
+
+    # パーセンタイルの目標相対誤差。指定するとsizeを上限としてパスを追加しながら計算し、
+    # 全パーセンタイルの95%信頼区間の半幅/推定値がこの値以下になった時点で終了する。Noneなら常にsize個計算する
+    tolerance: float = None
+
+    # 分散削減法。antitheticは乱数の符号を反転した対のパスを作る(対称変量法)。
+    # control_variateは解析的に求まる資産額の期待値を使ってパスに重みを付け、重み付きの分布からパーセンタイルを求める(制御変量法)
+    antithetic: bool = False
+    control_variate: bool = False
+
+    # 乱数の生成方法。"random"は擬似乱数、"sobol"はスクランブルしたSobol列(準モンテカルロ)を逆正規分布関数で
+    # 正規乱数に変換し、共分散行列の主成分で相関を持たせて使う。Sobol列は滑らかな集計値ほど少ないパス数で収束する
+    sampler: str = "random"
+
+    # 重点サンプリングの傾き。0より大きいと半分のパスの各年の騰落率を、ポートフォリオのリターンが
+    # 1年あたりtilt標準偏差だけ下がる方向へずらして生成し、尤度比で重み付けする(下位のパーセンタイルと期待ショートフォールの精度が上がる)。
+    # 下位q%を狙う場合は標準正規分布の下側q%点/sqrt(year)の絶対値程度(1%なら2.33/sqrt(year))が目安。0なら使わない
+    tilt: float = 0.0
+
     def __post_init__(self):
         if self.stds is None:
             self.stds = self.get_stds()
+        # 共分散行列の分解結果のキャッシュ(dataclassのfieldにはしない)
+        self._cov_factor = None
+        self._cov_factor_src = None
+
+    def get_cov_factor(self) -> np.ndarray:
+        """共分散行列を cov = L @ L.T と分解した行列Lを返す関数。
+        分解結果はparamにキャッシュし、covが変更されたときのみ再計算する。
+        正定値ならコレスキー分解、半正定値なら固有値分解で計算する。
+
+        Returns:
+            np.ndarray: (asset_len, asset_len)の分解行列L
+        """
+        if self._cov_factor is not None and np.array_equal(
+            self._cov_factor_src, self.cov
+        ):
+            return self._cov_factor
+
+        cov = np.asarray(self.cov, dtype=np.float64)
+        try:
+            factor = np.linalg.cholesky(cov)
+        except np.linalg.LinAlgError:
+            # 半正定値行列の場合は負の固有値を0に丸めて分解する
+            w, v = np.linalg.eigh(cov)
+            factor = v * np.sqrt(np.clip(w, 0.0, None))
+
+        self._cov_factor = factor
+        self._cov_factor_src = cov.copy()
+        return factor
 
     def get_stds(self) -> np.ndarray:
         """標準偏差を計算して返す関数
@@ -142,27 +223,47 @@ class MultiMonteCarloParam:
         Returns:
             MultiMonteCarloParam: _description_
         """
+        # ブックを1度だけ開いて、各シートを読み込む
+        with pd.ExcelFile(fpath) as xls:
+            df_param = xls.parse("sim_param", index_col=None)
+            df_info = xls.parse("asset_info", index_col=0)
+            df_pers = xls.parse("percentiles", index_col=None)
+            df_cor = xls.parse("correlation", index_col=None)
+
         # 基本パラメータ
-        df_param = pd.read_excel(fpath, sheet_name="sim_param", index_col=None)
         year = int(df_param["year"][0])
         start = int(df_param["start"][0])
         month = int(df_param["month"][0])
         size = int(df_param["size"][0])
         rebalance = bool(df_param["rebalance"][0])
+        seed = None
+        if "seed" in df_param and pd.notna(df_param["seed"][0]):
+            seed = int(df_param["seed"][0])
+        precision = "float64"
+        if "precision" in df_param:
+            precision = str(df_param["precision"][0])
+        tolerance = None
+        if "tolerance" in df_param and pd.notna(df_param["tolerance"][0]):
+            tolerance = float(df_param["tolerance"][0])
+        antithetic = bool(df_param["antithetic"][0]) if "antithetic" in df_param else False
+        control_variate = (
+            bool(df_param["control_variate"][0]) if "control_variate" in df_param else False
+        )
+        sampler = str(df_param["sampler"][0]) if "sampler" in df_param else "random"
+        tilt = 0.0
+        if "tilt" in df_param and pd.notna(df_param["tilt"][0]):
+            tilt = float(df_param["tilt"][0])
 
         # アセット情報
-        df_info = pd.read_excel(fpath, sheet_name="asset_info", index_col=0)
         labels = df_info.index.values.tolist()  # ndarray
         profits = df_info["リターン"].values
         stds = df_info["標準偏差"].values
         ratios = df_info["構成比率"].values
 
         # パーセンタイル
-        df_pers = pd.read_excel(fpath, sheet_name="percentiles", index_col=None)
         percentiles = df_pers["パーセンタイル"].values.tolist()
 
-        # 相関係数を読込
-        df_cor = pd.read_excel(fpath, sheet_name="correlation", index_col=None)
+        # 相関係数
         np_cor = df_cor.values
 
         # 相関係数の対称行列に変換
@@ -185,6 +286,13 @@ class MultiMonteCarloParam:
             labels=labels,
             ratios=ratios,
             percentiles=percentiles,
+            seed=seed,
+            precision=precision,
+            tolerance=tolerance,
+            antithetic=antithetic,
+            control_variate=control_variate,
+            sampler=sampler,
+            tilt=tilt,
         )
         param.check_types()
 
@@ -205,6 +313,13 @@ class MultiMonteCarloParam:
                 "month": self.month,
                 "size": self.size,
                 "rebalance": self.rebalance,
+                "seed": self.seed,
+                "precision": self.precision,
+                "tolerance": self.tolerance,
+                "antithetic": self.antithetic,
+                "control_variate": self.control_variate,
+                "sampler": self.sampler,
+                "tilt": self.tilt,
             }
         )
         df_pers = pd.DataFrame({"パーセンタイル": self.percentiles})
@@ -231,7 +346,7 @@ class MultiMonteCarloParam:
             MonteCarloParam: _description_
         """
         with open(fname, encoding="utf-8", mode="r") as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=_YAML_LOADER)
             stds = np.array(data["stds"])
             profits = np.array(data["profits"])
             ratios = np.array(data["ratios"])
@@ -259,10 +374,75 @@ class MultiMonteCarloParam:
                 labels=data["labels"],
                 ratios=ratios,
                 percentiles=data["percentiles"],
+                seed=data.get("seed"),
+                precision=data.get("precision", "float64"),
+                tolerance=data.get("tolerance"),
+                antithetic=data.get("antithetic", False),
+                control_variate=data.get("control_variate", False),
+                sampler=data.get("sampler", "random"),
+                tilt=float(data.get("tilt", 0.0)),
             )
             param.check_types()
             return param
 
+    @classmethod
+    def load_file(cls, fpath: str):
+        """拡張子に応じて、エクセルまたはYamlファイルからパラメータを読み込む関数
+
+        Args:
+            fpath (str): ファイル名(.xlsx, .xlsm, .xls, .yml, .yaml)
+
+        Raises:
+            ValueError: 拡張子が不明な場合
+
+        Returns:
+            MultiMonteCarloParam: _description_
+        """
+        fmt = PARAM_FILE_FORMATS.get(os.path.splitext(fpath)[1].lower())
+        if fmt == "excel":
+            return cls.load_excel(fpath)
+        if fmt == "yaml":
+            return cls.load_yaml(fpath)
+        raise ValueError(f"file extension must be one of {sorted(PARAM_FILE_FORMATS)}")
+
+    @classmethod
+    def load_files(cls, fpaths: list[str], workers: int = None, return_exceptions: bool = False):
+        """多数のエクセル,Yamlファイルからパラメータを並列に読み込む関数。
+        エクセルの解析はPythonで行われGILを解放しないため、スレッドではなくプロセスプールで並列化する。
+        workers>1の場合は、スクリプトから呼ぶ際に if __name__ == "__main__": の中で呼ぶこと
+
+        Args:
+            fpaths (list[str]): ファイル名のリスト
+            workers (int, optional): 並列に読み込むプロセス数. Defaults to None(CPU数とファイル数の小さい方).
+            return_exceptions (bool, optional): 読み込めなかったファイルの例外を結果に入れて続けるかどうか.
+                Defaults to False(最初の例外を送出する).
+
+        Raises:
+            ValueError: workersが0以下の場合
+
+        Returns:
+            list[MultiMonteCarloParam]: fpathsと同じ順のパラメータ(return_exceptions=Trueなら読み込めなかったものは例外)
+        """
+        fpaths = list(fpaths)
+        if workers is None:
+            workers = min(os.cpu_count() or 1, len(fpaths))
+        if workers <= 0 and len(fpaths) > 0:
+            raise ValueError("workers must be positive")
+        if workers <= 1:
+            return [_load_param_file(fpath, return_exceptions) for fpath in fpaths]
+
+        # プロセス間の受け渡しの回数を減らすため、1プロセスあたり4回程度に分けて渡す
+        chunksize = max(1, len(fpaths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    _load_param_file,
+                    fpaths,
+                    [return_exceptions] * len(fpaths),
+                    chunksize=chunksize,
+                )
+            )
+
     def save_yaml(self, fname: str):
         """Yamlファイルへ設定を保存する関数
 
@@ -299,6 +479,24 @@ class MultiMonteCarloParam:
             raise ValueError("percentile must be list")
         if any([isinstance(p, int) is False for p in self.percentiles]):
             raise ValueError("percentile must be list of int")
+        if self.seed is not None and isinstance(self.seed, int) is False:
+            raise ValueError("seed must be int or None")
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}")
+        if self.tolerance is not None and (
+            isinstance(self.tolerance, float) is False or self.tolerance <= 0
+        ):
+            raise ValueError("tolerance must be positive float or None")
+        if isinstance(self.antithetic, bool) is False:
+            raise ValueError("antithetic must be bool")
+        if isinstance(self.control_variate, bool) is False:
+            raise ValueError("control_variate must be bool")
+        if self.sampler not in SAMPLERS:
+            raise ValueError(f"sampler must be one of {SAMPLERS}")
+        if isinstance(self.tilt, (int, float)) is False or self.tilt < 0:
+            raise ValueError("tilt must be non-negative float")
+        if self.tilt > 0 and self.control_variate is True:
+            raise ValueError("tilt can not be used with control_variate")
         # 行列チェック
         if self.cov.shape != (dim, dim):
             raise ValueError(f"cov matrix shape must be ({dim},{dim})")
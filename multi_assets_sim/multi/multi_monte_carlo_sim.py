@@ -1,17 +1,20 @@
+import time
+import threading
 import numpy as np
 import pandas as pd
+from typing import Callable
 from .multi_monte_carlo_param import MultiMonteCarloParam
-from multi_assets_sim.table_keys import DataFrameKey
+from .correlated_shock import iter_correlated_shocks, generate_qmc_shocks
+from multi_assets_sim.sim_base import MonteCarloSimBase
 
 
-class MultiMonteCarloSim:
+class MultiMonteCarloSim(MonteCarloSimBase):
     """相関を持つ複数アセットでモンテカルロシミュレーションを行うクラス"""
 
     def __init__(self):
-        self.param = None
+        super().__init__()
         self.all_pattern = None
-        self.result = None
-        self.org = None  # 元本計算用
+        self.keep_all_pattern = True
 
     def set_param(self, param: MultiMonteCarloParam):
         """Dataclassを用いてパラメータのセットを行う関数
@@ -19,179 +22,283 @@ class MultiMonteCarloSim:
         Args:
             param (MonteCarloParam): _description_
         """
-        self.param = param
+        super().set_param(param)
 
-    def simulate(self):
-        """積立資産のモンテカルロシミュレーションを行う関数。途中経過も残すためメモリ量に注意"""
-        rng = np.random.default_rng()
+    def simulate(
+        self,
+        keep_all_pattern: bool = True,
+        chunk_size: int = None,
+        keep_result: bool = True,
+        workers: int = 1,
+        store_dir: str = None,
+        progress_fn: Callable[[int, int], None] = None,
+        cancel_event: threading.Event = None,
+        interim_fn: Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None] = None,
+        interim_interval: float = 0.3,
+        keep_growth: bool = False,
+        hist_bins: int = None,
+        hist_per_year: bool = False,
+    ):
+        """積立資産のモンテカルロシミュレーションを行う関数。
 
-        year = self.param.year
-        size = self.param.size
-        means = self.param.profits
-        cov = self.param.cov
-        ratio = self.param.ratios
-        rebalance = self.param.rebalance
-        month = self.param.month
-        start = self.param.start
-        assets_len = len(self.param.labels)
+        keep_all_pattern=Trueでは全アセットの途中経過(year, size, asset_len)を残すためメモリ量に注意。
+        Falseにすると各年の資産合計(year, size)のみを記録し、アセットごとの状態は
+        その年の分(size, asset_len)しか保持しない。パーセンタイルの計算結果はどちらも同じになる。
 
-        # 元本
-        org = np.arange(1, year + 1) * 12 * month + start
-
-        # シミュレーションパターン
-        pattern = np.zeros((year, size, assets_len))
-
-        for i in range(year):
-            vals = rng.multivariate_normal(
-                1 + means, cov, size=size
-            )  # (size,asset_len)
-            if i == 0:
-                prev = (
-                    np.ones((size, assets_len)) * (start + 12.0 * month) * ratio
-                )  # (size, asset_len)
-            else:
-                if rebalance is False:
-                    prev = pattern[i - 1, :] + (12.0 * month) * ratio
-                else:
-                    sums = pattern[i - 1, :].sum(axis=1)  # シミュレーションパターンごとに資産額を合計(size)
-                    reb = (
-                        sums[:, np.newaxis] * ratio
-                    )  # sums(size,)->(size,1)と列ベクトルに拡張し、行ベクトルratio(asset_len,)と乗算してリバランス後の値を計算(size, asset_len)
-                    prev = reb + (12.0 * month) * ratio
+        Args:
+            keep_all_pattern (bool, optional): アセットごとの全パターンをall_patternに残すかどうか. Defaults to True.
+            chunk_size (int, optional): 1度に計算するパス数. Defaults to None(自動).
+            keep_result (bool, optional): 全パスの資産合計をresultに残すかどうか. Defaults to True.
+            workers (int, optional): 並列に計算するプロセス数. Defaults to 1.
+            store_dir (str, optional): 全パスの配列を.npyファイルとして確保するディレクトリ. Defaults to None(メモリ上に確保).
+            progress_fn (Callable[[int, int], None], optional): (計算済みのパス数, 全パス数)を受け取る進捗通知用の関数. Defaults to None.
+            cancel_event (threading.Event, optional): setされたらブロックの区切りで計算を中断する. Defaults to None.
+            interim_fn (Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None], optional):
+                計算途中のパスから求めた暫定の(describe, eachtime, history)を受け取る関数. Defaults to None.
+            interim_interval (float, optional): 暫定結果を通知する最小間隔[s]. Defaults to 0.3.
+            keep_growth (bool, optional): reprice()用の騰落率の累積を残すかどうか. Defaults to False.
+            hist_bins (int, optional): 蓄積するヒストグラムのビン数. Defaults to None(蓄積しない).
+            hist_per_year (bool, optional): 最終年だけでなく各年のヒストグラムも蓄積するかどうか. Defaults to False.
+
+        Raises:
+            SimulationCancelled: cancel_eventにより中断された場合
+        """
+        self.keep_all_pattern = keep_all_pattern
+        super().simulate(
+            chunk_size,
+            keep_result,
+            workers,
+            store_dir,
+            progress_fn,
+            cancel_event,
+            interim_fn,
+            interim_interval,
+            keep_growth,
+            hist_bins,
+            hist_per_year,
+        )
 
-            pattern[i, :] = prev * vals  # 要素積
+    def _store_names(self) -> list[str]:
+        """シミュレーション結果として全パスを記録する配列の属性名を返す関数
 
-        # 全パターンを記録
-        self.all_pattern = pattern
-        # 各年,各パターンごとに資産合計を取って利益計算(year, size)。これでsingle互換の結果
-        self.result = pattern.sum(axis=2)
-        self.org = org
+        Returns:
+            list[str]: _description_
+        """
+        return super()._store_names() + ["all_pattern"]
 
-    def has_result(self) -> bool:
-        """シミュレーション結果を保持しているかどうか
+    def _get_export_arrays(self) -> dict:
+        """npz形式で書き出す配列の辞書を返す関数。アセットのラベルも書き出す
 
         Returns:
-            bool: _description_
+            dict: 配列名 -> 配列
         """
-        if self.result is None:
-            return False
-        else:
-            return True
+        arrays = super()._get_export_arrays()
+        arrays["labels"] = np.array(self.param.labels, dtype=str)
+        return arrays
 
-    def get_result(self) -> np.ndarray:
-        """シミュレーション結果のndarrayを返す関数
+    def _get_export_columns(self, sl: slice) -> dict:
+        """slの範囲のパスの結果を、(パス, 年)の順に平らにした列の辞書で返す関数。
+        全アセットのパターンを残している場合は、アセットごとの資産額の列も加える
 
-        Raises:
-            ValueError: _description_
+        Args:
+            sl (slice): 書き出すパスの範囲
 
         Returns:
-            np.ndarray: _description_
+            dict: 列名 -> 値の1次元配列
         """
-        if self.result is None:
-            raise ValueError("Simulation result is not Calculated")
-        return self.result
+        cols = super()._get_export_columns(sl)
+        if self.all_pattern is not None:
+            pattern = self.all_pattern[:, sl, :]
+            for k, label in enumerate(self.param.labels):
+                cols[label] = pattern[:, :, k].T.ravel()
+        return cols
 
-    def _get_percentile_label(self, i: int) -> str:
-        """パーセンタイルの値を表示用に整形する。
-        50を中央値、1~49を下位1~49%, 51~99を上位49~1%とする
+    def _get_store_shapes(self, size: int, keep_result: bool) -> dict:
+        """今回のシミュレーションで確保する配列の属性名と形状を返す関数。
+        全アセットのパターンを残す場合はall_patternも確保する
 
         Args:
-            i (int): Percentilの値。0~100のint想定
+            size (int): シミュレーション数
+            keep_result (bool): 全パスの資産合計をresultに残すかどうか
 
         Returns:
-            str: 表示用に整形した文字列
+            dict: 属性名 -> 形状の辞書
         """
-        if i > 50:
-            return f"上位{100-i}%"
-        elif i == 50:
-            return "中央値"
-        else:
-            return f"下位{i}%"
+        shapes = super()._get_store_shapes(size, keep_result)
+        if self.keep_all_pattern is True:
+            shapes["all_pattern"] = (self.param.year, size, len(self.param.labels))
+        return shapes
 
-    def get_percentile_describe(self) -> pd.DataFrame:
-        """パーセンタイルと分析値を作成してDataFrameとして返す
+    def _save_store_param(self, fpath: str):
+        """store_dirへパラメータを保存する関数
 
-        Raises:
-            ValueError: _description_
+        Args:
+            fpath (str): yamlファイル名
+        """
+        self.param.save_yaml(fpath)
+
+    @classmethod
+    def _load_store_param(cls, fpath: str) -> MultiMonteCarloParam:
+        """store_dirからパラメータを読み込む関数
+
+        Args:
+            fpath (str): yamlファイル名
 
         Returns:
-            pd.DataFrame: _description_
+            MultiMonteCarloParam: _description_
         """
-        if self.result is None or self.org is None:
-            raise ValueError("Simulation result is not Calculated")
-        idxs = self.param.percentiles
-        labels = [self._get_percentile_label(i) for i in idxs]
-        pers = np.percentile(self.result[-1, :], idxs, method="nearest").astype(int)
-        diff = pers - self.org[-1]
-        plus_ratio = diff / self.org[-1]
-        df = pd.DataFrame(
-            {
-                DataFrameKey.percentile.value: idxs,
-                DataFrameKey.labels.value: labels,
-                DataFrameKey.result.value: pers,
-                DataFrameKey.profit.value: diff,
-                DataFrameKey.profit_ratio.value: plus_ratio,
-            }
-        )
-        df.sort_values(DataFrameKey.result.value, inplace=True, ascending=False)
-        df.reset_index(inplace=True, drop=True)
-        # print(df)
-        return df
+        return MultiMonteCarloParam.load_yaml(fpath)
 
-    def get_percentile_history(self):
-        """パーセンタイルを計算し、その利益率の推移をDataFrameとして返す。
-        なお、パーセンタイルは最終結果から計算し、それに対応する過去の履歴を使っている。
-        その時点時点でのパーセンタイルを使う場合は別の関数を利用する。
-
-        Raises:
-            ValueError: _description_
+    def _get_assets_len(self) -> int:
+        """1年あたりに使う正規乱数の数(アセット数)を返す関数
 
         Returns:
-            _type_: _description_
+            int: _description_
         """
-        if self.result is None and self.org is None:
-            raise ValueError("Simulation result is not Calculated")
-        idxs = self.param.percentiles
-        last = self.result[-1, :]
-        pers = np.percentile(last, idxs, method="nearest")
-        data = {}
-        for i, p in zip(idxs, pers):
-            i_p = np.where(last == p)[0][0]  # 一致するidxを探す(2次元タプルを外してる)
-            # 利益率に変換
-            data[self._get_percentile_label(i)] = (
-                self.result[:, i_p] - self.org
-            ) / self.org
-        data[DataFrameKey.passing_year.value] = np.arange(1, self.param.year + 1)
-        df = pd.DataFrame(data)
-        return df
-
-    def get_percentile_eachtime(self):
-        """パーセンタイルを計算し、その利益率の推移をDataFrameとして返す。
-        なお、パーセンタイルはその時刻ごとに計算している。
+        return len(self.param.labels)
 
-        Raises:
-            ValueError: _description_
+    def _get_expected_totals(self) -> np.ndarray:
+        """積立のスケジュールと平均リターンから解析的に求めた各年の資産合計の期待値を返す関数。
+        各年の騰落率は前年までの資産額と独立なので、リバランスする場合は
+        E_t = (E_{t-1} + 12*month) * Σ ratio*(1+profits)、しない場合はアセットごとに
+        E_t = (E_{t-1} + 12*month*ratio) * (1+profits) を積み上げて合計する
 
         Returns:
-            _type_: _description_
+            np.ndarray: 各年の資産合計の期待値(year,)
         """
-        if self.result is None and self.org is None:
-            raise ValueError("Simulation result is not Calculated")
-        idxs = self.param.percentiles
-        src = np.zeros((self.param.year, len(idxs)))
+        ratio = np.asarray(self.param.ratios, dtype=np.float64)
+        growth = 1 + np.asarray(self.param.profits, dtype=np.float64)
+        month = self.param.month
+        expected = np.zeros(self.param.year)
+        cur = self.param.start * ratio  # アセットごとの期待値
         for i in range(self.param.year):
-            src[i, :] = np.percentile(self.result[i, :], idxs, method="nearest")
-            # 利益率に変換
-            src[i, :] = (src[i, :] - self.org[i]) / self.org[i]
-
-        cols = [self._get_percentile_label(p) for p in idxs]
-        df = pd.DataFrame(data=src, columns=cols)
-        df[DataFrameKey.passing_year.value] = np.arange(1, self.param.year + 1)
-        # print(df)
-        return df
-
-    def get_hist(self) -> (np.ndarray, np.ndarray):
-        if self.result is None:
-            raise ValueError("Simulation result is not Calculated")
-        h, b = np.histogram(self.result[-1, :], bins="sturges", density=True)
-        return h, b
+            if self.param.rebalance is True and i > 0:
+                cur = cur.sum() * ratio
+            cur = (cur + 12.0 * month * ratio) * growth
+            expected[i] = cur.sum()
+        return expected
+
+    def _simulate_block(
+        self, rng: np.random.Generator, sl: slice
+    ) -> (np.ndarray, np.ndarray):
+        """ブロック1つ分のシミュレーションを行う関数。
+        all_patternを確保している場合はアセットごとの値も書き込む。
+        重点サンプリングでは、半分のパスの騰落率をポートフォリオのリターンが下がる方向
+        d = cov @ ratios / sqrt(ratios @ cov @ ratios) へ毎年tiltだけずらす(dは1標準偏差分)。
+
+        Args:
+            rng (np.random.Generator): このブロック用の乱数生成器
+            sl (slice): 全パスのうちこのブロックが担当する範囲
+
+        Returns:
+            (np.ndarray, np.ndarray): 各年,各パターンの資産合計(year, n)と、重点サンプリングの場合は各パスの重み(n,)
+        """
+        year = self.param.year
+        size = sl.stop - sl.start
+        means = self.param.profits
+        factor = self.param.get_cov_factor()  # 共分散行列の分解はparamにキャッシュされる
+        ratio = self.param.ratios
+        rebalance = self.param.rebalance
+        month = self.param.month
+        start = self.param.start
+        assets_len = len(self.param.labels)
+        dtype = np.dtype(self.param.precision)
+
+        tilt = self.param.tilt
+        port_std = np.sqrt(max(float(ratio @ self.param.cov @ ratio), 0.0))
+        if tilt > 0 and port_std > 0:
+            direction = self.param.cov @ ratio / port_std
+            tilted = self._get_tilted(sl)
+            proj = np.zeros(size)  # 騰落率を方向dへ射影した値の合計(標準偏差単位)
+        else:
+            tilted = None
+
+        # 各年,各パターンごとの資産合計(year, size)
+        result = np.zeros((year, size), dtype=dtype)
+
+        # reprice()用の騰落率の累積(資産合計 = start * A_t + 12 * month * B_t)。
+        # リバランスする場合はポートフォリオの騰落率、しない場合はアセットごとに累積して構成比率で合計する
+        growth_a = np.ones(size) if rebalance is True else np.ones((size, assets_len))
+        growth_b = np.zeros_like(growth_a)
+
+        i = 0
+        prev = None  # 前年のアセットごとの資産額(size, asset_len)。precisionによらずfloat64で積算する
+        # 乱数生成(ジェネレータから次の数年分を取り出す時間を含む),累積,資産合計の集約の時間
+        t_shock = t_acc = t_reduce = 0.0
+        t = time.perf_counter()
+        if self.sobol is not None:
+            # Sobol列は年とアセットの次元をまとめて割り当てるので、全年分を1度に生成する
+            blocks = [
+                generate_qmc_shocks(
+                    self.sobol,
+                    rng,
+                    self._get_qmc_start(sl),
+                    means,
+                    self.param.cov,
+                    year,
+                    size,
+                    dtype,
+                    self.param.antithetic,
+                )
+            ]
+        else:
+            # 相関を持つ騰落率を数年分ずつまとめて生成する
+            blocks = iter_correlated_shocks(
+                rng, means, factor, year, size, dtype=dtype, antithetic=self.param.antithetic
+            )
+        for shocks in blocks:
+            t1 = time.perf_counter()
+            t_shock += t1 - t
+            for vals in shocks:  # (size,asset_len)
+                if tilted is not None:
+                    vals[tilted] -= tilt * direction
+                    proj += (vals @ ratio - (1 + means) @ ratio) / port_std
+                t2 = time.perf_counter()
+                t_shock += t2 - t1
+                if i == 0:
+                    cur = (
+                        np.ones((size, assets_len)) * (start + 12.0 * month) * ratio
+                    )  # (size, asset_len)
+                else:
+                    if rebalance is False:
+                        cur = prev + (12.0 * month) * ratio
+                    else:
+                        sums = prev.sum(axis=1)  # シミュレーションパターンごとに資産額を合計(size)
+                        reb = (
+                            sums[:, np.newaxis] * ratio
+                        )  # sums(size,)->(size,1)と列ベクトルに拡張し、行ベクトルratio(asset_len,)と乗算してリバランス後の値を計算(size, asset_len)
+                        cur = reb + (12.0 * month) * ratio
+
+                cur *= vals  # 要素積
+                t3 = time.perf_counter()
+                result[i, :] = cur.sum(axis=1)
+                t4 = time.perf_counter()
+                t_reduce += t4 - t3
+                if self.growth_start is not None:
+                    c = vals @ ratio if rebalance is True else vals
+                    growth_a *= c
+                    growth_b += 1.0
+                    growth_b *= c
+                    if rebalance is True:
+                        self.growth_start[i, sl] = growth_a
+                        self.growth_month[i, sl] = growth_b
+                    else:
+                        self.growth_start[i, sl] = growth_a @ ratio
+                        self.growth_month[i, sl] = growth_b @ ratio
+                if self.all_pattern is not None:
+                    self.all_pattern[i, sl] = cur
+                prev = cur
+                i += 1
+                t1 = time.perf_counter()
+                t_acc += (t3 - t2) + (t1 - t4)
+            t = time.perf_counter()
+        self.profile.add("shock", t_shock)
+        self.profile.add("accumulate", t_acc)
+        self.profile.add("reduce", t_reduce)
+
+        weights = None
+        if tilted is not None:
+            weights = self._get_is_weights(proj)
+        elif tilt > 0:
+            weights = np.ones(size)  # ポートフォリオの分散が0ならずらさない
+        return result, weights
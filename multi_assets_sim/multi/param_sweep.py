@@ -0,0 +1,244 @@
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable
+from .multi_monte_carlo_param import MultiMonteCarloParam
+from multi_assets_sim.sim_base import MonteCarloSimBase, SimulationCancelled, SEED_BLOCK
+from multi_assets_sim.table_keys import DataFrameKey
+
+# 構成比率の候補をまとめて計算する際の、1バッチあたりの作業配列の目安サイズ[byte]
+SWEEP_BLOCK_BYTES = 256 * 1024 * 1024
+# 全組合せで共有する相関付きの乱数を全年分残しておく上限[byte]。超える場合は組合せのグループごとに生成し直す
+SWEEP_SHOCK_BYTES = 256 * 1024 * 1024
+
+
+class ParamSweep:
+    """基本のパラメータから構成比率,リバランス,積立額,運用年数,リターンを変えた全ての組合せを比較するクラス。
+
+    全ての組合せで同じ標準正規乱数(共通乱数)を使うため、組合せ間の差に乱数のばらつきがほとんど乗らない。
+    乱数はMultiMonteCarloSim.simulate()と同じく、SEED_BLOCKごとにSeedSequence.spawn()で派生させた乱数列から
+    1年分ずつ取り出すので、シードを指定していれば基本のパラメータの行はsimulate()と同じパスから求まる。
+    各年の相関付きの乱数 z @ L.T は年ごとに1度だけ計算し、リターンの候補はその平均を足すだけで済ませる。
+    各年の資産合計は start * A_t + 12 * month * B_t (A_t, B_t は騰落率の累積)と表せるので、
+    積立額の候補は累積を1度計算すれば1次式で求まり、構成比率の候補は配列の軸としてまとめて計算する。
+    リバランスしない場合はアセットごとの累積が構成比率によらないため、構成比率を掛けるのは集計時のみでよい。
+    param.sampler="sobol", tilt, control_variateはパスや重みが組合せごとに変わるため使えない(antitheticは使う)。
+    """
+
+    def __init__(self, param: MultiMonteCarloParam):
+        """
+        Args:
+            param (MultiMonteCarloParam): 基本のパラメータ。候補を指定しない項目はこの値を使う
+        """
+        self.param = param
+        self.shocks = None  # 全組合せで共有する相関付きの乱数 z @ L.T (year, size, asset_len)。SWEEP_SHOCK_BYTES以下の場合のみ残す
+        self._shock_key = None  # self.shocksを生成した際のシード,パス数,型,分解行列
+
+    def _check_param(self):
+        """共通乱数で比較できないパラメータを指定していないか確認する関数
+
+        Raises:
+            ValueError: sampler="sobol", tilt, control_variateを指定している場合
+        """
+        param = self.param
+        if param.sampler != "random":
+            raise ValueError("ParamSweep supports only sampler='random'")
+        if param.tilt > 0:
+            raise ValueError("ParamSweep does not support tilt")
+        if param.control_variate is True:
+            raise ValueError("ParamSweep does not support control_variate")
+
+    def _iter_shocks(self, entropy: int, year: int, factor_t: np.ndarray):
+        """各年の相関付きの乱数 z @ L.T (平均リターンは足さない)を1年分ずつ返すジェネレータ。
+        simulate()と同じくSEED_BLOCKごとに派生させた乱数列から、各ブロックの乱数を年の順に取り出す。
+        全年分がSWEEP_SHOCK_BYTES以下なら1度だけ生成してself.shocksに残し、次回以降はそれを返す
+
+        Args:
+            entropy (int): ルートのSeedSequenceのエントロピー
+            year (int): 必要な年数
+            factor_t (np.ndarray): 分解行列の転置L.T(asset_len, asset_len)
+
+        Yields:
+            np.ndarray: (size, asset_len)の相関付きの乱数
+        """
+        param = self.param
+        size = param.size
+        assets_len = len(param.labels)
+        dtype = np.dtype(param.precision)
+        key = (entropy, size, dtype.str, param.antithetic, factor_t.tobytes())
+        if self.shocks is not None and self._shock_key == key and self.shocks.shape[0] >= year:
+            yield from self.shocks[:year]
+            return
+
+        keep = year * size * assets_len * dtype.itemsize <= SWEEP_SHOCK_BYTES
+        self.shocks = np.empty((year, size, assets_len), dtype=dtype) if keep is True else None
+        self._shock_key = None  # 途中で中断された場合に生成途中の乱数を使わないよう、生成し終えてから設定する
+        n_blocks = -(-size // SEED_BLOCK)
+        rngs = [np.random.default_rng(ss) for ss in np.random.SeedSequence(entropy).spawn(n_blocks)]
+        for t in range(year):
+            out = self.shocks[t] if keep is True else np.empty((size, assets_len), dtype=dtype)
+            for i, rng in enumerate(rngs):
+                sl = slice(i * SEED_BLOCK, min((i + 1) * SEED_BLOCK, size))
+                n = sl.stop - sl.start
+                if param.antithetic is True:
+                    half = rng.standard_normal(((n + 1) // 2, assets_len), dtype=dtype)
+                    z = np.concatenate([half, -half[: n // 2]])
+                else:
+                    z = rng.standard_normal((n, assets_len), dtype=dtype)
+                out[sl] = z @ factor_t
+            if keep is True and t == year - 1:
+                self._shock_key = key
+            yield out
+
+    @staticmethod
+    def _as_grid(values, base: np.ndarray, name: str) -> np.ndarray:
+        """アセットごとの値の候補を(候補数, asset_len)の配列にする関数
+
+        Args:
+            values (list | np.ndarray): 候補のリスト。Noneなら基本の値のみ
+            base (np.ndarray): 基本の値(asset_len,)
+            name (str): エラーメッセージ用の名前
+
+        Raises:
+            ValueError: 候補の長さがアセット数と異なる場合
+
+        Returns:
+            np.ndarray: _description_
+        """
+        if values is None:
+            return np.asarray(base, dtype=np.float64)[np.newaxis, :]
+        grid = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        if grid.ndim != 2 or grid.shape[1] != len(base) or grid.shape[0] == 0:
+            raise ValueError(f"{name} must be list of arrays of length {len(base)}")
+        return grid
+
+    def sweep(
+        self,
+        ratios: list = None,
+        rebalance: list[bool] = None,
+        month: list[int] = None,
+        year: list[int] = None,
+        profits: list = None,
+        progress_fn: Callable[[int, int], None] = None,
+        cancel_event: threading.Event = None,
+    ) -> pd.DataFrame:
+        """全ての組合せの最終年のパーセンタイルを計算する関数
+
+        Args:
+            ratios (list, optional): 構成比率の候補のリスト(各要素は(asset_len,)). Defaults to None(基本の値のみ).
+            rebalance (list[bool], optional): リバランスの有無の候補. Defaults to None(基本の値のみ).
+            month (list[int], optional): 毎月積立額の候補. Defaults to None(基本の値のみ).
+            year (list[int], optional): 運用年数の候補. Defaults to None(基本の値のみ).
+            profits (list, optional): 各アセットの平均リターンの候補のリスト(各要素は(asset_len,)). Defaults to None(基本の値のみ).
+            progress_fn (Callable[[int, int], None], optional): (計算済みの年数, 全体の年数)を受け取る進捗通知用の関数. Defaults to None.
+            cancel_event (threading.Event, optional): setされたら年の区切りで計算を中断する. Defaults to None.
+
+        Raises:
+            ValueError: 候補の値が不正な場合や、param.sampler="sobol", tilt, control_variateを指定している場合
+            SimulationCancelled: cancel_eventにより中断された場合
+
+        Returns:
+            pd.DataFrame: 1行が1つの組合せで、構成比率,リバランス,毎月積立額,運用年数,リターンと各パーセンタイルの列を持つ
+        """
+        param = self.param
+        ratio_grid = self._as_grid(ratios, param.ratios, "ratios")
+        profit_grid = self._as_grid(profits, param.profits, "profits")
+        rebalances = [param.rebalance] if rebalance is None else list(rebalance)
+        months = [param.month] if month is None else list(month)
+        years = [param.year] if year is None else list(year)
+        if any(isinstance(r, bool) is False for r in rebalances):
+            raise ValueError("rebalance must be list of bool")
+        if any(isinstance(m, int) is False or m < 0 for m in months):
+            raise ValueError("month must be list of non-negative int")
+        if any(isinstance(y, int) is False or y <= 0 for y in years):
+            raise ValueError("year must be list of positive int")
+
+        self._check_param()
+        size = param.size
+        start = param.start
+        idxs = param.percentiles
+        max_year = max(years)
+        dtype = np.dtype(param.precision)
+        factor_t = np.asarray(param.get_cov_factor().T, dtype=dtype)
+        # シード未指定でも1回のsweep()の中では全組合せで同じ乱数を使う
+        entropy = np.random.SeedSequence(param.seed).entropy
+
+        # 作業配列(累積2つと集計用2つ)が目安に収まるよう、構成比率の候補をバッチに分ける
+        n_ratio = ratio_grid.shape[0]
+        assets_len = ratio_grid.shape[1]
+        batch = int(max(1, min(n_ratio, SWEEP_BLOCK_BYTES // max(1, size * 8 * 4))))
+        # 累積を持つ単位(リターンの候補の番号, リバランス, 構成比率の範囲)。
+        # リバランスしない場合はアセットごとの累積を構成比率の全候補で共有する
+        units = []
+        for gi, reb in itertools.product(range(len(profit_grid)), rebalances):
+            if reb is True:
+                units += [
+                    (gi, reb, slice(k0, min(k0 + batch, n_ratio))) for k0 in range(0, n_ratio, batch)
+                ]
+            else:
+                units.append((gi, reb, slice(0, n_ratio)))
+        # 累積の合計が目安に収まる単位ずつグループにまとめ、グループごとに全年分の乱数を1度ずつ使う
+        groups = []
+        used = 0
+        for u in units:
+            width = u[2].stop - u[2].start if u[1] is True else assets_len
+            cost = size * width * 8 * 2
+            if len(groups) == 0 or used + cost > SWEEP_BLOCK_BYTES:
+                groups.append([])
+                used = 0
+            groups[-1].append(u)
+            used += cost
+        total = len(groups) * max_year
+        done = 0
+
+        rows = []  # (並び順のキー, 行)
+        for group in groups:
+            accs = []
+            for gi, reb, sl in group:
+                shape = (size, sl.stop - sl.start) if reb is True else (size, assets_len)
+                accs.append((np.ones(shape), np.zeros(shape)))
+            shocks = self._iter_shocks(entropy, max_year, factor_t)
+            for t in range(max_year):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise SimulationCancelled("Parameter sweep is cancelled")
+                zf = next(shocks)  # (size, asset_len)。全ての単位で共有する
+                for (gi, reb, sl), (a, b) in zip(group, accs):
+                    growth_mean = 1 + profit_grid[gi]
+                    # リバランスする場合はポートフォリオの騰落率、しない場合はアセットごとに累積する
+                    if reb is True:
+                        r = ratio_grid[sl]
+                        c = zf @ r.T  # (size, batch)
+                        c += growth_mean @ r.T
+                    else:
+                        c = zf + growth_mean.astype(dtype)  # (size, asset_len)
+                    a *= c
+                    b += 1.0
+                    b *= c
+                    if t + 1 not in years:
+                        continue
+                    for k0 in range(sl.start, sl.stop, batch):
+                        r = ratio_grid[k0 : k0 + batch]
+                        # リバランスする場合の単位は1バッチ分なので累積をそのまま使う
+                        at, bt = (a, b) if reb is True else (a @ r.T, b @ r.T)  # (size, batch)
+                        for mi, m in enumerate(months):
+                            totals = start * at + (12.0 * m) * bt
+                            pers = np.percentile(totals, idxs, axis=0, method="nearest")  # (P, batch)
+                            for k in range(len(r)):
+                                row = {
+                                    DataFrameKey.ratios.value: tuple(r[k].tolist()),
+                                    DataFrameKey.rebalance.value: reb,
+                                    DataFrameKey.month.value: m,
+                                    DataFrameKey.year.value: t + 1,
+                                    DataFrameKey.profits.value: tuple(profit_grid[gi].tolist()),
+                                }
+                                for p, v in zip(idxs, pers[:, k]):
+                                    row[MonteCarloSimBase._get_percentile_label(p)] = v
+                                key = (gi, rebalances.index(reb), t, mi, k0 + k)
+                                rows.append((key, row))
+                done += 1
+                if progress_fn is not None:
+                    progress_fn(done, total)
+            shocks.close()
+        rows.sort(key=lambda x: x[0])
+        return pd.DataFrame([row for _, row in rows])
@@ -1,6 +1,10 @@
+import copy
+import threading
 import flet as ft
 from typing import Callable
 from .multi.multi_monte_carlo_param import MultiMonteCarloParam
+from .multi.allocation_optimizer import AllocationOptimizer
+from .sim_base import SimulationCancelled
 from . import validate
 from .table_keys import CtrlKey
 from .cor_table_view import CorrelationTableView
@@ -50,7 +54,7 @@ class MultiMonteCarloInputView(ft.UserControl):
         )
         self.tf[CtrlKey.size] = ft.TextField(
             label="simulation size",
-            hint_text="size of monte carlo simulation: recomended 5000-10000",
+            hint_text="size of monte carlo simulation: recomended 5000-10000 (upper limit if tolerance is set)",
             keyboard_type=ft.KeyboardType.NUMBER,
             on_change=validate.textfield_int_changed,
             value=str(self.sim_param.size),
@@ -62,15 +66,41 @@ class MultiMonteCarloInputView(ft.UserControl):
             on_change=validate.textfield_percentile_changed,
             value=str(",".join([f"{p}" for p in self.sim_param.percentiles])),
         )
+        self.tf[CtrlKey.tolerance] = ft.TextField(
+            label="tolerance",
+            hint_text="target relative error of percentiles: ex. 1%->0.01 (empty: always run simulation size)",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_change=validate.textfield_optional_float_changed,
+            value=self._tolerance_text(),
+        )
+        self.tf[CtrlKey.tilt] = ft.TextField(
+            label="tilt",
+            hint_text="importance sampling shift per year[σ]: ex. 1% tail in 20 years->2.33/sqrt(20)=0.52 (empty or 0: off)",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_change=validate.textfield_optional_float_changed,
+            value=str(self.sim_param.tilt),
+        )
         self.cb_rebalance = ft.Checkbox(
             label="毎年資産構成に従ってリバランスする", value=self.sim_param.rebalance
         )
+        self.cb_antithetic = ft.Checkbox(
+            label="対称変量法(符号を反転した乱数の対を使う)", value=self.sim_param.antithetic
+        )
+        self.cb_control_variate = ft.Checkbox(
+            label="制御変量法(資産額の期待値で重み付けする)",
+            value=self.sim_param.control_variate,
+        )
+        self.cb_sobol = ft.Checkbox(
+            label="準モンテカルロ(Sobol列)", value=self.sim_param.sampler == "sobol"
+        )
         labels = {
             CtrlKey.year: "運用年数",
             CtrlKey.start: "開始時資産",
             CtrlKey.month: "毎月積立額",
             CtrlKey.size: "シミュレーション数",
             CtrlKey.percentiles: "パーセンタイル",
+            CtrlKey.tolerance: "目標相対誤差",
+            CtrlKey.tilt: "重点サンプリング",
         }
 
         # 相関入力ビュー
@@ -90,6 +120,23 @@ class MultiMonteCarloInputView(ft.UserControl):
             self.btn_save_param.visible = False
             self.btn_load_param.visible = False
 
+        ## 構成比率の最適化
+        self.dd_objective = ft.Dropdown(
+            width=320,
+            value="median",
+            options=[
+                ft.dropdown.Option("median", "中央値を最大化(下位3%が元本以上)"),
+                ft.dropdown.Option("cvar", "下位5%の平均を最大化(CVaR最小化)"),
+            ],
+        )
+        self.btn_optimize = ft.ElevatedButton("Optimize Ratios", on_click=self.click_optimize)
+        self.btn_cancel_optimize = ft.ElevatedButton(
+            "Cancel", on_click=self.click_cancel_optimize, disabled=True
+        )
+        self.txt_optimize = ft.Text("")
+        self.optimize_thread = None
+        self.optimize_cancel_event = None
+
         # Error用ダイアログ
         self.err_dlg = ft.AlertDialog(title=ft.Text("Error!"))
 
@@ -100,6 +147,8 @@ class MultiMonteCarloInputView(ft.UserControl):
             CtrlKey.month,
             CtrlKey.size,
             CtrlKey.percentiles,
+            CtrlKey.tolerance,
+            CtrlKey.tilt,
         ]
         ctrls = [
             ft.Row(
@@ -111,10 +160,26 @@ class MultiMonteCarloInputView(ft.UserControl):
             for k in ckey
         ]
         ctrls.append(ft.Row([self.cb_rebalance]))
+        ctrls.append(ft.Row([self.cb_antithetic, self.cb_control_variate, self.cb_sobol]))
         ctrls.append(ft.ResponsiveRow([self.cor_view]))
+        ctrls.append(
+            ft.Row(
+                [self.dd_objective, self.btn_optimize, self.btn_cancel_optimize, self.txt_optimize]
+            )
+        )
         ctrls.append(ft.Row([self.btn_sim, self.btn_save_param, self.btn_load_param]))
         return ft.Column(ctrls)
 
+    def _tolerance_text(self) -> str:
+        """目標相対誤差の表示用の文字列を返す関数(未指定なら空欄)
+
+        Returns:
+            str: _description_
+        """
+        if self.sim_param.tolerance is None:
+            return ""
+        return str(self.sim_param.tolerance)
+
     def did_mount(self):
         """pageにmountされた後の処理。
         Overlayへ追加が必要なControl(FilePickerなど)を追加する
@@ -134,6 +199,73 @@ class MultiMonteCarloInputView(ft.UserControl):
         else:
             self.open_err_dlg("入力したシミュレーションパラメータの値が不正です")
 
+    def click_optimize(self, e):
+        """Optimize Ratiosボタン押下時に、ワーカースレッドで構成比率を最適化する関数
+
+        Args:
+            e (_type_): _description_
+        """
+        if self.optimize_thread is not None and self.optimize_thread.is_alive():
+            self.open_err_dlg("最適化を実行中です")
+            return
+        param = self.get_param()
+        if param is None:
+            self.open_err_dlg("入力したシミュレーションパラメータの値が不正です")
+            return
+        self.optimize_cancel_event = threading.Event()
+        self.btn_optimize.disabled = True
+        self.btn_cancel_optimize.disabled = False
+        self.txt_optimize.value = "最適化中..."
+        self.update()
+        self.optimize_thread = threading.Thread(
+            target=self.run_optimize, args=(param, self.dd_objective.value), daemon=True
+        )
+        self.optimize_thread.start()
+
+    def run_optimize(self, param: MultiMonteCarloParam, objective: str):
+        """構成比率を最適化して相関入力ビューへ反映する関数。ワーカースレッドで実行される
+
+        Args:
+            param (MultiMonteCarloParam): 構成比率以外のパラメータ
+            objective (str): 目的関数
+        """
+
+        def progress(done: int, total: int):
+            self.txt_optimize.value = f"最適化中... {done / total:.0%}"
+            self.txt_optimize.update()
+
+        try:
+            optimizer = AllocationOptimizer(param, objective=objective)
+            ratios = optimizer.optimize(
+                progress_fn=progress, cancel_event=self.optimize_cancel_event
+            )
+            self.cor_view.set_ratios(ratios)
+            stats = optimizer.best_stats
+            self.txt_optimize.value = (
+                f"中央値: {stats['median']:,.0f}円 / 下位3%: {stats['floor']:,.0f}円 / "
+                f"下位5%の平均: {stats['shortfall']:,.0f}円"
+            )
+        except SimulationCancelled:
+            self.txt_optimize.value = "キャンセルしました"
+        except Exception as e:
+            self.txt_optimize.value = ""
+            self.open_err_dlg(f"最適化中にエラーが発生しました: {e}")
+        self.btn_optimize.disabled = False
+        self.btn_cancel_optimize.disabled = True
+        self.update()
+
+    def click_cancel_optimize(self, e):
+        """最適化のCancelボタン押下時に実行中の最適化を中断する関数
+
+        Args:
+            e (_type_): _description_
+        """
+        if self.optimize_cancel_event is not None:
+            self.optimize_cancel_event.set()
+            self.txt_optimize.value = "キャンセル中..."
+            self.btn_cancel_optimize.disabled = True
+            self.update()
+
     def open_err_dlg(self, msg: str):
         """指定されたメッセージでError Dialogを開く関数
 
@@ -145,6 +277,16 @@ class MultiMonteCarloInputView(ft.UserControl):
         self.err_dlg.open = True
         self.page.update()
 
+    def get_param(self) -> MultiMonteCarloParam:
+        """入力からパラメータを作成して、そのコピーを返す関数
+
+        Returns:
+            MultiMonteCarloParam: 入力が不正な場合はNone
+        """
+        if self._set_param() is False:
+            return None
+        return copy.deepcopy(self.sim_param)
+
     def _set_param(self) -> bool:
         """入力からパラメータをセットして、正しく数値に変換できなければFalseを返す
 
@@ -159,7 +301,14 @@ class MultiMonteCarloInputView(ft.UserControl):
             self.sim_param.percentiles = [
                 int(p) for p in self.tf[CtrlKey.percentiles].value.split(",")
             ]
+            tolerance = self.tf[CtrlKey.tolerance].value.strip()
+            self.sim_param.tolerance = float(tolerance) if tolerance != "" else None
+            tilt = self.tf[CtrlKey.tilt].value.strip()
+            self.sim_param.tilt = float(tilt) if tilt != "" else 0.0
             self.sim_param.rebalance = self.cb_rebalance.value
+            self.sim_param.antithetic = self.cb_antithetic.value
+            self.sim_param.control_variate = self.cb_control_variate.value
+            self.sim_param.sampler = "sobol" if self.cb_sobol.value is True else "random"
 
             p = self.cor_view.get_param()
             self.sim_param.cor = p.cor
@@ -218,7 +367,12 @@ class MultiMonteCarloInputView(ft.UserControl):
                 self.tf[CtrlKey.percentiles].value = ",".join(
                     [f"{p}" for p in self.sim_param.percentiles]
                 )
+                self.tf[CtrlKey.tolerance].value = self._tolerance_text()
+                self.tf[CtrlKey.tilt].value = str(self.sim_param.tilt)
                 self.cb_rebalance.value = self.sim_param.rebalance
+                self.cb_antithetic.value = self.sim_param.antithetic
+                self.cb_control_variate.value = self.sim_param.control_variate
+                self.cb_sobol.value = self.sim_param.sampler == "sobol"
                 self.cor_view.set_param(self.sim_param)
                 self.cor_view.update_view()
                 self.update()
@@ -0,0 +1,232 @@
+import threading
+import pandas as pd
+import flet as ft
+from typing import Callable
+from .multi import MultiMonteCarloParam, ParamSweep
+from .sim_base import SimulationCancelled
+from .table_keys import DataFrameKey
+
+
+class ParamSweepView(ft.UserControl):
+    """複数アセットのパラメータの候補を共通乱数でまとめて比較するView。
+    乱数はSimulateと同じ乱数列を使う(sobol, tilt, control_variateを指定している場合はエラーになる)
+
+    Args:
+        ft (_type_): _description_
+    """
+
+    # 表に表示する最大の行数
+    MAX_ROWS = 500
+
+    def __init__(
+        self, is_web: bool, get_param_fn: Callable[[], MultiMonteCarloParam]
+    ):
+        """
+        Args:
+            is_web (bool): Web版かどうか
+            get_param_fn (Callable[[], MultiMonteCarloParam]): 基本のパラメータを返す関数(入力が不正ならNone)
+        """
+        super().__init__()
+        self.is_web = is_web
+        self.get_param_fn = get_param_fn
+        self.df_sweep = None
+        self.sweep_thread = None
+        self.cancel_event = None
+
+    def build(self):
+        self.tf_ratios = ft.TextField(
+            label="ratios",
+            hint_text="1 candidate per line: ex. 0.25, 0.25, 0.25, 0.25 (empty: Multi Asset Params)",
+            multiline=True,
+            min_lines=3,
+        )
+        self.tf_profits = ft.TextField(
+            label="profits",
+            hint_text="1 candidate per line: ex. 0.01, 0.02, 0.05, 0.07 (empty: Multi Asset Params)",
+            multiline=True,
+            min_lines=2,
+        )
+        self.tf_month = ft.TextField(
+            label="save / month",
+            hint_text="comma separated: ex. 30000, 50000 (empty: Multi Asset Params)",
+        )
+        self.tf_year = ft.TextField(
+            label="operation year",
+            hint_text="comma separated: ex. 10, 20, 30 (empty: Multi Asset Params)",
+        )
+        self.cb_rebalance = ft.Checkbox(label="リバランスあり/なしの両方を比較する", value=False)
+
+        self.btn_sweep = ft.ElevatedButton("Sweep", on_click=self.click_sweep)
+        self.btn_cancel = ft.ElevatedButton(
+            "Cancel", on_click=self.click_cancel, disabled=True
+        )
+        self.txt_status = ft.Text("")
+        self.dtbl = ft.DataTable()
+
+        # Error用ダイアログ
+        self.err_dlg = ft.AlertDialog(title=ft.Text("Error!"))
+
+        labels = [
+            ("構成比率の候補", self.tf_ratios),
+            ("リターンの候補", self.tf_profits),
+            ("毎月積立額の候補", self.tf_month),
+            ("運用年数の候補", self.tf_year),
+        ]
+        ctrls = [ft.Row([ft.Text(k, width=100), ft.Container(v, expand=True)]) for k, v in labels]
+        ctrls.append(ft.Row([self.cb_rebalance]))
+        ctrls.append(ft.Row([self.btn_sweep, self.btn_cancel, self.txt_status]))
+        ctrls.append(ft.Row([self.dtbl], scroll=ft.ScrollMode.AUTO))
+        return ft.Column(ctrls)
+
+    @staticmethod
+    def _parse_rows(text: str) -> list:
+        """1行に1つのカンマ区切りの数値列を読み取る関数
+
+        Args:
+            text (str): 入力文字列
+
+        Returns:
+            list: 各行の数値のリスト。空欄ならNone
+        """
+        rows = [line for line in text.splitlines() if line.strip() != ""]
+        if len(rows) == 0:
+            return None
+        return [[float(v) for v in line.split(",")] for line in rows]
+
+    @staticmethod
+    def _parse_ints(text: str) -> list:
+        """カンマ区切りの整数値を読み取る関数
+
+        Args:
+            text (str): 入力文字列
+
+        Returns:
+            list: 整数値のリスト。空欄ならNone
+        """
+        if text.strip() == "":
+            return None
+        return [int(v) for v in text.split(",")]
+
+    def click_sweep(self, e):
+        """Sweepボタン押下時に、ワーカースレッドで全ての組合せを計算する関数
+
+        Args:
+            e (_type_): _description_
+        """
+        if self.sweep_thread is not None and self.sweep_thread.is_alive():
+            self.open_err_dlg("計算を実行中です")
+            return
+        param = self.get_param_fn()
+        if param is None:
+            self.open_err_dlg("Multi Asset Paramsのパラメータの値が不正です")
+            return
+        try:
+            grids = {
+                "ratios": self._parse_rows(self.tf_ratios.value),
+                "profits": self._parse_rows(self.tf_profits.value),
+                "month": self._parse_ints(self.tf_month.value),
+                "year": self._parse_ints(self.tf_year.value),
+                "rebalance": [True, False] if self.cb_rebalance.value is True else None,
+            }
+        except ValueError:
+            self.open_err_dlg("入力した候補の値が不正です")
+            return
+
+        self.cancel_event = threading.Event()
+        self.btn_sweep.disabled = True
+        self.btn_cancel.disabled = False
+        self.txt_status.value = "計算中..."
+        self.update()
+        self.sweep_thread = threading.Thread(
+            target=self.run_sweep, args=(param, grids), daemon=True
+        )
+        self.sweep_thread.start()
+
+    def run_sweep(self, param: MultiMonteCarloParam, grids: dict):
+        """全ての組合せを計算して表に表示する関数。ワーカースレッドで実行される
+
+        Args:
+            param (MultiMonteCarloParam): 基本のパラメータ
+            grids (dict): ParamSweep.sweep()に渡す候補
+        """
+
+        def progress(done: int, total: int):
+            self.txt_status.value = f"計算中... {done / total:.0%}"
+            self.txt_status.update()
+
+        try:
+            df = ParamSweep(param).sweep(
+                progress_fn=progress, cancel_event=self.cancel_event, **grids
+            )
+            self.set_sweep_result(df)
+            self.txt_status.value = f"{len(df):,} 通りの組合せ(Simulateと同じ共通乱数, {param.size:,} パス)"
+        except SimulationCancelled:
+            self.txt_status.value = "キャンセルしました"
+        except Exception as e:
+            self.txt_status.value = ""
+            self.open_err_dlg(f"計算中にエラーが発生しました: {e}")
+        self.btn_sweep.disabled = False
+        self.btn_cancel.disabled = True
+        self.update()
+
+    def click_cancel(self, e):
+        """Cancelボタン押下時に実行中の計算を中断する関数
+
+        Args:
+            e (_type_): _description_
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.txt_status.value = "キャンセル中..."
+            self.btn_cancel.disabled = True
+            self.update()
+
+    def set_sweep_result(self, df: pd.DataFrame):
+        """計算結果を中央値の高い順に表に表示する関数
+
+        Args:
+            df (pd.DataFrame): ParamSweep.sweep()の結果
+        """
+        self.df_sweep = df
+        if "中央値" in df.columns:
+            df = df.sort_values("中央値", ascending=False)
+        df = df.head(ParamSweepView.MAX_ROWS)
+
+        def cell_text(v):
+            if isinstance(v, tuple):
+                return ", ".join(f"{x:g}" for x in v)
+            elif isinstance(v, bool):
+                return "あり" if v is True else "なし"
+            elif isinstance(v, float):
+                return f"{v:,.0f}"
+            return f"{v:,}"
+
+        # 構成比率以外で同じ候補しかない列は表示しない
+        cols = [
+            c
+            for c in df.columns
+            if c
+            not in (
+                DataFrameKey.rebalance.value,
+                DataFrameKey.month.value,
+                DataFrameKey.year.value,
+                DataFrameKey.profits.value,
+            )
+            or df[c].nunique() > 1
+        ]
+        self.dtbl.columns = [ft.DataColumn(ft.Text(c)) for c in cols]
+        self.dtbl.rows = [
+            ft.DataRow(cells=[ft.DataCell(ft.Text(cell_text(v))) for v in r])
+            for r in df[cols].itertuples(index=False)
+        ]
+
+    def open_err_dlg(self, msg: str):
+        """指定されたメッセージでError Dialogを開く関数
+
+        Args:
+            msg (str): エラー内容のメッセージ
+        """
+        self.err_dlg.content = ft.Text(msg)
+        self.page.dialog = self.err_dlg
+        self.err_dlg.open = True
+        self.page.update()
@@ -0,0 +1,393 @@
+import os
+import json
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+import numpy as np
+import pandas as pd
+from multi_assets_sim.sim_histogram import SimHistogram
+
+# キャッシュの形式を変えた場合に増やし、古いキャッシュを使わないようにする
+CACHE_VERSION = 2
+# メモリ上,ディスク上のキャッシュの既定の上限[byte]
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024
+# ディスク上のキャッシュのファイルの拡張子
+CACHE_FILE_EXT = ".npz"
+# ディスク上のキャッシュで、値の構造(JSON)を保存する配列の名前
+CACHE_META_KEY = "__meta__"
+
+
+def _canonical(v):
+    """ハッシュ用に、値を型と値だけで決まるJSONに変換できる形にする関数。
+    ndarrayはdtype,形状とリトルエンディアンのバイト列のハッシュで表す
+
+    Args:
+        v (_type_): _description_
+
+    Returns:
+        _type_: _description_
+    """
+    if isinstance(v, np.ndarray):
+        arr = np.ascontiguousarray(v)
+        if arr.dtype.kind in "biuf":
+            arr = arr.astype(arr.dtype.newbyteorder("<"))
+        return {
+            "ndarray": arr.dtype.str,
+            "shape": list(arr.shape),
+            "sha256": hashlib.sha256(arr.tobytes()).hexdigest(),
+        }
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, dict):
+        return {str(k): _canonical(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_canonical(x) for x in v]
+    if is_dataclass(v):
+        return {
+            "class": type(v).__name__,
+            "fields": {f.name: _canonical(getattr(v, f.name)) for f in fields(v)},
+        }
+    return v
+
+
+def param_hash(param, extra: dict = None) -> str:
+    """パラメータのDataclass(cov, ratios, seedなどの全フィールド)から、キャッシュのキーとなるハッシュを求める関数。
+    シードが指定されていない場合は毎回異なる乱数で計算するため、キャッシュしない(Noneを返す)
+
+    Args:
+        param (MonteCarloParam | MultiMonteCarloParam): シミュレーション用パラメータ
+        extra (dict, optional): 結果に影響するsimulate()の引数など. Defaults to None.
+
+    Returns:
+        str: SHA-256のハッシュ(16進数)。シードが指定されていなければNone
+    """
+    if getattr(param, "seed", None) is None:
+        return None
+    doc = {"version": CACHE_VERSION, "param": _canonical(param), "extra": _canonical(extra or {})}
+    s = json.dumps(doc, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def _get_nbytes(v) -> int:
+    """キャッシュする値のおおよそのメモリ量[byte]を返す関数
+
+    Args:
+        v (_type_): _description_
+
+    Returns:
+        int: _description_
+    """
+    if isinstance(v, pd.DataFrame):
+        return int(v.memory_usage(index=True, deep=True).sum())
+    if isinstance(v, np.ndarray):
+        return int(v.nbytes)
+    if isinstance(v, dict):
+        return sum(_get_nbytes(x) for x in v.values())
+    if isinstance(v, (list, tuple)):
+        return sum(_get_nbytes(x) for x in v)
+    if hasattr(v, "__dict__"):
+        return _get_nbytes(vars(v))
+    return 64
+
+
+def _to_plain_array(v) -> np.ndarray:
+    """値をpickleを使わずに保存できる配列に変換する関数。文字列のobject配列は固定長の文字列の配列にする
+
+    Raises:
+        ValueError: 文字列以外のobject配列の場合
+
+    Returns:
+        np.ndarray: _description_
+    """
+    arr = np.asarray(v)
+    if arr.dtype.kind == "O":
+        if not all(isinstance(x, str) for x in arr.ravel()):
+            raise ValueError("object arrays other than strings cannot be cached on disk")
+        arr = arr.astype(str)
+    return arr
+
+
+def _encode(v, arrays: dict):
+    """キャッシュする値を、JSONで表せる構造と配列(arraysに追加する)に分ける関数。
+    ディスク上のキャッシュはpickleを使わないため、保存できるのは
+    None, bool, int, float, str, list, dict(キーは文字列), ndarray, DataFrame, SimHistogramのみとする
+
+    Args:
+        v (_type_): キャッシュする値
+        arrays (dict): 配列の名前 -> 配列の辞書(この関数で追加する)
+
+    Raises:
+        ValueError: 保存できない型の値の場合
+
+    Returns:
+        dict: 値の構造を表す辞書
+    """
+
+    def add(arr) -> str:
+        name = f"a{len(arrays)}"
+        arrays[name] = _to_plain_array(arr)
+        return name
+
+    if isinstance(v, np.generic):
+        v = v.item()
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return {"type": "value", "value": v}
+    if isinstance(v, (list, tuple)):
+        return {"type": "list", "items": [_encode(x, arrays) for x in v]}
+    if isinstance(v, dict):
+        if not all(isinstance(k, str) for k in v):
+            raise ValueError("dict keys must be str to be cached on disk")
+        return {"type": "dict", "items": {k: _encode(x, arrays) for k, x in v.items()}}
+    if isinstance(v, np.ndarray):
+        return {"type": "ndarray", "name": add(v)}
+    if isinstance(v, pd.DataFrame):
+        return {
+            "type": "dataframe",
+            "columns": [_encode(c, arrays) for c in v.columns],
+            "data": [add(v.iloc[:, i].to_numpy()) for i in range(v.shape[1])],
+            "index": add(v.index.to_numpy()),
+            "index_name": _encode(v.index.name, arrays),
+            "attrs": _encode(dict(v.attrs), arrays),  # 近似値かどうかなどのラベル
+        }
+    if isinstance(v, SimHistogram):
+        return {
+            "type": "histogram",
+            "bins": v.bins,
+            "log": v.log,
+            "size": v.size,
+            "arrays": {k: add(getattr(v, k)) for k in ("lo", "hi", "counts", "under", "over")},
+        }
+    raise ValueError(f"{type(v).__name__} cannot be cached on disk")
+
+
+def _decode(d: dict, arrays):
+    """_encode()で分けた構造と配列から値を作り直す関数
+
+    Args:
+        d (dict): 値の構造を表す辞書
+        arrays (_type_): 配列の名前 -> 配列(np.loadの結果)
+
+    Raises:
+        ValueError: 構造が不正な場合
+
+    Returns:
+        _type_: _description_
+    """
+    kind = d["type"]
+    if kind == "value":
+        return d["value"]
+    if kind == "list":
+        return [_decode(x, arrays) for x in d["items"]]
+    if kind == "dict":
+        return {k: _decode(x, arrays) for k, x in d["items"].items()}
+    if kind == "ndarray":
+        return arrays[d["name"]]
+    if kind == "dataframe":
+        columns = [_decode(c, arrays) for c in d["columns"]]
+        index = pd.Index(arrays[d["index"]], name=_decode(d["index_name"], arrays))
+        data = {i: arrays[name] for i, name in enumerate(d["data"])}
+        df = pd.DataFrame(data, index=index)
+        df.columns = columns
+        if "attrs" in d:
+            df.attrs.update(_decode(d["attrs"], arrays))
+        return df
+    if kind == "histogram":
+        a = {k: arrays[name] for k, name in d["arrays"].items()}
+        hist = SimHistogram(a["lo"], a["hi"], d["bins"], d["log"])
+        hist.counts, hist.under, hist.over = a["counts"], a["under"], a["over"]
+        hist.size = d["size"]
+        return hist
+    raise ValueError(f"unknown cache entry type: {kind}")
+
+
+class ResultCache:
+    """パラメータのハッシュ(param_hash())をキーとして、シミュレーションの集計結果を保持するキャッシュ。
+
+    メモリ上とディスク上(disk_dirを指定した場合)の2段で保持し、それぞれ上限の容量を超えたら
+    最も長く使われていないものから破棄する(LRU)。ディスク上のキャッシュは値の構造をJSON、配列をnpzで保存し、
+    allow_pickle=Falseで読み込むため、ディレクトリに置かれたファイルからコードが実行されることはない。
+    最終使用時刻はファイルの更新時刻で管理するため、同じディレクトリを複数のプロセスやセッションで共有できる。
+    値は辞書(DataFrame, ndarray, SimHistogramなど、_encode()で保存できる型)とし、
+    get()で返す値は共有されるので変更しないこと。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = CACHE_MAX_BYTES,
+        disk_dir: str = None,
+        disk_max_bytes: int = CACHE_DISK_MAX_BYTES,
+    ):
+        """
+        Args:
+            max_bytes (int, optional): メモリ上のキャッシュの上限[byte]. Defaults to CACHE_MAX_BYTES.
+            disk_dir (str, optional): ディスク上のキャッシュのディレクトリ. Defaults to None(メモリ上のみ).
+            disk_max_bytes (int, optional): ディスク上のキャッシュの上限[byte]. Defaults to CACHE_DISK_MAX_BYTES.
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # キー -> (値, メモリ量)。末尾ほど最近使ったもの
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        """キーに対応するディスク上のキャッシュのファイル名を返す関数"""
+        return os.path.join(self.disk_dir, key + CACHE_FILE_EXT)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.disk_dir is not None and os.path.exists(self._disk_path(key))
+
+    @property
+    def nbytes(self) -> int:
+        """メモリ上のキャッシュのおおよその容量[byte]"""
+        return self._nbytes
+
+    def get(self, key: str) -> dict:
+        """キャッシュした値を返す関数。メモリ上になくディスク上にあれば読み込んでメモリ上にも保持する
+
+        Args:
+            key (str): param_hash()で求めたキー
+
+        Returns:
+            dict: キャッシュした値。なければNone
+        """
+        if key is None:
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[0]
+        value = self._load_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key: str, value: dict):
+        """値をキャッシュする関数。キーがNone(シード未指定)なら何もしない
+
+        Args:
+            key (str): param_hash()で求めたキー
+            value (dict): キャッシュする値
+
+        Raises:
+            ValueError: disk_dirを指定していて、ディスク上に保存できない型の値を含む場合
+        """
+        if key is None:
+            return
+        # ディスク上に保存できない値ならメモリ上にも保持せずに例外を送出する
+        arrays = {}
+        meta = _encode(value, arrays) if self.disk_dir is not None else None
+        with self._lock:
+            self._put_memory(key, value)
+        if meta is not None:
+            self._save_disk(key, meta, arrays)
+
+    def clear(self, disk: bool = False):
+        """メモリ上のキャッシュを破棄する関数
+
+        Args:
+            disk (bool, optional): ディスク上のキャッシュも削除するかどうか. Defaults to False.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+        if disk is True and self.disk_dir is not None:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(CACHE_FILE_EXT):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def _put_memory(self, key: str, value: dict):
+        """メモリ上に保持し、上限を超えた分を古い順に破棄する関数(ロックを取得してから呼ぶ)"""
+        nbytes = _get_nbytes(value)
+        if key in self._entries:
+            self._nbytes -= self._entries.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes:
+            _, (_, n) = self._entries.popitem(last=False)
+            self._nbytes -= n
+
+    def _load_disk(self, key: str) -> dict:
+        """ディスク上のキャッシュを読み込み、最終使用時刻を更新する関数
+
+        Returns:
+            dict: キャッシュした値。なければ(読み込めなければ)None
+        """
+        if self.disk_dir is None:
+            return None
+        fpath = self._disk_path(key)
+        try:
+            # pickleを使わずに読み込む(object配列を含むファイルは例外になる)
+            with np.load(fpath, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            meta = json.loads(str(arrays.pop(CACHE_META_KEY)))
+            if meta.get("version") != CACHE_VERSION:
+                return None
+            value = _decode(meta["value"], arrays)
+            os.utime(fpath)
+        except (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile):
+            return None
+        return value
+
+    def _save_disk(self, key: str, meta: dict, arrays: dict):
+        """_encode()で分けた値をディスク上に保存し、上限を超えた分を最終使用時刻の古い順に削除する関数
+
+        Args:
+            key (str): param_hash()で求めたキー
+            meta (dict): 値の構造を表す辞書
+            arrays (dict): 配列の名前 -> 配列の辞書
+        """
+        if sum(arr.nbytes for arr in arrays.values()) > self.disk_max_bytes:
+            return
+        doc = json.dumps({"version": CACHE_VERSION, "value": meta}, ensure_ascii=False)
+        # 書きかけのファイルを他のプロセスが読まないよう、一時ファイルに書いてから置き換える
+        fpath = self._disk_path(key)
+        tmp = f"{fpath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, mode="wb") as f:
+            np.savez(f, **{CACHE_META_KEY: np.array(doc)}, **arrays)
+        os.replace(tmp, fpath)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """ディスク上のキャッシュが上限を超えていれば、最終使用時刻の古い順に削除する関数"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(CACHE_FILE_EXT):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+            total -= size
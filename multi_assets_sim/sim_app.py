@@ -1,6 +1,11 @@
+import copy
+import time
+import threading
 from enum import Enum
+from typing import Callable
 import flet as ft
 from multi_assets_sim import (
+    SimulationCancelled,
     MonteCarloInputView,
     MonteCarloParam,
     MonteCarloSim,
@@ -8,26 +13,55 @@ from multi_assets_sim import (
     MultiMonteCarloParam,
     MultiMonteCarloSim,
     MonteCarloResultView,
+    ParamSweepView,
 )
+from multi_assets_sim.sim_histogram import HIST_BINS
+from multi_assets_sim.result_cache import ResultCache, param_hash
 
 
 class TabIdx(Enum):
     SingleAsset = 0
     MultiAsset = 1
     Result = 2
+    Sweep = 3
 
 
 class SimApp(ft.UserControl):
-    def __init__(self, is_web: bool):
+    # 進捗バーを更新する最小間隔[s]
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        is_web: bool,
+        profile_hook: Callable[[dict], None] = None,
+        result_cache: ResultCache = None,
+    ):
+        """
+        Args:
+            is_web (bool): Web版かどうか
+            profile_hook (Callable[[dict], None], optional): シミュレーションの処理区分の時間を受け取る関数
+                (SimProfileのhook. JsonlProfileHookなど). Defaults to None.
+            result_cache (ResultCache, optional): シードを指定した場合の集計結果のキャッシュ
+                (Web版のセッション間で共有できる). Defaults to None(キャッシュしない).
+        """
         super().__init__()
         self.is_web = is_web
+        self.profile_hook = profile_hook
+        self.result_cache = result_cache
+        self.sim_thread = None
+        self.cancel_event = None
+        self.last_progress = 0.0
 
     def build(self):
         self.single_sim = MonteCarloSim()
         self.multi_sim = MultiMonteCarloSim()
+        for sim in (self.single_sim, self.multi_sim):
+            sim.profile_hook = self.profile_hook
+            sim.trace_memory = True
         self.ctl_res = MonteCarloResultView(self.is_web)
         self.ctl_in_single = MonteCarloInputView(self.is_web, self.simulate_single)
         self.ctl_in_multi = MultiMonteCarloInputView(self.is_web, self.simulate_multi)
+        self.ctl_sweep = ParamSweepView(self.is_web, self.ctl_in_multi.get_param)
 
         self.tabs = ft.Tabs(
             selected_index=TabIdx.SingleAsset.value,
@@ -43,6 +77,9 @@ class SimApp(ft.UserControl):
                 ft.Tab(
                     text="Simulation Result",
                 ),
+                ft.Tab(
+                    text="Parameter Sweep",
+                ),
             ],
             on_change=self.onchange_tabs,
         )
@@ -51,47 +88,223 @@ class SimApp(ft.UserControl):
             ft.Column([self.ctl_in_single]),
             ft.Column([self.ctl_in_multi], visible=False),
             ft.Column([self.ctl_res], visible=False),
+            ft.Column([self.ctl_sweep], visible=False),
         ]
 
         self.err_dlg = ft.AlertDialog(
             title=ft.Text("Error!"), content=ft.Text("シミュレーションが実行されていません")
         )
 
+        # シミュレーション実行中の進捗表示
+        self.progress_bar = ft.ProgressBar(width=400, value=0)
+        self.progress_text = ft.Text("")
+        self.btn_cancel = ft.ElevatedButton("Cancel", on_click=self.click_cancel)
+        self.row_progress = ft.Row(
+            [self.progress_bar, self.progress_text, self.btn_cancel], visible=False
+        )
+
+        # フッターに直近のシミュレーションの処理区分ごとの時間を表示する
+        self.txt_profile = ft.Text("", size=12)
+
         return ft.Column(
             controls=[
                 ft.Row([self.tabs]),
+                self.row_progress,
                 self.cols[0],
                 self.cols[1],
                 self.cols[2],
+                self.cols[3],
+                ft.Row([self.txt_profile]),
             ],
             expand=True,
         )
 
     def simulate_single(self, param: MonteCarloParam):
-        self.single_sim.set_param(param)
-        self.single_sim.simulate()
-        df_desc = self.single_sim.get_percentile_describe()
-        df_each = self.single_sim.get_percentile_eachtime()
-        df_hist = self.single_sim.get_percentile_history()
-        self.ctl_res.set_sim_result(df_desc, df_each, df_hist)
-        self.toggle_tab(TabIdx.Result.value)
+        # 積立額だけを変えた場合に再計算せずに済むよう、騰落率の累積も残す
+        self.start_simulation(
+            self.single_sim,
+            param,
+            {"keep_growth": True, "hist_bins": HIST_BINS, "hist_per_year": True},
+        )
 
     def simulate_multi(self, param: MultiMonteCarloParam):
-        self.multi_sim.set_param(param)
-        self.multi_sim.simulate()
-        df_desc = self.multi_sim.get_percentile_describe()
-        df_each = self.multi_sim.get_percentile_eachtime()
-        df_hist = self.multi_sim.get_percentile_history()
-        self.ctl_res.set_sim_result(df_desc, df_each, df_hist)
-        self.toggle_tab(TabIdx.Result.value)
+        # 結果表示にはアセットごとの途中経過は使わないので資産合計のみ記録する
+        self.start_simulation(
+            self.multi_sim,
+            param,
+            {
+                "keep_all_pattern": False,
+                "keep_growth": True,
+                "hist_bins": HIST_BINS,
+                "hist_per_year": True,
+            },
+        )
+
+    def start_simulation(self, sim, param, options: dict):
+        """バックグラウンドのスレッドでシミュレーションを開始する関数
+
+        Args:
+            sim (MonteCarloSim | MultiMonteCarloSim): シミュレーションクラス
+            param (MonteCarloParam | MultiMonteCarloParam): シミュレーション用パラメータ
+            options (dict): simulate()に渡す追加の引数
+        """
+        if self.sim_thread is not None and self.sim_thread.is_alive():
+            self.open_err_dlg("シミュレーションを実行中です")
+            return
+
+        self.cancel_event = threading.Event()
+        self.progress_bar.value = 0
+        self.progress_text.value = "シミュレーション中..."
+        self.btn_cancel.disabled = False
+        self.row_progress.visible = True
+        self.update()
+
+        # 入力View側でパラメータが変更されても影響しないようにコピーして渡す
+        self.sim_thread = threading.Thread(
+            target=self.run_simulation,
+            args=(sim, copy.deepcopy(param), options),
+            daemon=True,
+        )
+        self.sim_thread.start()
+
+    def run_simulation(self, sim, param, options: dict):
+        """シミュレーションを実行して結果を表示する関数。ワーカースレッドで実行される
+
+        Args:
+            sim (MonteCarloSim | MultiMonteCarloSim): シミュレーションクラス
+            param (MonteCarloParam | MultiMonteCarloParam): シミュレーション用パラメータ
+            options (dict): simulate()に渡す追加の引数
+        """
+        def show_interim(df_desc, df_each, df_hist):
+            # 計算途中の暫定結果を表示し、最初の1回で結果タブへ移動する
+            self.ctl_res.set_sim_result(
+                df_desc,
+                df_each,
+                df_hist,
+                status=f"暫定結果: {sim.n_done:,} / {param.size:,} パス",
+            )
+            if self.tabs.selected_index != TabIdx.Result.value:
+                self.toggle_tab(TabIdx.Result.value)
+
+        try:
+            # 同じパラメータ,同じシードの結果がキャッシュにあれば計算せずに表示する
+            key = None
+            if self.result_cache is not None:
+                key = param_hash(param, options)
+                t = time.perf_counter()
+                cached = self.result_cache.get(key)
+                if cached is not None:
+                    self.ctl_res.set_sim_result(
+                        cached["describe"],
+                        cached["eachtime"],
+                        cached["history"],
+                        status=" / ".join(cached["status"] + ["キャッシュから表示"]),
+                        hist=cached["hist"],
+                    )
+                    self.txt_profile.value = (
+                        f"キャッシュから表示: {(time.perf_counter() - t) * 1000:.1f}ms"
+                    )
+                    self.row_progress.visible = False
+                    self.toggle_tab(TabIdx.Result.value)
+                    return
+
+            status = []
+            if sim.can_reprice(param):
+                # start, month, percentilesだけの変更なら前回のパスから作り直す
+                sim.reprice(param)
+                status.append("前回のパスから再計算")
+            else:
+                sim.set_param(param)
+                sim.simulate(
+                    progress_fn=self.update_progress,
+                    cancel_event=self.cancel_event,
+                    interim_fn=show_interim,
+                    **options,
+                )
+            self.progress_text.value = "集計中..."
+            self.row_progress.update()
+            df_desc = sim.get_percentile_describe(with_ci=True, with_es=True)
+            df_each = sim.get_percentile_eachtime()
+            df_hist = sim.get_percentile_history()
+            # 分布のグラフ用のヒストグラム(reprice()した場合は結果から作り直す)
+            hist = sim.get_histogram(per_year=True)
+            if param.tolerance is not None:
+                status.append(
+                    f"使用パス数: {sim.n_paths:,} / {param.size:,} "
+                    f"(推定相対誤差 最大{sim.rel_error.max():.2%} / 目標{param.tolerance:.2%})"
+                )
+            if param.antithetic is True or param.control_variate is True or param.tilt > 0:
+                vrf = sim.get_variance_reduction()
+                status.append(f"分散削減率: {vrf.min():.2f}~{vrf.max():.2f}倍")
+            if self.result_cache is not None:
+                self.result_cache.put(
+                    key,
+                    {
+                        "describe": df_desc,
+                        "eachtime": df_each,
+                        "history": df_hist,
+                        "hist": hist,
+                        # 前回のパスから再計算したかどうかはキャッシュから表示する際には関係ない
+                        "status": [v for v in status if v != "前回のパスから再計算"],
+                    },
+                )
+            status = " / ".join(status)
+            self.ctl_res.set_sim_result(df_desc, df_each, df_hist, status=status, hist=hist)
+            sim.profile.add("plot", self.ctl_res.plot_seconds)
+            self.txt_profile.value = sim.profile.format()
+            self.row_progress.visible = False
+            self.toggle_tab(TabIdx.Result.value)
+        except SimulationCancelled:
+            self.row_progress.visible = False
+            self.update()
+        except Exception as e:
+            self.row_progress.visible = False
+            self.update()
+            self.open_err_dlg(f"シミュレーション中にエラーが発生しました: {e}")
+
+    def update_progress(self, done: int, total: int):
+        """シミュレーションの進捗を進捗バーに反映する関数
+
+        Args:
+            done (int): 計算済みのパス数
+            total (int): 全パス数
+        """
+        now = time.monotonic()
+        if done < total and now - self.last_progress < SimApp.PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        self.progress_bar.value = done / total
+        self.progress_text.value = f"{done:,} / {total:,}"
+        self.row_progress.update()
+
+    def click_cancel(self, e):
+        """Cancelボタン押下時に実行中のシミュレーションを中断する関数
+
+        Args:
+            e (_type_): _description_
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.progress_text.value = "キャンセル中..."
+            self.btn_cancel.disabled = True
+            self.row_progress.update()
+
+    def open_err_dlg(self, msg: str):
+        """指定されたメッセージでError Dialogを開く関数
+
+        Args:
+            msg (str): エラー内容のメッセージ
+        """
+        self.err_dlg.content = ft.Text(msg)
+        self.page.dialog = self.err_dlg
+        self.err_dlg.open = True
+        self.page.update()
 
     def onchange_tabs(self, e):
         idx = self.tabs.selected_index
         if idx == TabIdx.Result.value and self.ctl_res.has_result() is False:
-            self.page.dialog = self.err_dlg
-            self.err_dlg.open = True
             self.toggle_tab(TabIdx.SingleAsset.value)
-            self.page.update()
+            self.open_err_dlg("シミュレーションが実行されていません")
         else:
             self.toggle_tab(idx)
 
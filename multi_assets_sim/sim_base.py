@@ -0,0 +1,1446 @@
+import os
+import gc
+import copy
+import yaml
+import time
+import threading
+import multiprocessing as mp
+from dataclasses import fields
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from multi_assets_sim.table_keys import DataFrameKey
+from multi_assets_sim.sim_summary import SimSummary
+from multi_assets_sim.sim_histogram import SimHistogram, HIST_BINS
+from multi_assets_sim.sim_export import export_result, EXPORT_CHUNK_ROWS
+from multi_assets_sim.sim_profile import SimProfile
+from multi_assets_sim.sobol import SobolSampler, SOBOL_MAX_DIM
+
+
+# 乱数のシードを割り当てる単位となるパス数。
+# ブロックごとにSeedSequence.spawn()で独立した乱数列を割り当てるため、
+# チャンクサイズやワーカー数を変えても同じシードなら同じ結果になる
+SEED_BLOCK = 16384
+
+# Sobol列のスクランブル用のシードを派生させるspawn_key(ブロックの番号と重ならない値)
+SOBOL_SPAWN_KEY = 2**32 - 1
+
+# ワーカープロセス内で共有メモリ上の配列を保持する
+_worker_store = {}
+
+
+# パーセンタイルを計算する際に1度に読み込む行(年)の目安サイズ[byte]
+PERCENTILE_BLOCK_BYTES = 256 * 1024 * 1024
+
+# 積立額の変更だけなら再計算せずに済むパラメータ
+REPRICE_FIELDS = ("start", "month", "percentiles")
+# reprice()で作り直しても変わらない全パスの配列(それ以外は前回の積立額の値なので破棄する)
+REPRICE_KEEP_ARRAYS = ("result", "weights", "growth_start", "growth_month")
+
+# store_dirに保存するメタ情報のファイル名
+STORE_META_FILE = "meta.yml"
+STORE_PARAM_FILE = "param.yml"
+
+
+class SimulationCancelled(Exception):
+    """シミュレーションがキャンセルされたことを示す例外"""
+
+    pass
+
+
+def _open_store_array(spec) -> np.ndarray:
+    """共有メモリ(RawArray)または.npyファイル上の配列をndarrayとして開く関数
+
+    Args:
+        spec (tuple): (RawArray, shape, dtype)または(.npyファイルのパス, None, None)
+
+    Returns:
+        np.ndarray: _description_
+    """
+    src, shape, dtype = spec
+    if isinstance(src, str):
+        return np.load(src, mmap_mode="r+")
+    return np.frombuffer(src, dtype=dtype).reshape(shape)
+
+
+def _init_worker(store_specs: dict):
+    """ワーカープロセスの初期化時に、共有メモリ上の配列をndarrayとして復元する関数
+
+    Args:
+        store_specs (dict): 属性名 -> _open_store_array()に渡す情報の辞書
+    """
+    global _worker_store
+    _worker_store = {
+        name: _open_store_array(spec) for name, spec in store_specs.items()
+    }
+
+
+def _run_worker_blocks(
+    sim, blocks: list, summary: SimSummary, hist: SimHistogram
+) -> (SimSummary, SimHistogram, SimProfile):
+    """ワーカープロセスで担当するブロックのシミュレーションを行う関数。
+    結果の配列は共有メモリへ直接書き込み、集約結果と処理時間のみを返す
+
+    Args:
+        sim (MonteCarloSimBase): 結果の配列を持たないシミュレーションクラスのコピー
+        blocks (list): (担当範囲のslice, SeedSequence)のリスト
+        summary (SimSummary): 集約先の空のSimSummary。集約しない場合はNone
+        hist (SimHistogram): 蓄積先の空のSimHistogram。蓄積しない場合はNone
+
+    Returns:
+        (SimSummary, SimHistogram, SimProfile): 担当ブロックを集約したSimSummary, SimHistogramと、担当ブロックの処理区分ごとの時間
+    """
+    for name, arr in _worker_store.items():
+        setattr(sim, name, arr)
+    sim.hist = hist
+    sim._run_blocks(blocks, summary)
+    return summary, hist, sim.profile
+
+
+def _antithetic_pairs(n: int) -> (np.ndarray, np.ndarray):
+    """対称変量法で対になるパスのインデックスを返す関数。
+    ブロックごとに前半(n_b+1)//2個の乱数を生成し、後半はその符号を反転したものを使うため、
+    ブロック内のj番目と(n_b+1)//2+j番目のパスが対になる(n_bが奇数の場合の余りは対にしない)。
+
+    Args:
+        n (int): パス数
+
+    Returns:
+        (np.ndarray, np.ndarray): 対の一方と他方のインデックス
+    """
+    first, second = [], []
+    for b in range(0, n, SEED_BLOCK):
+        nb = min(SEED_BLOCK, n - b)
+        h = (nb + 1) // 2
+        first.append(np.arange(b, b + nb - h))
+        second.append(np.arange(b + h, b + nb))
+    return np.concatenate(first), np.concatenate(second)
+
+
+def _cv_weights(x: np.ndarray, expected: float, paired: bool = False) -> np.ndarray:
+    """資産額自身を制御変量とした線形の重みを返す関数。
+    w_i = 1/n + (E - 平均)(x_i - 平均)/Σ(x_j - 平均)x_j は合計が1で、重み付き平均が期待値Eに一致する。
+    paired=Trueでは対称変量法の対の平均で回帰係数を求める(対の平均の分散は小さいため係数が変わる)。
+
+    Args:
+        x (np.ndarray): 各パスの資産額(n,)
+        expected (float): 資産額の期待値
+        paired (bool, optional): 対称変量法の対を考慮するかどうか. Defaults to False.
+
+    Returns:
+        np.ndarray: 各パスの重み(n,)
+    """
+    x = x.astype(np.float64)
+    n = len(x)
+    xp = x
+    if paired is True:
+        # 各パスを対の平均で置き換える(対にならないパスはそのまま)
+        xp = x.copy()
+        i1, i2 = _antithetic_pairs(n)
+        xp[i1] = xp[i2] = (x[i1] + x[i2]) / 2
+    d = xp - x.mean()
+    ss = d @ x
+    if ss <= 0:
+        return np.full(n, 1.0 / n)
+    return 1.0 / n + (expected - x.mean()) * d / ss
+
+
+def _weighted_percentiles(x: np.ndarray, w: np.ndarray, qs: np.ndarray) -> np.ndarray:
+    """重み付きの経験分布から分位点を求める関数(累積の重みがqを超える最小の値)
+
+    Args:
+        x (np.ndarray): 値(n,)
+        w (np.ndarray): 重み(n,)。負の重みは累積が単調になるように扱う
+        qs (np.ndarray): 0~1の確率
+
+    Returns:
+        np.ndarray: 各確率の分位点(len(qs),)
+    """
+    order = np.argsort(x, kind="stable")
+    cum = np.maximum.accumulate(np.cumsum(w[order]))
+    idx = np.searchsorted(cum, np.asarray(qs) * cum[-1], side="left")
+    return x[order[np.clip(idx, 0, len(x) - 1)]]
+
+
+class MonteCarloSimBase:
+    """単一/複数アセットのモンテカルロシミュレーションで共通の処理を持つ基底クラス。
+
+    シミュレーション数(size)をSEED_BLOCKごとのブロックに分け、ブロックごとに
+    ルートのシードからSeedSequence.spawn()で派生させた独立な乱数列を使って計算する。
+    ブロックはchunk_sizeごとのチャンクにまとめて実行し、workers>1ならチャンクを
+    プロセスプールで並列に実行する(結果は共有メモリへ書き込む)。
+    store_dirを指定すると全パスの配列はメモリではなく.npyファイル(np.memmap)上に確保し、
+    open_store()で再度シミュレーションせずに開き直せる。
+    keep_result=Trueなら全パスの資産合計(year, size)をresultに記録し、
+    Falseならresultは保持せずにブロックごとの結果をSimSummaryへ集約するため、
+    メモリ量はチャンクサイズに比例する量で済む。
+    派生クラスは_simulate_block()でブロック1つ分のシミュレーションを実装する。
+    処理区分(乱数生成,累積,集約,パーセンタイル,DataFrame作成)ごとの時間は直近のシミュレーションのprofileに記録する。
+    """
+
+    def __init__(self):
+        self.param = None
+        self.result = None
+        self.summary = None  # keep_result=Falseの場合の集約結果
+        self.hist = None  # hist_binsを指定した場合の資産額のヒストグラム
+        self.org = None  # 元本計算用
+        self.entropy = None  # 直近のシミュレーションで使ったシード
+        self._percentile_cache = None  # (パーセンタイルのtuple, 各年のパーセンタイル)
+        self.n_done = None  # シミュレーション途中の場合の計算済みパス数
+        self.n_paths = None  # 直近のシミュレーションで計算したパス数(目標相対誤差で打ち切った場合はsize未満)
+        self.rel_error = None  # 目標相対誤差を指定した場合の、各パーセンタイルの推定相対誤差
+        self._summary_vrf = None  # keep_result=Falseの場合に最初のブロックから推定した分散削減率
+        self.sobol = None  # sampler="sobol"の場合のSobol列の生成器
+        self.weights = None  # 重点サンプリングの場合の各パスの尤度比の重み(size,)
+        # 各年の資産合計を start * growth_start + 12 * month * growth_month と表す係数(year, size)
+        self.growth_start = None
+        self.growth_month = None
+        self.keep_growth = False
+        self.profile = SimProfile()  # 直近のシミュレーションの処理区分ごとの時間など
+        self.profile_hook = None  # 処理区分の時間を記録するたびに呼ぶ関数(SimProfileのhook)
+        # simulate()中のピークメモリをtracemallocで計測するかどうか(計測中は数%遅くなる)
+        self.trace_memory = False
+
+    def set_param(self, param):
+        """Dataclassを用いてパラメータのセットを行う関数
+
+        Args:
+            param (MonteCarloParam | MultiMonteCarloParam): _description_
+        """
+        self.param = param
+        self._percentile_cache = None
+
+    def _store_names(self) -> list[str]:
+        """シミュレーション結果として全パスを記録する配列の属性名を返す関数
+
+        Returns:
+            list[str]: _description_
+        """
+        return ["result", "weights", "growth_start", "growth_month"]
+
+    def _get_store_shapes(self, size: int, keep_result: bool) -> dict:
+        """今回のシミュレーションで確保する配列の属性名と形状を返す関数
+
+        Args:
+            size (int): シミュレーション数
+            keep_result (bool): 全パスの資産合計をresultに残すかどうか
+
+        Returns:
+            dict: 属性名 -> 形状の辞書
+        """
+        shapes = {}
+        if keep_result is True:
+            shapes["result"] = (self.param.year, size)
+            if self.param.tilt > 0:
+                shapes["weights"] = (size,)
+            if self.keep_growth is True:
+                shapes["growth_start"] = (self.param.year, size)
+                shapes["growth_month"] = (self.param.year, size)
+        return shapes
+
+    def _simulate_block(
+        self, rng: np.random.Generator, sl: slice
+    ) -> (np.ndarray, np.ndarray):
+        """ブロック1つ分のシミュレーションを行う関数
+
+        Args:
+            rng (np.random.Generator): このブロック用の乱数生成器
+            sl (slice): 全パスのうちこのブロックが担当する範囲
+
+        Returns:
+            (np.ndarray, np.ndarray): 各年,各パターンの資産合計(year, sl.stop - sl.start)と、
+                重点サンプリングの場合は各パスの尤度比の重み(sl.stop - sl.start,)(それ以外はNone)
+        """
+        raise NotImplementedError
+
+    def _get_tilted(self, sl: slice) -> np.ndarray:
+        """重点サンプリングで騰落率をずらすパスを返す関数。
+        各ブロックの後半のパスだけをずらし、残りは元の分布のままにする(防御的な混合分布)。
+        Sobol列では連続した番号の点の集合ほど一様になるため、交互ではなく前半と後半に分ける。
+        対称変量法では対の番号で決め、対の両方を同じ分布から生成する
+
+        Args:
+            sl (slice): 全パスのうちこのブロックが担当する範囲
+
+        Returns:
+            np.ndarray: ずらすパスならTrue(sl.stop - sl.start,)
+        """
+        size = sl.stop - sl.start
+        idx = np.arange(size)
+        n = size
+        if self.param.antithetic is True:
+            n = (size + 1) // 2
+            idx = np.where(idx < n, idx, idx - n)
+        return idx >= n // 2
+
+    def _get_is_weights(self, proj: np.ndarray) -> np.ndarray:
+        """重点サンプリングの尤度比の重みを計算する関数。
+        各年の標準正規乱数を方向vへ-tiltだけずらした分布をq、元の分布をpとすると、
+        q/p = exp(-tilt * Σ_t v・z_t - year * tilt^2 / 2) となる。
+        半分のパスをq、残りをpから生成しているので、重みは p / (p/2 + q/2) とする(1パスあたり最大2)
+
+        Args:
+            proj (np.ndarray): 各パスの Σ_t v・z_t (生成された乱数を方向vへ射影して全年で合計したもの)
+
+        Returns:
+            np.ndarray: 各パスの重み(元の分布での平均は1)
+        """
+        tilt = self.param.tilt
+        ratio = np.exp(-tilt * proj - self.param.year * tilt**2 / 2)
+        return 1.0 / (0.5 + 0.5 * ratio)
+
+    def _get_assets_len(self) -> int:
+        """1年あたりに使う正規乱数の数(アセット数)を返す関数
+
+        Returns:
+            int: _description_
+        """
+        return 1
+
+    def _get_qmc_start(self, sl: slice) -> int:
+        """ブロックで使うSobol列の最初の点の番号を返す関数。
+        対称変量法では1ブロックあたり半分の点しか使わないので番号も半分にする
+
+        Args:
+            sl (slice): 全パスのうちこのブロックが担当する範囲
+
+        Returns:
+            int: _description_
+        """
+        if self.param.antithetic is True:
+            return sl.start // 2
+        return sl.start
+
+    def _get_expected_totals(self) -> np.ndarray:
+        """積立のスケジュールと平均リターンから解析的に求めた各年の資産合計の期待値を返す関数
+
+        Returns:
+            np.ndarray: 各年の資産合計の期待値(year,)
+        """
+        raise NotImplementedError
+
+    def _get_cv_expected(self) -> np.ndarray:
+        """制御変量法を使う場合に各年の資産合計の期待値を返す関数
+
+        Returns:
+            np.ndarray: 各年の資産合計の期待値(year,)。制御変量法を使わない場合はNone
+        """
+        if self.param.control_variate is True:
+            return self._get_expected_totals()
+        return None
+
+    def _uses_variance_reduction(self) -> bool:
+        """対称変量法,制御変量法,重点サンプリングのいずれかを使うかどうか
+
+        Returns:
+            bool: _description_
+        """
+        return (
+            self.param.antithetic is True
+            or self.param.control_variate is True
+            or self.param.tilt > 0
+        )
+
+    def _run_blocks(self, blocks: list, summary: SimSummary):
+        """ブロックを順にシミュレーションして、結果を記録・集約する関数
+
+        Args:
+            blocks (list): (担当範囲のslice, SeedSequence)のリスト
+            summary (SimSummary): 集約先のSimSummary。集約しない場合はNone
+        """
+        for sl, ss in blocks:
+            totals, weights = self._simulate_block(np.random.default_rng(ss), sl)
+            self._run_block_totals(sl, totals, weights, summary)
+
+    def _run_block_totals(
+        self, sl: slice, totals: np.ndarray, weights: np.ndarray, summary: SimSummary
+    ):
+        """ブロック1つ分の結果を記録し、SimSummaryとヒストグラムへ集約する関数
+
+        Args:
+            sl (slice): 全パスのうちこのブロックが担当する範囲
+            totals (np.ndarray): 各年,各パターンの資産合計(year, n)
+            weights (np.ndarray): 重点サンプリングの場合の各パスの重み(n,)
+            summary (SimSummary): 集約先のSimSummary。集約しない場合はNone
+        """
+        t = time.perf_counter()
+        if self.result is not None:
+            self.result[:, sl] = totals
+        if self.weights is not None:
+            self.weights[sl] = weights
+        if summary is not None:
+            summary.add(totals, weights)
+        if self.hist is not None:
+            self.hist.add(totals, weights)
+        self.profile.add("reduce", time.perf_counter() - t)
+
+    def simulate(
+        self,
+        chunk_size: int = None,
+        keep_result: bool = True,
+        workers: int = 1,
+        store_dir: str = None,
+        progress_fn: Callable[[int, int], None] = None,
+        cancel_event: threading.Event = None,
+        interim_fn: Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None] = None,
+        interim_interval: float = 0.3,
+        keep_growth: bool = False,
+        hist_bins: int = None,
+        hist_per_year: bool = False,
+    ):
+        """積立資産のモンテカルロシミュレーションを行う関数。
+        workers>1の場合はプロセスプールを使うため、スクリプトから呼ぶ場合は
+        if __name__ == "__main__": の中で呼ぶこと。
+        param.toleranceを指定した場合はチャンクごとにパーセンタイルの推定相対誤差を確かめ、
+        全パーセンタイルが目標以下になった時点で打ち切る(計算したパス数はn_pathsに残る)。
+        keep_growth=Trueでは各パスの騰落率の累積をgrowth_start, growth_monthに残し、
+        start, month, percentilesだけを変えた場合にreprice()で乱数を使わずに結果を作り直せるようにする。
+        hist_binsを指定すると、資産額のヒストグラムをブロックごとにhistへ蓄積する(keep_result=Falseでも分布を描ける)。
+
+        Args:
+            chunk_size (int, optional): 1度に計算するパス数(SEED_BLOCKの倍数に切り上げ). Defaults to None(自動).
+            keep_result (bool, optional): 全パスの資産合計をresultに残すかどうか. Defaults to True.
+            workers (int, optional): 並列に計算するプロセス数. Defaults to 1.
+            store_dir (str, optional): 全パスの配列を.npyファイルとして確保するディレクトリ. Defaults to None(メモリ上に確保).
+            progress_fn (Callable[[int, int], None], optional): (計算済みのパス数, 全パス数)を受け取る進捗通知用の関数. Defaults to None.
+            cancel_event (threading.Event, optional): setされたらブロックの区切りで計算を中断する. Defaults to None.
+            interim_fn (Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None], optional):
+                計算途中のパスから求めた暫定の(describe, eachtime, history)を受け取る関数. Defaults to None.
+            interim_interval (float, optional): 暫定結果を通知する最小間隔[s]. Defaults to 0.3.
+            keep_growth (bool, optional): reprice()用の騰落率の累積を残すかどうか(keep_result=Trueの場合のみ). Defaults to False.
+            hist_bins (int, optional): 蓄積するヒストグラムのビン数. Defaults to None(蓄積しない).
+            hist_per_year (bool, optional): 最終年だけでなく各年のヒストグラムも蓄積するかどうか. Defaults to False.
+
+        Raises:
+            SimulationCancelled: cancel_eventにより中断された場合。結果は破棄される
+        """
+        self.profile = SimProfile(self.profile_hook)
+        self.profile.start_run(self.trace_memory)
+        try:
+            self._run_simulation(
+                chunk_size,
+                keep_result,
+                workers,
+                store_dir,
+                progress_fn,
+                cancel_event,
+                interim_fn,
+                interim_interval,
+                keep_growth,
+                hist_bins,
+                hist_per_year,
+            )
+        finally:
+            self.profile.stop_run(self.n_paths or 0)
+
+    def _run_simulation(
+        self,
+        chunk_size: int,
+        keep_result: bool,
+        workers: int,
+        store_dir: str,
+        progress_fn: Callable[[int, int], None],
+        cancel_event: threading.Event,
+        interim_fn: Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None],
+        interim_interval: float,
+        keep_growth: bool,
+        hist_bins: int,
+        hist_per_year: bool,
+    ):
+        """simulate()の本体。引数はsimulate()と同じ
+
+        Raises:
+            SimulationCancelled: cancel_eventにより中断された場合。結果は破棄される
+        """
+        year = self.param.year
+        size = self.param.size
+        month = self.param.month
+        start = self.param.start
+
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if workers <= 0:
+            raise ValueError("workers must be positive")
+        if hist_bins is not None and hist_bins <= 0:
+            raise ValueError("hist_bins must be positive")
+
+        # 元本
+        org = np.arange(1, year + 1) * 12 * month + start
+        self.org = org
+        self._percentile_cache = None
+        self.keep_growth = keep_growth
+
+        # ブロックごとに独立な乱数列を割り当てる
+        root = np.random.SeedSequence(self.param.seed)
+        self.entropy = root.entropy
+        self.sobol = None
+        if self.param.sampler == "sobol":
+            # 全ブロックで1つのSobol列を共有し、スクランブルはルートのシードから決める
+            dim = min(year * self._get_assets_len(), SOBOL_MAX_DIM)
+            self.sobol = SobolSampler(
+                dim, np.random.SeedSequence(root.entropy, spawn_key=(SOBOL_SPAWN_KEY,))
+            )
+        n_blocks = -(-size // SEED_BLOCK)
+        blocks = [
+            (slice(i * SEED_BLOCK, min((i + 1) * SEED_BLOCK, size)), ss)
+            for i, ss in enumerate(root.spawn(n_blocks))
+        ]
+
+        # 結果の格納先を確保する(store_dir指定時はファイル上、並列時は共有メモリ上に確保)
+        shapes = self._get_store_shapes(size, keep_result)
+        dtype = np.dtype(self.param.precision)
+        store_specs = {}
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+            # Windowsではマップ中のファイルを削除できないため、前回の結果のmemmapを先に閉じる
+            self._release_store_arrays()
+        for name in self._store_names():
+            if name not in shapes:
+                setattr(self, name, None)
+            elif store_dir is not None:
+                fpath = os.path.join(store_dir, f"{name}.npy")
+                if os.path.exists(fpath):
+                    os.remove(fpath)  # 前回の結果を読み込み専用で開いていた場合も上書きできるように作り直す
+                setattr(
+                    self,
+                    name,
+                    np.lib.format.open_memmap(
+                        fpath, mode="w+", dtype=dtype, shape=shapes[name]
+                    ),
+                )
+                store_specs[name] = (fpath, None, None)
+            elif workers == 1:
+                setattr(self, name, np.zeros(shapes[name], dtype=dtype))
+            else:
+                raw = mp.RawArray(dtype.char, int(np.prod(shapes[name])))
+                self.profile.untraced_bytes += int(np.prod(shapes[name])) * dtype.itemsize
+                store_specs[name] = (raw, shapes[name], dtype)
+                setattr(self, name, _open_store_array(store_specs[name]))
+
+        summary = None
+        self.summary = None
+        self.hist = None
+        self.n_done = 0
+        done = 0
+        next_interim = time.monotonic()
+
+        def check_cancel():
+            if cancel_event is not None and cancel_event.is_set():
+                self._clear_result()
+                raise SimulationCancelled("Simulation is cancelled")
+
+        def report(n: int):
+            nonlocal done, next_interim
+            done += n
+            self.n_done = done
+            if progress_fn is not None:
+                progress_fn(done, size)
+            if interim_fn is not None and done < size and time.monotonic() >= next_interim:
+                # 計算済みのパスから暫定結果を作る(計算時間の数倍は間隔を空けて本計算を妨げないようにする)
+                t = time.monotonic()
+                self._percentile_cache = None
+                interim_fn(
+                    self.get_percentile_describe(with_ci=True),
+                    self.get_percentile_eachtime(),
+                    self.get_percentile_history(),
+                )
+                cost = time.monotonic() - t
+                next_interim = time.monotonic() + max(interim_interval, 4 * cost)
+
+        if keep_result is False or hist_bins is not None:
+            # ビンの範囲は最初のブロックから決める(チャンクサイズやワーカー数によらず同じになる)
+            sl, ss = blocks.pop(0)
+            totals, weights = self._simulate_block(np.random.default_rng(ss), sl)
+            with self.profile.span("reduce"):
+                if keep_result is False:
+                    summary = SimSummary.from_totals(totals, org, self.param.percentiles)
+                if hist_bins is not None:
+                    self.hist = SimHistogram.from_totals(totals, hist_bins, hist_per_year)
+            self._run_block_totals(sl, totals, weights, summary)
+            self.summary = summary
+            self._summary_vrf = None
+            if keep_result is False and self._uses_variance_reduction():
+                # 全パスを保持しないため、分散削減率は最初のブロックから推定する
+                self._summary_vrf = self._estimate_variance_reduction(
+                    totals[-1, :], weights, paired_cv=False
+                )
+            report(sl.stop - sl.start)
+
+        tolerance = self.param.tolerance
+
+        def converged() -> bool:
+            # 目標相対誤差が指定されていれば、計算済みのパスで全パーセンタイルの誤差を確かめる
+            if tolerance is None or done == 0 or done >= size:
+                return False
+            self.rel_error = self.get_percentile_error()
+            return bool(np.all(self.rel_error <= tolerance))
+
+        # ブロックをチャンクにまとめる。
+        # 目標相対誤差の判定はチャンクの区切りで行うため、未指定時は1ブロックずつ判定する
+        if chunk_size is not None:
+            per_chunk = -(-chunk_size // SEED_BLOCK)
+        elif tolerance is not None:
+            per_chunk = 1
+        elif workers == 1:
+            per_chunk = max(1, len(blocks))
+        else:
+            per_chunk = max(1, -(-len(blocks) // (workers * 4)))
+        chunks = [
+            blocks[i : i + per_chunk] for i in range(0, len(blocks), per_chunk)
+        ]
+
+        if converged():
+            chunks = []
+        if workers == 1:
+            for chunk in chunks:
+                for block in chunk:
+                    check_cancel()
+                    self._run_blocks([block], summary)
+                    report(block[0].stop - block[0].start)
+                if converged():
+                    break
+        else:
+            # 結果の配列を持たないコピーをワーカーへ渡す
+            worker_sim = copy.copy(self)
+            for name in self._store_names():
+                setattr(worker_sim, name, None)
+            worker_sim.summary = None
+            worker_sim.hist = None
+            # hookはワーカーへ渡さず、ワーカーの処理時間はチャンクごとにまとめて記録する
+            worker_sim.profile = SimProfile()
+            worker_sim.profile_hook = None
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(store_specs,),
+            ) as executor:
+
+                def submit(chunk):
+                    return executor.submit(
+                        _run_worker_blocks,
+                        worker_sim,
+                        chunk,
+                        None if summary is None else summary.empty_like(),
+                        None if self.hist is None else self.hist.empty_like(),
+                    )
+
+                # 打ち切った場合に無駄な計算が少なくなるよう、先行して投入するチャンクはワーカー数の2倍までにする
+                pending = [submit(chunk) for chunk in chunks[: workers * 2]]
+                # チャンクの順に集約して、ワーカー数によらず同じ結果にする
+                for i, chunk in enumerate(chunks):
+                    f = pending.pop(0)
+                    while len(wait([f], timeout=0.1).done) == 0:
+                        if cancel_event is not None and cancel_event.is_set():
+                            executor.shutdown(wait=True, cancel_futures=True)
+                            check_cancel()
+                    part, part_hist, part_profile = f.result()
+                    self.profile.merge(part_profile)
+                    if summary is not None:
+                        summary.merge(part)
+                    if self.hist is not None:
+                        self.hist.merge(part_hist)
+                    report(sum(sl.stop - sl.start for sl, _ in chunk))
+                    if converged():
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        break
+                    if i + workers * 2 < len(chunks):
+                        pending.append(submit(chunks[i + workers * 2]))
+
+        if done < size:
+            # 目標相対誤差に達して打ち切った場合は、計算済みの範囲だけを結果とする
+            for name in shapes:
+                setattr(self, name, self._truncate_paths(getattr(self, name), done))
+        self.n_paths = done
+        self.summary = summary
+        self.n_done = None
+        self._percentile_cache = None
+        if tolerance is not None:
+            self.rel_error = self.get_percentile_error()
+
+        if store_dir is not None:
+            self._save_store(store_dir, shapes)
+
+    def _is_same_paths(self, param) -> bool:
+        """paramで計算した場合に、前回のシミュレーションと同じ騰落率のパスになるかどうか
+
+        Args:
+            param (MonteCarloParam | MultiMonteCarloParam): 新しいパラメータ
+
+        Returns:
+            bool: REPRICE_FIELDS以外のパラメータが全て同じならTrue
+        """
+        if type(param) is not type(self.param):
+            return False
+        for f in fields(param):
+            if f.name in REPRICE_FIELDS:
+                continue
+            a, b = getattr(param, f.name), getattr(self.param, f.name)
+            if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+                if not np.array_equal(a, b):
+                    return False
+            elif a != b:
+                return False
+        return True
+
+    def can_reprice(self, param) -> bool:
+        """paramでの結果を、再シミュレーションせずにreprice()で作れるかどうか。
+        keep_growth=Trueでシミュレーション済みで、start, month, percentiles以外が同じ場合に作れる。
+        シードを指定していない場合は、パラメータが全く同じなら新しい乱数で計算し直すためFalseとする
+
+        Args:
+            param (MonteCarloParam | MultiMonteCarloParam): 新しいパラメータ
+
+        Returns:
+            bool: _description_
+        """
+        if self.growth_start is None or self.n_done is not None or self.param is None:
+            return False
+        if self._is_same_paths(param) is False:
+            return False
+        if param.seed is None and all(
+            getattr(param, name) == getattr(self.param, name) for name in REPRICE_FIELDS
+        ):
+            return False
+        return True
+
+    def reprice(self, param):
+        """前回のシミュレーションの騰落率の累積から、start, month, percentilesを変えた結果を作り直す関数。
+        各年の資産合計は start * growth_start + 12 * month * growth_month となるため、乱数は使わない。
+        resultとweights以外の全パスの配列(アセットごとのall_patternなど)は前回の積立額のままになるため破棄する。
+        resultが書き込み可能なstore_dir上のファイルの場合は、store_dirのパラメータとメタ情報も保存し直す
+
+        Args:
+            param (MonteCarloParam | MultiMonteCarloParam): start, month, percentiles以外は前回と同じパラメータ
+
+        Raises:
+            ValueError: 再シミュレーションが必要な場合
+        """
+        if self.growth_start is None or self.n_done is not None:
+            raise ValueError("Simulation result with growth factors is not Calculated")
+        if self._is_same_paths(param) is False:
+            raise ValueError("only start, month and percentiles can be changed by reprice")
+        self.set_param(param)
+        self.hist = None  # 蓄積したヒストグラムは前回の積立額のものなので破棄する
+        self.summary = None
+        for name in self._store_names():
+            if name not in REPRICE_KEEP_ARRAYS:
+                setattr(self, name, None)
+        store_dir = None
+        if isinstance(self.result, np.memmap) and self.result.flags.writeable is True:
+            store_dir = os.path.dirname(os.path.abspath(self.result.filename))
+        year = self.param.year
+        self.org = np.arange(1, year + 1) * 12 * self.param.month + self.param.start
+        n = self.growth_start.shape[1]
+        self.profile = SimProfile(self.profile_hook)
+        self.profile.start_run(self.trace_memory)
+        try:
+            with self.profile.span("reduce"):
+                if self.result is None or self.result.flags.writeable is False:
+                    self.result = np.zeros(
+                        self.growth_start.shape, dtype=self.growth_start.dtype
+                    )
+                # メモリ量が目安に収まる年数ずつ計算する
+                rows = max(1, PERCENTILE_BLOCK_BYTES // max(1, n * self.growth_start.itemsize))
+                for i in range(0, year, rows):
+                    res = self.result[i : i + rows, :]
+                    np.multiply(self.growth_start[i : i + rows, :], self.param.start, out=res)
+                    res += self.growth_month[i : i + rows, :] * (12.0 * self.param.month)
+            if self.param.tolerance is not None:
+                self.rel_error = self.get_percentile_error()
+            if store_dir is not None:
+                # 開き直した際に新しいstart, monthと組み合わされるよう、パラメータも保存し直す
+                names = [name for name in self._store_names() if getattr(self, name) is not None]
+                self._save_store(store_dir, dict.fromkeys(names))
+        finally:
+            self.profile.stop_run(n)
+
+    @staticmethod
+    def _truncate_paths(arr: np.ndarray, n: int) -> np.ndarray:
+        """全パスを記録する配列の先頭n個のパスのビューを返す関数
+
+        Args:
+            arr (np.ndarray): パスの軸が2番目(1次元の場合は1番目)の配列
+            n (int): パス数
+
+        Returns:
+            np.ndarray: _description_
+        """
+        if arr.ndim == 1:
+            return arr[:n]
+        return arr[:, :n]
+
+    def _release_store_arrays(self):
+        """全パスを記録する配列を破棄し、ファイル上(np.memmap)に確保していた場合はマップを閉じる関数。
+        memmapは参照がなくなった時点で閉じられるため、参照を外してから循環参照も回収する。
+        呼び出し元が結果の配列(ビューを含む)を保持している場合は、そのマップは閉じられない
+        """
+        mapped = False
+        for name in self._store_names():
+            if isinstance(getattr(self, name, None), np.memmap):
+                mapped = True
+            setattr(self, name, None)
+        self._percentile_cache = None
+        if mapped is True:
+            gc.collect()
+
+    def _clear_result(self):
+        """シミュレーション結果を破棄する関数"""
+        for name in self._store_names():
+            setattr(self, name, None)
+        self.summary = None
+        self.hist = None
+        self.n_done = None
+        self.n_paths = None
+        self.rel_error = None
+        self._summary_vrf = None
+        self._percentile_cache = None
+
+    def _save_store_param(self, fpath: str):
+        """store_dirへパラメータを保存する関数
+
+        Args:
+            fpath (str): yamlファイル名
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _load_store_param(cls, fpath: str):
+        """store_dirからパラメータを読み込む関数
+
+        Args:
+            fpath (str): yamlファイル名
+
+        Returns:
+            MonteCarloParam | MultiMonteCarloParam: _description_
+        """
+        raise NotImplementedError
+
+    def _save_store(self, store_dir: str, shapes: dict):
+        """ファイル上に確保した配列を書き出し、開き直すためのメタ情報を保存する関数
+
+        Args:
+            store_dir (str): 保存先のディレクトリ
+            shapes (dict): ファイル上に確保した配列の属性名 -> 形状の辞書
+        """
+        for name in shapes:
+            getattr(self, name).flush()
+        self._save_store_param(os.path.join(store_dir, STORE_PARAM_FILE))
+        meta = {"entropy": self.entropy, "arrays": list(shapes), "n_paths": self.n_paths}
+        with open(os.path.join(store_dir, STORE_META_FILE), encoding="utf-8", mode="w") as f:
+            yaml.safe_dump(meta, f)
+
+    @classmethod
+    def open_store(cls, store_dir: str, mode: str = "r"):
+        """store_dirに保存したシミュレーション結果を開く関数。
+        配列はnp.memmapとして開くため、パーセンタイルの計算時に必要な部分だけ読み込まれる
+
+        Args:
+            store_dir (str): simulate()で指定したディレクトリ
+            mode (str, optional): np.memmapのモード. Defaults to "r".
+
+        Returns:
+            MonteCarloSimBase: 結果を読み込んだシミュレーションクラス
+        """
+        with open(os.path.join(store_dir, STORE_META_FILE), encoding="utf-8", mode="r") as f:
+            meta = yaml.safe_load(f)
+        sim = cls()
+        sim.set_param(cls._load_store_param(os.path.join(store_dir, STORE_PARAM_FILE)))
+        for name in sim._store_names():
+            if name in meta["arrays"]:
+                fpath = os.path.join(store_dir, f"{name}.npy")
+                setattr(sim, name, np.load(fpath, mmap_mode=mode))
+            else:
+                setattr(sim, name, None)
+        sim.entropy = meta["entropy"]
+        sim.n_paths = meta.get("n_paths", sim.param.size)
+        if sim.n_paths < sim.param.size:
+            # 目標相対誤差で打ち切った場合は、ファイル上の計算済みの範囲だけを使う
+            for name in meta["arrays"]:
+                setattr(sim, name, sim._truncate_paths(getattr(sim, name), sim.n_paths))
+        sim.org = np.arange(1, sim.param.year + 1) * 12 * sim.param.month + sim.param.start
+        return sim
+
+    def has_result(self) -> bool:
+        """シミュレーション結果を保持しているかどうか
+
+        Returns:
+            bool: _description_
+        """
+        if self.result is None and self.summary is None:
+            return False
+        else:
+            return True
+
+    def get_result(self) -> np.ndarray:
+        """シミュレーション結果のndarrayを返す関数
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: _description_
+        """
+        if self.result is None:
+            raise ValueError("Simulation result is not Calculated")
+        return self.result
+
+    def _get_export_arrays(self) -> dict:
+        """npz形式で書き出す配列の辞書を返す関数(全パスの配列はコピーせずに返す)
+
+        Returns:
+            dict: 配列名 -> 配列
+        """
+        arrays = {"passing_year": np.arange(1, self.param.year + 1), "org": self.org}
+        for name in self._store_names():
+            arr = getattr(self, name)
+            if arr is not None:
+                arrays[name] = arr
+        return arrays
+
+    def _get_export_columns(self, sl: slice) -> dict:
+        """slの範囲のパスの結果を、(パス, 年)の順に平らにした列の辞書で返す関数
+
+        Args:
+            sl (slice): 書き出すパスの範囲
+
+        Returns:
+            dict: 列名 -> 値の1次元配列
+        """
+        result = self.result[:, sl]
+        year, n = result.shape
+        cols = {
+            DataFrameKey.path.value: np.repeat(np.arange(sl.start, sl.start + n), year),
+            DataFrameKey.passing_year.value: np.tile(np.arange(1, year + 1), n),
+            DataFrameKey.result.value: result.T.ravel(),
+        }
+        if self.weights is not None:
+            cols[DataFrameKey.weight.value] = np.repeat(self.weights[sl], year)
+        return cols
+
+    def export_result(
+        self, fpath: str, fmt: str = None, chunk_rows: int = EXPORT_CHUNK_ROWS, compress: bool = False
+    ):
+        """全パスのシミュレーション結果をファイルに書き出す関数。
+        npz形式では配列をそのままの形状で、parquet/arrow/csv形式では(パス, 年)ごとの行として
+        チャンクごとに書き出すため、全パスを1つのDataFrameにはしない(parquet/arrow形式はpyarrowが必要)
+
+        Args:
+            fpath (str): 書き出し先のファイル名
+            fmt (str, optional): 書き出し形式("npz", "parquet", "arrow", "csv"). Defaults to None(拡張子から決める).
+            chunk_rows (int, optional): 1度に書き出す行数の目安(npz以外). Defaults to EXPORT_CHUNK_ROWS.
+            compress (bool, optional): npz形式で圧縮するかどうか. Defaults to False.
+
+        Raises:
+            ValueError: 全パスの結果を保持していない(keep_result=False)場合や、形式が不明な場合
+        """
+        if self.result is None or self.n_done is not None:
+            raise ValueError("Simulation result of all paths is not Calculated")
+        export_result(self, fpath, fmt, chunk_rows, compress)
+
+    @staticmethod
+    def _get_percentile_label(i: int) -> str:
+        """パーセンタイルの値を表示用に整形する。
+        50を中央値、1~49を下位1~49%, 51~99を上位49~1%とする
+
+        Args:
+            i (int): Percentilの値。0~100のint想定
+
+        Returns:
+            str: 表示用に整形した文字列
+        """
+        if i > 50:
+            return f"上位{100-i}%"
+        elif i == 50:
+            return "中央値"
+        else:
+            return f"下位{i}%"
+
+    def _filled_result(self) -> np.ndarray:
+        """計算済みのパスの資産合計を返す関数。シミュレーション途中では計算済みの範囲のみを返す
+
+        Returns:
+            np.ndarray: (year, 計算済みのパス数)。resultを保持しない場合はNone
+        """
+        if self.result is None or self.n_done is None:
+            return self.result
+        return self.result[:, : self.n_done]
+
+    def _get_path_weights(self, row: np.ndarray, i: int) -> np.ndarray:
+        """i年目のパーセンタイルを求めるための各パスの重みを返す関数
+
+        Args:
+            row (np.ndarray): i年目の計算済みの各パスの資産合計(n,)
+            i (int): 年の添字
+
+        Returns:
+            np.ndarray: 制御変量法または重点サンプリングの重み(n,)。どちらも使わない場合はNone
+        """
+        expected = self._get_cv_expected()
+        if expected is not None:
+            return _cv_weights(row, expected[i], self.param.antithetic)
+        if self.weights is None:
+            return None
+        return np.asarray(self.weights[: len(row)], dtype=np.float64)
+
+    def get_percentile_table(self) -> np.ndarray:
+        """全年の全パーセンタイルを計算して返す関数。
+        複数年分をまとめて1度のnp.percentile(axis=1)で計算し、結果はシミュレーションごとにキャッシュする。
+        describe / eachtime / historyはこの結果を共有する。
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: 各年のパーセンタイル(year, len(percentiles))
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        idxs = tuple(self.param.percentiles)
+        if self._percentile_cache is not None and self._percentile_cache[0] == idxs:
+            return self._percentile_cache[1]
+        with self.profile.span("percentile"):
+            table = self._calc_percentile_table(idxs)
+        self._percentile_cache = (idxs, table)
+        return table
+
+    def _calc_percentile_table(self, idxs: tuple) -> np.ndarray:
+        """全年の指定したパーセンタイルを計算する関数
+
+        Args:
+            idxs (tuple): パーセンタイル
+
+        Returns:
+            np.ndarray: 各年のパーセンタイル(year, len(idxs))
+        """
+        result = self._filled_result()
+        expected = self._get_cv_expected()
+        if result is not None and (expected is not None or self.weights is not None):
+            # 制御変量法/重点サンプリングでは年ごとに重み付きの分位点を求める
+            qs = np.asarray(idxs) / 100
+            table = np.zeros((result.shape[0], len(idxs)), dtype=result.dtype)
+            for i in range(result.shape[0]):
+                row = np.asarray(result[i, :])
+                table[i, :] = _weighted_percentiles(row, self._get_path_weights(row, i), qs)
+        elif result is not None:
+            year, size = result.shape
+            # np.percentileは対象をコピーするので、メモリ量が目安に収まる年数ずつ計算する
+            rows = max(1, PERCENTILE_BLOCK_BYTES // max(1, size * result.itemsize))
+            table = np.zeros((year, len(idxs)), dtype=result.dtype)
+            for i in range(0, year, rows):
+                table[i : i + rows, :] = np.percentile(
+                    result[i : i + rows, :], idxs, axis=1, method="nearest"
+                ).T
+        else:
+            table = self.summary.get_percentiles(list(idxs), expected)
+        return table
+
+    def _get_final_percentiles(self, qs: np.ndarray) -> np.ndarray:
+        """計算済みのパスから最終年の任意の分位点を求める関数(全年のパーセンタイルは計算しない)
+
+        Args:
+            qs (np.ndarray): 0~1の確率
+
+        Returns:
+            np.ndarray: 各確率の分位点(len(qs),)
+        """
+        result = self._filled_result()
+        expected = self._get_cv_expected()
+        qs = np.clip(np.asarray(qs, dtype=np.float64), 0.0, 1.0)
+        if result is None:
+            return self.summary.get_percentiles(list(qs * 100), expected)[-1, :]
+        last = np.asarray(result[-1, :])
+        w = self._get_path_weights(last, -1)
+        if w is not None:
+            return _weighted_percentiles(last, w, qs)
+        # np.percentile(method="nearest")と同じ順位の値を選ぶ
+        ranks = np.around((len(last) - 1) * qs).astype(np.intp)
+        return np.partition(last, np.unique(ranks))[ranks]
+
+    def _estimate_variance_reduction(
+        self, last: np.ndarray, weights: np.ndarray = None, paired_cv: bool = True
+    ) -> np.ndarray:
+        """最終年の値から、各パーセンタイルの分散削減率を推定する関数。
+        p分位点の推定誤差は分布関数の推定値 mean(I(x_i <= x_p)) の分散に比例するので、
+        単純なモンテカルロでの指示関数の分散p(1-p)を、対称変量法(対の平均)や制御変量法(資産額で回帰した残差)、
+        重点サンプリング(尤度比で重み付けした w_i(I(x_i <= x_p) - p))を使った場合の1パスあたりの分散で割った値を分散削減率とする。
+
+        Args:
+            last (np.ndarray): 最終年の各パスの資産合計(n,)
+            weights (np.ndarray, optional): 重点サンプリングの尤度比の重み(n,). Defaults to None.
+            paired_cv (bool, optional): 制御変量法の回帰係数を対の平均から求めるかどうか
+                (Falseではパスごとの値から求める。ヒストグラムに集約する場合). Defaults to True.
+
+        Returns:
+            np.ndarray: 各パーセンタイルの分散削減率(len(percentiles),)
+        """
+        last = np.asarray(last, dtype=np.float64)
+        q = np.asarray(self.param.percentiles) / 100
+        if weights is not None:
+            w = np.asarray(weights, dtype=np.float64)
+            w = w / w.mean()
+            thresholds = _weighted_percentiles(last, w, q)
+        else:
+            thresholds = np.percentile(last, self.param.percentiles, method="nearest")
+        h = (last[np.newaxis, :] <= thresholds[:, np.newaxis]).astype(np.float64)  # (P, n)
+        plain = q * (1 - q)
+        if weights is not None:
+            h = w * (h - q[:, np.newaxis])
+        if self.param.control_variate is True:
+            d = last - last.mean()
+            if self.param.antithetic is False or paired_cv is False:
+                beta = (h - h.mean(axis=1, keepdims=True)) @ d / max(d @ d, 1e-300)
+            else:
+                i1, i2 = _antithetic_pairs(len(last))
+                hp = (h[:, i1] + h[:, i2]) / 2
+                dp = (d[i1] + d[i2]) / 2
+                beta = (hp - hp.mean(axis=1, keepdims=True)) @ dp / max(dp @ dp, 1e-300)
+            h = h - beta[:, np.newaxis] * d
+        per_path = 1.0
+        if self.param.antithetic is True:
+            i1, i2 = _antithetic_pairs(len(last))
+            h = (h[:, i1] + h[:, i2]) / 2
+            per_path = 2.0  # 対の平均1つは2パス分
+        reduced = h.var(axis=1) * per_path
+        return np.where(reduced > 0, plain / np.where(reduced > 0, reduced, 1.0), 1.0)
+
+    def get_variance_reduction(self) -> np.ndarray:
+        """対称変量法/制御変量法/重点サンプリングによる最終年の各パーセンタイルの分散削減率を返す関数。
+        同じ精度を得るのに必要なパス数が単純なモンテカルロの何分の1になるかを表す(使わない場合は1)。
+        keep_result=Falseでは最初のブロックから推定した値を返す。
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: 各パーセンタイルの分散削減率(len(percentiles),)
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        if self._uses_variance_reduction() is False:
+            return np.ones(len(self.param.percentiles))
+        result = self._filled_result()
+        if result is None:
+            return self._summary_vrf
+        last = result[-1, :]
+        w = None if self.weights is None else self.weights[: len(last)]
+        with self.profile.span("percentile"):
+            return self._estimate_variance_reduction(last, w)
+
+    def get_percentile_ci(self, z: float = 1.96) -> np.ndarray:
+        """最終年の各パーセンタイルの信頼区間を順序統計量から計算する関数。
+        n個のパスのうちp分位点の順位は平均np,標準偏差sqrt(np(1-p))の二項分布に従うので、
+        その順位の±z倍の範囲に位置する値を信頼区間とする(分布の形によらない)。
+        対称変量法/制御変量法/重点サンプリングを使う場合は、順位の標準偏差を分散削減率の平方根で割る。
+
+        Args:
+            z (float, optional): 信頼区間の幅(標準正規分布の分位点). Defaults to 1.96(95%).
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: 各パーセンタイルの信頼区間の下限と上限(len(percentiles), 2)
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        result = self._filled_result()
+        n = result.shape[1] if result is not None else self.summary.size
+        q = np.asarray(self.param.percentiles) / 100
+        with self.profile.span("percentile"):
+            vrf = self.get_variance_reduction()
+            half = z * np.sqrt(q * (1 - q) / (n * vrf))
+            vals = self._get_final_percentiles(np.concatenate([q - half, q + half]))
+        return np.stack([vals[: len(q)], vals[len(q) :]], axis=1)
+
+    def get_percentile_error(self, z: float = 1.96) -> np.ndarray:
+        """最終年の各パーセンタイルの推定相対誤差(信頼区間の半幅/推定値)を計算する関数。
+        信頼区間はget_percentile_ci()と同じく順序統計量から求める。
+
+        Args:
+            z (float, optional): 信頼区間の幅(標準正規分布の分位点). Defaults to 1.96(95%).
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: 各パーセンタイルの相対誤差(len(percentiles),)
+        """
+        with self.profile.span("percentile"):
+            ci = self.get_percentile_ci(z)
+            est = self._get_final_percentiles(np.asarray(self.param.percentiles) / 100)
+        half = (ci[:, 1] - ci[:, 0]) / 2
+        # 推定値が0付近の場合は元本を基準にする
+        base = np.maximum(np.abs(est.astype(np.float64)), np.abs(self.org[-1]) * 1e-3)
+        return half / np.maximum(base, 1.0)
+
+    def get_percentile_bounds(self) -> np.ndarray:
+        """keep_result=Falseの場合に、SimSummaryのヒストグラムから近似した各年のパーセンタイルの誤差の範囲を返す関数。
+        ビンごとのパス数は正確なので、全パスを残した場合の値(np.percentile(method="nearest"))はこの範囲にある。
+        範囲の幅はビン幅で、相対誤差はおよそ(asinh変換後の値域の幅/SUMMARY_BINS)程度になる。
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: 各年の各パーセンタイルの下限と上限(year, len(percentiles), 2)。全パスから求めた正確な値の場合はNone
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        if self._filled_result() is not None:
+            return None
+        with self.profile.span("percentile"):
+            return self.summary.get_percentile_bounds(
+                list(self.param.percentiles), self._get_cv_expected()
+            )
+
+    def get_expected_shortfall(self) -> np.ndarray:
+        """最終年の各パーセンタイルの期待ショートフォール(資産額がパーセンタイル以下になる場合の平均)を計算する関数。
+        制御変量法/重点サンプリングの場合は各パスの重みで重み付けした平均とする
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: 各パーセンタイルの期待ショートフォール(len(percentiles),)
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        with self.profile.span("percentile"):
+            return self._calc_expected_shortfall()
+
+    def _calc_expected_shortfall(self) -> np.ndarray:
+        """最終年の各パーセンタイルの期待ショートフォールを計算する関数
+
+        Returns:
+            np.ndarray: _description_
+        """
+        idxs = self.param.percentiles
+        result = self._filled_result()
+        if result is None:
+            return self.summary.get_expected_shortfall(idxs, self._get_cv_expected())
+        last = np.asarray(result[-1, :], dtype=np.float64)
+        w = self._get_path_weights(last, -1)
+        if w is None:
+            w = np.ones(len(last))
+        order = np.argsort(last, kind="stable")
+        cum = np.maximum.accumulate(np.cumsum(w[order]))
+        cum_val = np.cumsum(w[order] * last[order])
+        res = np.zeros(len(idxs))
+        for j, p in enumerate(idxs):
+            # パーセンタイルの順位までの重み付き平均(境界のパスは順位の割合だけ加える)
+            rank = max(p / 100 * cum[-1], 1e-12)
+            k = min(int(np.searchsorted(cum, rank, side="left")), len(last) - 1)
+            below = cum[k - 1] if k > 0 else 0.0
+            below_val = cum_val[k - 1] if k > 0 else 0.0
+            res[j] = (below_val + (rank - below) * last[order[k]]) / rank
+        return res
+
+    def get_percentile_describe(
+        self, with_ci: bool = False, with_es: bool = False
+    ) -> pd.DataFrame:
+        """パーセンタイルと分析値を作成してDataFrameとして返す。
+        keep_result=Falseの場合はパーセンタイルがヒストグラムからの近似値になるため、
+        get_percentile_bounds()の誤差の範囲の列を追加し、df.attrs["approximate"]をTrueとする
+
+        Args:
+            with_ci (bool, optional): 各パーセンタイルの95%信頼区間の列を追加するかどうか. Defaults to False.
+            with_es (bool, optional): 各パーセンタイルの期待ショートフォールの列を追加するかどうか. Defaults to False.
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            pd.DataFrame: _description_
+        """
+        if self.has_result() is False or self.org is None:
+            raise ValueError("Simulation result is not Calculated")
+        idxs = self.param.percentiles
+        labels = [self._get_percentile_label(i) for i in idxs]
+        pers = self.get_percentile_table()[-1, :].astype(int)
+        ci = self.get_percentile_ci().astype(int) if with_ci is True else None
+        es = self.get_expected_shortfall().astype(int) if with_es is True else None
+        bounds = self.get_percentile_bounds()
+        diff = pers - self.org[-1]
+        plus_ratio = diff / self.org[-1]
+        with self.profile.span("dataframe"):
+            df = pd.DataFrame(
+                {
+                    DataFrameKey.percentile.value: idxs,
+                    DataFrameKey.labels.value: labels,
+                    DataFrameKey.result.value: pers,
+                    DataFrameKey.profit.value: diff,
+                    DataFrameKey.profit_ratio.value: plus_ratio,
+                }
+            )
+            if ci is not None:
+                df[DataFrameKey.ci_lower.value] = ci[:, 0]
+                df[DataFrameKey.ci_upper.value] = ci[:, 1]
+            if es is not None:
+                df[DataFrameKey.shortfall.value] = es
+            if bounds is not None:
+                df[DataFrameKey.approx_lower.value] = bounds[-1, :, 0].astype(int)
+                df[DataFrameKey.approx_upper.value] = bounds[-1, :, 1].astype(int)
+            df.attrs["approximate"] = bounds is not None
+            df.sort_values(DataFrameKey.result.value, inplace=True, ascending=False)
+            df.reset_index(inplace=True, drop=True)
+        # print(df)
+        return df
+
+    def get_percentile_ranks(self, band: int = 1) -> np.ndarray:
+        """最終年の値の順位から、各パーセンタイルに位置するパスのインデックスを返す関数。
+        np.percentile(method="nearest")と同じ順位のパスを、1度のargpartitionで選ぶ。
+        band>1の場合は、その順位を中心にband個の順位が近いパスを選ぶ。
+
+        Args:
+            band (int, optional): 1つのパーセンタイルあたりに選ぶパス数. Defaults to 1.
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            np.ndarray: パスのインデックス(len(percentiles), band)
+        """
+        result = self._filled_result()
+        if result is None:
+            raise ValueError("Simulation result is not Calculated")
+        if band <= 0:
+            raise ValueError("band must be positive")
+        last = result[-1, :]
+        n = len(last)
+        qs = np.asarray(self.param.percentiles) / 100
+        w = self._get_path_weights(np.asarray(last), -1)
+        if w is not None:
+            # 制御変量法/重点サンプリングでは重み付きの累積分布がパーセンタイルを超える順位を使う
+            order = np.argsort(last, kind="stable")
+            cum = np.maximum.accumulate(np.cumsum(w[order]))
+            ranks = np.searchsorted(cum, qs * cum[-1], side="left")
+        else:
+            # np.percentile(method="nearest")と同じ丸め方で順位を求める
+            ranks = np.around((n - 1) * qs)
+        ranks = ranks.astype(np.intp)[:, np.newaxis] + (np.arange(band) - band // 2)
+        ranks = np.clip(ranks, 0, n - 1)
+
+        if w is None:
+            kth = np.unique(ranks)
+            if len(kth) > 64:
+                # 順位の数が多い場合は全体をソートした方が速い
+                order = np.argsort(last, kind="stable")
+            else:
+                order = np.argpartition(last, kth)
+        return order[ranks]
+
+    def get_percentile_history(self, band: int = 1):
+        """パーセンタイルを計算し、その利益率の推移をDataFrameとして返す。
+        なお、パーセンタイルは最終結果から計算し、それに対応する過去の履歴を使っている。
+        その時点時点でのパーセンタイルを使う場合は別の関数を利用する。
+        band>1では、最終結果の順位がパーセンタイルに近いband個のパスの平均を履歴とする(1本のパスよりノイズが少ない)。
+        keep_result=Falseの場合は、近似したパーセンタイルに近い候補パスの履歴になるため、df.attrs["approximate"]をTrueとする。
+
+        Args:
+            band (int, optional): 1つのパーセンタイルあたりに平均するパス数. Defaults to 1.
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            _type_: _description_
+        """
+        if self.has_result() is False or self.org is None:
+            raise ValueError("Simulation result is not Calculated")
+        idxs = self.param.percentiles
+        result = self._filled_result()
+        with self.profile.span("percentile"):
+            if result is not None:
+                i_p = self.get_percentile_ranks(band)  # (len(idxs), band)
+                paths = result[:, i_p].mean(axis=2, dtype=np.float64).T  # (len(idxs), year)
+            else:
+                paths = self.summary.get_history(idxs, band, self._get_cv_expected())
+        with self.profile.span("dataframe"):
+            data = {}
+            for i, path in zip(idxs, paths):
+                # 利益率に変換
+                data[self._get_percentile_label(i)] = (path - self.org) / self.org
+            data[DataFrameKey.passing_year.value] = np.arange(1, self.param.year + 1)
+            df = pd.DataFrame(data)
+            df.attrs["approximate"] = result is None
+        return df
+
+    def get_percentile_eachtime(self):
+        """パーセンタイルを計算し、その利益率の推移をDataFrameとして返す。
+        なお、パーセンタイルはその時刻ごとに計算している。
+        keep_result=Falseの場合はヒストグラムからの近似値になるため、df.attrs["approximate"]をTrueとし、
+        df.attrs["approx_bounds"]に利益率に換算した誤差の範囲(year, len(percentiles), 2)を入れる。
+
+        Raises:
+            ValueError: _description_
+
+        Returns:
+            _type_: _description_
+        """
+        if self.has_result() is False or self.org is None:
+            raise ValueError("Simulation result is not Calculated")
+        idxs = self.param.percentiles
+        src = self.get_percentile_table()
+        bounds = self.get_percentile_bounds()
+        with self.profile.span("dataframe"):
+            # 利益率に変換
+            src = (src - self.org[:, np.newaxis]) / self.org[:, np.newaxis]
+
+            cols = [self._get_percentile_label(p) for p in idxs]
+            df = pd.DataFrame(data=src, columns=cols)
+            df[DataFrameKey.passing_year.value] = np.arange(1, self.param.year + 1)
+            df.attrs["approximate"] = bounds is not None
+            if bounds is not None:
+                org = self.org[:, np.newaxis, np.newaxis]
+                df.attrs["approx_bounds"] = (bounds - org) / org
+        # print(df)
+        return df
+
+    def get_hist(self) -> (np.ndarray, np.ndarray):
+        """最終年の資産額のヒストグラムを密度として返す関数。
+        simulate()でhist_binsを指定した場合は、蓄積したヒストグラムを返す
+
+        Returns:
+            (np.ndarray, np.ndarray): 密度とビンの境界
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        if self.hist is not None:
+            return self.hist.get_density()
+        result = self._filled_result()
+        if result is None:
+            return self.summary.get_hist()
+        w = None if self.weights is None else self.weights[: result.shape[1]]
+        h, b = np.histogram(result[-1, :], bins="sturges", density=True, weights=w)
+        return h, b
+
+    def get_histogram(self, per_year: bool = False, bins: int = HIST_BINS) -> SimHistogram:
+        """分布のグラフ用に資産額のヒストグラムを返す関数。
+        simulate()で蓄積したヒストグラムがあればそれを返し、なければ全パスの結果をブロックごとに蓄積するか、
+        keep_result=Falseの場合はSimSummaryのヒストグラムを等間隔なビンに振り分け直して作る
+
+        Args:
+            per_year (bool, optional): 各年のヒストグラムが必要かどうか. Defaults to False.
+            bins (int, optional): 蓄積したヒストグラムがない場合のビン数. Defaults to HIST_BINS.
+
+        Returns:
+            SimHistogram: _description_
+        """
+        if self.has_result() is False:
+            raise ValueError("Simulation result is not Calculated")
+        if self.hist is not None and (per_year is False or self.hist.per_year is True):
+            return self.hist
+        result = self._filled_result()
+        if result is None:
+            mass = self.summary.get_mass(self._get_cv_expected())
+            edges = self.summary.get_edges()
+            if per_year is False:
+                mass, edges = mass[-1:], edges[-1:]
+            return SimHistogram.from_mass(mass, edges, bins)
+        n = result.shape[1]
+        hist = SimHistogram.from_totals(result[:, :SEED_BLOCK], bins, per_year)
+        for i in range(0, n, SEED_BLOCK):
+            w = None if self.weights is None else self.weights[i : i + SEED_BLOCK]
+            hist.add(result[:, i : i + SEED_BLOCK], w)
+        return hist
@@ -0,0 +1,172 @@
+import os
+import numpy as np
+import pandas as pd
+
+# 拡張子 -> 書き出し形式
+EXPORT_FORMATS = {
+    ".npz": "npz",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".csv": "csv",
+}
+
+# 1度に書き出す行((パス, 年)の組)の数の目安
+EXPORT_CHUNK_ROWS = 1_000_000
+
+
+def _import_pyarrow():
+    """parquet/arrow形式の書き出しに使うpyarrowを読み込む関数(任意の依存パッケージ)
+
+    Raises:
+        ImportError: pyarrowがインストールされていない場合
+
+    Returns:
+        module: pyarrow
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required to export parquet/arrow files (pip install pyarrow)"
+        ) from e
+    return pyarrow
+
+
+def get_export_format(fpath: str, fmt: str = None) -> str:
+    """書き出し形式を返す関数。指定がなければファイルの拡張子から決める
+
+    Args:
+        fpath (str): 書き出し先のファイル名
+        fmt (str, optional): 書き出し形式(EXPORT_FORMATSの値のいずれか). Defaults to None(拡張子から決める).
+
+    Raises:
+        ValueError: 形式が不明な場合
+
+    Returns:
+        str: _description_
+    """
+    if fmt is None:
+        fmt = EXPORT_FORMATS.get(os.path.splitext(fpath)[1].lower())
+    if fmt not in EXPORT_FORMATS.values():
+        raise ValueError(f"export format must be one of {sorted(set(EXPORT_FORMATS.values()))}")
+    return fmt
+
+
+def iter_export_chunks(sim, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """全パスの結果を、行数がchunk_rows程度になるパスの範囲ごとに列の辞書として返すジェネレータ。
+    各列は(パス, 年)の順に平らにした1次元配列で、全体を1つのDataFrameにはしない
+
+    Args:
+        sim (MonteCarloSimBase): 全パスの結果(keep_result=True)を持つシミュレーションクラス
+        chunk_rows (int, optional): 1度に返す行数の目安. Defaults to EXPORT_CHUNK_ROWS.
+
+    Yields:
+        dict: 列名 -> 値の1次元配列
+    """
+    n = sim.get_result().shape[1]
+    per_chunk = max(1, chunk_rows // max(1, sim.param.year))
+    for start in range(0, n, per_chunk):
+        yield sim._get_export_columns(slice(start, min(start + per_chunk, n)))
+
+
+def export_npz(sim, fpath: str, compress: bool = False):
+    """全パスの配列をそのままの形状でnpz形式に書き出す関数。
+    配列はnp.savez内で少しずつ書き出されるため、memmap上の結果も全体を読み込まずに書き出せる
+
+    Args:
+        sim (MonteCarloSimBase): 全パスの結果を持つシミュレーションクラス
+        fpath (str): 書き出し先のファイル名
+        compress (bool, optional): 圧縮するかどうか. Defaults to False.
+    """
+    arrays = sim._get_export_arrays()
+    if compress is True:
+        np.savez_compressed(fpath, **arrays)
+    else:
+        np.savez(fpath, **arrays)
+
+
+def export_parquet(sim, fpath: str, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """全パスの結果を(パス, 年)ごとの行としてparquet形式に書き出す関数。チャンクごとに1つのrow groupとする
+
+    Args:
+        sim (MonteCarloSimBase): 全パスの結果を持つシミュレーションクラス
+        fpath (str): 書き出し先のファイル名
+        chunk_rows (int, optional): 1度に書き出す行数の目安. Defaults to EXPORT_CHUNK_ROWS.
+    """
+    pa = _import_pyarrow()
+    writer = None
+    try:
+        for cols in iter_export_chunks(sim, chunk_rows):
+            table = pa.table(cols)
+            if writer is None:
+                writer = pa.parquet.ParquetWriter(fpath, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_arrow(sim, fpath: str, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """全パスの結果を(パス, 年)ごとの行としてArrow IPC(Feather v2)形式に書き出す関数。チャンクごとに1つのRecordBatchとする
+
+    Args:
+        sim (MonteCarloSimBase): 全パスの結果を持つシミュレーションクラス
+        fpath (str): 書き出し先のファイル名
+        chunk_rows (int, optional): 1度に書き出す行数の目安. Defaults to EXPORT_CHUNK_ROWS.
+    """
+    pa = _import_pyarrow()
+    writer = None
+    try:
+        for cols in iter_export_chunks(sim, chunk_rows):
+            batch = pa.record_batch(cols)
+            if writer is None:
+                writer = pa.ipc.new_file(fpath, batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_csv(sim, fpath: str, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """全パスの結果を(パス, 年)ごとの行としてCSV形式に書き出す関数。チャンクごとに追記していく
+
+    Args:
+        sim (MonteCarloSimBase): 全パスの結果を持つシミュレーションクラス
+        fpath (str): 書き出し先のファイル名
+        chunk_rows (int, optional): 1度に書き出す行数の目安. Defaults to EXPORT_CHUNK_ROWS.
+    """
+    with open(fpath, encoding="utf-8", mode="w", newline="") as f:
+        for i, cols in enumerate(iter_export_chunks(sim, chunk_rows)):
+            pd.DataFrame(cols).to_csv(f, header=i == 0, index=False)
+
+
+def export_result(
+    sim, fpath: str, fmt: str = None, chunk_rows: int = EXPORT_CHUNK_ROWS, compress: bool = False
+):
+    """全パスのシミュレーション結果をファイルに書き出す関数
+
+    Args:
+        sim (MonteCarloSimBase): 全パスの結果を持つシミュレーションクラス
+        fpath (str): 書き出し先のファイル名
+        fmt (str, optional): 書き出し形式("npz", "parquet", "arrow", "csv"). Defaults to None(拡張子から決める).
+        chunk_rows (int, optional): 1度に書き出す行数の目安(npz以外). Defaults to EXPORT_CHUNK_ROWS.
+        compress (bool, optional): npz形式で圧縮するかどうか. Defaults to False.
+
+    Raises:
+        ValueError: 形式が不明な場合
+        ImportError: parquet/arrow形式でpyarrowがインストールされていない場合
+    """
+    fmt = get_export_format(fpath, fmt)
+    if chunk_rows <= 0:
+        raise ValueError("chunk_rows must be positive")
+    if fmt == "npz":
+        export_npz(sim, fpath, compress)
+    elif fmt == "parquet":
+        export_parquet(sim, fpath, chunk_rows)
+    elif fmt == "arrow":
+        export_arrow(sim, fpath, chunk_rows)
+    else:
+        export_csv(sim, fpath, chunk_rows)
@@ -0,0 +1,273 @@
+import numpy as np
+
+# 分布のグラフ用ヒストグラムの既定のビン数
+HIST_BINS = 120
+
+
+class SimHistogram:
+    """全パスを保持せずに、資産額のヒストグラムをチャンクごとに蓄積するクラス。
+
+    ビンは等間隔(fixed)または対数で等間隔(log)の固定の境界とし、境界が同じSimHistogramどうしは
+    merge()で結合できるため、チャンクやワーカーごとに蓄積した結果を順に足し合わせられる。
+    ビンの範囲外の値は下側(under),上側(over)にまとめて数える(対数の場合は0以下の値も下側に数える)。
+    最終年だけでなく、各年のヒストグラムも蓄積できる(per_year=True)。
+    重点サンプリングの場合はパスの尤度比の重みで重み付けして数える。
+    """
+
+    def __init__(self, lo: np.ndarray, hi: np.ndarray, bins: int = HIST_BINS, log: bool = False):
+        """
+        Args:
+            lo (np.ndarray): 各行(年)のビンの下限(rows,)
+            hi (np.ndarray): 各行(年)のビンの上限(rows,)
+            bins (int, optional): 1行あたりのビン数. Defaults to HIST_BINS.
+            log (bool, optional): 対数で等間隔なビンにするかどうか. Defaults to False.
+
+        Raises:
+            ValueError: ビンの範囲が不正な場合
+        """
+        lo = np.atleast_1d(np.asarray(lo, dtype=np.float64))
+        hi = np.atleast_1d(np.asarray(hi, dtype=np.float64))
+        if bins <= 0:
+            raise ValueError("bins must be positive")
+        if lo.shape != hi.shape or np.any(hi <= lo):
+            raise ValueError("hi must be greater than lo")
+        if log is True and np.any(lo <= 0):
+            raise ValueError("lo must be positive for log-spaced bins")
+        self.lo = lo
+        self.hi = hi
+        self.bins = bins
+        self.log = log
+
+        rows = len(lo)
+        self.size = 0
+        self.counts = np.zeros((rows, bins))  # 各行,各ビンのパス数(重み)
+        self.under = np.zeros(rows)  # 下限未満のパス数(重み)
+        self.over = np.zeros(rows)  # 上限以上のパス数(重み)
+
+    @classmethod
+    def from_totals(
+        cls,
+        totals: np.ndarray,
+        bins: int = HIST_BINS,
+        per_year: bool = False,
+        log: bool = None,
+        margin: float = 0.25,
+        tail: float = 0.001,
+    ):
+        """最初のチャンクの結果からビンの範囲を決めてSimHistogramを作成する関数。
+        裾の外れ値でビンが粗くならないよう、両側のtailの割合を除いた値域の両側に
+        (値域の幅*margin)の余裕を持たせる(対数の場合は対数での幅)。
+
+        Args:
+            totals (np.ndarray): 各年,各パターンの資産合計(year, n)
+            bins (int, optional): 1行あたりのビン数. Defaults to HIST_BINS.
+            per_year (bool, optional): 各年のヒストグラムを蓄積するかどうか(Falseなら最終年のみ). Defaults to False.
+            log (bool, optional): 対数で等間隔なビンにするかどうか. Defaults to None(値域の下限が正なら対数).
+            margin (float, optional): 値域の幅に対する余裕の割合. Defaults to 0.25.
+            tail (float, optional): 値域から除く片側の裾の割合. Defaults to 0.001.
+
+        Returns:
+            SimHistogram: 空のSimHistogram(totalsは追加されていない)
+        """
+        vals = np.atleast_2d(totals)
+        if per_year is False:
+            vals = vals[-1:, :]
+        lo, hi = np.quantile(vals.astype(np.float64), [tail, 1 - tail], axis=1)
+        if log is None:
+            log = bool(np.all(lo > 0))
+        return cls(*cls._widen(lo, hi, log, margin), bins, log)
+
+    @staticmethod
+    def _widen(lo: np.ndarray, hi: np.ndarray, log: bool, margin: float) -> (np.ndarray, np.ndarray):
+        """値域の両側に(値域の幅*margin)の余裕を持たせる関数(対数の場合は対数での幅)
+
+        Args:
+            lo (np.ndarray): 各行の値域の下限(rows,)
+            hi (np.ndarray): 各行の値域の上限(rows,)
+            log (bool): 対数で等間隔なビンにするかどうか
+            margin (float): 値域の幅に対する余裕の割合
+
+        Raises:
+            ValueError: 対数のビンで値域の下限が正でない場合
+
+        Returns:
+            (np.ndarray, np.ndarray): 余裕を持たせた下限と上限
+        """
+        if log is True:
+            if np.any(lo <= 0):
+                raise ValueError("lo must be positive for log-spaced bins")
+            lo, hi = np.log(lo), np.log(hi)
+        width = np.maximum((hi - lo) * margin, np.maximum(np.abs(hi) * 1e-6, 1e-6))
+        lo, hi = lo - width, hi + width
+        if log is True:
+            lo, hi = np.exp(lo), np.exp(hi)
+        return lo, hi
+
+    @property
+    def per_year(self) -> bool:
+        """各年のヒストグラムを蓄積しているかどうか(1行なら最終年のみ)"""
+        return len(self.lo) > 1
+
+    def empty_like(self):
+        """同じビンを持つ空のSimHistogramを返す関数
+
+        Returns:
+            SimHistogram: _description_
+        """
+        return SimHistogram(self.lo, self.hi, self.bins, self.log)
+
+    def get_edges(self) -> np.ndarray:
+        """各行のビンの境界を返す関数
+
+        Returns:
+            np.ndarray: ビンの境界(rows, bins+1)
+        """
+        t = np.linspace(0.0, 1.0, self.bins + 1)
+        if self.log is True:
+            lo, hi = np.log(self.lo), np.log(self.hi)
+            return np.exp(lo[:, np.newaxis] + (hi - lo)[:, np.newaxis] * t)
+        return self.lo[:, np.newaxis] + (self.hi - self.lo)[:, np.newaxis] * t
+
+    def add(self, totals: np.ndarray, weights: np.ndarray = None):
+        """チャンクの結果を追加する関数。最終年のみの場合はtotalsの最終行だけを数える
+
+        Args:
+            totals (np.ndarray): 各年,各パターンの資産合計(year, n)
+            weights (np.ndarray, optional): 重点サンプリングの各パスの重み(n,). Defaults to None.
+        """
+        vals = np.atleast_2d(totals)[-len(self.lo) :, :]
+        rows, n = vals.shape
+        if n == 0:
+            return
+        if self.log is True:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                u = np.log(np.maximum(vals, 0.0, dtype=np.float64))  # 0以下は-infとして下側に数える
+            lo, hi = np.log(self.lo), np.log(self.hi)
+        else:
+            u = vals.astype(np.float64)
+            lo, hi = self.lo, self.hi
+        # 一時配列を増やさないよう、ビンの番号への変換はその場で行う
+        u -= lo[:, np.newaxis]
+        u *= (self.bins / (hi - lo))[:, np.newaxis]
+        # 下側を-1, 上側をbinsとし、行ごとにbins+2個の区間として数える
+        # (1を足してから0以上の値を切り捨てるため、floorは不要)
+        np.clip(u, -1, self.bins, out=u)
+        u += (np.arange(rows) * (self.bins + 2) + 1)[:, np.newaxis]
+        idx = u.astype(np.intp)
+        w = None
+        if weights is not None:
+            w = np.broadcast_to(np.asarray(weights, dtype=np.float64), idx.shape).ravel()
+        counts = np.bincount(idx.ravel(), weights=w, minlength=rows * (self.bins + 2)).reshape(
+            rows, self.bins + 2
+        )
+        self.under += counts[:, 0]
+        self.counts += counts[:, 1:-1]
+        self.over += counts[:, -1]
+        self.size += n
+
+    def merge(self, other):
+        """同じビンで作成した別のSimHistogramを結合する関数
+
+        Args:
+            other (SimHistogram): _description_
+
+        Raises:
+            ValueError: ビンが異なる場合
+        """
+        if (
+            self.bins != other.bins
+            or self.log != other.log
+            or not np.array_equal(self.lo, other.lo)
+            or not np.array_equal(self.hi, other.hi)
+        ):
+            raise ValueError("histograms with different bins cannot be merged")
+        self.counts += other.counts
+        self.under += other.under
+        self.over += other.over
+        self.size += other.size
+
+    def get_shares(self) -> np.ndarray:
+        """各行,各ビンに入ったパスの割合を返す関数(範囲外も含めた全体に対する割合)
+
+        Returns:
+            np.ndarray: 各行,各ビンの割合(rows, bins)
+        """
+        total = self.counts.sum(axis=1) + self.under + self.over
+        return self.counts / np.where(total > 0, total, 1.0)[:, np.newaxis]
+
+    def get_density(self) -> (np.ndarray, np.ndarray):
+        """最終年のヒストグラムを密度として返す関数
+
+        Returns:
+            (np.ndarray, np.ndarray): 密度とビンの境界
+        """
+        edges = self.get_edges()[-1]
+        return self.get_shares()[-1] / np.diff(edges), edges
+
+    def rebin(self, edges: np.ndarray) -> np.ndarray:
+        """各行のヒストグラムを共通のビンの境界に振り分け直した割合を返す関数。
+        ビン内では(対数の場合は対数で)一様に分布しているとみなして累積分布を補間する
+
+        Args:
+            edges (np.ndarray): 共通のビンの境界(昇順)(m+1,)
+
+        Returns:
+            np.ndarray: 各行,各ビンの割合(rows, m)
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        src = self.get_edges()
+        shares = self.get_shares()
+        cum = np.concatenate([np.zeros((len(shares), 1)), np.cumsum(shares, axis=1)], axis=1)
+        if self.log is True:
+            src = np.log(src)
+            with np.errstate(divide="ignore"):
+                edges = np.log(np.where(edges > 0, edges, 0.0))
+        out = np.array([np.interp(edges, src[i], cum[i]) for i in range(len(shares))])
+        return np.diff(out, axis=1)
+
+    @classmethod
+    def from_mass(
+        cls,
+        mass: np.ndarray,
+        edges: np.ndarray,
+        bins: int = HIST_BINS,
+        log: bool = None,
+        margin: float = 0.25,
+        tail: float = 0.001,
+    ):
+        """別の境界で集計したヒストグラム(SimSummaryのビンなど)から、等間隔なビンのSimHistogramを作る関数。
+        値域はfrom_totals()と同様に決め、元のビン内では一様に分布しているとみなして振り分ける
+
+        Args:
+            mass (np.ndarray): 各行,各ビンのパス数(重み)(rows, k)
+            edges (np.ndarray): 各行のビンの境界(rows, k+1)
+            bins (int, optional): 1行あたりのビン数. Defaults to HIST_BINS.
+            log (bool, optional): 対数で等間隔なビンにするかどうか. Defaults to None(値域の下限が正なら対数).
+            margin (float, optional): 値域の幅に対する余裕の割合. Defaults to 0.25.
+            tail (float, optional): 値域から除く片側の裾の割合. Defaults to 0.001.
+
+        Returns:
+            SimHistogram: _description_
+        """
+        rows = len(mass)
+        total = mass.sum(axis=1)
+        cum = np.concatenate([np.zeros((rows, 1)), np.cumsum(mass, axis=1)], axis=1)
+        ratio = cum / np.where(total > 0, total, 1.0)[:, np.newaxis]
+        lo = np.array([np.interp(tail, ratio[i], edges[i]) for i in range(rows)])
+        hi = np.array([np.interp(1 - tail, ratio[i], edges[i]) for i in range(rows)])
+        if log is None:
+            log = bool(np.all(lo > 0))
+        hist = cls(*cls._widen(lo, hi, log, margin), bins, log)
+
+        dst = hist.get_edges()
+        src = edges
+        if log is True:
+            # 0以下の境界(パスがあれば下側に数える)は下限より小さい値に置き換えて対数をとる
+            src = np.log(np.maximum(edges, hist.lo.min() * 1e-12))
+            dst = np.log(dst)
+        at = np.array([np.interp(dst[i], src[i], cum[i]) for i in range(rows)])
+        hist.counts = np.diff(at, axis=1)
+        hist.under = at[:, 0]
+        hist.over = total - at[:, -1]
+        hist.size = int(round(float(total.max())))
+        return hist
@@ -0,0 +1,171 @@
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable
+
+# 計測する処理の区分と表示名
+PHASES = {
+    "shock": "乱数生成",
+    "accumulate": "累積・リバランス",
+    "reduce": "資産合計の集約",
+    "percentile": "パーセンタイル",
+    "dataframe": "DataFrame作成",
+    "plot": "グラフ描画",
+}
+
+
+class SimProfile:
+    """シミュレーションの処理区分(PHASES)ごとの処理時間と、パス数/秒,ピークメモリを記録するクラス。
+
+    区分ごとの時間は合計して保持し、span()の中で別のspan()を使った場合は外側の区分の時間に含める。
+    hookを指定すると、区分の時間を記録するたびに
+    {"name", "start", "seconds"}の辞書(startはtime.time()の値)を渡して呼ぶので、
+    外部のプロファイラやJsonlProfileHookへそのまま転送できる。
+    workers>1の場合、ワーカープロセス内の区分の時間はチャンクごとにまとめてmerge()される(全プロセスの合計)。
+    """
+
+    def __init__(self, hook: Callable[[dict], None] = None):
+        """
+        Args:
+            hook (Callable[[dict], None], optional): 区分の時間を記録するたびに呼ぶ関数. Defaults to None.
+        """
+        self.hook = hook
+        self.spans = {}  # 区分名 -> 合計時間[s]
+        self.n_paths = 0  # シミュレーションしたパス数
+        self.elapsed = None  # simulate()全体の経過時間[s]
+        # simulate()中のメインプロセスのピークメモリ[MiB]。tracemallocで計測した値に、
+        # tracemallocで追跡できない共有メモリ(workers>1の結果の配列)の分を加える(ワーカープロセスの分は含まない)
+        self.peak_mb = None
+        self.untraced_bytes = 0
+        self._trace_started = False
+        self._depth = 0  # 実行中のspan()の入れ子の深さ
+
+    def add(self, name: str, seconds: float, start: float = None):
+        """区分の時間を加算する関数
+
+        Args:
+            name (str): 区分名
+            seconds (float): 時間[s]
+            start (float, optional): 開始時刻(time.time()). Defaults to None(現在時刻から逆算).
+        """
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+        if self.hook is not None:
+            if start is None:
+                start = time.time() - seconds
+            self.hook({"name": name, "start": start, "seconds": seconds})
+
+    @contextmanager
+    def span(self, name: str):
+        """with文の中の処理時間を区分の時間として加算する。入れ子の場合は外側の区分のみに加算する
+
+        Args:
+            name (str): 区分名
+        """
+        if self._depth > 0:
+            yield
+            return
+        self._depth += 1
+        start = time.time()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.add(name, time.perf_counter() - t, start)
+
+    def merge(self, other: "SimProfile"):
+        """ワーカープロセスで記録した区分の時間を加算する関数
+
+        Args:
+            other (SimProfile): _description_
+        """
+        for name, seconds in other.spans.items():
+            self.add(name, seconds)
+
+    def start_run(self, trace_memory: bool):
+        """simulate()の開始時に呼び、経過時間とピークメモリの計測を始める関数。
+        他で既にtracemallocを使っている場合は、その計測を妨げないようにピークメモリは計測しない
+
+        Args:
+            trace_memory (bool): ピークメモリを計測するかどうか
+        """
+        self._t0 = time.perf_counter()
+        self._trace_started = False
+        if trace_memory is True and tracemalloc.is_tracing() is False:
+            tracemalloc.start()
+            self._trace_started = True
+
+    def stop_run(self, n_paths: int):
+        """simulate()の終了時(中断時を含む)に呼び、経過時間とピークメモリを記録する関数
+
+        Args:
+            n_paths (int): 計算したパス数
+        """
+        self.elapsed = time.perf_counter() - self._t0
+        self.n_paths = n_paths
+        if self._trace_started is True:
+            self.peak_mb = (tracemalloc.get_traced_memory()[1] + self.untraced_bytes) / 1024**2
+            tracemalloc.stop()
+            self._trace_started = False
+
+    @property
+    def paths_per_sec(self) -> float:
+        """simulate()全体の経過時間から求めた1秒あたりのパス数"""
+        if not self.elapsed:
+            return None
+        return self.n_paths / self.elapsed
+
+    def to_dict(self) -> dict:
+        """記録した内容を辞書で返す関数
+
+        Returns:
+            dict: "spans", "n_paths", "elapsed", "paths_per_sec", "peak_mb"の辞書
+        """
+        return {
+            "spans": dict(self.spans),
+            "n_paths": self.n_paths,
+            "elapsed": self.elapsed,
+            "paths_per_sec": self.paths_per_sec,
+            "peak_mb": self.peak_mb,
+        }
+
+    def format(self) -> str:
+        """記録した内容を1行の表示用の文字列にする関数
+
+        Returns:
+            str: _description_
+        """
+        items = [
+            f"{PHASES.get(name, name)} {seconds:.3f}s"
+            for name, seconds in sorted(
+                self.spans.items(),
+                key=lambda kv: list(PHASES).index(kv[0]) if kv[0] in PHASES else len(PHASES),
+            )
+        ]
+        if self.paths_per_sec is not None:
+            items.append(f"{self.paths_per_sec:,.0f} パス/s")
+        if self.peak_mb is not None:
+            items.append(f"ピークメモリ {self.peak_mb:,.1f}MiB")
+        return " / ".join(items)
+
+
+class JsonlProfileHook:
+    """SimProfileのhookに指定して、区分の時間を1行1つのJSONとしてファイルへ追記するクラス"""
+
+    def __init__(self, fpath: str, **extra):
+        """
+        Args:
+            fpath (str): 追記先のファイル名
+            extra: 全ての行に加える項目(実行名など)
+        """
+        self.fpath = fpath
+        self.extra = extra
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        line = json.dumps({**self.extra, **event}, ensure_ascii=False)
+        with self._lock:
+            with open(self.fpath, encoding="utf-8", mode="a") as f:
+                f.write(line + "\n")
@@ -0,0 +1,367 @@
+import numpy as np
+
+# 1年あたりのヒストグラムのビン数
+SUMMARY_BINS = 8192
+# 履歴用の候補として残す、チャンク内のパーセンタイル位置からの順位のずれ
+CANDIDATE_OFFSETS = np.arange(-2, 3)
+# 候補パスの配列がこの数を超えたら、現時点のパーセンタイルに近い候補だけに絞り込む
+CANDIDATE_COMPACT_CHUNKS = 64
+# 絞り込みで1つのパーセンタイルあたりに残す候補パスの数(get_history()のbandの上限の目安)
+CANDIDATE_KEEP = 128
+
+
+class SimSummary:
+    """全パスを保持せずに、チャンクごとのシミュレーション結果を集約するクラス。
+
+    各年の資産額はasinh(資産額/元本)で等間隔なビンのヒストグラムとして蓄積し(対数に近い間隔で負値も扱える)、
+    パーセンタイルはビン内を線形補間して求める。ビン幅は最初のチャンクの値域から決めるため、
+    パーセンタイルの相対誤差はおよそ(値域の幅/ビン数)程度になる。ビンごとのパス数は正確なので、
+    全パスから求めた値はパーセンタイルの順位を含むビンの中にあり、get_percentile_bounds()でその範囲を返す。
+    パーセンタイルの履歴用には、チャンクごとに各パーセンタイルに位置するパスを候補として残し、
+    候補がCANDIDATE_COMPACT_CHUNKSチャンク分たまるごとに、その時点のパーセンタイルに近いものだけに絞り込む
+    (チャンク数によらず候補のメモリ量は一定以下になる)。
+    同じビンで作成したSimSummaryどうしはmerge()で結合できる。
+    制御変量法で重み付きのパーセンタイルを求められるよう、ビンごとの資産額の合計と各年の1次,2次のモーメントも蓄積する。
+    重点サンプリングの場合はパスの尤度比の重みで重み付けしたヒストグラムも蓄積する。
+    """
+
+    def __init__(
+        self,
+        lo: np.ndarray,
+        hi: np.ndarray,
+        scale: np.ndarray,
+        percentiles: list[int],
+        bins: int = SUMMARY_BINS,
+    ):
+        """
+        Args:
+            lo (np.ndarray): 各年のビンの下限(asinh変換後)(year,)
+            hi (np.ndarray): 各年のビンの上限(asinh変換後)(year,)
+            scale (np.ndarray): 各年のasinh変換のスケール(year,)
+            percentiles (list[int]): 履歴の候補を残すパーセンタイル
+            bins (int, optional): 1年あたりのビン数. Defaults to SUMMARY_BINS.
+        """
+        self.lo = lo
+        self.hi = hi
+        self.scale = scale
+        self.percentiles = list(percentiles)
+        self.bins = bins
+
+        year = len(lo)
+        self.size = 0
+        self.counts = np.zeros((year, bins), dtype=np.int64)
+        self.vmin = np.full(year, np.inf)
+        self.vmax = np.full(year, -np.inf)
+        self.sums = np.zeros((year, bins))  # ビンごとの資産額の合計
+        self.total = np.zeros(year)  # 各年の資産額の合計
+        self.total_sq = np.zeros(year)  # 各年の資産額の2乗の合計
+        self.wcounts = None  # 重点サンプリングの場合のビンごとの重みの合計(year, bins)
+        self.wsums = None  # 重点サンプリングの場合のビンごとの重み付きの資産額の合計(year, bins)
+        self.candidates = []  # チャンクごとの候補パス(len(percentiles)*len(CANDIDATE_OFFSETS), year)のリスト
+
+    @classmethod
+    def from_totals(
+        cls,
+        totals: np.ndarray,
+        org: np.ndarray,
+        percentiles: list[int],
+        bins: int = SUMMARY_BINS,
+    ):
+        """最初のチャンクの結果からビンの範囲を決めてSimSummaryを作成する関数。
+        値域の外側にも余裕を持たせているが、範囲外の値は端のビンに丸めて数える。
+
+        Args:
+            totals (np.ndarray): 各年,各パターンの資産合計(year, n)
+            org (np.ndarray): 各年の元本(year,)
+            percentiles (list[int]): 履歴の候補を残すパーセンタイル
+            bins (int, optional): 1年あたりのビン数. Defaults to SUMMARY_BINS.
+
+        Returns:
+            SimSummary: 空のSimSummary(totalsは追加されていない)
+        """
+        scale = np.maximum(np.abs(org).astype(np.float64), 1.0)
+        u = np.arcsinh(totals / scale[:, np.newaxis])
+        lo = u.min(axis=1)
+        hi = u.max(axis=1)
+        margin = np.maximum((hi - lo) * 0.5, 1e-3)
+        return cls(lo - margin, hi + margin, scale, percentiles, bins)
+
+    def empty_like(self):
+        """同じビンを持つ空のSimSummaryを返す関数
+
+        Returns:
+            SimSummary: _description_
+        """
+        return SimSummary(self.lo, self.hi, self.scale, self.percentiles, self.bins)
+
+    def _to_bin(self, totals: np.ndarray) -> np.ndarray:
+        """資産額をビンの番号に変換する関数"""
+        u = np.arcsinh(totals / self.scale[:, np.newaxis])
+        width = (self.hi - self.lo) / self.bins
+        idx = np.floor((u - self.lo[:, np.newaxis]) / width[:, np.newaxis])
+        return np.clip(idx, 0, self.bins - 1).astype(np.int64)
+
+    def add(self, totals: np.ndarray, weights: np.ndarray = None):
+        """チャンクの結果を追加する関数
+
+        Args:
+            totals (np.ndarray): 各年,各パターンの資産合計(year, n)
+            weights (np.ndarray, optional): 重点サンプリングの各パスの重み(n,). Defaults to None.
+        """
+        year, n = totals.shape
+        if n == 0:
+            return
+        idx = self._to_bin(totals) + (np.arange(year) * self.bins)[:, np.newaxis]
+        self.counts += np.bincount(idx.ravel(), minlength=year * self.bins).reshape(
+            year, self.bins
+        )
+        vals = totals.astype(np.float64)
+        self.sums += np.bincount(
+            idx.ravel(), weights=vals.ravel(), minlength=year * self.bins
+        ).reshape(year, self.bins)
+        self.total += vals.sum(axis=1)
+        self.total_sq += np.einsum("ij,ij->i", vals, vals)
+        if weights is not None:
+            if self.wcounts is None:
+                self.wcounts = np.zeros_like(self.sums)
+                self.wsums = np.zeros_like(self.sums)
+            w = np.broadcast_to(np.asarray(weights, dtype=np.float64), vals.shape).ravel()
+            self.wcounts += np.bincount(idx.ravel(), weights=w, minlength=year * self.bins).reshape(
+                year, self.bins
+            )
+            self.wsums += np.bincount(
+                idx.ravel(), weights=w * vals.ravel(), minlength=year * self.bins
+            ).reshape(year, self.bins)
+        self.vmin = np.minimum(self.vmin, totals.min(axis=1))
+        self.vmax = np.maximum(self.vmax, totals.max(axis=1))
+        self.size += n
+
+        # 最終年の値でチャンク内の各パーセンタイルに位置するパスと、その前後のパスを候補として残す
+        order = np.argsort(totals[-1, :])
+        if weights is not None:
+            # 重点サンプリングでは重み付きの累積分布で順位を決める
+            cum = np.cumsum(np.asarray(weights, dtype=np.float64)[order])
+            ranks = np.searchsorted(cum, np.array(self.percentiles) / 100 * cum[-1])
+        else:
+            ranks = np.round(np.array(self.percentiles) / 100 * (n - 1)).astype(int)
+        ranks = np.clip(ranks[:, np.newaxis] + CANDIDATE_OFFSETS, 0, n - 1).ravel()
+        self.candidates.append(totals[:, order[ranks]].T.copy())
+        self._compact_candidates()
+
+    def merge(self, other):
+        """同じビンで作成した別のSimSummaryを結合する関数
+
+        Args:
+            other (SimSummary): _description_
+        """
+        self.counts += other.counts
+        self.vmin = np.minimum(self.vmin, other.vmin)
+        self.vmax = np.maximum(self.vmax, other.vmax)
+        self.sums += other.sums
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if other.wcounts is not None:
+            if self.wcounts is None:
+                self.wcounts = np.zeros_like(self.sums)
+                self.wsums = np.zeros_like(self.sums)
+            self.wcounts += other.wcounts
+            self.wsums += other.wsums
+        self.size += other.size
+        self.candidates.extend(other.candidates)
+        self._compact_candidates()
+
+    @staticmethod
+    def _select_nearest(cands: np.ndarray, pers: np.ndarray, band: int) -> np.ndarray:
+        """最終年の値が各パーセンタイルに近い順にband個の候補のインデックスを返す関数
+
+        Args:
+            cands (np.ndarray): 候補パス(候補数, year)
+            pers (np.ndarray): 最終年のパーセンタイル(len(idxs),)
+            band (int): 1つのパーセンタイルあたりに選ぶ候補の数(候補数以下)
+
+        Returns:
+            np.ndarray: 候補のインデックス(len(idxs), band)
+        """
+        dist = np.abs(cands[np.newaxis, :, -1] - pers[:, np.newaxis])  # (len(idxs), 候補数)
+        return np.argpartition(dist, band - 1, axis=1)[:, :band]
+
+    def _compact_candidates(self):
+        """候補パスの配列がCANDIDATE_COMPACT_CHUNKSを超えたら、get_history()と同じ選び方で
+        現時点の各パーセンタイルに近いCANDIDATE_KEEP個ずつの候補に絞り込む関数
+        """
+        if len(self.candidates) <= CANDIDATE_COMPACT_CHUNKS:
+            return
+        cands = np.concatenate(self.candidates, axis=0)
+        pers = self.get_percentiles(self.percentiles)[-1, :]
+        keep = min(CANDIDATE_KEEP, len(cands))
+        # 複数のパーセンタイルで選ばれた候補は1つにまとめ、元の順序を保つ
+        nearest = np.unique(self._select_nearest(cands, pers, keep))
+        self.candidates = [cands[nearest]]
+
+    def get_mass(self, expected: np.ndarray = None) -> np.ndarray:
+        """各年,各ビンのパス数(重み)を返す関数。
+        expectedを指定すると、各年の資産額を制御変量とした重み w_i = 1/n + (E - 平均)(x_i - 平均)/Σ(x_j - 平均)^2 を
+        ビンごとに合計し、パス数の単位に換算して返す(重みは資産額の1次式なのでビンごとの合計から計算できる)。
+        重点サンプリングの場合は尤度比の重みの合計をパス数の単位に換算して返す。
+
+        Args:
+            expected (np.ndarray, optional): 各年の資産額の期待値(year,). Defaults to None(重み付けしない).
+
+        Returns:
+            np.ndarray: 各年,各ビンの重み(year, bins)
+        """
+        if self.wcounts is not None:
+            total = self.wcounts.sum(axis=1, keepdims=True)
+            return self.wcounts * self.size / np.where(total > 0, total, 1.0)
+        if expected is None:
+            return self.counts.astype(np.float64)
+        n = self.size
+        mean = self.total / n
+        ss = self.total_sq - n * mean**2
+        beta = np.where(ss > 0, (expected - mean) / np.where(ss > 0, ss, 1.0), 0.0)
+        mass = self.counts + n * beta[:, np.newaxis] * (
+            self.sums - self.counts * mean[:, np.newaxis]
+        )
+        # 重みが負になったビンは0に丸めて累積分布を単調にする
+        return np.maximum(mass, 0.0)
+
+    def get_percentiles(self, idxs: list[int], expected: np.ndarray = None) -> np.ndarray:
+        """ヒストグラムから各年のパーセンタイルを推定する関数
+
+        Args:
+            idxs (list[int]): パーセンタイルのリスト
+            expected (np.ndarray, optional): 制御変量法で使う各年の資産額の期待値(year,). Defaults to None.
+
+        Returns:
+            np.ndarray: 各年のパーセンタイル(year, len(idxs))
+        """
+        mass = self.get_mass(expected)
+        b, frac = self._locate(mass, idxs)
+        width = (self.hi - self.lo) / self.bins
+        u = self.lo[:, np.newaxis] + (b + frac) * width[:, np.newaxis]
+        res = np.sinh(u) * self.scale[:, np.newaxis]
+        return np.clip(res, self.vmin[:, np.newaxis], self.vmax[:, np.newaxis])
+
+    def get_percentile_bounds(self, idxs: list[int], expected: np.ndarray = None) -> np.ndarray:
+        """get_percentiles()の推定値の誤差の範囲を返す関数。パーセンタイルの順位を切り捨て,切り上げた順位を
+        含むビンの範囲で、全パスから求めた値(順位を丸めるnp.percentile(method="nearest")など)もこの範囲にある。
+        範囲外の値を丸めて数える端のビンは、各年の最小値,最大値までを範囲とする
+
+        Args:
+            idxs (list[int]): パーセンタイルのリスト
+            expected (np.ndarray, optional): 制御変量法で使う各年の資産額の期待値(year,). Defaults to None.
+
+        Returns:
+            np.ndarray: 各年の各パーセンタイルの下限と上限(year, len(idxs), 2)
+        """
+        mass = self.get_mass(expected)
+        b_lo, _ = self._locate(mass, idxs, np.floor)
+        b_hi, _ = self._locate(mass, idxs, np.ceil)
+        edges = self.get_edges()  # (year, bins+1)
+        edges[:, 0] = np.minimum(edges[:, 0], self.vmin)
+        edges[:, -1] = np.maximum(edges[:, -1], self.vmax)
+        lower = np.take_along_axis(edges, b_lo, axis=1)
+        upper = np.take_along_axis(edges, b_hi + 1, axis=1)
+        res = np.stack([lower, upper], axis=2)
+        return np.clip(res, self.vmin[:, np.newaxis, np.newaxis], self.vmax[:, np.newaxis, np.newaxis])
+
+    def _locate(
+        self, mass: np.ndarray, idxs: list[int], round_fn=None
+    ) -> (np.ndarray, np.ndarray):
+        """各年の各パーセンタイルの順位を含むビンと、ビン内の位置を求める関数
+
+        Args:
+            mass (np.ndarray): 各年,各ビンのパス数(重み)(year, bins)
+            idxs (list[int]): パーセンタイルのリスト
+            round_fn (optional): 順位を整数に丸める関数(np.floorなど). Defaults to None(丸めない).
+
+        Returns:
+            (np.ndarray, np.ndarray): ビンの番号(year, len(idxs))と、ビン内の位置(0~1)(year, len(idxs))
+        """
+        year = mass.shape[0]
+        cum = np.cumsum(mass, axis=1)  # (year, bins)
+        bins = np.zeros((year, len(idxs)), dtype=np.int64)
+        fracs = np.zeros((year, len(idxs)))
+        for i in range(year):
+            # 重みの合計をパス数に合わせた上で順位に換算する
+            ranks = np.array(idxs, dtype=np.float64) / 100 * (cum[i][-1] - 1)
+            if round_fn is not None:
+                ranks = round_fn(ranks)
+            b = np.searchsorted(cum[i], ranks, side="right")
+            b = np.minimum(b, self.bins - 1)
+            below = np.where(b > 0, cum[i][b - 1], 0)
+            frac = (ranks - below + 0.5) / np.where(mass[i][b] > 0, mass[i][b], 1)
+            bins[i, :] = b
+            fracs[i, :] = np.clip(frac, 0.0, 1.0)
+        return bins, fracs
+
+    def get_expected_shortfall(
+        self, idxs: list[int], expected: np.ndarray = None
+    ) -> np.ndarray:
+        """ヒストグラムから最終年の期待ショートフォール(各パーセンタイル以下の資産額の平均)を推定する関数。
+        ビン内の資産額はビンごとの平均値で代表させ、パーセンタイルを含むビンは順位の割合だけ加える
+
+        Args:
+            idxs (list[int]): パーセンタイルのリスト
+            expected (np.ndarray, optional): 制御変量法で使う各年の資産額の期待値(year,). Defaults to None.
+
+        Returns:
+            np.ndarray: 各パーセンタイルの期待ショートフォール(len(idxs),)
+        """
+        mass = self.get_mass(expected)[-1]
+        if self.wcounts is not None:
+            counts, sums = self.wcounts[-1], self.wsums[-1]
+        else:
+            counts, sums = self.counts[-1], self.sums[-1]
+        means = np.where(counts > 0, sums / np.where(counts > 0, counts, 1), 0.0)
+        cum = np.cumsum(mass)
+        cum_val = np.cumsum(mass * means)
+
+        res = np.zeros(len(idxs))
+        for j, p in enumerate(idxs):
+            rank = max(p / 100 * cum[-1], 1e-12)
+            b = min(int(np.searchsorted(cum, rank, side="left")), self.bins - 1)
+            below = cum[b - 1] if b > 0 else 0.0
+            below_val = cum_val[b - 1] if b > 0 else 0.0
+            res[j] = (below_val + (rank - below) * means[b]) / rank
+        return res
+
+    def get_history(
+        self, idxs: list[int], band: int = 1, expected: np.ndarray = None
+    ) -> np.ndarray:
+        """最終年のパーセンタイルに最も近い候補パスの履歴を返す関数
+
+        Args:
+            idxs (list[int]): パーセンタイルのリスト(percentilesに含まれるもの)
+            band (int, optional): 平均する候補パスの数(CANDIDATE_KEEP以下を推奨). Defaults to 1.
+            expected (np.ndarray, optional): 制御変量法で使う各年の資産額の期待値(year,). Defaults to None.
+
+        Returns:
+            np.ndarray: 各パーセンタイルのパスの履歴(len(idxs), year)
+        """
+        cands = np.concatenate(self.candidates, axis=0)  # (候補数, year)
+        pers = self.get_percentiles(idxs, expected)[-1, :]
+        band = min(band, len(cands))
+        # 最終年の値がパーセンタイルに近い順にband個の候補を選んで平均する
+        nearest = self._select_nearest(cands, pers, band)
+        return cands[nearest].mean(axis=1)
+
+    def get_edges(self) -> np.ndarray:
+        """各年のビンの境界を資産額で返す関数
+
+        Returns:
+            np.ndarray: 各年のビンの境界(year, bins+1)
+        """
+        t = np.linspace(0.0, 1.0, self.bins + 1)
+        u = self.lo[:, np.newaxis] + (self.hi - self.lo)[:, np.newaxis] * t
+        return np.sinh(u) * self.scale[:, np.newaxis]
+
+    def get_hist(self) -> (np.ndarray, np.ndarray):
+        """最終年のヒストグラムを密度として返す関数
+
+        Returns:
+            (np.ndarray, np.ndarray): 密度とビンの境界
+        """
+        edges = self.get_edges()[-1]
+        density = self.get_mass()[-1] / self.size / np.diff(edges)
+        return density, edges
@@ -1,6 +1,11 @@
 import yaml
 from dataclasses import dataclass, asdict, field
 
+# 指定可能な計算精度
+PRECISIONS = ("float64", "float32")
+# 指定可能な乱数の生成方法
+SAMPLERS = ("random", "sobol")
+
 
 @dataclass
 class MonteCarloParam:
@@ -17,6 +22,34 @@ class MonteCarloParam:
     # ±3σで99.7: 50を中心として1と99
     percentiles: list[int] = field(default_factory=lambda: [99, 97, 84, 50, 16, 3, 1])
 
+    # 乱数のシード。Noneなら毎回異なる乱数になる
+    seed: int = None
+
+    # 乱数と結果の配列の精度("float64" or "float32")。
+    # float32では乱数と結果の配列をfloat32で持つ(メモリ量が半分)。年ごとの資産額の積算はfloat64で行うが、
+    # float32の正規乱数はfloat64とは別の乱数列になるため、同じシードでもパスごとの結果は一致せず、
+    # パーセンタイルの差はシードを変えた場合と同程度(10万パス,30年で1%前後)になる。
+    # 丸め誤差そのもの(同じ乱数をfloat64で計算した値との相対誤差)は年数とともに増え、実測で30年の平均1e-6程度、最大1e-4程度
+    precision: str = "float64"
+
+    # パーセンタイルの目標相対誤差。指定するとsizeを上限としてパスを追加しながら計算し、
+    # 全パーセンタイルの95%信頼区間の半幅/推定値がこの値以下になった時点で終了する。Noneなら常にsize個計算する
+    tolerance: float = None
+
+    # 分散削減法。antitheticは乱数の符号を反転した対のパスを作る(対称変量法)。
+    # control_variateは解析的に求まる資産額の期待値を使ってパスに重みを付け、重み付きの分布からパーセンタイルを求める(制御変量法)
+    antithetic: bool = False
+    control_variate: bool = False
+
+    # 乱数の生成方法。"random"は擬似乱数、"sobol"はスクランブルしたSobol列(準モンテカルロ)を逆正規分布関数で
+    # 正規乱数に変換して使う。Sobol列は滑らかな集計値ほど少ないパス数で収束する
+    sampler: str = "random"
+
+    # 重点サンプリングの傾き。0より大きいと半分のパスの各年の騰落率を、ポートフォリオのリターンが
+    # 1年あたりtilt標準偏差だけ下がる方向へずらして生成し、尤度比で重み付けする(下位のパーセンタイルと期待ショートフォールの精度が上がる)。
+    # 下位q%を狙う場合は標準正規分布の下側q%点/sqrt(year)の絶対値程度(1%なら2.33/sqrt(year))が目安。0なら使わない
+    tilt: float = 0.0
+
     @classmethod
     def load_param(cls, fname: str):
         """Yamlファイルから設定を読み込む関数
@@ -63,4 +96,22 @@ class MonteCarloParam:
             raise ValueError("percentile must be list")
         if any([isinstance(p, int) is False for p in self.percentiles]):
             raise ValueError("percentile must be list of int")
+        if self.seed is not None and isinstance(self.seed, int) is False:
+            raise ValueError("seed must be int or None")
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}")
+        if self.tolerance is not None and (
+            isinstance(self.tolerance, float) is False or self.tolerance <= 0
+        ):
+            raise ValueError("tolerance must be positive float or None")
+        if isinstance(self.antithetic, bool) is False:
+            raise ValueError("antithetic must be bool")
+        if isinstance(self.control_variate, bool) is False:
+            raise ValueError("control_variate must be bool")
+        if self.sampler not in SAMPLERS:
+            raise ValueError(f"sampler must be one of {SAMPLERS}")
+        if isinstance(self.tilt, (int, float)) is False or self.tilt < 0:
+            raise ValueError("tilt must be non-negative float")
+        if self.tilt > 0 and self.control_variate is True:
+            raise ValueError("tilt can not be used with control_variate")
         return
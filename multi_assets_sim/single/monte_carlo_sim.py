@@ -1,16 +1,19 @@
+import time
+import threading
 import numpy as np
 import pandas as pd
+from typing import Callable
 from .monte_carlo_param import MonteCarloParam
-from multi_assets_sim.table_keys import DataFrameKey
+from multi_assets_sim.sim_base import MonteCarloSimBase
+from multi_assets_sim.sobol import sobol_normals
 
 
-class MonteCarloSim:
+class MonteCarloSim(MonteCarloSimBase):
     """モンテカルロシミュレーションを行うクラス"""
 
     def __init__(self):
+        super().__init__()
         self.param = MonteCarloParam()
-        self.result = None
-        self.org = None  # 元本計算用
 
     def set_param(self, param: MonteCarloParam):
         """Dataclassを用いてパラメータのセットを行う関数
@@ -18,163 +21,157 @@ class MonteCarloSim:
         Args:
             param (MonteCarloParam): _description_
         """
-        self.param = param
+        super().set_param(param)
+
+    def simulate(
+        self,
+        chunk_size: int = None,
+        keep_result: bool = True,
+        workers: int = 1,
+        store_dir: str = None,
+        progress_fn: Callable[[int, int], None] = None,
+        cancel_event: threading.Event = None,
+        interim_fn: Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None] = None,
+        interim_interval: float = 0.3,
+        keep_growth: bool = False,
+        hist_bins: int = None,
+        hist_per_year: bool = False,
+    ):
+        """積立資産のモンテカルロシミュレーションを行う関数。途中経過も残すためメモリ量に注意
 
-    def simulate(self):
-        """積立資産のモンテカルロシミュレーションを行う関数。途中経過も残すためメモリ量に注意"""
-        rng = np.random.default_rng()
-
-        year = self.param.year
-        size = self.param.size
-        profit = self.param.profit
-        risk = self.param.risk
-        month = self.param.month
-        start = self.param.start
-
-        # 元本
-        org = np.arange(1, year + 1) * 12 * month + start
-        # シミュレーションパターン
-        pattern = np.zeros((year, size))
-
-        for i in range(year):
-            c = rng.normal(loc=1 + profit, scale=risk, size=size)
-            if i == 0:
-                pattern[i, :] = (start + 12.0 * month) * c
-            else:
-                pattern[i, :] = (pattern[i - 1, :] + 12.0 * month) * c  # 要素積
-        # print(pattern)
-
-        self.result = pattern
-        self.org = org
-
-    def has_result(self) -> bool:
-        """シミュレーション結果を保持しているかどうか
+        Args:
+            chunk_size (int, optional): 1度に計算するパス数. Defaults to None(自動).
+            keep_result (bool, optional): 全パスの資産合計をresultに残すかどうか. Defaults to True.
+            workers (int, optional): 並列に計算するプロセス数. Defaults to 1.
+            store_dir (str, optional): 全パスの配列を.npyファイルとして確保するディレクトリ. Defaults to None(メモリ上に確保).
+            progress_fn (Callable[[int, int], None], optional): (計算済みのパス数, 全パス数)を受け取る進捗通知用の関数. Defaults to None.
+            cancel_event (threading.Event, optional): setされたらブロックの区切りで計算を中断する. Defaults to None.
+            interim_fn (Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], None], optional):
+                計算途中のパスから求めた暫定の(describe, eachtime, history)を受け取る関数. Defaults to None.
+            interim_interval (float, optional): 暫定結果を通知する最小間隔[s]. Defaults to 0.3.
+            keep_growth (bool, optional): reprice()用の騰落率の累積を残すかどうか. Defaults to False.
+            hist_bins (int, optional): 蓄積するヒストグラムのビン数. Defaults to None(蓄積しない).
+            hist_per_year (bool, optional): 最終年だけでなく各年のヒストグラムも蓄積するかどうか. Defaults to False.
 
-        Returns:
-            bool: _description_
+        Raises:
+            SimulationCancelled: cancel_eventにより中断された場合
         """
-        if self.result is None:
-            return False
-        else:
-            return True
-
-    def get_result(self) -> np.ndarray:
-        """シミュレーション結果のndarrayを返す関数
+        super().simulate(
+            chunk_size,
+            keep_result,
+            workers,
+            store_dir,
+            progress_fn,
+            cancel_event,
+            interim_fn,
+            interim_interval,
+            keep_growth,
+            hist_bins,
+            hist_per_year,
+        )
 
-        Raises:
-            ValueError: _description_
+    def _save_store_param(self, fpath: str):
+        """store_dirへパラメータを保存する関数
 
-        Returns:
-            np.ndarray: _description_
+        Args:
+            fpath (str): yamlファイル名
         """
-        if self.result is None:
-            raise ValueError("Simulation result is not Calculated")
-        return self.result
+        self.param.save_param(fpath)
 
-    def _get_percentile_label(self, i: int) -> str:
-        """パーセンタイルの値を表示用に整形する。
-        50を中央値、1~49を下位1~49%, 51~99を上位49~1%とする
+    @classmethod
+    def _load_store_param(cls, fpath: str) -> MonteCarloParam:
+        """store_dirからパラメータを読み込む関数
 
         Args:
-            i (int): Percentilの値。0~100のint想定
+            fpath (str): yamlファイル名
 
         Returns:
-            str: 表示用に整形した文字列
+            MonteCarloParam: _description_
         """
-        if i > 50:
-            return f"上位{100-i}%"
-        elif i == 50:
-            return "中央値"
-        else:
-            return f"下位{i}%"
-
-    def get_percentile_describe(self) -> pd.DataFrame:
-        """パーセンタイルと分析値を作成してDataFrameとして返す
+        return MonteCarloParam.load_param(fpath)
 
-        Raises:
-            ValueError: _description_
+    def _get_expected_totals(self) -> np.ndarray:
+        """積立のスケジュールと平均リターンから解析的に求めた各年の資産額の期待値を返す関数。
+        各年の騰落率は前年までの資産額と独立なので E_t = (E_{t-1} + 12*month) * (1 + profit) となる
 
         Returns:
-            pd.DataFrame: _description_
+            np.ndarray: 各年の資産額の期待値(year,)
         """
-        if self.result is None or self.org is None:
-            raise ValueError("Simulation result is not Calculated")
-        idxs = self.param.percentiles
-        labels = [self._get_percentile_label(i) for i in idxs]
-        pers = np.percentile(self.result[-1, :], idxs, method="nearest").astype(int)
-        diff = pers - self.org[-1]
-        plus_ratio = diff / self.org[-1]
-        df = pd.DataFrame(
-            {
-                DataFrameKey.percentile.value: idxs,
-                DataFrameKey.labels.value: labels,
-                DataFrameKey.result.value: pers,
-                DataFrameKey.profit.value: diff,
-                DataFrameKey.profit_ratio.value: plus_ratio,
-            }
-        )
-        df.sort_values(DataFrameKey.result.value, inplace=True, ascending=False)
-        df.reset_index(inplace=True, drop=True)
-        # print(df)
-        return df
+        expected = np.zeros(self.param.year)
+        cur = float(self.param.start)
+        for i in range(self.param.year):
+            cur = (cur + 12.0 * self.param.month) * (1 + self.param.profit)
+            expected[i] = cur
+        return expected
 
-    def get_percentile_history(self):
-        """パーセンタイルを計算し、その利益率の推移をDataFrameとして返す。
-        なお、パーセンタイルは最終結果から計算し、それに対応する過去の履歴を使っている。
-        その時点時点でのパーセンタイルを使う場合は別の関数を利用する。
+    def _simulate_block(
+        self, rng: np.random.Generator, sl: slice
+    ) -> (np.ndarray, np.ndarray):
+        """ブロック1つ分のシミュレーションを行う関数
 
-        Raises:
-            ValueError: _description_
+        Args:
+            rng (np.random.Generator): このブロック用の乱数生成器
+            sl (slice): 全パスのうちこのブロックが担当する範囲
 
         Returns:
-            _type_: _description_
+            (np.ndarray, np.ndarray): 各年,各パターンの資産額(year, n)と、重点サンプリングの場合は各パスの重み(n,)
         """
-        if self.result is None and self.org is None:
-            raise ValueError("Simulation result is not Calculated")
-        idxs = self.param.percentiles
-        last = self.result[-1, :]
-        pers = np.percentile(last, idxs, method="nearest")
-        data = {}
-        for i, p in zip(idxs, pers):
-            i_p = np.where(last == p)[0][0]  # 一致するidxを探す(2次元タプルを外してる)
-            # 利益率に変換
-            data[self._get_percentile_label(i)] = (
-                self.result[:, i_p] - self.org
-            ) / self.org
-        data[DataFrameKey.passing_year.value] = np.arange(1, self.param.year + 1)
-        df = pd.DataFrame(data)
-        return df
-
-    def get_percentile_eachtime(self):
-        """パーセンタイルを計算し、その利益率の推移をDataFrameとして返す。
-        なお、パーセンタイルはその時刻ごとに計算している。
+        year = self.param.year
+        size = sl.stop - sl.start
+        profit = self.param.profit
+        risk = self.param.risk
+        month = self.param.month
+        start = self.param.start
+        tilt = self.param.tilt
 
-        Raises:
-            ValueError: _description_
+        dtype = np.dtype(self.param.precision)
 
-        Returns:
-            _type_: _description_
-        """
-        if self.result is None and self.org is None:
-            raise ValueError("Simulation result is not Calculated")
-        idxs = self.param.percentiles
-        src = np.zeros((self.param.year, len(idxs)))
-        for i in range(self.param.year):
-            src[i, :] = np.percentile(self.result[i, :], idxs, method="nearest")
-            # 利益率に変換
-            src[i, :] = (src[i, :] - self.org[i]) / self.org[i]
-
-        cols = [self._get_percentile_label(p) for p in idxs]
-        df = pd.DataFrame(data=src, columns=cols)
-        df[DataFrameKey.passing_year.value] = np.arange(1, self.param.year + 1)
-        # print(df)
-        return df
-
-    def get_hist(self) -> (np.ndarray, np.ndarray):
-        if self.result is None:
-            raise ValueError("Simulation result is not Calculated")
-        h, b = np.histogram(self.result[-1, :], bins="sturges", density=True)
-        return h, b
+        t = time.perf_counter()
+        # 騰落率を全年分まとめて生成し、そのままシミュレーションパターンとして上書きする
+        n = (size + 1) // 2 if self.param.antithetic is True else size
+        if self.sobol is not None:
+            z = sobol_normals(
+                self.sobol, rng, self._get_qmc_start(sl), n, year, np.ones(1), dtype
+            )[:, 0, :]
+        else:
+            z = rng.standard_normal((year, n), dtype=dtype)
+        if self.param.antithetic is True:
+            # 前半の乱数の符号を反転して後半のパスに使う
+            pattern = np.concatenate([z, -z[:, : size // 2]], axis=1)
+        else:
+            pattern = z
+        weights = None
+        if tilt > 0:
+            # 半分のパスの乱数を下方向へずらし、尤度比の重みを付ける
+            pattern[:, self._get_tilted(sl)] -= tilt
+            weights = self._get_is_weights(pattern.sum(axis=0, dtype=np.float64))
+        pattern *= risk
+        pattern += 1 + profit
+        self.profile.add("shock", time.perf_counter() - t)
+
+        t = time.perf_counter()
+        if self.growth_start is not None:
+            # 資産額 = start * A_t + 12 * month * B_t となる A_t = Πc, B_t = (B_{t-1} + 1) * c_t を残す
+            a = np.ones(size)
+            b = np.zeros(size)
+            for i in range(year):
+                a *= pattern[i, :]
+                b += 1.0
+                b *= pattern[i, :]
+                self.growth_start[i, sl] = a
+                self.growth_month[i, sl] = b
+
+        # 前年の資産額はprecisionによらずfloat64で積算する
+        cur = np.full(size, start + 12.0 * month)
+        for i in range(year):
+            if i > 0:
+                cur += 12.0 * month
+            cur *= pattern[i, :]  # 要素積
+            pattern[i, :] = cur
+        # print(pattern)
+        self.profile.add("accumulate", time.perf_counter() - t)
+
+        return pattern, weights
 
 
 def monte_carlo_sim_by_param(param: MonteCarloParam) -> np.ndarray:
@@ -0,0 +1,292 @@
+import numpy as np
+from multi_assets_sim.sobol_direction_numbers import POLY, VINIT
+
+# 方向数のビット数
+SOBOL_BITS = 32
+# 同梱している方向数の次元数。これを超える次元は擬似乱数で補う
+SOBOL_MAX_DIM = len(POLY)
+
+# Acklamの逆正規分布関数の近似の係数(相対誤差1.15e-9以下)
+_PPF_A = (
+    -3.969683028665376e01,
+    2.209460984245205e02,
+    -2.759285104469687e02,
+    1.383577518672690e02,
+    -3.066479806614716e01,
+    2.506628277459239e00,
+)
+_PPF_B = (
+    -5.447609879822406e01,
+    1.615858368580409e02,
+    -1.556989798598866e02,
+    6.680131188771972e01,
+    -1.328068155288572e01,
+)
+_PPF_C = (
+    -7.784894002430293e-03,
+    -3.223964580411365e-01,
+    -2.400758277161838e00,
+    -2.549732539343734e00,
+    4.374664141464968e00,
+    2.938163982698783e00,
+)
+_PPF_D = (
+    7.784695709041462e-03,
+    3.224671290700398e-01,
+    2.445134137142996e00,
+    3.754408661907416e00,
+)
+_PPF_LOW = 0.02425
+# norm_ppf()で1度に計算する要素数
+PPF_CHUNK = 1 << 15
+
+
+def _get_direction_numbers(dim: int) -> np.ndarray:
+    """Joe-Kuoの多項式と初期値から方向数を計算する関数
+
+    Args:
+        dim (int): 次元数(SOBOL_MAX_DIM以下)
+
+    Returns:
+        np.ndarray: 方向数(dim, SOBOL_BITS)。ビット列の上位から1桁目,2桁目...とする
+    """
+    v = np.zeros((dim, SOBOL_BITS), dtype=np.uint64)
+    # 1次元目はvan der Corput列
+    v[0, :] = [1 << (SOBOL_BITS - 1 - j) for j in range(SOBOL_BITS)]
+    for d in range(1, dim):
+        p = POLY[d]
+        s = p.bit_length() - 1  # 多項式の次数
+        m = list(VINIT[d])
+        # m_j = 2a_1 m_{j-1} ^ 4a_2 m_{j-2} ^ ... ^ 2^s m_{j-s} ^ m_{j-s}
+        for j in range(s, SOBOL_BITS):
+            new = m[j - s] ^ (m[j - s] << s)
+            for k in range(1, s):
+                if (p >> (s - k)) & 1:
+                    new ^= m[j - k] << k
+            m.append(new)
+        v[d, :] = [m[j] << (SOBOL_BITS - 1 - j) for j in range(SOBOL_BITS)]
+    return v.astype(np.uint32)
+
+
+def _parity(x: np.ndarray) -> np.ndarray:
+    """uint32の各要素の立っているビット数の偶奇を返す関数"""
+    x = x ^ (x >> 16)
+    x = x ^ (x >> 8)
+    x = x ^ (x >> 4)
+    x = x ^ (x >> 2)
+    x = x ^ (x >> 1)
+    return x & 1
+
+
+def _scramble(v: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """方向数に下三角のランダムな行列を掛けてスクランブルする関数(Matoušekのlinear matrix scramble)
+
+    Args:
+        v (np.ndarray): 方向数(dim, SOBOL_BITS)
+        rng (np.random.Generator): スクランブル用の乱数生成器
+
+    Returns:
+        np.ndarray: スクランブル後の方向数(dim, SOBOL_BITS)
+    """
+    dim = v.shape[0]
+    # 各次元の行列のi行目を、1~i桁目のビットの選択を表すマスクとして持つ(対角成分は1)
+    digit = (np.uint32(1) << (SOBOL_BITS - 1 - np.arange(SOBOL_BITS))).astype(np.uint32)
+    lower = ~(digit - np.uint32(1))  # 1~i桁目(上位側)のビット
+    bits = rng.integers(0, 2**SOBOL_BITS, size=(dim, SOBOL_BITS), dtype=np.uint64)
+    masks = (bits.astype(np.uint32) & lower) | digit  # (dim, i行目)
+    out = np.zeros_like(v)
+    for i in range(SOBOL_BITS):
+        out |= _parity(v & masks[:, i : i + 1]) * digit[i]
+    return out
+
+
+def _horner(x: np.ndarray, coefs: tuple) -> np.ndarray:
+    """多項式 coefs[0]*x^(k-1) + ... + coefs[k-1] をホーナー法で計算する関数"""
+    out = x * coefs[0]
+    for c in coefs[1:-1]:
+        out += c
+        out *= x
+    out += coefs[-1]
+    return out
+
+
+def _norm_ppf_chunk(u: np.ndarray) -> np.ndarray:
+    """norm_ppf()の1チャンク分の計算"""
+    q = u - 0.5
+    r = q * q
+    res = _horner(r, _PPF_A)
+    res *= q
+    res /= _horner(r, _PPF_B + (1.0,))
+
+    tail = np.flatnonzero(np.abs(q) > 0.5 - _PPF_LOW)
+    ut = u[tail]
+    t = np.sqrt(-2 * np.log(np.minimum(ut, 1 - ut)))
+    x = _horner(t, _PPF_C) / _horner(t, _PPF_D + (1.0,))
+    res[tail] = np.where(ut < 0.5, x, -x)
+    return res
+
+
+def norm_ppf(u: np.ndarray) -> np.ndarray:
+    """標準正規分布の逆関数をAcklamの有理関数近似で計算する関数。
+    大部分を占める中央の領域は全要素でまとめて計算し、裾の領域だけを取り出して計算し直す。
+    一時配列がキャッシュに収まるよう、PPF_CHUNKずつ計算する
+
+    Args:
+        u (np.ndarray): (0,1)の確率
+
+    Returns:
+        np.ndarray: 標準正規分布の分位点
+    """
+    u = np.asarray(u, dtype=np.float64)
+    flat = u.ravel()
+    res = np.empty(flat.shape)
+    for i in range(0, len(flat), PPF_CHUNK):
+        res[i : i + PPF_CHUNK] = _norm_ppf_chunk(flat[i : i + PPF_CHUNK])
+    return res.reshape(u.shape)
+
+
+class SobolSampler:
+    """スクランブルしたSobol列の任意の範囲の点を生成するクラス。
+
+    方向数はlinear matrix scrambleとdigital shiftでランダム化しており、各点は[0,1)^dimの一様分布に従う(不偏)。
+    点はgray codeの順に並べるため、index番目の点は先頭の点から直接求められ、ブロックごとに独立して生成できる。
+    2^kの倍数から始まる2^k個の点はそれぞれ低食い違い量の点集合になる。
+    """
+
+    def __init__(self, dim: int, seed: np.random.SeedSequence = None):
+        """
+        Args:
+            dim (int): 次元数(SOBOL_MAX_DIM以下)
+            seed (np.random.SeedSequence, optional): スクランブル用のシード. Defaults to None(スクランブルしない).
+        """
+        if dim <= 0 or dim > SOBOL_MAX_DIM:
+            raise ValueError(f"dim must be in 1..{SOBOL_MAX_DIM}")
+        self.dim = dim
+        v = _get_direction_numbers(dim)
+        self.shift = np.zeros(dim, dtype=np.uint32)
+        if seed is not None:
+            rng = np.random.default_rng(seed)
+            v = _scramble(v, rng)
+            self.shift = rng.integers(0, 2**SOBOL_BITS, size=dim, dtype=np.uint64).astype(
+                np.uint32
+            )
+        self.v = v  # (dim, SOBOL_BITS)
+
+    def _point_bits(self, index: int) -> np.ndarray:
+        """gray codeの順でindex番目の点のビット列を返す関数"""
+        gray = index ^ (index >> 1)
+        x = self.shift.copy()
+        for k in range(SOBOL_BITS):
+            if (gray >> k) & 1:
+                x ^= self.v[:, k]
+        return x
+
+    def random(self, start: int, n: int) -> np.ndarray:
+        """start番目からn個の点を生成する関数
+
+        Args:
+            start (int): 最初の点の番号
+            n (int): 点の数
+
+        Returns:
+            np.ndarray: [0,1)^dimの点(n, dim)
+        """
+        if start + n > 2**SOBOL_BITS:
+            raise ValueError("too many points for Sobol sequence")
+        # 連続するindexのgray codeは1ビットだけ異なるので、変わるビットの方向数を累積XORする
+        idx = np.arange(start + 1, start + n, dtype=np.int64)
+        ctz = np.log2(idx & -idx).astype(np.intp)
+        x = np.empty((n, self.dim), dtype=np.uint32)
+        x[0, :] = self._point_bits(start)
+        x[1:, :] = self.v[:, ctz].T
+        np.bitwise_xor.accumulate(x, axis=0, out=x)
+        # 区間の中央に置いて0と1を避ける
+        return (x + 0.5) / 2.0**SOBOL_BITS
+
+
+def brownian_bridge_steps(year: int) -> list:
+    """ブラウン橋で累積和を埋める順番を返す関数。
+    最初に最終年の累積和を決め、その後は決まった点の中間を順に埋める
+
+    Args:
+        year (int): 年数
+
+    Returns:
+        list: (埋める年, 左端の年, 右端の年, 条件付き分散)のリスト。年は累積和の添字(0は原点)
+    """
+    steps = [(year, 0, None, float(year))]
+    queue = [(0, year)]
+    while len(queue) > 0:
+        left, right = queue.pop(0)
+        if right - left <= 1:
+            continue
+        mid = (left + right) // 2
+        steps.append((mid, left, right, (mid - left) * (right - mid) / (right - left)))
+        queue.append((left, mid))
+        queue.append((mid, right))
+    return steps
+
+
+def get_qmc_order(year: int, weights: np.ndarray) -> np.ndarray:
+    """Sobol列の次元を(ブラウン橋の手順, 主成分)に割り当てる順番を返す関数。
+    分散(ブラウン橋の条件付き分散 x 主成分の固有値)の大きいものほど、一様性の良い先頭の次元に割り当てる
+
+    Args:
+        year (int): 年数
+        weights (np.ndarray): 各主成分の分散(固有値)(asset_len,)
+
+    Returns:
+        np.ndarray: 各次元に割り当てる(手順の番号, 主成分の番号)(year*asset_len, 2)
+    """
+    var = np.array([s[3] for s in brownian_bridge_steps(year)])
+    importance = var[:, np.newaxis] * np.asarray(weights)[np.newaxis, :]
+    order = np.argsort(-importance.ravel(), kind="stable")
+    return np.stack(np.unravel_index(order, importance.shape), axis=1)
+
+
+def sobol_normals(
+    sampler: SobolSampler,
+    rng: np.random.Generator,
+    start: int,
+    n: int,
+    year: int,
+    weights: np.ndarray,
+    dtype: np.dtype = np.float64,
+) -> np.ndarray:
+    """Sobol列から各年,各主成分の独立な標準正規乱数を生成する関数。
+    一様な点を逆正規分布関数で正規乱数にし、get_qmc_order()の順で(ブラウン橋の手順, 主成分)に割り当てて
+    ブラウン橋で各年の乱数に変換する。Sobol列の次元数を超える分はrngの擬似乱数で補う。
+
+    Args:
+        sampler (SobolSampler): Sobol列の生成器
+        rng (np.random.Generator): 次元数を超える分に使う乱数生成器
+        start (int): 最初の点の番号
+        n (int): 点の数
+        year (int): 年数
+        weights (np.ndarray): 各主成分の分散(固有値)(asset_len,)
+        dtype (np.dtype, optional): 乱数の型. Defaults to np.float64.
+
+    Returns:
+        np.ndarray: 標準正規乱数(year, asset_len, n)。パスの軸を最後にして各行を連続したメモリに置く
+    """
+    assets_len = len(weights)
+    order = get_qmc_order(year, weights)
+    rows = order[:, 0] * assets_len + order[:, 1]  # (手順, 主成分)を1次元の行番号にする
+    dims = min(sampler.dim, len(order))
+
+    # ブラウン橋の手順ごとの正規乱数(手順*asset_len, n)
+    xi = np.empty((year * assets_len, n), dtype=dtype)
+    xi[rows[:dims]] = norm_ppf(sampler.random(start, n)[:, :dims].T)
+    if dims < len(order):
+        xi[rows[dims:]] = rng.standard_normal((len(order) - dims, n), dtype=dtype)
+    xi = xi.reshape(year, assets_len, n)
+
+    # ブラウン橋で累積和を作り、差分を各年の乱数にする
+    cum = np.zeros((year + 1, assets_len, n), dtype=dtype)
+    for xi_i, (t, left, right, var) in zip(xi, brownian_bridge_steps(year)):
+        np.multiply(xi_i, np.sqrt(var), out=cum[t])
+        if right is not None:
+            w = (t - left) / (right - left)
+            cum[t] += (1 - w) * cum[left]
+            cum[t] += w * cum[right]
+    return np.diff(cum, axis=0)
@@ -0,0 +1,1103 @@
+"""Sobol列の方向数(primitive polynomialと初期値)。
+
+S. Joe and F. Y. Kuo, "Constructing Sobol sequences with better two-dimensional projections",
+SIAM J. Sci. Comput. 30, 2635-2654 (2008) の new-joe-kuo-6.21201 から先頭の1024次元を抜き出したもの。
+POLYは最高次と定数項を含めた多項式の係数をビットで表した整数、VINITは各次元の初期値m_1, ..., m_sで、
+1次元目はvan der Corput列(全ての方向数が1)とする。
+"""
+
+# fmt: off
+POLY = (
+    1, 3, 7, 11, 13, 19, 25, 37, 41, 47, 55, 59, 61, 67, 91, 97,
+    103, 109, 115, 131, 137, 143, 145, 157, 167, 171, 185, 191, 193, 203, 211, 213,
+    229, 239, 241, 247, 253, 285, 299, 301, 333, 351, 355, 357, 361, 369, 391, 397,
+    425, 451, 463, 487, 501, 529, 539, 545, 557, 563, 601, 607, 617, 623, 631, 637,
+    647, 661, 675, 677, 687, 695, 701, 719, 721, 731, 757, 761, 787, 789, 799, 803,
+    817, 827, 847, 859, 865, 875, 877, 883, 895, 901, 911, 949, 953, 967, 971, 973,
+    981, 985, 995, 1001, 1019, 1033, 1051, 1063, 1069, 1125, 1135, 1153, 1163, 1221, 1239, 1255,
+    1267, 1279, 1293, 1305, 1315, 1329, 1341, 1347, 1367, 1387, 1413, 1423, 1431, 1441, 1479, 1509,
+    1527, 1531, 1555, 1557, 1573, 1591, 1603, 1615, 1627, 1657, 1663, 1673, 1717, 1729, 1747, 1759,
+    1789, 1815, 1821, 1825, 1849, 1863, 1869, 1877, 1881, 1891, 1917, 1933, 1939, 1969, 2011, 2035,
+    2041, 2053, 2071, 2091, 2093, 2119, 2147, 2149, 2161, 2171, 2189, 2197, 2207, 2217, 2225, 2255,
+    2257, 2273, 2279, 2283, 2293, 2317, 2323, 2341, 2345, 2363, 2365, 2373, 2377, 2385, 2395, 2419,
+    2421, 2431, 2435, 2447, 2475, 2477, 2489, 2503, 2521, 2533, 2551, 2561, 2567, 2579, 2581, 2601,
+    2633, 2657, 2669, 2681, 2687, 2693, 2705, 2717, 2727, 2731, 2739, 2741, 2773, 2783, 2793, 2799,
+    2801, 2811, 2819, 2825, 2833, 2867, 2879, 2881, 2891, 2905, 2911, 2917, 2927, 2941, 2951, 2955,
+    2963, 2965, 2991, 2999, 3005, 3017, 3035, 3037, 3047, 3053, 3083, 3085, 3097, 3103, 3159, 3169,
+    3179, 3187, 3205, 3209, 3223, 3227, 3229, 3251, 3263, 3271, 3277, 3283, 3285, 3299, 3305, 3319,
+    3331, 3343, 3357, 3367, 3373, 3393, 3399, 3413, 3417, 3427, 3439, 3441, 3475, 3487, 3497, 3515,
+    3517, 3529, 3543, 3547, 3553, 3559, 3573, 3589, 3613, 3617, 3623, 3627, 3635, 3641, 3655, 3659,
+    3669, 3679, 3697, 3707, 3709, 3713, 3731, 3743, 3747, 3771, 3791, 3805, 3827, 3833, 3851, 3865,
+    3889, 3895, 3933, 3947, 3949, 3957, 3971, 3985, 3991, 3995, 4007, 4013, 4021, 4045, 4051, 4069,
+    4073, 4179, 4201, 4219, 4221, 4249, 4305, 4331, 4359, 4383, 4387, 4411, 4431, 4439, 4449, 4459,
+    4485, 4531, 4569, 4575, 4621, 4663, 4669, 4711, 4723, 4735, 4793, 4801, 4811, 4879, 4893, 4897,
+    4921, 4927, 4941, 4977, 5017, 5027, 5033, 5127, 5169, 5175, 5199, 5213, 5223, 5237, 5287, 5293,
+    5331, 5391, 5405, 5453, 5523, 5573, 5591, 5597, 5611, 5641, 5703, 5717, 5721, 5797, 5821, 5909,
+    5913, 5955, 5957, 6005, 6025, 6061, 6067, 6079, 6081, 6231, 6237, 6289, 6295, 6329, 6383, 6427,
+    6453, 6465, 6501, 6523, 6539, 6577, 6589, 6601, 6607, 6631, 6683, 6699, 6707, 6761, 6795, 6865,
+    6881, 6901, 6923, 6931, 6943, 6999, 7057, 7079, 7103, 7105, 7123, 7173, 7185, 7191, 7207, 7245,
+    7303, 7327, 7333, 7355, 7365, 7369, 7375, 7411, 7431, 7459, 7491, 7505, 7515, 7541, 7557, 7561,
+    7701, 7705, 7727, 7749, 7761, 7783, 7795, 7823, 7907, 7953, 7963, 7975, 8049, 8089, 8123, 8125,
+    8137, 8219, 8231, 8245, 8275, 8293, 8303, 8331, 8333, 8351, 8357, 8367, 8379, 8381, 8387, 8393,
+    8417, 8435, 8461, 8469, 8489, 8495, 8507, 8515, 8551, 8555, 8569, 8585, 8599, 8605, 8639, 8641,
+    8647, 8653, 8671, 8675, 8689, 8699, 8729, 8741, 8759, 8765, 8771, 8795, 8797, 8825, 8831, 8841,
+    8855, 8859, 8883, 8895, 8909, 8943, 8951, 8955, 8965, 8999, 9003, 9031, 9045, 9049, 9071, 9073,
+    9085, 9095, 9101, 9109, 9123, 9129, 9137, 9143, 9147, 9185, 9197, 9209, 9227, 9235, 9247, 9253,
+    9257, 9277, 9297, 9303, 9313, 9325, 9343, 9347, 9371, 9373, 9397, 9407, 9409, 9415, 9419, 9443,
+    9481, 9495, 9501, 9505, 9517, 9529, 9555, 9557, 9571, 9585, 9591, 9607, 9611, 9621, 9625, 9631,
+    9647, 9661, 9669, 9679, 9687, 9707, 9731, 9733, 9745, 9773, 9791, 9803, 9811, 9817, 9833, 9847,
+    9851, 9863, 9875, 9881, 9905, 9911, 9917, 9923, 9963, 9973, 10003, 10025, 10043, 10063, 10071, 10077,
+    10091, 10099, 10105, 10115, 10129, 10145, 10169, 10183, 10187, 10207, 10223, 10225, 10247, 10265, 10271, 10275,
+    10289, 10299, 10301, 10309, 10343, 10357, 10373, 10411, 10413, 10431, 10445, 10453, 10463, 10467, 10473, 10491,
+    10505, 10511, 10513, 10523, 10539, 10549, 10559, 10561, 10571, 10581, 10615, 10621, 10625, 10643, 10655, 10671,
+    10679, 10685, 10691, 10711, 10739, 10741, 10755, 10767, 10781, 10785, 10803, 10805, 10829, 10857, 10863, 10865,
+    10875, 10877, 10917, 10921, 10929, 10949, 10967, 10971, 10987, 10995, 11009, 11029, 11043, 11045, 11055, 11063,
+    11075, 11081, 11117, 11135, 11141, 11159, 11163, 11181, 11187, 11225, 11237, 11261, 11279, 11297, 11307, 11309,
+    11327, 11329, 11341, 11377, 11403, 11405, 11413, 11427, 11439, 11453, 11461, 11473, 11479, 11489, 11495, 11499,
+    11533, 11545, 11561, 11567, 11575, 11579, 11589, 11611, 11623, 11637, 11657, 11663, 11687, 11691, 11701, 11747,
+    11761, 11773, 11783, 11795, 11797, 11817, 11849, 11855, 11867, 11869, 11873, 11883, 11919, 11921, 11927, 11933,
+    11947, 11955, 11961, 11999, 12027, 12029, 12037, 12041, 12049, 12055, 12095, 12097, 12107, 12109, 12121, 12127,
+    12133, 12137, 12181, 12197, 12207, 12209, 12239, 12253, 12263, 12269, 12277, 12287, 12295, 12309, 12313, 12335,
+    12361, 12367, 12391, 12409, 12415, 12433, 12449, 12469, 12479, 12481, 12499, 12505, 12517, 12527, 12549, 12559,
+    12597, 12615, 12621, 12639, 12643, 12657, 12667, 12707, 12713, 12727, 12741, 12745, 12763, 12769, 12779, 12781,
+    12787, 12799, 12809, 12815, 12829, 12839, 12857, 12875, 12883, 12889, 12901, 12929, 12947, 12953, 12959, 12969,
+    12983, 12987, 12995, 13015, 13019, 13031, 13063, 13077, 13103, 13137, 13149, 13173, 13207, 13211, 13227, 13241,
+    13249, 13255, 13269, 13283, 13285, 13303, 13307, 13321, 13339, 13351, 13377, 13389, 13407, 13417, 13431, 13435,
+    13447, 13459, 13465, 13477, 13501, 13513, 13531, 13543, 13561, 13581, 13599, 13605, 13617, 13623, 13637, 13647,
+    13661, 13677, 13683, 13695, 13725, 13729, 13753, 13773, 13781, 13785, 13795, 13801, 13807, 13825, 13835, 13855,
+    13861, 13871, 13883, 13897, 13905, 13915, 13939, 13941, 13969, 13979, 13981, 13997, 14027, 14035, 14037, 14051,
+    14063, 14085, 14095, 14107, 14113, 14125, 14137, 14145, 14151, 14163, 14193, 14199, 14219, 14229, 14233, 14243,
+    14277, 14287, 14289, 14295, 14301, 14305, 14323, 14339, 14341, 14359, 14365, 14375, 14387, 14411, 14425, 14441,
+    14449, 14499, 14513, 14523, 14537, 14543, 14561, 14579, 14585, 14593, 14599, 14603, 14611, 14641, 14671, 14695,
+    14701, 14723, 14725, 14743, 14753, 14759, 14765, 14795, 14797, 14803, 14831, 14839, 14845, 14855, 14889, 14895,
+    14909, 14929, 14941, 14945, 14951, 14963, 14965, 14985, 15033, 15039, 15053, 15059, 15061, 15071, 15077, 15081,
+    15099, 15121, 15147, 15149, 15157, 15167, 15187, 15193, 15203, 15205, 15215, 15217, 15223, 15243, 15257, 15269,
+)
+
+VINIT = (
+    (1,),
+    (1,),
+    (1, 3,),
+    (1, 3, 1,),
+    (1, 1, 1,),
+    (1, 1, 3, 3,),
+    (1, 3, 5, 13,),
+    (1, 1, 5, 5, 17,),
+    (1, 1, 5, 5, 5,),
+    (1, 1, 7, 11, 19,),
+    (1, 1, 5, 1, 1,),
+    (1, 1, 1, 3, 11,),
+    (1, 3, 5, 5, 31,),
+    (1, 3, 3, 9, 7, 49,),
+    (1, 1, 1, 15, 21, 21,),
+    (1, 3, 1, 13, 27, 49,),
+    (1, 1, 1, 15, 7, 5,),
+    (1, 3, 1, 15, 13, 25,),
+    (1, 1, 5, 5, 19, 61,),
+    (1, 3, 7, 11, 23, 15, 103,),
+    (1, 3, 7, 13, 13, 15, 69,),
+    (1, 1, 3, 13, 7, 35, 63,),
+    (1, 3, 5, 9, 1, 25, 53,),
+    (1, 3, 1, 13, 9, 35, 107,),
+    (1, 3, 1, 5, 27, 61, 31,),
+    (1, 1, 5, 11, 19, 41, 61,),
+    (1, 3, 5, 3, 3, 13, 69,),
+    (1, 1, 7, 13, 1, 19, 1,),
+    (1, 3, 7, 5, 13, 19, 59,),
+    (1, 1, 3, 9, 25, 29, 41,),
+    (1, 3, 5, 13, 23, 1, 55,),
+    (1, 3, 7, 3, 13, 59, 17,),
+    (1, 3, 1, 3, 5, 53, 69,),
+    (1, 1, 5, 5, 23, 33, 13,),
+    (1, 1, 7, 7, 1, 61, 123,),
+    (1, 1, 7, 9, 13, 61, 49,),
+    (1, 3, 3, 5, 3, 55, 33,),
+    (1, 3, 1, 15, 31, 13, 49, 245,),
+    (1, 3, 5, 15, 31, 59, 63, 97,),
+    (1, 3, 1, 11, 11, 11, 77, 249,),
+    (1, 3, 1, 11, 27, 43, 71, 9,),
+    (1, 1, 7, 15, 21, 11, 81, 45,),
+    (1, 3, 7, 3, 25, 31, 65, 79,),
+    (1, 3, 1, 1, 19, 11, 3, 205,),
+    (1, 1, 5, 9, 19, 21, 29, 157,),
+    (1, 3, 7, 11, 1, 33, 89, 185,),
+    (1, 3, 3, 3, 15, 9, 79, 71,),
+    (1, 3, 7, 11, 15, 39, 119, 27,),
+    (1, 1, 3, 1, 11, 31, 97, 225,),
+    (1, 1, 1, 3, 23, 43, 57, 177,),
+    (1, 3, 7, 7, 17, 17, 37, 71,),
+    (1, 3, 1, 5, 27, 63, 123, 213,),
+    (1, 1, 3, 5, 11, 43, 53, 133,),
+    (1, 3, 5, 5, 29, 17, 47, 173, 479,),
+    (1, 3, 3, 11, 3, 1, 109, 9, 69,),
+    (1, 1, 1, 5, 17, 39, 23, 5, 343,),
+    (1, 3, 1, 5, 25, 15, 31, 103, 499,),
+    (1, 1, 1, 11, 11, 17, 63, 105, 183,),
+    (1, 1, 5, 11, 9, 29, 97, 231, 363,),
+    (1, 1, 5, 15, 19, 45, 41, 7, 383,),
+    (1, 3, 7, 7, 31, 19, 83, 137, 221,),
+    (1, 1, 1, 3, 23, 15, 111, 223, 83,),
+    (1, 1, 5, 13, 31, 15, 55, 25, 161,),
+    (1, 1, 3, 13, 25, 47, 39, 87, 257,),
+    (1, 1, 1, 11, 21, 53, 125, 249, 293,),
+    (1, 1, 7, 11, 11, 7, 57, 79, 323,),
+    (1, 1, 5, 5, 17, 13, 81, 3, 131,),
+    (1, 1, 7, 13, 23, 7, 65, 251, 475,),
+    (1, 3, 5, 1, 9, 43, 3, 149, 11,),
+    (1, 1, 3, 13, 31, 13, 13, 255, 487,),
+    (1, 3, 3, 1, 5, 63, 89, 91, 127,),
+    (1, 1, 3, 3, 1, 19, 123, 127, 237,),
+    (1, 1, 5, 7, 23, 31, 37, 243, 289,),
+    (1, 1, 5, 11, 17, 53, 117, 183, 491,),
+    (1, 1, 1, 5, 1, 13, 13, 209, 345,),
+    (1, 1, 3, 15, 1, 57, 115, 7, 33,),
+    (1, 3, 1, 11, 7, 43, 81, 207, 175,),
+    (1, 3, 1, 1, 15, 27, 63, 255, 49,),
+    (1, 3, 5, 3, 27, 61, 105, 171, 305,),
+    (1, 1, 5, 3, 1, 3, 57, 249, 149,),
+    (1, 1, 3, 5, 5, 57, 15, 13, 159,),
+    (1, 1, 1, 11, 7, 11, 105, 141, 225,),
+    (1, 3, 3, 5, 27, 59, 121, 101, 271,),
+    (1, 3, 5, 9, 11, 49, 51, 59, 115,),
+    (1, 1, 7, 1, 23, 45, 125, 71, 419,),
+    (1, 1, 3, 5, 23, 5, 105, 109, 75,),
+    (1, 1, 7, 15, 7, 11, 67, 121, 453,),
+    (1, 3, 7, 3, 9, 13, 31, 27, 449,),
+    (1, 3, 1, 15, 19, 39, 39, 89, 15,),
+    (1, 1, 1, 1, 1, 33, 73, 145, 379,),
+    (1, 3, 1, 15, 15, 43, 29, 13, 483,),
+    (1, 1, 7, 3, 19, 27, 85, 131, 431,),
+    (1, 3, 3, 3, 5, 35, 23, 195, 349,),
+    (1, 3, 3, 7, 9, 27, 39, 59, 297,),
+    (1, 1, 3, 9, 11, 17, 13, 241, 157,),
+    (1, 3, 7, 15, 25, 57, 33, 189, 213,),
+    (1, 1, 7, 1, 9, 55, 73, 83, 217,),
+    (1, 3, 3, 13, 19, 27, 23, 113, 249,),
+    (1, 3, 5, 3, 23, 43, 3, 253, 479,),
+    (1, 1, 5, 5, 11, 5, 45, 117, 217,),
+    (1, 3, 3, 7, 29, 37, 33, 123, 147,),
+    (1, 3, 1, 15, 5, 5, 37, 227, 223, 459,),
+    (1, 1, 7, 5, 5, 39, 63, 255, 135, 487,),
+    (1, 3, 1, 7, 9, 7, 87, 249, 217, 599,),
+    (1, 1, 3, 13, 9, 47, 7, 225, 363, 247,),
+    (1, 3, 7, 13, 19, 13, 9, 67, 9, 737,),
+    (1, 3, 5, 5, 19, 59, 7, 41, 319, 677,),
+    (1, 1, 5, 3, 31, 63, 15, 43, 207, 789,),
+    (1, 1, 7, 9, 13, 39, 3, 47, 497, 169,),
+    (1, 3, 1, 7, 21, 17, 97, 19, 415, 905,),
+    (1, 3, 7, 1, 3, 31, 71, 111, 165, 127,),
+    (1, 1, 5, 11, 1, 61, 83, 119, 203, 847,),
+    (1, 3, 3, 13, 9, 61, 19, 97, 47, 35,),
+    (1, 1, 7, 7, 15, 29, 63, 95, 417, 469,),
+    (1, 3, 1, 9, 25, 9, 71, 57, 213, 385,),
+    (1, 3, 5, 13, 31, 47, 101, 57, 39, 341,),
+    (1, 1, 3, 3, 31, 57, 125, 173, 365, 551,),
+    (1, 3, 7, 1, 13, 57, 67, 157, 451, 707,),
+    (1, 1, 1, 7, 21, 13, 105, 89, 429, 965,),
+    (1, 1, 5, 9, 17, 51, 45, 119, 157, 141,),
+    (1, 3, 7, 7, 13, 45, 91, 9, 129, 741,),
+    (1, 3, 7, 1, 23, 57, 67, 141, 151, 571,),
+    (1, 1, 3, 11, 17, 47, 93, 107, 375, 157,),
+    (1, 3, 3, 5, 11, 21, 43, 51, 169, 915,),
+    (1, 1, 5, 3, 15, 55, 101, 67, 455, 625,),
+    (1, 3, 5, 9, 1, 23, 29, 47, 345, 595,),
+    (1, 3, 7, 7, 5, 49, 29, 155, 323, 589,),
+    (1, 3, 3, 7, 5, 41, 127, 61, 261, 717,),
+    (1, 3, 7, 7, 17, 23, 117, 67, 129, 1009,),
+    (1, 1, 3, 13, 11, 39, 21, 207, 123, 305,),
+    (1, 1, 3, 9, 29, 3, 95, 47, 231, 73,),
+    (1, 3, 1, 9, 1, 29, 117, 21, 441, 259,),
+    (1, 3, 1, 13, 21, 39, 125, 211, 439, 723,),
+    (1, 1, 7, 3, 17, 63, 115, 89, 49, 773,),
+    (1, 3, 7, 13, 11, 33, 101, 107, 63, 73,),
+    (1, 1, 5, 5, 13, 57, 63, 135, 437, 177,),
+    (1, 1, 3, 7, 27, 63, 93, 47, 417, 483,),
+    (1, 1, 3, 1, 23, 29, 1, 191, 49, 23,),
+    (1, 1, 3, 15, 25, 55, 9, 101, 219, 607,),
+    (1, 3, 1, 7, 7, 19, 51, 251, 393, 307,),
+    (1, 3, 3, 3, 25, 55, 17, 75, 337, 3,),
+    (1, 1, 1, 13, 25, 17, 65, 45, 479, 413,),
+    (1, 1, 7, 7, 27, 49, 99, 161, 213, 727,),
+    (1, 3, 5, 1, 23, 5, 43, 41, 251, 857,),
+    (1, 3, 3, 7, 11, 61, 39, 87, 383, 835,),
+    (1, 1, 3, 15, 13, 7, 29, 7, 505, 923,),
+    (1, 3, 7, 1, 5, 31, 47, 157, 445, 501,),
+    (1, 1, 3, 7, 1, 43, 9, 147, 115, 605,),
+    (1, 3, 3, 13, 5, 1, 119, 211, 455, 1001,),
+    (1, 1, 3, 5, 13, 19, 3, 243, 75, 843,),
+    (1, 3, 7, 7, 1, 19, 91, 249, 357, 589,),
+    (1, 1, 1, 9, 1, 25, 109, 197, 279, 411,),
+    (1, 3, 1, 15, 23, 57, 59, 135, 191, 75,),
+    (1, 1, 5, 15, 29, 21, 39, 253, 383, 349,),
+    (1, 3, 3, 5, 19, 45, 61, 151, 199, 981,),
+    (1, 3, 5, 13, 9, 61, 107, 141, 141, 1,),
+    (1, 3, 1, 11, 27, 25, 85, 105, 309, 979,),
+    (1, 3, 3, 11, 19, 7, 115, 223, 349, 43,),
+    (1, 1, 7, 9, 21, 39, 123, 21, 275, 927,),
+    (1, 1, 7, 13, 15, 41, 47, 243, 303, 437,),
+    (1, 1, 1, 7, 7, 3, 15, 99, 409, 719,),
+    (1, 3, 3, 15, 27, 49, 113, 123, 113, 67, 469,),
+    (1, 3, 7, 11, 3, 23, 87, 169, 119, 483, 199,),
+    (1, 1, 5, 15, 7, 17, 109, 229, 179, 213, 741,),
+    (1, 1, 5, 13, 11, 17, 25, 135, 403, 557, 1433,),
+    (1, 3, 1, 1, 1, 61, 67, 215, 189, 945, 1243,),
+    (1, 1, 7, 13, 17, 33, 9, 221, 429, 217, 1679,),
+    (1, 1, 3, 11, 27, 3, 15, 93, 93, 865, 1049,),
+    (1, 3, 7, 7, 25, 41, 121, 35, 373, 379, 1547,),
+    (1, 3, 3, 9, 11, 35, 45, 205, 241, 9, 59,),
+    (1, 3, 1, 7, 3, 51, 7, 177, 53, 975, 89,),
+    (1, 1, 3, 5, 27, 1, 113, 231, 299, 759, 861,),
+    (1, 3, 3, 15, 25, 29, 5, 255, 139, 891, 2031,),
+    (1, 3, 1, 1, 13, 9, 109, 193, 419, 95, 17,),
+    (1, 1, 7, 9, 3, 7, 29, 41, 135, 839, 867,),
+    (1, 1, 7, 9, 25, 49, 123, 217, 113, 909, 215,),
+    (1, 1, 7, 3, 23, 15, 43, 133, 217, 327, 901,),
+    (1, 1, 3, 3, 13, 53, 63, 123, 477, 711, 1387,),
+    (1, 1, 3, 15, 7, 29, 75, 119, 181, 957, 247,),
+    (1, 1, 1, 11, 27, 25, 109, 151, 267, 99, 1461,),
+    (1, 3, 7, 15, 5, 5, 53, 145, 11, 725, 1501,),
+    (1, 3, 7, 1, 9, 43, 71, 229, 157, 607, 1835,),
+    (1, 3, 3, 13, 25, 1, 5, 27, 471, 349, 127,),
+    (1, 1, 1, 1, 23, 37, 9, 221, 269, 897, 1685,),
+    (1, 1, 3, 3, 31, 29, 51, 19, 311, 553, 1969,),
+    (1, 3, 7, 5, 5, 55, 17, 39, 475, 671, 1529,),
+    (1, 1, 7, 1, 1, 35, 47, 27, 437, 395, 1635,),
+    (1, 1, 7, 3, 13, 23, 43, 135, 327, 139, 389,),
+    (1, 3, 7, 3, 9, 25, 91, 25, 429, 219, 513,),
+    (1, 1, 3, 5, 13, 29, 119, 201, 277, 157, 2043,),
+    (1, 3, 5, 3, 29, 57, 13, 17, 167, 739, 1031,),
+    (1, 3, 3, 5, 29, 21, 95, 27, 255, 679, 1531,),
+    (1, 3, 7, 15, 9, 5, 21, 71, 61, 961, 1201,),
+    (1, 3, 5, 13, 15, 57, 33, 93, 459, 867, 223,),
+    (1, 1, 1, 15, 17, 43, 127, 191, 67, 177, 1073,),
+    (1, 1, 1, 15, 23, 7, 21, 199, 75, 293, 1611,),
+    (1, 3, 7, 13, 15, 39, 21, 149, 65, 741, 319,),
+    (1, 3, 7, 11, 23, 13, 101, 89, 277, 519, 711,),
+    (1, 3, 7, 15, 19, 27, 85, 203, 441, 97, 1895,),
+    (1, 3, 1, 3, 29, 25, 21, 155, 11, 191, 197,),
+    (1, 1, 7, 5, 27, 11, 81, 101, 457, 675, 1687,),
+    (1, 3, 1, 5, 25, 5, 65, 193, 41, 567, 781,),
+    (1, 3, 1, 5, 11, 15, 113, 77, 411, 695, 1111,),
+    (1, 1, 3, 9, 11, 53, 119, 171, 55, 297, 509,),
+    (1, 1, 1, 1, 11, 39, 113, 139, 165, 347, 595,),
+    (1, 3, 7, 11, 9, 17, 101, 13, 81, 325, 1733,),
+    (1, 3, 1, 1, 21, 43, 115, 9, 113, 907, 645,),
+    (1, 1, 7, 3, 9, 25, 117, 197, 159, 471, 475,),
+    (1, 3, 1, 9, 11, 21, 57, 207, 485, 613, 1661,),
+    (1, 1, 7, 7, 27, 55, 49, 223, 89, 85, 1523,),
+    (1, 1, 5, 3, 19, 41, 45, 51, 447, 299, 1355,),
+    (1, 3, 1, 13, 1, 33, 117, 143, 313, 187, 1073,),
+    (1, 1, 7, 7, 5, 11, 65, 97, 377, 377, 1501,),
+    (1, 3, 1, 1, 21, 35, 95, 65, 99, 23, 1239,),
+    (1, 1, 5, 9, 3, 37, 95, 167, 115, 425, 867,),
+    (1, 3, 3, 13, 1, 37, 27, 189, 81, 679, 773,),
+    (1, 1, 3, 11, 1, 61, 99, 233, 429, 969, 49,),
+    (1, 1, 1, 7, 25, 63, 99, 165, 245, 793, 1143,),
+    (1, 1, 5, 11, 11, 43, 55, 65, 71, 283, 273,),
+    (1, 1, 5, 5, 9, 3, 101, 251, 355, 379, 1611,),
+    (1, 1, 1, 15, 21, 63, 85, 99, 49, 749, 1335,),
+    (1, 1, 5, 13, 27, 9, 121, 43, 255, 715, 289,),
+    (1, 3, 1, 5, 27, 19, 17, 223, 77, 571, 1415,),
+    (1, 1, 5, 3, 13, 59, 125, 251, 195, 551, 1737,),
+    (1, 3, 3, 15, 13, 27, 49, 105, 389, 971, 755,),
+    (1, 3, 5, 15, 23, 43, 35, 107, 447, 763, 253,),
+    (1, 3, 5, 11, 21, 3, 17, 39, 497, 407, 611,),
+    (1, 1, 7, 13, 15, 31, 113, 17, 23, 507, 1995,),
+    (1, 1, 7, 15, 3, 15, 31, 153, 423, 79, 503,),
+    (1, 1, 7, 9, 19, 25, 23, 171, 505, 923, 1989,),
+    (1, 1, 5, 9, 21, 27, 121, 223, 133, 87, 697,),
+    (1, 1, 5, 5, 9, 19, 107, 99, 319, 765, 1461,),
+    (1, 1, 3, 3, 19, 25, 3, 101, 171, 729, 187,),
+    (1, 1, 3, 1, 13, 23, 85, 93, 291, 209, 37,),
+    (1, 1, 1, 15, 25, 25, 77, 253, 333, 947, 1073,),
+    (1, 1, 3, 9, 17, 29, 55, 47, 255, 305, 2037,),
+    (1, 3, 3, 9, 29, 63, 9, 103, 489, 939, 1523,),
+    (1, 3, 7, 15, 7, 31, 89, 175, 369, 339, 595,),
+    (1, 3, 7, 13, 25, 5, 71, 207, 251, 367, 665,),
+    (1, 3, 3, 3, 21, 25, 75, 35, 31, 321, 1603,),
+    (1, 1, 1, 9, 11, 1, 65, 5, 11, 329, 535,),
+    (1, 1, 5, 3, 19, 13, 17, 43, 379, 485, 383,),
+    (1, 3, 5, 13, 13, 9, 85, 147, 489, 787, 1133,),
+    (1, 3, 1, 1, 5, 51, 37, 129, 195, 297, 1783,),
+    (1, 1, 3, 15, 19, 57, 59, 181, 455, 697, 2033,),
+    (1, 3, 7, 1, 27, 9, 65, 145, 325, 189, 201,),
+    (1, 3, 1, 15, 31, 23, 19, 5, 485, 581, 539,),
+    (1, 1, 7, 13, 11, 15, 65, 83, 185, 847, 831,),
+    (1, 3, 5, 7, 7, 55, 73, 15, 303, 511, 1905,),
+    (1, 3, 5, 9, 7, 21, 45, 15, 397, 385, 597,),
+    (1, 3, 7, 3, 23, 13, 73, 221, 511, 883, 1265,),
+    (1, 1, 3, 11, 1, 51, 73, 185, 33, 975, 1441,),
+    (1, 3, 3, 9, 19, 59, 21, 39, 339, 37, 143,),
+    (1, 1, 7, 1, 31, 33, 19, 167, 117, 635, 639,),
+    (1, 1, 1, 3, 5, 13, 59, 83, 355, 349, 1967,),
+    (1, 1, 1, 5, 19, 3, 53, 133, 97, 863, 983,),
+    (1, 3, 1, 13, 9, 41, 91, 105, 173, 97, 625,),
+    (1, 1, 5, 3, 7, 49, 115, 133, 71, 231, 1063,),
+    (1, 1, 7, 5, 17, 43, 47, 45, 497, 547, 757,),
+    (1, 3, 5, 15, 21, 61, 123, 191, 249, 31, 631,),
+    (1, 3, 7, 9, 17, 7, 11, 185, 127, 169, 1951,),
+    (1, 1, 5, 13, 11, 11, 9, 49, 29, 125, 791,),
+    (1, 1, 1, 15, 31, 41, 13, 167, 273, 429, 57,),
+    (1, 3, 5, 3, 27, 7, 35, 209, 65, 265, 1393,),
+    (1, 3, 1, 13, 31, 19, 53, 143, 135, 9, 1021,),
+    (1, 1, 7, 13, 31, 5, 115, 153, 143, 957, 623,),
+    (1, 1, 5, 11, 25, 19, 29, 31, 297, 943, 443,),
+    (1, 3, 3, 5, 21, 11, 127, 81, 479, 25, 699,),
+    (1, 1, 3, 11, 25, 31, 97, 19, 195, 781, 705,),
+    (1, 1, 5, 5, 31, 11, 75, 207, 197, 885, 2037,),
+    (1, 1, 1, 11, 9, 23, 29, 231, 307, 17, 1497,),
+    (1, 1, 5, 11, 11, 43, 111, 233, 307, 523, 1259,),
+    (1, 1, 7, 5, 1, 21, 107, 229, 343, 933, 217,),
+    (1, 1, 1, 11, 3, 21, 125, 131, 405, 599, 1469,),
+    (1, 3, 5, 5, 9, 39, 33, 81, 389, 151, 811,),
+    (1, 1, 7, 7, 7, 1, 59, 223, 265, 529, 2021,),
+    (1, 3, 1, 3, 9, 23, 85, 181, 47, 265, 49,),
+    (1, 3, 5, 11, 19, 23, 9, 7, 157, 299, 1983,),
+    (1, 3, 1, 5, 15, 5, 21, 105, 29, 339, 1041,),
+    (1, 1, 1, 1, 5, 33, 65, 85, 111, 705, 479,),
+    (1, 1, 1, 7, 9, 35, 77, 87, 151, 321, 101,),
+    (1, 1, 5, 7, 17, 1, 51, 197, 175, 811, 1229,),
+    (1, 3, 3, 15, 23, 37, 85, 185, 239, 543, 731,),
+    (1, 3, 1, 7, 7, 55, 111, 109, 289, 439, 243,),
+    (1, 1, 7, 11, 17, 53, 35, 217, 259, 853, 1667,),
+    (1, 3, 1, 9, 1, 63, 87, 17, 73, 565, 1091,),
+    (1, 1, 3, 3, 11, 41, 1, 57, 295, 263, 1029,),
+    (1, 1, 5, 1, 27, 45, 109, 161, 411, 421, 1395,),
+    (1, 3, 5, 11, 25, 35, 47, 191, 339, 417, 1727,),
+    (1, 1, 5, 15, 21, 1, 93, 251, 351, 217, 1767,),
+    (1, 3, 3, 11, 3, 7, 75, 155, 313, 211, 491,),
+    (1, 3, 3, 5, 11, 9, 101, 161, 453, 913, 1067,),
+    (1, 1, 3, 1, 15, 45, 127, 141, 163, 727, 1597,),
+    (1, 3, 3, 7, 1, 33, 63, 73, 73, 341, 1691,),
+    (1, 3, 5, 13, 15, 39, 53, 235, 77, 99, 949,),
+    (1, 1, 5, 13, 31, 17, 97, 13, 215, 301, 1927,),
+    (1, 1, 7, 1, 1, 37, 91, 93, 441, 251, 1131,),
+    (1, 3, 7, 9, 25, 5, 105, 69, 81, 943, 1459,),
+    (1, 3, 7, 11, 31, 43, 13, 209, 27, 1017, 501,),
+    (1, 1, 7, 15, 1, 33, 31, 233, 161, 507, 387,),
+    (1, 3, 3, 5, 5, 53, 33, 177, 503, 627, 1927,),
+    (1, 1, 7, 11, 7, 61, 119, 31, 457, 229, 1875,),
+    (1, 1, 5, 15, 19, 5, 53, 201, 157, 885, 1057,),
+    (1, 3, 7, 9, 1, 35, 51, 113, 249, 425, 1009,),
+    (1, 3, 5, 7, 21, 53, 37, 155, 119, 345, 631,),
+    (1, 3, 5, 7, 15, 31, 109, 69, 503, 595, 1879,),
+    (1, 3, 3, 1, 25, 35, 65, 131, 403, 705, 503,),
+    (1, 3, 7, 7, 19, 33, 11, 153, 45, 633, 499,),
+    (1, 3, 3, 5, 11, 3, 29, 93, 487, 33, 703,),
+    (1, 1, 3, 15, 21, 53, 107, 179, 387, 927, 1757,),
+    (1, 1, 3, 7, 21, 45, 51, 147, 175, 317, 361,),
+    (1, 1, 1, 7, 7, 13, 15, 243, 269, 795, 1965,),
+    (1, 1, 3, 5, 19, 33, 57, 115, 443, 537, 627,),
+    (1, 3, 3, 9, 3, 39, 25, 61, 185, 717, 1049,),
+    (1, 3, 7, 3, 7, 37, 107, 153, 7, 269, 1581,),
+    (1, 1, 7, 3, 7, 41, 91, 41, 145, 489, 1245,),
+    (1, 1, 5, 9, 7, 7, 105, 81, 403, 407, 283,),
+    (1, 1, 7, 9, 27, 55, 29, 77, 193, 963, 949,),
+    (1, 1, 5, 3, 25, 51, 107, 63, 403, 917, 815,),
+    (1, 1, 7, 3, 7, 61, 19, 51, 457, 599, 535,),
+    (1, 3, 7, 1, 23, 51, 105, 153, 239, 215, 1847,),
+    (1, 1, 3, 5, 27, 23, 79, 49, 495, 45, 1935,),
+    (1, 1, 1, 11, 11, 47, 55, 133, 495, 999, 1461,),
+    (1, 1, 3, 15, 27, 51, 93, 17, 355, 763, 1675,),
+    (1, 3, 1, 3, 1, 3, 79, 119, 499, 17, 995,),
+    (1, 1, 1, 1, 15, 43, 45, 17, 167, 973, 799,),
+    (1, 1, 1, 3, 27, 49, 89, 29, 483, 913, 2023,),
+    (1, 1, 3, 3, 5, 11, 75, 7, 41, 851, 611,),
+    (1, 3, 1, 3, 7, 57, 39, 123, 257, 283, 507,),
+    (1, 3, 3, 11, 27, 23, 113, 229, 187, 299, 133,),
+    (1, 1, 3, 13, 9, 63, 101, 77, 451, 169, 337,),
+    (1, 3, 7, 3, 3, 59, 45, 195, 229, 415, 409,),
+    (1, 3, 5, 3, 11, 19, 71, 93, 43, 857, 369,),
+    (1, 3, 7, 9, 19, 33, 115, 19, 241, 703, 247,),
+    (1, 3, 5, 11, 5, 35, 21, 155, 463, 1005, 1073,),
+    (1, 3, 7, 3, 25, 15, 109, 83, 93, 69, 1189,),
+    (1, 3, 5, 7, 5, 21, 93, 133, 135, 167, 903,),
+    (1, 1, 7, 7, 3, 59, 121, 161, 285, 815, 1769, 3705,),
+    (1, 3, 1, 1, 3, 47, 103, 171, 381, 609, 185, 373,),
+    (1, 3, 3, 15, 23, 33, 107, 131, 441, 445, 689, 2059,),
+    (1, 3, 3, 11, 7, 53, 101, 167, 435, 803, 1255, 3781,),
+    (1, 1, 5, 11, 15, 59, 41, 19, 135, 835, 1263, 505,),
+    (1, 1, 7, 11, 21, 49, 23, 219, 127, 961, 1065, 385,),
+    (1, 3, 5, 15, 7, 47, 117, 217, 45, 731, 1639, 733,),
+    (1, 1, 7, 11, 27, 57, 91, 87, 81, 35, 1269, 1007,),
+    (1, 1, 3, 11, 15, 37, 53, 219, 193, 937, 1899, 3733,),
+    (1, 3, 5, 3, 13, 11, 27, 19, 199, 393, 965, 2195,),
+    (1, 3, 1, 3, 5, 1, 37, 173, 413, 1023, 553, 409,),
+    (1, 3, 1, 7, 15, 29, 123, 95, 255, 373, 1799, 3841,),
+    (1, 3, 5, 13, 21, 57, 51, 17, 511, 195, 1157, 1831,),
+    (1, 1, 1, 15, 29, 19, 7, 73, 295, 519, 587, 3523,),
+    (1, 1, 5, 13, 13, 35, 115, 191, 123, 535, 717, 1661,),
+    (1, 3, 3, 5, 23, 21, 47, 251, 379, 921, 1119, 297,),
+    (1, 3, 3, 9, 29, 53, 121, 201, 135, 193, 523, 2943,),
+    (1, 1, 1, 7, 29, 45, 125, 9, 99, 867, 425, 601,),
+    (1, 3, 1, 9, 13, 15, 67, 181, 109, 293, 1305, 3079,),
+    (1, 3, 3, 9, 5, 35, 15, 209, 305, 87, 767, 2795,),
+    (1, 3, 3, 11, 27, 57, 113, 123, 179, 643, 149, 523,),
+    (1, 1, 3, 15, 11, 17, 67, 223, 63, 657, 335, 3309,),
+    (1, 1, 1, 9, 25, 29, 109, 159, 39, 513, 571, 1761,),
+    (1, 1, 3, 1, 5, 63, 75, 19, 455, 601, 123, 691,),
+    (1, 1, 1, 3, 21, 5, 45, 169, 377, 513, 1951, 2565,),
+    (1, 1, 3, 11, 3, 33, 119, 69, 253, 907, 805, 1449,),
+    (1, 1, 5, 13, 31, 15, 17, 7, 499, 61, 687, 1867,),
+    (1, 3, 7, 11, 17, 33, 73, 77, 299, 243, 641, 2345,),
+    (1, 1, 7, 11, 9, 35, 31, 235, 359, 647, 379, 1161,),
+    (1, 3, 3, 15, 31, 25, 5, 67, 33, 45, 437, 4067,),
+    (1, 1, 3, 11, 7, 17, 37, 87, 333, 253, 1517, 2921,),
+    (1, 1, 7, 15, 7, 15, 107, 189, 153, 769, 1521, 3427,),
+    (1, 3, 5, 13, 5, 61, 113, 37, 293, 393, 113, 43,),
+    (1, 1, 1, 15, 29, 43, 107, 31, 167, 147, 301, 1021,),
+    (1, 1, 1, 13, 3, 1, 35, 93, 195, 181, 2027, 1491,),
+    (1, 3, 3, 3, 13, 33, 77, 199, 153, 221, 1699, 3671,),
+    (1, 3, 5, 13, 7, 49, 123, 155, 495, 681, 819, 809,),
+    (1, 3, 5, 15, 27, 61, 117, 189, 183, 887, 617, 4053,),
+    (1, 1, 1, 7, 31, 59, 125, 235, 389, 369, 447, 1039,),
+    (1, 3, 5, 1, 5, 39, 115, 89, 249, 377, 431, 3747,),
+    (1, 1, 1, 5, 7, 47, 59, 157, 77, 445, 699, 3439,),
+    (1, 1, 3, 5, 11, 21, 19, 75, 11, 599, 1575, 735,),
+    (1, 3, 5, 3, 19, 13, 41, 69, 199, 143, 1761, 3215,),
+    (1, 3, 5, 7, 19, 43, 25, 41, 41, 11, 1647, 2783,),
+    (1, 3, 1, 9, 19, 45, 111, 97, 405, 399, 457, 3219,),
+    (1, 1, 3, 1, 23, 15, 65, 121, 59, 985, 829, 2259,),
+    (1, 1, 3, 7, 17, 13, 107, 229, 75, 551, 1299, 2363,),
+    (1, 1, 5, 5, 21, 57, 23, 199, 509, 139, 2007, 3875,),
+    (1, 3, 1, 11, 19, 53, 15, 229, 215, 741, 695, 823,),
+    (1, 3, 7, 1, 29, 3, 17, 163, 417, 559, 549, 319,),
+    (1, 3, 1, 13, 17, 9, 47, 133, 365, 7, 1937, 1071,),
+    (1, 3, 5, 7, 19, 37, 55, 163, 301, 249, 689, 2327,),
+    (1, 3, 5, 13, 11, 23, 61, 205, 257, 377, 615, 1457,),
+    (1, 3, 5, 1, 23, 37, 13, 75, 331, 495, 579, 3367,),
+    (1, 1, 1, 9, 1, 23, 49, 129, 475, 543, 883, 2531,),
+    (1, 3, 1, 5, 23, 59, 51, 35, 343, 695, 219, 369,),
+    (1, 3, 3, 1, 27, 17, 63, 97, 71, 507, 1929, 613,),
+    (1, 1, 5, 1, 21, 31, 11, 109, 247, 409, 1817, 2173,),
+    (1, 1, 3, 15, 23, 9, 7, 209, 301, 23, 147, 1691,),
+    (1, 1, 7, 5, 5, 19, 37, 229, 249, 277, 1115, 2309,),
+    (1, 1, 1, 5, 5, 63, 5, 249, 285, 431, 343, 2467,),
+    (1, 1, 1, 11, 7, 45, 35, 75, 505, 537, 29, 2919,),
+    (1, 3, 5, 15, 11, 39, 15, 63, 263, 9, 199, 445,),
+    (1, 3, 3, 3, 27, 63, 53, 171, 227, 63, 1049, 827,),
+    (1, 1, 3, 13, 7, 11, 115, 183, 179, 937, 1785, 381,),
+    (1, 3, 1, 11, 13, 15, 107, 81, 53, 295, 1785, 3757,),
+    (1, 3, 3, 13, 11, 5, 109, 243, 3, 505, 323, 1373,),
+    (1, 3, 3, 11, 21, 51, 17, 177, 381, 937, 1263, 3889,),
+    (1, 3, 5, 9, 27, 25, 85, 193, 143, 573, 1189, 2995,),
+    (1, 3, 5, 11, 13, 9, 81, 21, 159, 953, 91, 1751,),
+    (1, 1, 3, 3, 27, 61, 11, 253, 391, 333, 1105, 635,),
+    (1, 3, 3, 15, 9, 57, 95, 81, 419, 735, 251, 1141,),
+    (1, 1, 5, 9, 31, 39, 59, 13, 319, 807, 1241, 2433,),
+    (1, 3, 3, 5, 27, 13, 107, 141, 423, 937, 2027, 3233,),
+    (1, 3, 3, 9, 9, 25, 125, 23, 443, 835, 1245, 847,),
+    (1, 1, 7, 15, 17, 17, 83, 107, 411, 285, 847, 1571,),
+    (1, 1, 3, 13, 29, 61, 37, 81, 349, 727, 1453, 1957,),
+    (1, 3, 7, 11, 31, 13, 59, 77, 273, 591, 1265, 1533,),
+    (1, 1, 7, 7, 13, 17, 25, 25, 187, 329, 347, 1473,),
+    (1, 3, 7, 7, 5, 51, 37, 99, 221, 153, 503, 2583,),
+    (1, 3, 1, 13, 19, 27, 11, 69, 181, 479, 1183, 3229,),
+    (1, 3, 3, 13, 23, 21, 103, 147, 323, 909, 947, 315,),
+    (1, 3, 1, 3, 23, 1, 31, 59, 93, 513, 45, 2271,),
+    (1, 3, 5, 1, 7, 43, 109, 59, 231, 41, 1515, 2385,),
+    (1, 3, 1, 5, 31, 57, 49, 223, 283, 1013, 11, 701,),
+    (1, 1, 5, 1, 19, 53, 55, 31, 31, 299, 495, 693,),
+    (1, 3, 3, 9, 5, 33, 77, 253, 427, 791, 731, 1019,),
+    (1, 3, 7, 11, 1, 9, 119, 203, 53, 877, 1707, 3499,),
+    (1, 1, 3, 7, 13, 39, 55, 159, 423, 113, 1653, 3455,),
+    (1, 1, 3, 5, 21, 47, 51, 59, 55, 411, 931, 251,),
+    (1, 3, 7, 3, 31, 25, 81, 115, 405, 239, 741, 455,),
+    (1, 1, 5, 1, 31, 3, 101, 83, 479, 491, 1779, 2225,),
+    (1, 3, 3, 3, 9, 37, 107, 161, 203, 503, 767, 3435,),
+    (1, 3, 7, 9, 1, 27, 61, 119, 233, 39, 1375, 4089,),
+    (1, 1, 5, 9, 1, 31, 45, 51, 369, 587, 383, 2813,),
+    (1, 3, 7, 5, 31, 7, 49, 119, 487, 591, 1627, 53,),
+    (1, 1, 7, 1, 9, 47, 1, 223, 369, 711, 1603, 1917,),
+    (1, 3, 5, 3, 21, 37, 111, 17, 483, 739, 1193, 2775,),
+    (1, 3, 3, 7, 17, 11, 51, 117, 455, 191, 1493, 3821,),
+    (1, 1, 5, 9, 23, 39, 99, 181, 343, 485, 99, 1931,),
+    (1, 3, 1, 7, 29, 49, 31, 71, 489, 527, 1763, 2909,),
+    (1, 1, 5, 11, 5, 5, 73, 189, 321, 57, 1191, 3685,),
+    (1, 1, 5, 15, 13, 45, 125, 207, 371, 415, 315, 983,),
+    (1, 3, 3, 5, 25, 59, 33, 31, 239, 919, 1859, 2709,),
+    (1, 3, 5, 13, 27, 61, 23, 115, 61, 413, 1275, 3559,),
+    (1, 3, 7, 15, 5, 59, 101, 81, 47, 967, 809, 3189,),
+    (1, 1, 5, 11, 31, 15, 39, 25, 173, 505, 809, 2677,),
+    (1, 1, 5, 9, 19, 13, 95, 89, 511, 127, 1395, 2935,),
+    (1, 1, 5, 5, 31, 45, 9, 57, 91, 303, 1295, 3215,),
+    (1, 3, 3, 3, 19, 15, 113, 187, 217, 489, 1285, 1803,),
+    (1, 1, 3, 1, 13, 29, 57, 139, 255, 197, 537, 2183,),
+    (1, 3, 1, 15, 11, 7, 53, 255, 467, 9, 757, 3167,),
+    (1, 3, 3, 15, 21, 13, 9, 189, 359, 323, 49, 333,),
+    (1, 3, 7, 11, 7, 37, 21, 119, 401, 157, 1659, 1069,),
+    (1, 1, 5, 7, 17, 33, 115, 229, 149, 151, 2027, 279,),
+    (1, 1, 5, 15, 5, 49, 77, 155, 383, 385, 1985, 945,),
+    (1, 3, 7, 3, 7, 55, 85, 41, 357, 527, 1715, 1619,),
+    (1, 1, 3, 1, 21, 45, 115, 21, 199, 967, 1581, 3807,),
+    (1, 1, 3, 7, 21, 39, 117, 191, 169, 73, 413, 3417,),
+    (1, 1, 1, 13, 1, 31, 57, 195, 231, 321, 367, 1027,),
+    (1, 3, 7, 3, 11, 29, 47, 161, 71, 419, 1721, 437,),
+    (1, 1, 7, 3, 11, 9, 43, 65, 157, 1, 1851, 823,),
+    (1, 1, 1, 5, 21, 15, 31, 101, 293, 299, 127, 1321,),
+    (1, 1, 7, 1, 27, 1, 11, 229, 241, 705, 43, 1475,),
+    (1, 3, 7, 1, 5, 15, 73, 183, 193, 55, 1345, 49,),
+    (1, 3, 3, 3, 19, 3, 55, 21, 169, 663, 1675, 137,),
+    (1, 1, 1, 13, 7, 21, 69, 67, 373, 965, 1273, 2279,),
+    (1, 1, 7, 7, 21, 23, 17, 43, 341, 845, 465, 3355,),
+    (1, 3, 5, 5, 25, 5, 81, 101, 233, 139, 359, 2057,),
+    (1, 1, 3, 11, 15, 39, 55, 3, 471, 765, 1143, 3941,),
+    (1, 1, 7, 15, 9, 57, 81, 79, 215, 433, 333, 3855,),
+    (1, 1, 5, 5, 19, 45, 83, 31, 209, 363, 701, 1303,),
+    (1, 3, 7, 5, 1, 13, 55, 163, 435, 807, 287, 2031,),
+    (1, 3, 3, 7, 3, 3, 17, 197, 39, 169, 489, 1769,),
+    (1, 1, 3, 5, 29, 43, 87, 161, 289, 339, 1233, 2353,),
+    (1, 3, 3, 9, 21, 9, 77, 1, 453, 167, 1643, 2227,),
+    (1, 1, 7, 1, 15, 7, 67, 33, 193, 241, 1031, 2339,),
+    (1, 3, 1, 11, 1, 63, 45, 65, 265, 661, 849, 1979,),
+    (1, 3, 1, 13, 19, 49, 3, 11, 159, 213, 659, 2839,),
+    (1, 3, 5, 11, 9, 29, 27, 227, 253, 449, 1403, 3427,),
+    (1, 1, 3, 1, 7, 3, 77, 143, 277, 779, 1499, 475,),
+    (1, 1, 1, 5, 11, 23, 87, 131, 393, 849, 193, 3189,),
+    (1, 3, 5, 11, 3, 3, 89, 9, 449, 243, 1501, 1739,),
+    (1, 3, 1, 9, 29, 29, 113, 15, 65, 611, 135, 3687,),
+    (1, 1, 1, 9, 21, 19, 39, 151, 395, 501, 1339, 959, 2725,),
+    (1, 3, 7, 1, 7, 35, 45, 33, 119, 225, 1631, 1695, 1459,),
+    (1, 1, 1, 3, 25, 55, 37, 79, 167, 907, 1075, 271, 4059,),
+    (1, 3, 5, 13, 5, 13, 53, 165, 437, 67, 1705, 3177, 8095,),
+    (1, 3, 3, 13, 27, 57, 95, 55, 443, 245, 1945, 1725, 1929,),
+    (1, 3, 1, 9, 5, 33, 109, 35, 99, 827, 341, 2401, 2411,),
+    (1, 1, 5, 9, 7, 33, 43, 39, 87, 799, 635, 3481, 7159,),
+    (1, 3, 1, 1, 31, 15, 45, 27, 337, 113, 987, 2065, 2529,),
+    (1, 1, 5, 9, 5, 15, 105, 123, 479, 289, 1609, 2177, 4629,),
+    (1, 3, 5, 11, 31, 47, 97, 87, 385, 195, 1041, 651, 3271,),
+    (1, 1, 3, 7, 17, 3, 101, 55, 87, 629, 1687, 1387, 2745,),
+    (1, 3, 5, 5, 7, 21, 9, 237, 313, 549, 1107, 117, 6183,),
+    (1, 1, 3, 9, 9, 5, 55, 201, 487, 851, 1103, 2993, 4055,),
+    (1, 1, 5, 9, 31, 19, 59, 7, 363, 381, 1167, 2057, 5715,),
+    (1, 3, 3, 15, 23, 63, 19, 227, 387, 827, 487, 1049, 7471,),
+    (1, 3, 1, 5, 23, 25, 61, 245, 363, 863, 963, 3583, 6475,),
+    (1, 1, 5, 1, 5, 27, 81, 85, 275, 49, 235, 3291, 1195,),
+    (1, 1, 5, 7, 23, 53, 85, 107, 511, 779, 1265, 1093, 7859,),
+    (1, 3, 3, 1, 9, 21, 75, 219, 59, 485, 1739, 3845, 1109,),
+    (1, 3, 5, 1, 13, 41, 19, 143, 293, 391, 2023, 1791, 4399,),
+    (1, 3, 7, 15, 21, 13, 21, 195, 215, 413, 523, 2099, 2341,),
+    (1, 1, 1, 3, 29, 51, 47, 57, 135, 575, 943, 1673, 541,),
+    (1, 3, 5, 1, 9, 13, 113, 175, 447, 115, 657, 4077, 5973,),
+    (1, 1, 1, 11, 17, 41, 37, 95, 297, 579, 911, 2207, 2387,),
+    (1, 3, 5, 3, 23, 11, 23, 231, 93, 667, 711, 1563, 7961,),
+    (1, 1, 7, 3, 17, 59, 13, 181, 141, 991, 1817, 457, 1711,),
+    (1, 3, 3, 5, 31, 59, 81, 205, 245, 537, 1049, 997, 1815,),
+    (1, 3, 7, 5, 17, 13, 9, 79, 17, 185, 5, 2211, 6263,),
+    (1, 3, 7, 13, 7, 53, 61, 145, 13, 285, 1203, 947, 2933,),
+    (1, 1, 7, 3, 31, 19, 69, 217, 47, 441, 1893, 673, 4451,),
+    (1, 1, 1, 1, 25, 9, 23, 225, 385, 629, 603, 3747, 4241,),
+    (1, 3, 1, 9, 5, 37, 31, 237, 431, 79, 1521, 459, 2523,),
+    (1, 3, 7, 3, 9, 43, 105, 179, 5, 225, 799, 1777, 4893,),
+    (1, 1, 3, 1, 29, 45, 29, 159, 267, 247, 455, 847, 3909,),
+    (1, 1, 3, 7, 25, 21, 121, 57, 467, 275, 719, 1521, 7319,),
+    (1, 3, 1, 3, 11, 35, 119, 123, 81, 979, 1187, 3623, 4293,),
+    (1, 1, 1, 7, 15, 25, 121, 235, 25, 487, 873, 1787, 1977,),
+    (1, 1, 1, 11, 3, 7, 17, 135, 345, 353, 383, 4011, 2573,),
+    (1, 3, 7, 15, 27, 13, 97, 123, 65, 675, 951, 1285, 6559,),
+    (1, 3, 7, 3, 7, 1, 71, 19, 325, 765, 337, 1197, 2697,),
+    (1, 3, 5, 1, 31, 37, 11, 71, 169, 283, 83, 3801, 7083,),
+    (1, 1, 3, 15, 17, 29, 83, 65, 275, 679, 1749, 4007, 7749,),
+    (1, 1, 3, 1, 21, 11, 41, 95, 237, 361, 1819, 2783, 2383,),
+    (1, 3, 7, 11, 29, 57, 111, 187, 465, 145, 605, 1987, 8109,),
+    (1, 1, 3, 3, 19, 15, 55, 83, 357, 1001, 643, 1517, 6529,),
+    (1, 3, 1, 5, 29, 35, 73, 23, 77, 619, 1523, 1725, 8145,),
+    (1, 1, 5, 5, 19, 23, 7, 197, 449, 337, 717, 2921, 315,),
+    (1, 3, 5, 9, 7, 63, 117, 97, 97, 813, 1925, 2817, 1579,),
+    (1, 1, 1, 11, 31, 7, 25, 235, 231, 133, 1007, 1371, 1553,),
+    (1, 1, 7, 5, 19, 7, 47, 171, 267, 243, 1331, 567, 6033,),
+    (1, 1, 5, 1, 7, 49, 55, 89, 109, 735, 1455, 3193, 6239,),
+    (1, 1, 1, 7, 1, 61, 9, 103, 3, 929, 1481, 2927, 2957,),
+    (1, 1, 5, 13, 17, 21, 75, 49, 255, 1019, 1161, 2133, 1177,),
+    (1, 3, 1, 3, 13, 15, 41, 247, 211, 409, 1163, 523, 2635,),
+    (1, 3, 7, 7, 21, 59, 91, 149, 479, 391, 681, 2311, 6249,),
+    (1, 1, 5, 11, 27, 53, 21, 211, 197, 815, 719, 1605, 255,),
+    (1, 1, 3, 3, 9, 33, 59, 3, 323, 1, 101, 1135, 8105,),
+    (1, 3, 3, 1, 29, 5, 17, 141, 51, 991, 841, 327, 3859,),
+    (1, 3, 1, 5, 11, 19, 23, 89, 175, 173, 165, 2881, 1881,),
+    (1, 1, 1, 15, 13, 51, 87, 39, 495, 611, 1341, 1531, 7029,),
+    (1, 1, 3, 11, 13, 55, 75, 185, 57, 61, 1917, 2051, 5965,),
+    (1, 1, 5, 5, 7, 53, 11, 217, 213, 933, 921, 3607, 5175,),
+    (1, 3, 3, 5, 17, 53, 103, 251, 369, 781, 1319, 3717, 4439,),
+    (1, 3, 5, 13, 1, 39, 25, 235, 321, 773, 251, 3111, 6397,),
+    (1, 1, 7, 3, 31, 5, 25, 29, 325, 385, 1313, 127, 4705,),
+    (1, 1, 5, 15, 15, 27, 15, 85, 239, 243, 1633, 3473, 2621,),
+    (1, 3, 3, 3, 9, 19, 113, 13, 137, 165, 25, 2957, 7549,),
+    (1, 3, 1, 3, 11, 21, 3, 97, 417, 183, 1205, 1437, 247,),
+    (1, 1, 7, 3, 17, 21, 125, 55, 67, 387, 385, 2323, 887,),
+    (1, 3, 5, 5, 29, 11, 103, 223, 233, 641, 133, 415, 1297,),
+    (1, 3, 3, 11, 1, 9, 5, 189, 235, 1007, 1363, 3985, 889,),
+    (1, 3, 7, 9, 23, 19, 19, 183, 269, 403, 1643, 3559, 5189,),
+    (1, 3, 7, 3, 29, 45, 17, 69, 475, 149, 1291, 2689, 7625,),
+    (1, 3, 7, 3, 27, 37, 41, 73, 253, 1001, 431, 1111, 7887,),
+    (1, 1, 7, 5, 3, 7, 87, 143, 289, 495, 631, 3011, 6151,),
+    (1, 1, 1, 13, 5, 45, 17, 167, 23, 975, 801, 1975, 6833,),
+    (1, 3, 1, 11, 7, 21, 39, 23, 213, 429, 1301, 2059, 197,),
+    (1, 3, 3, 15, 3, 57, 121, 133, 29, 711, 1961, 2497, 189,),
+    (1, 1, 3, 5, 11, 55, 115, 137, 233, 673, 985, 2849, 5911,),
+    (1, 1, 7, 15, 29, 45, 1, 241, 329, 323, 925, 2821, 3331,),
+    (1, 1, 5, 7, 13, 31, 81, 105, 199, 145, 195, 1365, 5119,),
+    (1, 3, 7, 11, 3, 55, 11, 31, 117, 343, 1265, 1837, 2451,),
+    (1, 1, 3, 7, 29, 57, 61, 179, 429, 591, 177, 1945, 2159,),
+    (1, 3, 5, 11, 23, 49, 101, 137, 339, 323, 1035, 1749, 7737,),
+    (1, 3, 1, 13, 21, 35, 55, 79, 19, 269, 1055, 2651, 7083,),
+    (1, 3, 3, 11, 9, 9, 95, 167, 437, 361, 1185, 4083, 603,),
+    (1, 1, 1, 7, 31, 61, 77, 65, 489, 657, 691, 2423, 4147,),
+    (1, 3, 5, 7, 21, 37, 87, 191, 311, 453, 2013, 829, 2619,),
+    (1, 1, 5, 9, 17, 47, 35, 101, 5, 813, 1157, 1279, 7365,),
+    (1, 1, 5, 3, 11, 35, 113, 199, 369, 721, 901, 1471, 7801,),
+    (1, 3, 1, 5, 9, 61, 83, 157, 391, 739, 1957, 2123, 4341,),
+    (1, 3, 5, 11, 19, 19, 111, 225, 383, 219, 997, 717, 7505,),
+    (1, 3, 1, 11, 13, 63, 35, 127, 209, 831, 501, 3017, 3507,),
+    (1, 3, 7, 9, 29, 7, 11, 163, 81, 563, 1445, 3215, 6377,),
+    (1, 3, 7, 11, 25, 3, 39, 195, 491, 45, 839, 4021, 4899,),
+    (1, 3, 7, 15, 13, 5, 67, 143, 117, 505, 1281, 3679, 5695,),
+    (1, 3, 7, 9, 9, 19, 21, 221, 147, 763, 683, 2211, 589,),
+    (1, 1, 3, 5, 21, 47, 53, 109, 299, 807, 1153, 1209, 7961,),
+    (1, 3, 7, 11, 9, 31, 45, 43, 505, 647, 1127, 2681, 4917,),
+    (1, 1, 5, 15, 31, 41, 63, 113, 399, 727, 673, 2587, 5259,),
+    (1, 1, 1, 13, 17, 53, 35, 99, 57, 243, 1447, 1919, 2831,),
+    (1, 3, 7, 11, 23, 51, 13, 9, 49, 449, 997, 3073, 4407,),
+    (1, 3, 5, 7, 23, 33, 89, 41, 415, 53, 697, 1113, 1489,),
+    (1, 1, 3, 7, 1, 13, 29, 13, 255, 749, 77, 3463, 1761,),
+    (1, 3, 3, 7, 13, 15, 93, 191, 309, 869, 739, 1041, 3053,),
+    (1, 3, 5, 13, 5, 19, 109, 211, 347, 839, 893, 2947, 7735,),
+    (1, 3, 1, 13, 27, 3, 119, 157, 485, 99, 1703, 3895, 573,),
+    (1, 3, 7, 11, 1, 23, 123, 105, 31, 359, 275, 1775, 3685,),
+    (1, 3, 3, 5, 27, 11, 125, 3, 413, 199, 2043, 2895, 2945,),
+    (1, 3, 3, 3, 15, 49, 121, 159, 233, 543, 193, 4007, 321,),
+    (1, 1, 3, 5, 9, 47, 87, 1, 51, 1011, 1595, 2239, 6467,),
+    (1, 3, 7, 9, 1, 33, 87, 137, 469, 749, 1413, 805, 6817,),
+    (1, 3, 1, 13, 19, 45, 95, 227, 29, 677, 1275, 3395, 4451,),
+    (1, 1, 7, 5, 7, 63, 33, 71, 443, 561, 1311, 3069, 6943,),
+    (1, 1, 1, 13, 9, 37, 23, 69, 13, 415, 1479, 1197, 861,),
+    (1, 3, 3, 13, 27, 21, 13, 233, 105, 777, 345, 2443, 1105,),
+    (1, 1, 7, 11, 23, 13, 21, 147, 221, 549, 73, 2729, 6279,),
+    (1, 1, 7, 7, 25, 27, 15, 45, 227, 39, 75, 1191, 3563,),
+    (1, 1, 5, 7, 13, 49, 99, 167, 227, 13, 353, 1047, 8075,),
+    (1, 1, 3, 13, 31, 9, 27, 7, 461, 737, 1559, 3243, 53,),
+    (1, 3, 1, 1, 21, 41, 97, 165, 171, 821, 587, 2137, 2293,),
+    (1, 3, 1, 11, 17, 41, 29, 187, 87, 599, 1467, 1395, 5931,),
+    (1, 1, 1, 9, 9, 49, 89, 205, 409, 453, 61, 1923, 1257,),
+    (1, 3, 7, 3, 9, 43, 89, 143, 431, 83, 1243, 1795, 3599,),
+    (1, 3, 5, 13, 3, 25, 59, 219, 43, 223, 797, 2651, 6015,),
+    (1, 1, 5, 15, 7, 55, 65, 207, 213, 311, 1287, 1269, 6467,),
+    (1, 3, 7, 11, 21, 57, 31, 183, 351, 857, 911, 1683, 7155,),
+    (1, 3, 5, 11, 27, 1, 21, 47, 387, 383, 1593, 115, 3805,),
+    (1, 3, 1, 1, 13, 23, 87, 173, 181, 619, 1653, 3931, 6073,),
+    (1, 1, 7, 5, 17, 43, 37, 61, 307, 621, 1785, 55, 115,),
+    (1, 3, 7, 15, 25, 61, 123, 15, 237, 671, 1473, 467, 1907,),
+    (1, 1, 7, 5, 29, 57, 75, 237, 85, 699, 159, 3577, 4771,),
+    (1, 1, 1, 11, 25, 19, 51, 1, 147, 31, 895, 2617, 625,),
+    (1, 3, 7, 5, 29, 15, 115, 175, 395, 391, 1141, 1827, 1181,),
+    (1, 3, 5, 7, 17, 7, 11, 193, 89, 243, 561, 3787, 4551,),
+    (1, 3, 1, 11, 7, 57, 7, 125, 403, 947, 1261, 409, 8083,),
+    (1, 1, 5, 13, 21, 63, 115, 233, 231, 921, 1747, 3635, 2519,),
+    (1, 1, 5, 11, 3, 27, 15, 91, 505, 591, 1451, 3881, 2997,),
+    (1, 1, 3, 11, 21, 9, 109, 153, 317, 533, 593, 3967, 2797,),
+    (1, 3, 3, 13, 9, 57, 121, 245, 219, 867, 967, 791, 7095,),
+    (1, 1, 1, 9, 29, 21, 99, 35, 375, 959, 329, 4087, 7171,),
+    (1, 1, 1, 9, 11, 17, 17, 97, 89, 135, 631, 3809, 3253,),
+    (1, 1, 1, 15, 21, 51, 91, 249, 459, 801, 757, 2353, 2033,),
+    (1, 3, 5, 9, 23, 29, 77, 53, 399, 767, 1817, 2171, 1629,),
+    (1, 1, 3, 5, 29, 5, 43, 121, 17, 859, 1479, 3785, 6641,),
+    (1, 1, 3, 7, 7, 61, 45, 109, 371, 833, 91, 153, 4553,),
+    (1, 1, 3, 11, 7, 55, 81, 123, 389, 139, 1933, 891, 1789,),
+    (1, 3, 7, 15, 25, 17, 93, 165, 503, 717, 1553, 1475, 1627,),
+    (1, 1, 1, 13, 13, 63, 13, 225, 357, 571, 33, 4073, 3795,),
+    (1, 1, 3, 11, 1, 31, 107, 145, 407, 961, 501, 2987, 103,),
+    (1, 1, 7, 1, 23, 63, 49, 193, 173, 281, 25, 2465, 5927,),
+    (1, 1, 7, 1, 1, 1, 85, 77, 273, 693, 349, 1239, 4503,),
+    (1, 1, 5, 11, 7, 61, 9, 121, 25, 357, 1443, 405, 7827,),
+    (1, 1, 7, 13, 11, 53, 11, 207, 145, 211, 1703, 1081, 2117,),
+    (1, 1, 3, 11, 27, 23, 19, 9, 297, 279, 1481, 2273, 6387,),
+    (1, 3, 3, 5, 15, 45, 3, 41, 305, 87, 1815, 3461, 5349,),
+    (1, 3, 3, 13, 9, 37, 79, 125, 259, 561, 1087, 4091, 793,),
+    (1, 3, 5, 7, 31, 55, 7, 145, 347, 929, 589, 2783, 5905,),
+    (1, 1, 7, 15, 3, 25, 1, 181, 13, 243, 653, 2235, 7445,),
+    (1, 3, 5, 5, 17, 53, 65, 7, 33, 583, 1363, 1313, 2319,),
+    (1, 3, 3, 7, 27, 47, 97, 201, 187, 321, 63, 1515, 7917,),
+    (1, 1, 3, 5, 23, 9, 3, 165, 61, 19, 1789, 3783, 3037,),
+    (1, 3, 1, 13, 15, 43, 125, 191, 67, 273, 1551, 2227, 5253,),
+    (1, 1, 1, 13, 25, 53, 107, 33, 299, 249, 1475, 2233, 907,),
+    (1, 3, 5, 1, 23, 37, 85, 17, 207, 643, 665, 2933, 5199,),
+    (1, 1, 7, 7, 25, 57, 59, 41, 15, 751, 751, 1749, 7053,),
+    (1, 3, 3, 1, 13, 25, 127, 93, 281, 613, 875, 2223, 6345,),
+    (1, 1, 5, 3, 29, 55, 79, 249, 43, 317, 533, 995, 1991,),
+    (1, 3, 3, 15, 17, 49, 79, 31, 193, 233, 1437, 2615, 819,),
+    (1, 1, 5, 15, 25, 3, 123, 145, 377, 9, 455, 1191, 3953,),
+    (1, 3, 5, 3, 15, 19, 41, 231, 81, 393, 3, 19, 2409,),
+    (1, 1, 3, 1, 27, 43, 113, 179, 7, 853, 947, 2731, 297,),
+    (1, 1, 1, 11, 29, 39, 53, 191, 443, 689, 529, 3329, 7431,),
+    (1, 3, 7, 5, 3, 29, 19, 67, 441, 113, 949, 2769, 4169,),
+    (1, 3, 5, 11, 11, 55, 85, 169, 215, 815, 803, 2345, 3967,),
+    (1, 1, 7, 9, 5, 45, 111, 5, 419, 375, 303, 1725, 4489,),
+    (1, 3, 5, 15, 29, 43, 79, 19, 23, 417, 381, 541, 4923,),
+    (1, 1, 3, 15, 3, 31, 117, 39, 117, 305, 1227, 1223, 143,),
+    (1, 1, 5, 9, 5, 47, 87, 239, 181, 353, 1561, 3313, 1921,),
+    (1, 3, 3, 1, 3, 15, 53, 221, 441, 987, 1997, 2529, 8059,),
+    (1, 1, 7, 11, 15, 57, 111, 139, 137, 883, 1881, 2823, 5661,),
+    (1, 3, 5, 5, 21, 11, 5, 13, 27, 973, 587, 1331, 1373,),
+    (1, 1, 7, 11, 29, 51, 93, 29, 217, 221, 55, 2477, 1979,),
+    (1, 3, 3, 13, 3, 11, 49, 75, 379, 371, 1441, 793, 7633,),
+    (1, 1, 1, 13, 19, 45, 89, 249, 91, 649, 1695, 915, 5619,),
+    (1, 3, 1, 7, 7, 29, 1, 77, 313, 895, 519, 771, 295,),
+    (1, 3, 1, 15, 5, 3, 1, 57, 331, 109, 485, 2853, 6831,),
+    (1, 1, 1, 15, 17, 3, 35, 99, 245, 971, 839, 2509, 2803,),
+    (1, 3, 3, 3, 9, 37, 57, 251, 325, 317, 529, 1313, 6379,),
+    (1, 1, 1, 15, 25, 59, 1, 119, 95, 15, 795, 2375, 6463,),
+    (1, 3, 1, 5, 1, 49, 117, 21, 47, 179, 863, 85, 1669,),
+    (1, 3, 7, 3, 9, 37, 19, 221, 455, 973, 571, 1427, 817,),
+    (1, 1, 1, 15, 17, 9, 67, 213, 127, 887, 1299, 2913, 7451,),
+    (1, 3, 1, 13, 27, 27, 41, 43, 171, 623, 691, 391, 4885,),
+    (1, 3, 1, 13, 17, 17, 123, 239, 143, 227, 1151, 519, 6543,),
+    (1, 3, 7, 5, 7, 63, 97, 39, 101, 555, 1057, 381, 7891,),
+    (1, 3, 5, 1, 3, 27, 85, 129, 161, 875, 1945, 3541, 695,),
+    (1, 3, 3, 5, 21, 59, 25, 183, 35, 25, 987, 1459, 181,),
+    (1, 3, 5, 13, 1, 15, 127, 237, 349, 337, 1491, 2383, 7811,),
+    (1, 3, 5, 5, 31, 5, 109, 51, 409, 733, 1395, 3207, 6049,),
+    (1, 1, 5, 7, 13, 35, 113, 25, 263, 389, 299, 2521, 1783,),
+    (1, 3, 7, 11, 15, 47, 97, 73, 55, 75, 113, 2695, 1023,),
+    (1, 3, 1, 1, 3, 13, 69, 211, 289, 483, 1335, 787, 677,),
+    (1, 1, 3, 3, 17, 7, 37, 77, 505, 137, 1113, 345, 2975,),
+    (1, 1, 1, 13, 3, 11, 95, 199, 453, 109, 479, 3725, 239,),
+    (1, 1, 7, 15, 19, 53, 3, 145, 359, 863, 347, 3833, 3043,),
+    (1, 1, 7, 15, 25, 63, 127, 129, 125, 195, 155, 2211, 8153,),
+    (1, 1, 7, 13, 9, 49, 121, 115, 73, 119, 1851, 727, 47,),
+    (1, 3, 3, 13, 13, 11, 71, 7, 45, 591, 133, 2407, 5563,),
+    (1, 1, 1, 13, 23, 29, 87, 89, 501, 71, 1759, 1119, 687,),
+    (1, 1, 7, 7, 13, 7, 13, 183, 53, 951, 1877, 3991, 6771,),
+    (1, 3, 7, 11, 7, 1, 27, 47, 61, 21, 919, 961, 1091,),
+    (1, 3, 5, 5, 1, 27, 1, 5, 63, 157, 1297, 1049, 5893,),
+    (1, 3, 7, 9, 19, 33, 17, 133, 425, 797, 1721, 153, 119,),
+    (1, 3, 3, 7, 13, 37, 1, 215, 509, 1003, 61, 2353, 7511,),
+    (1, 1, 7, 1, 29, 19, 31, 79, 199, 555, 1209, 1603, 6089,),
+    (1, 3, 1, 1, 5, 31, 111, 127, 333, 429, 1863, 3925, 5411,),
+    (1, 1, 7, 5, 5, 5, 123, 191, 47, 993, 269, 4051, 2111,),
+    (1, 1, 5, 15, 1, 9, 87, 5, 47, 463, 865, 1813, 7357,),
+    (1, 3, 1, 3, 23, 63, 123, 83, 511, 777, 63, 1285, 4537,),
+    (1, 3, 3, 7, 27, 25, 31, 65, 441, 529, 1815, 1893, 323,),
+    (1, 3, 7, 5, 11, 19, 7, 5, 397, 811, 755, 2883, 4217,),
+    (1, 3, 1, 13, 9, 21, 13, 7, 271, 539, 1769, 3243, 5325,),
+    (1, 1, 7, 1, 31, 13, 47, 131, 181, 457, 1559, 2663, 6653,),
+    (1, 3, 3, 7, 29, 55, 25, 203, 419, 91, 437, 1159, 5691,),
+    (1, 1, 3, 13, 29, 19, 71, 217, 337, 329, 501, 939, 2205,),
+    (1, 1, 3, 1, 1, 27, 17, 201, 97, 285, 1269, 4043, 2207,),
+    (1, 1, 1, 1, 3, 41, 13, 199, 141, 129, 1515, 3129, 5969,),
+    (1, 3, 3, 9, 3, 17, 119, 41, 271, 933, 877, 701, 2197,),
+    (1, 1, 1, 7, 15, 47, 3, 195, 115, 821, 725, 843, 6071,),
+    (1, 3, 5, 15, 17, 33, 85, 65, 297, 571, 1123, 2743, 5727,),
+    (1, 1, 5, 11, 27, 15, 37, 235, 415, 293, 1439, 2739, 4171,),
+    (1, 3, 7, 7, 1, 55, 71, 35, 307, 11, 401, 1881, 933,),
+    (1, 3, 1, 11, 21, 37, 3, 177, 119, 339, 559, 3991, 3437,),
+    (1, 3, 3, 9, 17, 17, 97, 119, 301, 169, 157, 3267, 2261,),
+    (1, 3, 3, 9, 29, 3, 111, 101, 355, 869, 375, 2609, 7377,),
+    (1, 3, 5, 9, 7, 21, 123, 99, 343, 693, 1927, 1605, 4923,),
+    (1, 1, 3, 5, 13, 31, 99, 17, 75, 385, 1539, 1553, 7077,),
+    (1, 3, 3, 5, 31, 35, 107, 11, 407, 1019, 1317, 3593, 7203,),
+    (1, 3, 3, 13, 17, 33, 99, 245, 401, 957, 157, 1949, 1571,),
+    (1, 3, 1, 11, 27, 15, 11, 109, 429, 307, 1911, 2701, 861,),
+    (1, 1, 5, 13, 13, 35, 55, 255, 311, 957, 1803, 2673, 5195,),
+    (1, 1, 1, 11, 19, 3, 89, 37, 211, 783, 1355, 3567, 7135,),
+    (1, 1, 5, 5, 21, 49, 79, 17, 509, 331, 183, 3831, 855,),
+    (1, 3, 7, 5, 29, 19, 85, 109, 105, 523, 845, 3385, 7477,),
+    (1, 1, 1, 7, 25, 17, 125, 131, 53, 757, 253, 2989, 2939,),
+    (1, 3, 3, 9, 19, 23, 105, 39, 351, 677, 211, 401, 8103,),
+    (1, 3, 5, 1, 5, 11, 17, 3, 405, 469, 1569, 2865, 3133,),
+    (1, 1, 3, 13, 15, 5, 117, 179, 139, 145, 477, 1137, 2537,),
+    (1, 1, 7, 9, 5, 21, 9, 93, 211, 963, 1207, 3343, 4911,),
+    (1, 1, 1, 9, 13, 43, 17, 53, 81, 793, 1571, 2523, 3683,),
+    (1, 3, 3, 13, 25, 21, 5, 59, 489, 987, 1941, 171, 6009,),
+    (1, 3, 3, 7, 1, 39, 89, 171, 403, 467, 1767, 3423, 2791,),
+    (1, 1, 3, 9, 19, 49, 91, 125, 163, 1013, 89, 2849, 6785,),
+    (1, 1, 5, 9, 9, 11, 15, 241, 43, 297, 1719, 1541, 1821,),
+    (1, 3, 7, 15, 29, 23, 103, 239, 191, 33, 1043, 3649, 6579,),
+    (1, 3, 3, 9, 21, 51, 123, 55, 223, 645, 1463, 4021, 5891,),
+    (1, 1, 5, 7, 3, 41, 27, 235, 391, 303, 2021, 3187, 7607,),
+    (1, 1, 1, 9, 5, 49, 49, 29, 377, 251, 1887, 1017, 1301,),
+    (1, 1, 3, 3, 13, 41, 27, 47, 223, 23, 517, 3227, 6731,),
+    (1, 1, 7, 1, 31, 25, 47, 9, 511, 623, 2047, 1263, 1511,),
+    (1, 1, 3, 15, 15, 23, 53, 1, 261, 595, 85, 241, 7047,),
+    (1, 3, 3, 11, 17, 5, 81, 73, 149, 781, 2035, 3163, 4247,),
+    (1, 3, 7, 7, 29, 59, 49, 79, 397, 901, 1105, 2191, 6277,),
+    (1, 3, 3, 11, 13, 27, 25, 173, 107, 73, 1265, 585, 5251,),
+    (1, 1, 7, 15, 29, 23, 73, 229, 235, 887, 1469, 4073, 2591,),
+    (1, 1, 3, 9, 17, 15, 83, 173, 207, 879, 1701, 1509, 11,),
+    (1, 1, 3, 5, 5, 37, 65, 161, 39, 421, 1153, 2007, 5355,),
+    (1, 1, 7, 11, 23, 37, 5, 11, 9, 499, 17, 157, 5747,),
+    (1, 3, 7, 13, 25, 9, 49, 7, 39, 945, 1349, 1759, 1441,),
+    (1, 1, 5, 3, 21, 15, 113, 81, 265, 837, 333, 3625, 6133,),
+    (1, 3, 1, 11, 13, 27, 73, 109, 297, 327, 299, 3253, 6957,),
+    (1, 1, 3, 13, 19, 39, 123, 73, 65, 5, 1061, 2187, 5055,),
+    (1, 1, 3, 1, 11, 31, 21, 115, 453, 857, 711, 495, 549,),
+    (1, 3, 7, 7, 15, 29, 79, 103, 47, 713, 1735, 3121, 6321,),
+    (1, 1, 5, 5, 29, 9, 97, 33, 471, 705, 329, 1501, 1349,),
+    (1, 3, 3, 1, 21, 9, 111, 209, 71, 47, 491, 2143, 1797,),
+    (1, 3, 3, 3, 11, 39, 21, 135, 445, 259, 607, 3811, 5449,),
+    (1, 1, 7, 9, 11, 25, 113, 251, 395, 317, 317, 91, 1979,),
+    (1, 3, 1, 9, 3, 21, 103, 133, 389, 943, 1235, 1749, 7063,),
+    (1, 1, 3, 7, 1, 11, 5, 15, 497, 477, 479, 3079, 6969,),
+    (1, 1, 3, 3, 15, 39, 105, 131, 475, 465, 181, 865, 3813,),
+    (1, 1, 7, 9, 19, 63, 123, 131, 415, 525, 457, 2471, 3135,),
+    (1, 3, 7, 15, 25, 35, 123, 45, 341, 805, 485, 4049, 7065,),
+    (1, 1, 1, 5, 29, 9, 47, 227, 51, 867, 1873, 1593, 2271,),
+    (1, 1, 7, 15, 31, 9, 71, 117, 285, 711, 837, 1435, 6275,),
+    (1, 3, 1, 1, 5, 19, 79, 25, 301, 415, 1871, 645, 3251,),
+    (1, 3, 1, 3, 17, 51, 99, 185, 447, 43, 523, 219, 429,),
+    (1, 3, 1, 13, 29, 13, 51, 93, 7, 995, 757, 3017, 6865,),
+    (1, 1, 3, 15, 7, 25, 75, 17, 155, 981, 1231, 1229, 1995,),
+    (1, 3, 5, 3, 27, 45, 71, 73, 225, 763, 377, 1139, 2863,),
+    (1, 1, 3, 1, 1, 39, 69, 113, 29, 371, 1051, 793, 3749,),
+    (1, 1, 3, 13, 23, 61, 27, 183, 307, 431, 1345, 2757, 4031,),
+    (1, 3, 7, 5, 5, 59, 117, 197, 303, 721, 877, 723, 1601,),
+    (1, 3, 5, 1, 27, 33, 99, 237, 485, 711, 665, 3077, 5105,),
+    (1, 1, 3, 1, 13, 9, 103, 201, 23, 951, 2029, 165, 2093,),
+    (1, 3, 5, 13, 5, 29, 55, 85, 221, 677, 611, 3613, 4567,),
+    (1, 1, 1, 1, 7, 61, 9, 233, 261, 561, 953, 4023, 2443,),
+    (1, 3, 3, 13, 1, 17, 103, 71, 223, 213, 833, 1747, 6999,),
+    (1, 3, 5, 15, 25, 53, 57, 187, 25, 695, 1207, 4089, 2877,),
+    (1, 1, 7, 1, 7, 31, 87, 129, 493, 519, 1555, 1155, 4637,),
+    (1, 1, 1, 15, 21, 17, 23, 29, 19, 255, 927, 1791, 3093,),
+    (1, 1, 3, 9, 17, 33, 95, 129, 175, 461, 287, 2633, 2325,),
+    (1, 3, 5, 7, 23, 19, 63, 209, 249, 583, 1373, 2039, 2225,),
+    (1, 3, 3, 5, 5, 19, 79, 241, 459, 355, 1455, 3313, 3639,),
+    (1, 1, 7, 9, 21, 41, 97, 119, 129, 769, 1541, 3495, 7741,),
+    (1, 1, 7, 11, 9, 29, 35, 255, 141, 937, 1763, 41, 1393,),
+    (1, 3, 7, 1, 13, 51, 61, 157, 177, 847, 1829, 3539, 285,),
+    (1, 1, 1, 15, 21, 13, 9, 55, 397, 19, 1495, 1255, 7235,),
+    (1, 1, 7, 7, 25, 37, 53, 237, 319, 197, 269, 1205, 1485,),
+    (1, 1, 5, 15, 23, 17, 35, 247, 323, 807, 233, 3681, 4407,),
+    (1, 1, 3, 7, 9, 59, 85, 105, 493, 763, 1639, 391, 1451,),
+    (1, 3, 3, 9, 15, 33, 5, 253, 129, 625, 1527, 2793, 6057,),
+    (1, 3, 1, 1, 7, 47, 21, 161, 235, 83, 397, 3563, 5953,),
+    (1, 3, 7, 11, 3, 41, 25, 117, 375, 779, 1297, 3715, 8117,),
+    (1, 1, 3, 7, 31, 19, 103, 173, 475, 189, 2035, 2921, 1107,),
+    (1, 1, 7, 3, 25, 7, 93, 255, 307, 113, 1893, 2233, 6919,),
+    (1, 3, 5, 15, 9, 57, 79, 143, 165, 5, 1389, 193, 693,),
+    (1, 3, 5, 1, 29, 45, 91, 49, 189, 461, 439, 1283, 7835,),
+    (1, 1, 3, 13, 11, 61, 41, 231, 373, 695, 395, 915, 5393,),
+    (1, 3, 7, 11, 5, 51, 67, 53, 483, 95, 1943, 247, 5653,),
+    (1, 3, 7, 5, 5, 57, 45, 235, 137, 793, 1069, 1661, 1557,),
+    (1, 3, 5, 3, 25, 55, 103, 177, 81, 861, 1151, 143, 7655,),
+    (1, 1, 3, 1, 21, 41, 67, 131, 253, 431, 1269, 3181, 3429,),
+    (1, 3, 1, 1, 21, 7, 77, 221, 257, 663, 71, 2949, 2481,),
+    (1, 3, 5, 3, 3, 23, 45, 107, 299, 739, 1013, 3, 3165,),
+    (1, 1, 5, 1, 3, 37, 109, 37, 243, 983, 1221, 1691, 3869,),
+    (1, 1, 5, 5, 31, 7, 5, 193, 397, 867, 1495, 3435, 7441,),
+    (1, 1, 1, 1, 17, 59, 97, 233, 389, 597, 1013, 1631, 483,),
+    (1, 1, 1, 11, 7, 41, 107, 53, 111, 125, 1513, 1921, 7647,),
+    (1, 3, 3, 3, 31, 29, 117, 3, 365, 971, 1139, 2123, 5913,),
+    (1, 1, 1, 13, 23, 3, 1, 167, 475, 639, 1811, 3841, 3081,),
+    (1, 1, 5, 3, 5, 47, 65, 123, 275, 783, 95, 119, 7591,),
+    (1, 3, 1, 15, 13, 33, 93, 237, 467, 431, 705, 4013, 4035,),
+    (1, 3, 5, 1, 19, 7, 101, 231, 155, 737, 1381, 3343, 2051,),
+    (1, 1, 5, 9, 15, 49, 45, 163, 433, 765, 2031, 201, 2589,),
+    (1, 3, 7, 9, 19, 41, 31, 89, 93, 623, 105, 745, 4409,),
+    (1, 1, 5, 1, 11, 45, 127, 85, 389, 439, 829, 477, 7965,),
+    (1, 3, 3, 15, 13, 41, 1, 207, 435, 585, 311, 1725, 2737,),
+    (1, 3, 3, 3, 13, 49, 21, 31, 197, 799, 1411, 2959, 7133,),
+    (1, 3, 1, 3, 7, 43, 9, 141, 133, 579, 1059, 93, 957,),
+    (1, 3, 7, 1, 15, 51, 23, 213, 381, 851, 699, 2261, 3419,),
+    (1, 3, 5, 9, 25, 35, 67, 141, 35, 409, 1423, 365, 1645,),
+    (1, 3, 3, 11, 15, 33, 27, 181, 93, 87, 1761, 3511, 1353,),
+    (1, 3, 5, 3, 25, 63, 111, 137, 321, 819, 705, 1547, 7271,),
+    (1, 3, 1, 1, 5, 57, 99, 59, 411, 757, 1371, 3953, 3695,),
+    (1, 3, 5, 11, 11, 21, 25, 147, 239, 455, 709, 953, 7175,),
+    (1, 3, 3, 15, 5, 53, 91, 205, 341, 63, 723, 1565, 7135,),
+    (1, 1, 7, 15, 11, 21, 99, 79, 63, 593, 2007, 3629, 5271,),
+    (1, 3, 3, 1, 9, 21, 45, 175, 453, 435, 1855, 2649, 6959,),
+    (1, 1, 3, 15, 15, 33, 121, 121, 251, 431, 1127, 3305, 4199,),
+    (1, 1, 1, 9, 31, 15, 71, 29, 345, 391, 1159, 2809, 345,),
+    (1, 3, 7, 1, 23, 29, 95, 151, 327, 727, 647, 1623, 2971,),
+    (1, 1, 7, 7, 9, 29, 79, 91, 127, 909, 1293, 1315, 5315,),
+    (1, 1, 5, 11, 13, 37, 89, 73, 149, 477, 1909, 3343, 525,),
+    (1, 3, 5, 7, 5, 59, 55, 255, 223, 459, 2027, 237, 4205,),
+    (1, 1, 1, 7, 27, 11, 95, 65, 325, 835, 907, 3801, 3787,),
+    (1, 1, 1, 11, 27, 33, 99, 175, 51, 913, 331, 1851, 4133,),
+    (1, 3, 5, 5, 13, 37, 31, 99, 273, 409, 1827, 3845, 5491,),
+    (1, 1, 3, 7, 23, 19, 107, 85, 283, 523, 509, 451, 421,),
+    (1, 3, 5, 7, 13, 9, 51, 81, 87, 619, 61, 2803, 5271,),
+    (1, 1, 1, 15, 9, 45, 35, 219, 401, 271, 953, 649, 6847,),
+    (1, 1, 7, 11, 9, 45, 17, 219, 169, 837, 1483, 1605, 2901,),
+    (1, 1, 7, 7, 21, 43, 37, 33, 291, 359, 71, 2899, 7037,),
+    (1, 3, 3, 13, 31, 53, 37, 15, 149, 949, 551, 3445, 5455,),
+    (1, 3, 1, 5, 19, 45, 81, 223, 193, 439, 2047, 3879, 789,),
+    (1, 1, 7, 3, 11, 63, 35, 61, 255, 563, 459, 2991, 3359,),
+    (1, 1, 5, 9, 13, 49, 47, 185, 239, 221, 1533, 3635, 2045,),
+    (1, 3, 7, 3, 25, 37, 127, 223, 51, 357, 483, 3837, 6873,),
+    (1, 1, 7, 9, 31, 37, 113, 31, 387, 833, 1243, 1543, 5535,),
+    (1, 3, 1, 9, 23, 59, 119, 221, 73, 185, 2007, 2885, 2563,),
+    (1, 1, 1, 13, 7, 33, 53, 179, 67, 185, 1541, 1807, 4659,),
+    (1, 3, 1, 11, 31, 37, 23, 215, 269, 357, 207, 645, 4219,),
+    (1, 3, 3, 13, 19, 27, 107, 55, 91, 71, 1695, 1815, 89,),
+    (1, 1, 3, 15, 3, 19, 35, 247, 49, 529, 1523, 3317, 6151,),
+    (1, 1, 7, 7, 23, 25, 107, 139, 483, 503, 1277, 243, 7879,),
+    (1, 3, 3, 13, 3, 15, 11, 197, 135, 839, 985, 275, 5527,),
+    (1, 3, 5, 3, 25, 47, 95, 21, 113, 307, 1001, 3065, 295,),
+    (1, 1, 3, 9, 19, 19, 99, 213, 363, 449, 735, 2851, 2521,),
+    (1, 1, 3, 9, 5, 49, 63, 61, 157, 857, 497, 2801, 6987,),
+    (1, 1, 1, 9, 1, 41, 109, 119, 499, 939, 867, 3675, 8023,),
+    (1, 3, 1, 1, 13, 33, 109, 123, 289, 3, 1271, 2773, 4265,),
+    (1, 3, 1, 11, 9, 57, 83, 221, 95, 43, 1189, 457, 7133,),
+    (1, 1, 7, 3, 11, 49, 33, 219, 229, 289, 685, 3359, 4495,),
+    (1, 3, 1, 3, 19, 43, 67, 193, 41, 771, 407, 81, 3891,),
+    (1, 1, 7, 11, 5, 29, 51, 175, 297, 539, 1, 2245, 6439,),
+    (1, 3, 7, 15, 21, 33, 117, 183, 511, 489, 1283, 3281, 5979,),
+    (1, 3, 7, 5, 9, 3, 125, 147, 359, 549, 369, 3049, 2405,),
+    (1, 3, 5, 7, 19, 5, 65, 97, 483, 377, 1523, 1457, 2995,),
+    (1, 1, 5, 1, 11, 21, 41, 113, 277, 131, 1475, 1043, 2367,),
+    (1, 3, 3, 1, 15, 17, 101, 69, 443, 865, 817, 1421, 5231,),
+    (1, 1, 3, 3, 3, 55, 95, 99, 75, 195, 1929, 3931, 5855,),
+    (1, 3, 1, 3, 19, 23, 93, 213, 241, 551, 1307, 585, 7729,),
+    (1, 3, 1, 11, 23, 15, 53, 249, 467, 519, 95, 741, 409,),
+    (1, 1, 1, 15, 29, 37, 43, 203, 233, 877, 77, 1933, 2729,),
+    (1, 3, 7, 11, 27, 39, 43, 161, 255, 15, 1463, 833, 495,),
+    (1, 1, 7, 11, 3, 53, 81, 67, 375, 823, 1903, 3061, 395,),
+    (1, 1, 1, 1, 15, 37, 93, 233, 247, 501, 1321, 3275, 5409,),
+    (1, 3, 3, 7, 7, 11, 5, 105, 139, 983, 1239, 531, 3881,),
+    (1, 1, 5, 3, 19, 49, 107, 227, 361, 101, 355, 2649, 7383,),
+    (1, 1, 7, 5, 25, 41, 101, 121, 209, 293, 1937, 2259, 5557,),
+    (1, 1, 3, 7, 7, 1, 9, 13, 463, 1019, 995, 3159, 107,),
+    (1, 3, 5, 11, 5, 35, 127, 97, 261, 789, 807, 807, 6257,),
+    (1, 1, 7, 5, 11, 13, 45, 91, 417, 101, 1973, 3645, 2107,),
+    (1, 1, 3, 7, 5, 63, 57, 49, 203, 157, 115, 1393, 8117,),
+    (1, 3, 5, 5, 3, 43, 15, 155, 127, 489, 1165, 3701, 4867,),
+    (1, 1, 7, 7, 29, 29, 69, 215, 415, 367, 371, 1901, 6075,),
+    (1, 1, 1, 3, 11, 33, 89, 149, 433, 705, 1437, 1597, 505,),
+    (1, 3, 5, 1, 13, 37, 19, 119, 5, 581, 2037, 1633, 2099,),
+    (1, 3, 7, 13, 5, 49, 103, 245, 215, 515, 133, 2007, 1933,),
+    (1, 3, 1, 9, 1, 3, 25, 197, 253, 387, 1683, 2267, 221,),
+    (1, 3, 5, 15, 21, 9, 73, 201, 405, 999, 437, 3877, 6045,),
+    (1, 1, 3, 1, 31, 55, 25, 83, 421, 395, 1807, 2129, 7797,),
+    (1, 1, 3, 1, 23, 21, 121, 183, 125, 347, 143, 3685, 4317,),
+    (1, 3, 3, 3, 17, 45, 17, 223, 267, 795, 1815, 1309, 155,),
+    (1, 1, 1, 15, 17, 59, 5, 133, 15, 715, 1503, 153, 2887,),
+    (1, 1, 1, 1, 27, 13, 119, 77, 243, 995, 1851, 3719, 4695,),
+    (1, 3, 1, 5, 31, 49, 43, 165, 49, 609, 1265, 1141, 505,),
+    (1, 1, 7, 13, 11, 63, 21, 253, 229, 585, 1543, 3719, 4141,),
+    (1, 3, 7, 11, 23, 27, 17, 131, 295, 895, 1493, 1411, 3247,),
+    (1, 1, 5, 9, 29, 7, 97, 15, 113, 445, 859, 1483, 1121,),
+    (1, 3, 1, 9, 13, 49, 99, 107, 323, 201, 681, 3071, 5281,),
+    (1, 1, 1, 15, 9, 19, 61, 161, 7, 87, 587, 2199, 2811,),
+    (1, 3, 3, 15, 15, 19, 95, 45, 299, 829, 981, 3479, 487,),
+    (1, 1, 1, 9, 3, 37, 7, 19, 227, 13, 397, 513, 1257,),
+    (1, 1, 5, 15, 15, 13, 17, 111, 135, 929, 1145, 811, 1801,),
+    (1, 3, 1, 3, 27, 57, 31, 19, 279, 103, 693, 631, 3409,),
+    (1, 1, 1, 1, 15, 13, 67, 83, 23, 799, 1735, 2063, 3363,),
+    (1, 3, 3, 7, 3, 1, 61, 31, 41, 533, 2025, 4067, 6963,),
+    (1, 1, 5, 7, 17, 27, 81, 79, 107, 205, 29, 97, 4883,),
+    (1, 1, 1, 5, 19, 49, 91, 201, 283, 949, 651, 3819, 5073,),
+    (1, 1, 7, 9, 11, 13, 73, 197, 37, 219, 1931, 3369, 6017,),
+    (1, 1, 7, 15, 11, 7, 75, 205, 7, 819, 399, 661, 6487,),
+    (1, 3, 3, 3, 27, 37, 95, 41, 307, 165, 1077, 3485, 563,),
+    (1, 3, 5, 3, 21, 49, 57, 179, 109, 627, 1789, 431, 2941,),
+    (1, 1, 7, 5, 11, 19, 43, 137, 149, 679, 1543, 245, 1381,),
+    (1, 3, 5, 5, 15, 3, 69, 81, 135, 159, 1363, 3401, 6355,),
+    (1, 3, 5, 1, 9, 61, 49, 53, 319, 25, 1647, 1297, 615,),
+    (1, 3, 5, 11, 31, 43, 9, 101, 71, 919, 335, 3147, 5823,),
+    (1, 3, 1, 1, 15, 5, 29, 109, 511, 945, 867, 3677, 6915,),
+    (1, 3, 3, 15, 17, 49, 91, 111, 215, 29, 1879, 97, 2505,),
+    (1, 3, 1, 13, 19, 61, 11, 111, 163, 777, 533, 1113, 5339,),
+    (1, 1, 7, 9, 17, 55, 117, 91, 455, 289, 557, 913, 4455,),
+    (1, 3, 1, 7, 25, 19, 123, 37, 1, 277, 717, 2965, 4469,),
+    (1, 3, 7, 3, 19, 23, 87, 235, 209, 457, 2041, 2893, 1805,),
+    (1, 3, 3, 5, 5, 43, 23, 61, 351, 791, 59, 2009, 2909,),
+    (1, 1, 3, 7, 5, 1, 27, 231, 385, 257, 1261, 2701, 1807,),
+    (1, 3, 1, 1, 27, 19, 87, 253, 131, 685, 1743, 3983, 2651,),
+    (1, 3, 7, 11, 21, 17, 11, 81, 191, 641, 1821, 3005, 7251,),
+    (1, 3, 3, 5, 15, 31, 41, 213, 55, 931, 1953, 49, 6037,),
+    (1, 1, 7, 15, 7, 27, 65, 223, 113, 79, 1875, 911, 5445,),
+    (1, 3, 7, 7, 23, 55, 51, 167, 495, 25, 1585, 3447, 799,),
+    (1, 1, 3, 7, 27, 15, 95, 193, 337, 415, 975, 3085, 967,),
+    (1, 1, 7, 15, 19, 7, 93, 41, 433, 551, 401, 3169, 3971,),
+    (1, 1, 7, 11, 13, 15, 53, 69, 433, 59, 1117, 3359, 6231,),
+    (1, 1, 7, 3, 23, 5, 115, 201, 225, 109, 1903, 3897, 6265,),
+    (1, 1, 1, 11, 17, 1, 39, 143, 361, 659, 1105, 23, 4923,),
+    (1, 1, 1, 9, 27, 57, 85, 227, 261, 119, 1881, 3965, 6999,),
+    (1, 3, 7, 7, 15, 7, 107, 17, 315, 49, 1591, 905, 7789,),
+    (1, 3, 1, 7, 29, 3, 47, 237, 157, 769, 839, 3199, 3195,),
+    (1, 1, 3, 15, 25, 39, 63, 15, 111, 857, 881, 1505, 7671,),
+    (1, 1, 7, 1, 3, 35, 41, 215, 99, 895, 1025, 1483, 4707,),
+    (1, 3, 5, 1, 1, 31, 25, 247, 113, 841, 397, 1825, 6969,),
+    (1, 1, 3, 5, 19, 41, 49, 243, 225, 973, 241, 175, 1041,),
+    (1, 1, 1, 7, 15, 15, 105, 141, 83, 75, 1675, 3523, 5219,),
+    (1, 1, 7, 5, 13, 27, 47, 199, 445, 841, 959, 1157, 2209,),
+    (1, 3, 5, 15, 23, 31, 31, 81, 85, 33, 785, 2639, 7799,),
+    (1, 1, 5, 13, 21, 3, 47, 99, 235, 943, 1731, 2467, 7891,),
+    (1, 1, 1, 3, 17, 53, 85, 219, 73, 131, 1339, 875, 1191,),
+    (1, 1, 5, 7, 17, 63, 113, 7, 185, 557, 749, 3563, 4973,),
+    (1, 3, 3, 15, 15, 21, 43, 111, 155, 689, 345, 423, 3597,),
+    (1, 1, 5, 1, 15, 29, 93, 5, 361, 713, 695, 3937, 425,),
+    (1, 3, 7, 7, 13, 41, 115, 175, 315, 937, 123, 2841, 4457,),
+    (1, 1, 3, 11, 25, 5, 103, 53, 423, 811, 657, 399, 7257,),
+    (1, 1, 1, 1, 1, 13, 101, 211, 383, 325, 97, 1703, 4429,),
+    (1, 3, 7, 9, 31, 45, 83, 157, 509, 701, 841, 1105, 3643,),
+    (1, 1, 1, 7, 1, 9, 69, 17, 129, 281, 1161, 2945, 7693,),
+    (1, 3, 7, 1, 11, 29, 51, 143, 77, 433, 1723, 2317, 5641,),
+    (1, 1, 1, 1, 21, 43, 13, 67, 177, 505, 1629, 1267, 4885,),
+    (1, 1, 3, 11, 27, 63, 111, 47, 233, 781, 453, 1679, 3209,),
+    (1, 1, 3, 13, 29, 27, 119, 141, 493, 971, 461, 1159, 633,),
+    (1, 1, 3, 15, 23, 5, 79, 215, 163, 149, 1805, 2399, 61,),
+    (1, 3, 5, 13, 19, 5, 1, 39, 409, 561, 709, 829, 1357,),
+    (1, 3, 3, 13, 19, 43, 9, 177, 449, 447, 73, 2107, 5669,),
+    (1, 3, 5, 1, 23, 13, 63, 109, 203, 593, 829, 4017, 6881,),
+    (1, 1, 5, 7, 3, 9, 53, 175, 391, 169, 1283, 3793, 4451,),
+    (1, 1, 5, 7, 29, 43, 9, 5, 209, 77, 927, 2941, 8145,),
+    (1, 3, 5, 15, 17, 49, 5, 143, 131, 771, 1685, 925, 2175,),
+    (1, 1, 3, 11, 27, 27, 27, 159, 161, 1015, 1587, 4049, 1983,),
+    (1, 3, 1, 3, 23, 57, 119, 67, 481, 577, 389, 3319, 5325,),
+    (1, 3, 5, 1, 19, 39, 87, 61, 329, 657, 1773, 31, 1707,),
+    (1, 1, 3, 1, 5, 25, 15, 241, 131, 815, 1751, 3029, 8039,),
+    (1, 3, 3, 13, 27, 13, 77, 87, 437, 57, 621, 1031, 7891,),
+    (1, 3, 1, 13, 23, 51, 117, 37, 331, 745, 605, 3179, 4713,),
+    (1, 1, 5, 5, 19, 17, 99, 167, 87, 721, 737, 789, 2165,),
+    (1, 3, 5, 13, 1, 51, 119, 211, 165, 299, 1327, 3053, 3343,),
+    (1, 1, 5, 15, 29, 45, 17, 129, 67, 345, 1553, 2705, 7369,),
+    (1, 1, 1, 9, 23, 7, 13, 209, 7, 407, 317, 3077, 7287,),
+    (1, 1, 1, 5, 9, 59, 89, 3, 487, 451, 505, 2499, 7563,),
+    (1, 3, 1, 7, 21, 1, 21, 203, 101, 417, 1389, 2751, 1397,),
+    (1, 3, 7, 13, 7, 31, 3, 247, 349, 485, 1259, 549, 6321,),
+    (1, 1, 7, 7, 27, 33, 107, 197, 293, 729, 1753, 2571, 103,),
+    (1, 3, 5, 9, 25, 35, 5, 253, 137, 213, 2041, 3387, 1809,),
+    (1, 1, 7, 13, 15, 35, 67, 83, 295, 175, 839, 2831, 839,),
+    (1, 3, 3, 11, 3, 17, 55, 141, 247, 991, 117, 3799, 1221,),
+    (1, 1, 5, 1, 11, 37, 87, 233, 457, 653, 899, 2933, 3105,),
+    (1, 1, 3, 15, 3, 31, 67, 167, 437, 9, 651, 1109, 1139,),
+    (1, 1, 3, 1, 7, 63, 67, 17, 11, 883, 1855, 1941, 4751,),
+    (1, 3, 7, 9, 19, 33, 113, 117, 495, 39, 1795, 2561, 5519,),
+    (1, 1, 7, 5, 1, 3, 103, 37, 201, 223, 1101, 877, 6483,),
+    (1, 1, 5, 9, 29, 49, 51, 33, 439, 917, 861, 1321, 2135,),
+    (1, 1, 3, 3, 1, 5, 17, 93, 217, 619, 613, 1357, 6095,),
+    (1, 3, 1, 11, 3, 21, 5, 41, 15, 175, 843, 2937, 6849,),
+    (1, 3, 3, 7, 9, 57, 55, 127, 79, 287, 445, 2205, 7989,),
+    (1, 1, 7, 13, 23, 17, 93, 129, 157, 135, 1747, 1813, 4183,),
+    (1, 1, 1, 5, 31, 59, 99, 33, 425, 329, 887, 367, 1761,),
+    (1, 1, 7, 9, 17, 53, 77, 139, 435, 387, 49, 3649, 1773,),
+    (1, 3, 3, 15, 21, 57, 45, 161, 331, 719, 273, 3479, 4173,),
+    (1, 1, 3, 9, 3, 3, 105, 201, 373, 877, 919, 1263, 6649,),
+    (1, 3, 1, 15, 13, 43, 13, 99, 73, 163, 353, 3569, 5601,),
+    (1, 3, 7, 3, 5, 9, 69, 177, 449, 47, 781, 1125, 4245,),
+    (1, 1, 1, 5, 3, 45, 1, 123, 409, 903, 205, 2057, 7637,),
+    (1, 3, 5, 9, 19, 47, 87, 135, 481, 799, 101, 3409, 2241,),
+    (1, 3, 1, 13, 3, 25, 15, 27, 181, 967, 669, 2577, 7249,),
+    (1, 1, 7, 3, 31, 5, 103, 53, 1, 911, 1209, 3697, 6685,),
+    (1, 1, 3, 1, 5, 5, 49, 135, 281, 747, 761, 2973, 7963,),
+    (1, 3, 3, 5, 19, 61, 125, 199, 299, 515, 1365, 369, 7027,),
+    (1, 3, 1, 7, 5, 41, 63, 229, 283, 571, 147, 447, 657,),
+    (1, 3, 1, 11, 5, 15, 55, 7, 259, 61, 27, 1429, 5631,),
+    (1, 1, 5, 1, 3, 53, 51, 253, 155, 553, 1293, 3735, 6567,),
+    (1, 3, 5, 9, 5, 41, 21, 159, 101, 785, 1981, 3799, 7693,),
+    (1, 3, 7, 7, 9, 3, 95, 105, 129, 213, 1215, 1027, 5699,),
+    (1, 1, 3, 3, 29, 13, 9, 253, 449, 321, 341, 2879, 171,),
+    (1, 3, 7, 11, 21, 11, 75, 35, 43, 965, 675, 2217, 7175,),
+    (1, 1, 5, 15, 31, 5, 29, 137, 311, 751, 47, 1367, 5921,),
+    (1, 1, 3, 15, 17, 1, 45, 69, 55, 649, 835, 569, 7615,),
+    (1, 3, 1, 13, 31, 7, 23, 15, 391, 145, 1845, 1825, 1403,),
+    (1, 1, 3, 15, 5, 9, 79, 77, 105, 399, 1933, 2503, 4781,),
+    (1, 3, 1, 3, 17, 47, 19, 13, 107, 475, 759, 2933, 3761,),
+    (1, 1, 7, 11, 3, 7, 121, 209, 397, 877, 293, 847, 7039,),
+    (1, 1, 1, 15, 29, 45, 5, 109, 335, 461, 143, 931, 4045,),
+    (1, 3, 1, 7, 11, 57, 73, 89, 201, 173, 803, 3953, 5205,),
+    (1, 1, 5, 11, 11, 33, 37, 29, 263, 1019, 657, 1453, 7807,),
+)
+# fmt: on
@@ -9,6 +9,8 @@ class CtrlKey(Enum):
     month = "month"
     size = "size"
     percentiles = "percentiles"
+    tolerance = "tolerance"
+    tilt = "tilt"
 
 
 class DataFrameKey(Enum):
@@ -18,3 +20,15 @@ class DataFrameKey(Enum):
     profit = "利益[円]"
     profit_ratio = "累積利益率"
     passing_year = "経過年数"
+    ci_lower = "95%信頼区間下限[円]"
+    ci_upper = "95%信頼区間上限[円]"
+    shortfall = "期待ショートフォール[円]"
+    approx_lower = "近似誤差の範囲下限[円]"
+    approx_upper = "近似誤差の範囲上限[円]"
+    ratios = "構成比率"
+    rebalance = "リバランス"
+    month = "毎月積立額[円]"
+    year = "運用年数[年]"
+    profits = "リターン"
+    path = "パス番号"
+    weight = "重み"
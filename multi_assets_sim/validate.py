@@ -65,6 +65,20 @@ def textfield_float_changed(e):
         e.control.update()
 
 
+def textfield_optional_float_changed(e):
+    """TextFieldの入力が空欄または浮動点小数値か確かめてエラーテキストを表示する関数
+
+    Args:
+        e (_type_): _description_
+    """
+    if e.control.value != "" and _validate_float_digits(e.control.value) is False:
+        e.control.error_text = "小数値を入力するか空欄にしてください!"
+        e.control.update()
+    else:
+        e.control.error_text = None
+        e.control.update()
+
+
 def _validate_percentile_digits(s: str) -> bool:
     """入力がパーセンタイルのリストになっているか検証する
 
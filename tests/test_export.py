@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from multi_assets_sim.sim_base import SEED_BLOCK
+from multi_assets_sim.table_keys import DataFrameKey
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim
+
+YEAR = 5
+SIZE = SEED_BLOCK + 123
+RTOL = 1e-9
+
+
+@pytest.fixture(scope="module")
+def sim():
+    param = MultiMonteCarloParam(size=SIZE, year=YEAR, seed=1)
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_all_pattern=True)
+    return sim
+
+
+def _check_columns(df: pd.DataFrame, sim: MultiMonteCarloSim):
+    """(パス, 年)ごとの行が全パスの結果と一致し、アセットごとの列の合計が資産合計になることを確かめる"""
+    labels = sim.param.labels
+    assert len(df) == SIZE * YEAR
+    np.testing.assert_array_equal(df[DataFrameKey.path.value], np.repeat(np.arange(SIZE), YEAR))
+    np.testing.assert_array_equal(
+        df[DataFrameKey.passing_year.value], np.tile(np.arange(1, YEAR + 1), SIZE)
+    )
+    total = df[DataFrameKey.result.value].to_numpy()
+    np.testing.assert_allclose(total, sim.get_result().T.ravel(), rtol=RTOL)
+    np.testing.assert_allclose(df[labels].to_numpy().sum(axis=1), total, rtol=RTOL)
+
+
+def test_export_csv(sim, tmp_path):
+    fpath = tmp_path / "result.csv"
+    # チャンクの区切りがパスの途中にならないことも確かめる
+    sim.export_result(str(fpath), chunk_rows=7 * YEAR + 3)
+    _check_columns(pd.read_csv(fpath), sim)
+
+
+def test_export_npz(sim, tmp_path):
+    fpath = tmp_path / "result.npz"
+    sim.export_result(str(fpath), compress=True)
+    with np.load(fpath) as f:
+        np.testing.assert_array_equal(f["result"], sim.get_result())
+        np.testing.assert_array_equal(f["all_pattern"], sim.all_pattern)
+        np.testing.assert_allclose(f["all_pattern"].sum(axis=2), f["result"], rtol=RTOL)
+        assert f["labels"].tolist() == sim.param.labels
+        np.testing.assert_array_equal(f["org"], sim.org)
+
+
+@pytest.mark.parametrize("ext", [".parquet", ".arrow"])
+def test_export_pyarrow(sim, tmp_path, ext):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    fpath = str(tmp_path / f"result{ext}")
+    sim.export_result(fpath, chunk_rows=SEED_BLOCK)
+    if ext == ".parquet":
+        table = pa.parquet.read_table(fpath)
+    else:
+        table = pa.feather.read_table(fpath)
+    _check_columns(table.to_pandas(), sim)
+
+
+def test_export_weights(tmp_path):
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=YEAR, seed=2, tilt=0.2)
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_all_pattern=False)
+    fpath = tmp_path / "result.csv"
+    sim.export_result(str(fpath))
+    df = pd.read_csv(fpath)
+    assert set(param.labels).isdisjoint(df.columns)
+    np.testing.assert_allclose(df[DataFrameKey.weight.value], np.repeat(sim.weights, YEAR), rtol=RTOL)
+
+
+def test_export_errors(sim, tmp_path):
+    with pytest.raises(ValueError):
+        sim.export_result(str(tmp_path / "result.txt"))
+    with pytest.raises(ValueError):
+        sim.export_result(str(tmp_path / "result.csv"), chunk_rows=0)
+    summary_only = MultiMonteCarloSim()
+    summary_only.set_param(MultiMonteCarloParam(size=SEED_BLOCK, year=YEAR, seed=3))
+    summary_only.simulate(keep_result=False)
+    with pytest.raises(ValueError):
+        summary_only.export_result(str(tmp_path / "result.csv"))
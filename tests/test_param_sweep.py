@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+import multi_assets_sim.multi.param_sweep as param_sweep
+from multi_assets_sim.sim_base import SEED_BLOCK
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim, ParamSweep
+
+SIZE = 2 * SEED_BLOCK + 123
+CANDIDATES = dict(
+    ratios=[[0.25, 0.25, 0.25, 0.25], [0.1, 0.2, 0.3, 0.4], [0.7, 0.1, 0.1, 0.1]],
+    rebalance=[True, False],
+    month=[30000, 50000],
+    year=[5, 10],
+)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"antithetic": True}, {"rebalance": False}])
+def test_base_row_matches_simulate(kwargs):
+    param = MultiMonteCarloParam(size=SIZE, year=10, seed=1, **kwargs)
+    df = ParamSweep(param).sweep()
+    assert len(df) == 1
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate()
+    expected = np.percentile(sim.get_result()[-1], param.percentiles, method="nearest")
+    labels = [sim._get_percentile_label(p) for p in param.percentiles]
+    np.testing.assert_allclose(df[labels].to_numpy()[0], expected, rtol=1e-12)
+
+
+def test_same_result_with_small_budgets(monkeypatch):
+    param = MultiMonteCarloParam(size=SIZE, year=10, seed=2)
+    expected = ParamSweep(param).sweep(**CANDIDATES)
+    assert len(expected) == 3 * 2 * 2 * 2
+    # 共有する乱数を残さず、組合せを1つずつのグループに分けても同じ結果になる
+    monkeypatch.setattr(param_sweep, "SWEEP_SHOCK_BYTES", 1)
+    monkeypatch.setattr(param_sweep, "SWEEP_BLOCK_BYTES", 1)
+    sweep = ParamSweep(param)
+    actual = sweep.sweep(**CANDIDATES)
+    assert sweep.shocks is None
+    pd.testing.assert_frame_equal(actual, expected, rtol=1e-12)
+
+
+def test_shocks_reused_across_sweeps():
+    param = MultiMonteCarloParam(size=SIZE, year=10, seed=3)
+    sweep = ParamSweep(param)
+    first = sweep.sweep(**CANDIDATES)
+    shocks = sweep.shocks
+    second = sweep.sweep(**CANDIDATES)
+    assert sweep.shocks is shocks
+    pd.testing.assert_frame_equal(first, second, check_exact=True)
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"sampler": "sobol"}, {"tilt": 0.2}, {"control_variate": True}]
+)
+def test_unsupported_param(kwargs):
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=5, seed=4, **kwargs)
+    with pytest.raises(ValueError):
+        ParamSweep(param).sweep()
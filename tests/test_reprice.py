@@ -0,0 +1,104 @@
+import copy
+import numpy as np
+import pytest
+from multi_assets_sim.sim_base import SEED_BLOCK
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim
+from multi_assets_sim.single.monte_carlo_sim import MonteCarloSim
+from multi_assets_sim.single.monte_carlo_param import MonteCarloParam
+
+# reprice()は同じ乱数の累積から1次式で作り直すため、丸め誤差の分だけ許容する
+RTOL_EPS = 16
+
+
+def _new_sim(param):
+    sim = MultiMonteCarloSim() if isinstance(param, MultiMonteCarloParam) else MonteCarloSim()
+    sim.set_param(param)
+    return sim
+
+
+def _repriced(param):
+    param = copy.deepcopy(param)
+    param.start = 1_000_000
+    param.month = 50_000
+    param.percentiles = [95, 50, 5]
+    return param
+
+
+def _assert_same_result(actual, expected):
+    rtol = RTOL_EPS * np.finfo(expected.dtype).eps
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=0)
+
+
+@pytest.mark.parametrize(
+    "param",
+    [
+        MonteCarloParam(size=SEED_BLOCK + 123, year=10, seed=1),
+        MultiMonteCarloParam(size=SEED_BLOCK + 123, year=10, seed=1),
+        MultiMonteCarloParam(size=SEED_BLOCK + 123, year=10, seed=1, rebalance=False),
+        MultiMonteCarloParam(size=SEED_BLOCK + 123, year=10, seed=1, precision="float32"),
+    ],
+)
+def test_reprice_matches_simulate(param):
+    sim = _new_sim(param)
+    sim.simulate(keep_growth=True)
+    repriced = _repriced(param)
+    assert sim.can_reprice(repriced) is True
+    sim.reprice(repriced)
+
+    ref = _new_sim(repriced)
+    ref.simulate()
+    _assert_same_result(sim.get_result(), ref.get_result())
+    np.testing.assert_array_equal(sim.org, ref.org)
+    _assert_same_result(sim.get_percentile_table(), ref.get_percentile_table())
+
+
+def test_reprice_drops_all_pattern():
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=5, seed=2)
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_all_pattern=True, keep_growth=True)
+    assert sim.all_pattern is not None
+    repriced = _repriced(param)
+    sim.reprice(repriced)
+    # アセットごとの値は作り直せないので、古いstart, monthの値を残さない
+    assert sim.all_pattern is None
+
+    ref = MultiMonteCarloSim()
+    ref.set_param(repriced)
+    ref.simulate(keep_all_pattern=True)
+    _assert_same_result(sim.get_result(), ref.get_result())
+
+
+def test_reprice_store_dir(tmp_path):
+    param = MultiMonteCarloParam(size=SEED_BLOCK + 123, year=10, seed=3)
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_all_pattern=True, keep_growth=True, store_dir=str(tmp_path))
+    repriced = _repriced(param)
+    sim.reprice(repriced)
+
+    ref = MultiMonteCarloSim()
+    ref.set_param(repriced)
+    ref.simulate()
+    _assert_same_result(sim.get_result(), ref.get_result())
+
+    # 保存し直したパラメータで、作り直した結果として開き直せる
+    opened = MultiMonteCarloSim.open_store(str(tmp_path))
+    assert opened.param.start == repriced.start
+    assert opened.param.month == repriced.month
+    assert opened.param.percentiles == repriced.percentiles
+    assert opened.all_pattern is None
+    _assert_same_result(np.asarray(opened.get_result()), ref.get_result())
+    np.testing.assert_array_equal(opened.org, ref.org)
+
+
+def test_reprice_rejects_other_fields():
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=5, seed=4)
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_growth=True)
+    changed = copy.deepcopy(param)
+    changed.year = 6
+    assert sim.can_reprice(changed) is False
+    with pytest.raises(ValueError):
+        sim.reprice(changed)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from multi_assets_sim.sim_base import SEED_BLOCK
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim
+from multi_assets_sim.single.monte_carlo_sim import MonteCarloSim
+from multi_assets_sim.single.monte_carlo_param import MonteCarloParam
+
+# ブロックの途中で終わるパス数とする
+SIZE = 3 * SEED_BLOCK + 123
+
+PARAMS = {
+    "single": MonteCarloParam(size=SIZE, year=10, seed=1),
+    "multi": MultiMonteCarloParam(size=SIZE, year=10, seed=1),
+    "multi[antithetic]": MultiMonteCarloParam(size=SIZE, year=10, seed=1, antithetic=True),
+    "multi[sobol]": MultiMonteCarloParam(size=SIZE, year=10, seed=1, sampler="sobol"),
+    "multi[tilt]": MultiMonteCarloParam(size=SIZE, year=10, seed=1, tilt=0.2),
+    "multi[float32]": MultiMonteCarloParam(size=SIZE, year=10, seed=1, precision="float32"),
+}
+
+
+def _new_sim(param):
+    sim = MultiMonteCarloSim() if isinstance(param, MultiMonteCarloParam) else MonteCarloSim()
+    sim.set_param(param)
+    return sim
+
+
+@pytest.fixture(scope="module")
+def expected():
+    res = {}
+    for name, param in PARAMS.items():
+        sim = _new_sim(param)
+        sim.simulate()
+        res[name] = (sim.get_result(), sim.weights)
+    return res
+
+
+@pytest.mark.parametrize("name", list(PARAMS))
+@pytest.mark.parametrize(
+    "workers, chunk_size", [(1, SEED_BLOCK), (1, 2 * SEED_BLOCK), (2, None), (2, SEED_BLOCK)]
+)
+def test_same_result_across_workers_and_chunks(expected, name, workers, chunk_size):
+    sim = _new_sim(PARAMS[name])
+    sim.simulate(workers=workers, chunk_size=chunk_size)
+    result, weights = expected[name]
+    np.testing.assert_array_equal(sim.get_result(), result)
+    if weights is None:
+        assert sim.weights is None
+    else:
+        np.testing.assert_array_equal(sim.weights, weights)
+
+
+@pytest.mark.parametrize("name", ["multi", "multi[antithetic]"])
+def test_same_summary_across_workers_and_chunks(name):
+    ref = _new_sim(PARAMS[name])
+    ref.simulate(keep_result=False, chunk_size=SEED_BLOCK)
+    sim = _new_sim(PARAMS[name])
+    sim.simulate(keep_result=False, chunk_size=2 * SEED_BLOCK, workers=2)
+    np.testing.assert_array_equal(sim.summary.counts, ref.summary.counts)
+    np.testing.assert_array_equal(sim.get_percentile_table(), ref.get_percentile_table())
+
+
+def test_seed_changes_result():
+    a = _new_sim(PARAMS["multi"])
+    a.simulate()
+    param = MultiMonteCarloParam(size=SIZE, year=10, seed=2)
+    b = _new_sim(param)
+    b.simulate()
+    assert np.array_equal(a.get_result(), b.get_result()) is False
@@ -0,0 +1,72 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from multi_assets_sim.result_cache import CACHE_FILE_EXT, ResultCache, param_hash
+from multi_assets_sim.sim_base import SEED_BLOCK
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim
+
+
+@pytest.fixture(scope="module")
+def entry():
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=5, seed=1)
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_result=False)
+    return param, {
+        "describe": sim.get_percentile_describe(with_ci=True),
+        "eachtime": sim.get_percentile_eachtime(),
+        "hist": sim.get_histogram(per_year=True),
+        "paths": np.zeros((5, 3), dtype=np.float32),
+        "status": ["a", 1, 2.5, None],
+    }
+
+
+def test_param_hash():
+    param = MultiMonteCarloParam(seed=1)
+    assert param_hash(param) == param_hash(MultiMonteCarloParam(seed=1))
+    assert param_hash(param) != param_hash(MultiMonteCarloParam(seed=2))
+    assert param_hash(param) != param_hash(param, {"chunk_size": SEED_BLOCK})
+    # シードを指定していなければ毎回異なる乱数になるのでキャッシュしない
+    assert param_hash(MultiMonteCarloParam()) is None
+
+
+def test_disk_round_trip(entry, tmp_path):
+    param, value = entry
+    key = param_hash(param)
+    ResultCache(disk_dir=str(tmp_path)).put(key, value)
+    cache = ResultCache(disk_dir=str(tmp_path))
+    loaded = cache.get(key)
+    assert cache.hits == 1
+    for name in ["describe", "eachtime"]:
+        pd.testing.assert_frame_equal(loaded[name], value[name])
+        assert loaded[name].attrs["approximate"] == value[name].attrs["approximate"]
+    np.testing.assert_array_equal(
+        loaded["eachtime"].attrs["approx_bounds"], value["eachtime"].attrs["approx_bounds"]
+    )
+    np.testing.assert_array_equal(loaded["hist"].counts, value["hist"].counts)
+    assert loaded["paths"].dtype == np.float32
+    assert loaded["status"] == value["status"]
+
+
+def test_disk_ignores_pickle(tmp_path):
+    key = param_hash(MultiMonteCarloParam(seed=1))
+    with open(os.path.join(tmp_path, key + CACHE_FILE_EXT), "wb") as f:
+        pickle.dump({"status": "x"}, f)
+    cache = ResultCache(disk_dir=str(tmp_path))
+    assert cache.get(key) is None
+    assert cache.misses == 1
+
+
+def test_put_rejects_unsupported_value(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        cache.put("key", {"value": object()})
+    assert "key" not in cache
+
+
+def test_put_without_seed_is_ignored(entry):
+    cache = ResultCache()
+    cache.put(param_hash(MultiMonteCarloParam()), entry[1])
+    assert len(cache) == 0
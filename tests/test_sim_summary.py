@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from multi_assets_sim.sim_base import SEED_BLOCK
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim
+from multi_assets_sim.table_keys import DataFrameKey
+
+
+def _simulate(param, keep_result):
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(keep_result=keep_result, keep_all_pattern=False)
+    return sim
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"antithetic": True}, {"rebalance": False}])
+def test_bounds_contain_exact_percentiles(kwargs):
+    param = MultiMonteCarloParam(size=8 * SEED_BLOCK, year=20, seed=1, **kwargs)
+    exact = _simulate(param, True)
+    approx = _simulate(param, False)
+    assert exact.get_percentile_bounds() is None
+
+    table = exact.get_percentile_table()
+    bounds = approx.get_percentile_bounds()
+    assert bounds.shape == (param.year, len(param.percentiles), 2)
+    assert np.all((bounds[..., 0] <= table) & (table <= bounds[..., 1]))
+    est = approx.get_percentile_table()
+    assert np.all((bounds[..., 0] <= est) & (est <= bounds[..., 1]))
+    # ビン幅は値域の幅/ビン数なので、相対誤差は1%よりも十分小さい
+    assert np.max((bounds[..., 1] - bounds[..., 0]) / np.abs(table)) < 0.01
+
+
+def test_describe_labels_approximation():
+    param = MultiMonteCarloParam(size=2 * SEED_BLOCK, year=10, seed=2)
+    exact = _simulate(param, True)
+    approx = _simulate(param, False)
+
+    df = exact.get_percentile_describe()
+    assert df.attrs["approximate"] is False
+    assert DataFrameKey.approx_lower.value not in df.columns
+    assert exact.get_percentile_eachtime().attrs["approximate"] is False
+    assert exact.get_percentile_history().attrs["approximate"] is False
+
+    df = approx.get_percentile_describe()
+    assert df.attrs["approximate"] is True
+    res = df[DataFrameKey.result.value]
+    assert np.all(df[DataFrameKey.approx_lower.value] <= res)
+    assert np.all(res <= df[DataFrameKey.approx_upper.value])
+    each = approx.get_percentile_eachtime()
+    assert each.attrs["approximate"] is True
+    assert each.attrs["approx_bounds"].shape == (param.year, len(param.percentiles), 2)
+    assert approx.get_percentile_history().attrs["approximate"] is True
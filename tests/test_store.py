@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pandas as pd
+from multi_assets_sim.sim_base import SEED_BLOCK, STORE_META_FILE, STORE_PARAM_FILE
+from multi_assets_sim.multi import MultiMonteCarloParam, MultiMonteCarloSim
+from multi_assets_sim.single.monte_carlo_sim import MonteCarloSim
+from multi_assets_sim.single.monte_carlo_param import MonteCarloParam
+
+
+def _simulate_store(store_dir, param, **kwargs):
+    sim = MultiMonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(store_dir=str(store_dir), **kwargs)
+    return sim
+
+
+def test_open_store_round_trip(tmp_path):
+    param = MultiMonteCarloParam(size=2 * SEED_BLOCK + 123, year=10, seed=1)
+    sim = _simulate_store(tmp_path, param, keep_all_pattern=True, keep_growth=True)
+    assert os.path.exists(os.path.join(tmp_path, STORE_META_FILE))
+    assert os.path.exists(os.path.join(tmp_path, STORE_PARAM_FILE))
+
+    opened = MultiMonteCarloSim.open_store(str(tmp_path))
+    assert isinstance(opened.result, np.memmap)
+    for name in ["result", "all_pattern", "growth_start", "growth_month"]:
+        np.testing.assert_array_equal(np.asarray(getattr(opened, name)), getattr(sim, name))
+    assert opened.entropy == sim.entropy
+    assert opened.n_paths == param.size
+    np.testing.assert_array_equal(opened.org, sim.org)
+    assert opened.param.labels == param.labels
+    assert opened.param.seed == param.seed
+    pd.testing.assert_frame_equal(
+        opened.get_percentile_describe(), sim.get_percentile_describe()
+    )
+
+
+def test_open_store_single(tmp_path):
+    param = MonteCarloParam(size=SEED_BLOCK + 123, year=5, seed=2)
+    sim = MonteCarloSim()
+    sim.set_param(param)
+    sim.simulate(store_dir=str(tmp_path))
+    opened = MonteCarloSim.open_store(str(tmp_path))
+    np.testing.assert_array_equal(np.asarray(opened.get_result()), sim.get_result())
+
+
+def test_open_store_without_all_pattern(tmp_path):
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=5, seed=3)
+    sim = _simulate_store(tmp_path, param, keep_all_pattern=False)
+    opened = MultiMonteCarloSim.open_store(str(tmp_path))
+    assert opened.all_pattern is None
+    assert opened.growth_start is None
+    np.testing.assert_array_equal(np.asarray(opened.get_result()), sim.get_result())
+
+
+def test_open_store_truncated_by_tolerance(tmp_path):
+    param = MultiMonteCarloParam(size=8 * SEED_BLOCK, year=5, seed=4, tolerance=0.05)
+    sim = _simulate_store(tmp_path, param, chunk_size=SEED_BLOCK)
+    assert sim.n_paths < param.size
+    opened = MultiMonteCarloSim.open_store(str(tmp_path))
+    assert opened.n_paths == sim.n_paths
+    assert opened.get_result().shape == (param.year, sim.n_paths)
+    np.testing.assert_array_equal(np.asarray(opened.get_result()), sim.get_result())
+
+
+def test_simulate_again_into_same_store(tmp_path):
+    param = MultiMonteCarloParam(size=SEED_BLOCK, year=5, seed=5)
+    sim = _simulate_store(tmp_path, param, keep_all_pattern=True)
+    # 前回のmemmapを開いたまま、同じディレクトリへパス数を変えて計算し直す
+    param = MultiMonteCarloParam(size=2 * SEED_BLOCK, year=6, seed=6)
+    sim.set_param(param)
+    sim.simulate(store_dir=str(tmp_path), keep_all_pattern=True)
+    opened = MultiMonteCarloSim.open_store(str(tmp_path))
+    assert opened.param.size == param.size
+    assert opened.get_result().shape == (6, 2 * SEED_BLOCK)
+    np.testing.assert_array_equal(np.asarray(opened.all_pattern), sim.all_pattern)